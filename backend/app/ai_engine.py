@@ -11,6 +11,8 @@ import tiktoken
 from openai import AsyncOpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
+from app import knowledge_search, query_embeddings
+from app.chunker import split_into_chunks, split_into_chunks_async  # noqa: F401 — usados pelas rotas
 from app.models import (
     KnowledgeDocument, AIConfig, Message, AIConversationSummary,
     Contact, Property, PropertyNearbyPlace, PipelineStage
@@ -55,31 +57,6 @@ def count_tokens(text: str, model: str = "gpt-5") -> int:
         return len(text) // 4
 
 
-def split_into_chunks(text: str, title: str, max_tokens: int = 400) -> list[dict]:
-    enc = tiktoken.encoding_for_model("gpt-4o")
-    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
-
-    chunks = []
-    current_chunk = ""
-    chunk_index = 0
-
-    for paragraph in paragraphs:
-        test_chunk = f"{current_chunk}\n{paragraph}".strip() if current_chunk else paragraph
-        if len(enc.encode(test_chunk)) > max_tokens and current_chunk:
-            tokens = len(enc.encode(current_chunk))
-            chunks.append({"title": title, "content": current_chunk, "chunk_index": chunk_index, "token_count": tokens})
-            chunk_index += 1
-            current_chunk = paragraph
-        else:
-            current_chunk = test_chunk
-
-    if current_chunk:
-        tokens = len(enc.encode(current_chunk))
-        chunks.append({"title": title, "content": current_chunk, "chunk_index": chunk_index, "token_count": tokens})
-
-    return chunks
-
-
 # === Embeddings ===
 
 async def generate_embedding(text: str) -> list[float]:
@@ -87,6 +64,11 @@ async def generate_embedding(text: str) -> list[float]:
     return response.data[0].embedding
 
 
+async def embed_query(query: str) -> np.ndarray:
+    """Embedding de uma pergunta, com cache (app/query_embeddings.py)."""
+    return await query_embeddings.get(query, EMBEDDING_MODEL, generate_embedding)
+
+
 def cosine_similarity(a: list[float], b: list[float]) -> float:
     a = np.array(a)
     b = np.array(b)
@@ -96,28 +78,21 @@ def cosine_similarity(a: list[float], b: list[float]) -> float:
 # === RAG: Busca por Similaridade (Knowledge Base) ===
 
 async def search_knowledge(query: str, channel_id: int, db: AsyncSession, top_k: int = 3) -> list[dict]:
-    query_embedding = await generate_embedding(query)
-    result = await db.execute(
-        select(KnowledgeDocument).where(
-            KnowledgeDocument.channel_id == channel_id,
-            KnowledgeDocument.embedding.isnot(None),
-        )
-    )
-    documents = result.scalars().all()
-    if not documents:
+    # BM25 + vetorial (RRF); com a API de embeddings lenta ou fora, só BM25
+    best = await knowledge_search.hybrid_search(channel_id, query, top_k, embed_query)
+    if not best:
         return []
 
-    scored = []
-    for doc in documents:
-        try:
-            doc_embedding = json.loads(doc.embedding)
-            score = cosine_similarity(query_embedding, doc_embedding)
-            scored.append({"title": doc.title, "content": doc.content, "score": score})
-        except (json.JSONDecodeError, TypeError):
-            continue
-
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:top_k]
+    # Só título/conteúdo dos escolhidos; chunk apagado entre a busca e aqui fica de fora
+    result = await db.execute(
+        select(KnowledgeDocument.id, KnowledgeDocument.title, KnowledgeDocument.content)
+        .where(KnowledgeDocument.id.in_([doc_id for doc_id, _ in best]))
+    )
+    rows = {row.id: row for row in result}
+    return [
+        {"title": rows[doc_id].title, "content": rows[doc_id].content, "score": score}
+        for doc_id, score in best if doc_id in rows
+    ]
 
 
 # === RAG: Busca de Imóveis no Catálogo ===
@@ -259,6 +234,19 @@ async def get_conversation_history(contact_wa_id: str, db: AsyncSession, limit:
     return history
 
 
+def drop_current_turn(history: list[dict], user_message: str, pending: list[str] | None = None) -> list[dict]:
+    """
+    Tira do fim do histórico as mensagens do lead do turno atual (já gravadas antes da IA
+    responder), para não irem duas vezes. pending: textos das mensagens agrupadas no turno,
+    na ordem; sem ela o turno é uma mensagem só (user_message, que pode ter quebras de linha).
+    """
+    pending = list(pending) if pending else [user_message]
+    while pending and history and history[-1]["role"] == "user" and history[-1]["content"] == pending[-1]:
+        history.pop()
+        pending.pop()
+    return history
+
+
 # === Processar comandos da IA ===
 
 async def process_ai_commands(
@@ -337,8 +325,12 @@ async def generate_ai_response(
     user_message: str,
     channel_id: int,
     db: AsyncSession,
+    pending_messages: list[str] | None = None,
 ) -> str | None:
-    """Gera resposta do agente IA usando RAG + catálogo de imóveis."""
+    """
+    Gera resposta do agente IA usando RAG + catálogo de imóveis. pending_messages: mensagens
+    do lead agrupadas em user_message (com quebra de linha), na ordem.
+    """
 
     # 1. Buscar config da IA para o canal
     result = await db.execute(select(AIConfig).where(AIConfig.channel_id == channel_id))
@@ -409,11 +401,12 @@ async def generate_ai_response(
     # 7. Montar mensagens para o GPT
     full_context = system_prompt + lead_info + property_catalog + knowledge_context
 
+    # As mensagens do turno já estão no histórico e são substituídas pelo turno (agrupado)
+    drop_current_turn(history, user_message, pending_messages)
+
     messages = [{"role": "system", "content": full_context}]
     messages.extend(history)
-
-    if not history or history[-1].get("content") != user_message:
-        messages.append({"role": "user", "content": user_message})
+    messages.append({"role": "user", "content": user_message})
 
     # 8. Chamar OpenAI
     try:
@@ -1,16 +1,17 @@
 """
 Rotas da IA: config do agente, upload de documentos RAG, toggle por contato.
 """
-import json
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from pydantic import BaseModel
 from typing import Optional
 
 from app.database import get_db
+from app import knowledge_index, knowledge_ingest, knowledge_search, query_embeddings
 from app.models import AIConfig, KnowledgeDocument, Contact, AIConversationSummary
-from app.ai_engine import generate_embedding, split_into_chunks, count_tokens
+from app.ai_engine import EMBEDDING_MODEL, split_into_chunks_async, count_tokens
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
@@ -23,6 +24,8 @@ class AIConfigUpdate(BaseModel):
     model: Optional[str] = None
     temperature: Optional[str] = None
     max_tokens: Optional[int] = None
+    coalesce_window_ms: Optional[int] = None
+    coalesce_max_wait_ms: Optional[int] = None
 
 
 class ToggleAIRequest(BaseModel):
@@ -58,6 +61,8 @@ async def get_ai_config(channel_id: int, db: AsyncSession = Depends(get_db)):
             "model": "gpt-5",
             "temperature": "0.7",
             "max_tokens": 500,
+            "coalesce_window_ms": None,
+            "coalesce_max_wait_ms": None,
         }
 
     return {
@@ -68,6 +73,8 @@ async def get_ai_config(channel_id: int, db: AsyncSession = Depends(get_db)):
         "model": config.model,
         "temperature": config.temperature,
         "max_tokens": config.max_tokens,
+        "coalesce_window_ms": config.coalesce_window_ms,
+        "coalesce_max_wait_ms": config.coalesce_max_wait_ms,
     }
 
 
@@ -92,6 +99,10 @@ async def update_ai_config(channel_id: int, req: AIConfigUpdate, db: AsyncSessio
         config.temperature = req.temperature
     if req.max_tokens is not None:
         config.max_tokens = req.max_tokens
+    if req.coalesce_window_ms is not None:
+        config.coalesce_window_ms = req.coalesce_window_ms
+    if req.coalesce_max_wait_ms is not None:
+        config.coalesce_max_wait_ms = req.coalesce_max_wait_ms
 
     await db.commit()
     return {"status": "updated"}
@@ -130,6 +141,27 @@ async def toggle_contact_ai(wa_id: str, req: ToggleAIRequest, db: AsyncSession =
 
 # === Documentos do RAG ===
 
+@router.get("/knowledge-index/stats")
+async def knowledge_index_stats():
+    """Índices vetorial e lexical em memória deste worker, contadores da ingestão e do cache de perguntas."""
+    return {
+        **knowledge_index.stats(),
+        "lexical": knowledge_search.stats(),
+        "ingest": knowledge_ingest.stats(),
+        "query_cache": query_embeddings.stats(),
+    }
+
+
+@router.post("/query-cache/warm")
+async def warm_query_cache(limit: int = 500, days: int = 30):
+    """Carrega no cache deste worker (e na tabela, se ligada) as perguntas mais frequentes."""
+    try:
+        return await query_embeddings.warm(knowledge_ingest.embed_texts, EMBEDDING_MODEL, limit, days)
+    except Exception as e:
+        print(f"❌ Erro ao aquecer o cache de embeddings: {e}")
+        raise HTTPException(status_code=502, detail="Erro ao gerar embeddings das perguntas frequentes")
+
+
 @router.get("/documents/{channel_id}")
 async def list_documents(channel_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
@@ -173,40 +205,64 @@ async def upload_document(
     if not content.strip():
         raise HTTPException(status_code=400, detail="Arquivo vazio")
 
-    # Dividir em chunks
-    chunks = split_into_chunks(content, title)
+    # Dividir em chunks (documento grande vai para um processo separado)
+    chunks = await split_into_chunks_async(content, title)
 
     if not chunks:
         raise HTTPException(status_code=400, detail="Não foi possível processar o documento")
 
-    # Gerar embeddings e salvar cada chunk
-    saved = 0
-    for chunk in chunks:
-        try:
-            embedding = await generate_embedding(chunk["content"])
-            doc = KnowledgeDocument(
-                channel_id=channel_id,
-                title=chunk["title"],
-                content=chunk["content"],
-                embedding=json.dumps(embedding),
-                chunk_index=chunk["chunk_index"],
-                token_count=chunk["token_count"],
-            )
-            db.add(doc)
-            saved += 1
-        except Exception as e:
-            print(f"❌ Erro ao processar chunk {chunk['chunk_index']}: {e}")
-            continue
-
+    total_tokens = sum(c["token_count"] for c in chunks)
+
+    # Muitos chunks para embedar (no reenvio, só os que mudaram): processa em segundo plano e
+    # responde já com o id do job
+    diff = await knowledge_ingest.diff_document(db, channel_id, title, chunks)
+    # Fecha a transação da leitura: a sessão não segura conexão enquanto os embeddings saem
+    await db.rollback()
+    if len(diff["embed"]) >= knowledge_ingest.KNOWLEDGE_INGEST_BACKGROUND_MIN_CHUNKS:
+        job = await knowledge_ingest.start_job(db, channel_id, title, chunks)
+        return JSONResponse(status_code=202, content={
+            "job_id": job.id,
+            "status": job.status,
+            "title": title,
+            "total_chunks": len(chunks),
+            "total_tokens": total_tokens,
+        })
+
+    # Gerar embeddings em lotes (só dos chunks novos ou alterados) e salvar de uma vez
+    stats = {"api_calls": 0, "retries": 0}
+    try:
+        ids = await knowledge_ingest.ingest(db, channel_id, chunks, stats=stats, diff=diff)
+    except Exception as e:
+        print(f"❌ Erro ao gerar embeddings de '{title}': {e}")
+        raise HTTPException(status_code=502, detail="Erro ao gerar embeddings do documento")
     await db.commit()
 
     return {
         "title": title,
-        "chunks_saved": saved,
-        "total_tokens": sum(c["token_count"] for c in chunks),
+        "chunks_saved": len(ids),
+        "total_tokens": total_tokens,
+        "reused_chunks": stats["kept_chunks"] + stats["reused_chunks"],
+        "removed_chunks": stats["removed_chunks"],
+        "api_calls": stats["api_calls"],
+        "saved_api_calls": stats["saved_api_calls"],
+        "seconds_saved_est": stats["seconds_saved_est"],
     }
 
 
+@router.get("/documents/jobs/{job_id}")
+async def get_ingest_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Progresso de um upload processado em segundo plano."""
+    jobs = await knowledge_ingest.get_jobs(db, job_id=job_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return jobs[0]
+
+
+@router.get("/documents/{channel_id}/jobs")
+async def list_ingest_jobs(channel_id: int, db: AsyncSession = Depends(get_db)):
+    return await knowledge_ingest.get_jobs(db, channel_id=channel_id)
+
+
 @router.delete("/documents/{channel_id}/{title}")
 async def delete_document(channel_id: int, title: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
@@ -223,6 +279,7 @@ async def delete_document(channel_id: int, title: str, db: AsyncSession = Depend
     for doc in docs:
         await db.delete(doc)
 
+    knowledge_index.publish_changes(db, channel_id, removed=[doc.id for doc in docs])
     await db.commit()
     return {"status": "deleted", "chunks_removed": len(docs)}
 class TestChatRequest(BaseModel):
@@ -0,0 +1,172 @@
+"""
+Divisão de documentos da base de conhecimento em chunks por tokens.
+O split_into_chunks antigo recodificava com o tiktoken o chunk inteiro a cada parágrafo
+acrescentado (quadrático no tamanho do chunk, e um parágrafo gigante virava um chunk acima
+do limite). Aqui o documento é codificado uma vez só; com a posição de cada token no texto, as
+janelas de até max_tokens são cortadas direto na lista de tokens, de preferência no fim de
+um parágrafo, senão no fim de uma frase, e só em último caso no meio. Cada chunk começa
+`overlap` tokens antes do fim do anterior (alinhado ao início de uma frase quando dá), para
+o trecho de contexto não se perder no corte.
+
+Linear no tamanho do documento. Documento grande (KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS) é
+dividido num processo separado, sem ocupar o loop nem o GIL do worker.
+
+Este módulo não importa o resto do app: é o que o processo auxiliar carrega.
+"""
+import os
+import re
+import asyncio
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import multiprocessing
+
+import numpy as np
+import tiktoken
+
+KNOWLEDGE_CHUNK_MODEL = os.getenv("KNOWLEDGE_CHUNK_MODEL", "gpt-4o")
+KNOWLEDGE_CHUNK_OVERLAP = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", "50"))
+KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS = int(os.getenv("KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS", "200000"))
+KNOWLEDGE_CHUNK_PROCESSES = int(os.getenv("KNOWLEDGE_CHUNK_PROCESSES", "1"))
+
+# Fim de frase: pontuação seguida de espaço (o corte fica antes do espaço)
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+
+_executor: ProcessPoolExecutor | None = None
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model)
+
+
+@lru_cache(maxsize=4)
+def _token_lengths(model: str) -> np.ndarray:
+    """Tamanho em bytes de cada token do vocabulário (0 nos ids sem token)."""
+    enc = _encoding(model)
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for token in range(enc.n_vocab):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+
+def _char_offsets(model: str, tokens: list[int], text: str) -> list[int]:
+    """
+    Posição (em caracteres) onde cada token começa, como o decode_with_offsets do tiktoken,
+    mas vetorizado: o de lá percorre os tokens em Python e era a maior parte do tempo. Token
+    que começa no meio de um caractere (emoji, acento) aponta para o início do caractere.
+    """
+    lengths = _token_lengths(model)[np.asarray(tokens, dtype=np.int64)]
+    byte_starts = np.cumsum(lengths) - lengths
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    # Caractere que contém cada byte: bytes de continuação do UTF-8 são 10xxxxxx
+    char_of_byte = np.cumsum((raw & 0xC0) != 0x80) - 1
+    return char_of_byte[byte_starts].tolist()
+
+
+def normalize(text: str) -> str:
+    """Mesmo texto que o chunker antigo via: linhas sem espaço nas pontas, sem linhas vazias."""
+    return "\n".join(line.strip() for line in text.split("\n") if line.strip())
+
+
+def _token_positions(offsets: list[int], positions) -> list[int]:
+    """Índice do primeiro token que começa em cada posição (ou logo depois), sem repetição."""
+    indexes = []
+    for position in positions:
+        index = bisect_left(offsets, position)
+        if not indexes or index > indexes[-1]:
+            indexes.append(index)
+    return indexes
+
+
+def _last_between(boundaries: list[int], low: int, high: int) -> int | None:
+    """Maior fronteira em (low, high]."""
+    i = bisect_right(boundaries, high) - 1
+    return boundaries[i] if i >= 0 and boundaries[i] > low else None
+
+
+def _first_between(boundaries: list[int], low: int, high: int) -> int | None:
+    """Menor fronteira em [low, high)."""
+    i = bisect_left(boundaries, low)
+    return boundaries[i] if i < len(boundaries) and boundaries[i] < high else None
+
+
+def split_into_chunks(text: str, title: str, max_tokens: int = 400, overlap: int | None = None,
+                      model: str | None = None) -> list[dict]:
+    """Chunks de até max_tokens tokens ({title, content, chunk_index, token_count}), em ordem."""
+    overlap = KNOWLEDGE_CHUNK_OVERLAP if overlap is None else overlap
+    overlap = max(0, min(overlap, max_tokens // 2))
+    model = model or KNOWLEDGE_CHUNK_MODEL
+    enc = _encoding(model)
+    text = normalize(text)
+    if not text:
+        return []
+
+    tokens = enc.encode_ordinary(text)
+    offsets = _char_offsets(model, tokens, text)
+    total = len(tokens)
+    # Fronteiras em índice de token: onde um chunk pode terminar (o próximo começa ali)
+    paragraphs = _token_positions(offsets, (m.start() for m in re.finditer("\n", text)))
+    sentences = _token_positions(offsets, (m.end() for m in _SENTENCE_END.finditer(text)))
+    sentences = sorted(set(sentences).union(paragraphs))
+
+    def char_at(index: int) -> int:
+        return offsets[index] if index < total else len(text)
+
+    chunks = []
+    start = 0
+    while start < total:
+        limit = min(start + max_tokens, total)
+        if limit == total:
+            end = total
+        else:
+            end = (_last_between(paragraphs, start + max_tokens // 2, limit)
+                   or _last_between(sentences, start + max_tokens // 4, limit)
+                   or limit)
+        content = text[char_at(start):char_at(end)].strip()
+        # Recodificar o trecho pode dar um token a mais nas bordas: encolhe até caber
+        count = len(enc.encode_ordinary(content))
+        while count > max_tokens and end > start + 1:
+            end -= max(1, count - max_tokens)
+            content = text[char_at(start):char_at(end)].strip()
+            count = len(enc.encode_ordinary(content))
+        if content:
+            chunks.append({"title": title, "content": content, "chunk_index": len(chunks), "token_count": count})
+        if end >= total:
+            break
+        # Sobreposição de no máximo metade do chunk: o avanço é sempre proporcional
+        next_start = max(end - overlap, start + (end - start + 1) // 2)
+        if overlap:
+            next_start = _first_between(sentences, next_start, end) or next_start
+        start = next_start
+    return chunks
+
+
+# ============================================================
+# DOCUMENTO GRANDE: PROCESSO SEPARADO
+# ============================================================
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: o processo auxiliar não herda o loop, conexões e threads do worker
+        _executor = ProcessPoolExecutor(KNOWLEDGE_CHUNK_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def split_into_chunks_async(text: str, title: str, max_tokens: int = 400) -> list[dict]:
+    """split_into_chunks fora do loop: processo separado para texto grande, thread para o resto."""
+    if len(text) >= KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pool(), split_into_chunks, text, title, max_tokens)
+    return await asyncio.to_thread(split_into_chunks, text, title, max_tokens)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
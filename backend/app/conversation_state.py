@@ -0,0 +1,250 @@
+"""
+Estado das conversas (tabela conversation_state).
+Guarda, por wa_id, a prévia da última mensagem, direção, não lidas e última mensagem
+recebida, para a caixa de entrada ler tudo de uma vez em vez de consultar messages
+por contato. Toda gravação de mensagem chama record_messages() na mesma transação,
+e todo contato criado pelo ORM ganha a sua linha na hora (_create_state).
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update, func, case, text, event, or_, tuple_, exists, literal_column
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import ConversationState, Contact, Message, Tag, contact_tags
+
+PREVIEW_MAX_CHARS = 500
+
+
+def _as_dict(message) -> dict:
+    if isinstance(message, dict):
+        return message
+    return {
+        "contact_wa_id": message.contact_wa_id,
+        "channel_id": message.channel_id,
+        "direction": message.direction,
+        "content": message.content,
+        "timestamp": message.timestamp,
+        "status": message.status,
+    }
+
+
+async def record_messages(db: AsyncSession, messages: list):
+    """
+    Atualiza o estado das conversas com mensagens recém-inseridas (dicts ou objetos Message).
+    Um único upsert para o lote todo; não faz commit.
+    """
+    states: dict[str, dict] = {}
+    for raw in messages:
+        msg = _as_dict(raw)
+        wa_id = msg["contact_wa_id"]
+        ts = msg["timestamp"]
+        state = states.setdefault(wa_id, {
+            "wa_id": wa_id,
+            "channel_id": msg.get("channel_id"),
+            "last_message_at": None,
+            "unread_count": 0,
+            "last_inbound_at": None,
+        })
+        if state["last_message_at"] is None or ts >= state["last_message_at"]:
+            state["last_message_at"] = ts
+            state["last_message_preview"] = (msg.get("content") or "")[:PREVIEW_MAX_CHARS]
+            state["last_direction"] = msg["direction"]
+            state["channel_id"] = msg.get("channel_id") or state["channel_id"]
+        if msg["direction"] == "inbound":
+            if msg.get("status") == "received":
+                state["unread_count"] += 1
+            if state["last_inbound_at"] is None or ts > state["last_inbound_at"]:
+                state["last_inbound_at"] = ts
+
+    if not states:
+        return
+
+    stmt = insert(ConversationState).values(list(states.values()))
+    excluded = stmt.excluded
+    # Mensagem mais antiga que a atual (reentrega fora de ordem) não troca a prévia
+    is_newer = func.coalesce(ConversationState.last_message_at, text("'-infinity'::timestamp")) <= excluded.last_message_at
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ConversationState.wa_id],
+        set_={
+            "last_message_preview": case((is_newer, excluded.last_message_preview), else_=ConversationState.last_message_preview),
+            "last_direction": case((is_newer, excluded.last_direction), else_=ConversationState.last_direction),
+            "last_message_at": func.greatest(ConversationState.last_message_at, excluded.last_message_at),
+            "last_inbound_at": func.greatest(ConversationState.last_inbound_at, excluded.last_inbound_at),
+            "unread_count": ConversationState.unread_count + excluded.unread_count,
+            "channel_id": func.coalesce(ConversationState.channel_id, excluded.channel_id),
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+
+
+async def recount_unread(db: AsyncSession, wa_ids: list[str]):
+    """
+    Recalcula as não lidas pelo índice parcial de não lidas. Usado depois de mudar o status
+    de mensagens recebidas (mark_as_read, status vindo do provedor), sem perder as que
+    chegaram no meio do caminho.
+    """
+    if not wa_ids:
+        return
+    unread = (
+        select(func.count(Message.id))
+        .where(
+            Message.contact_wa_id == ConversationState.wa_id,
+            Message.direction == "inbound",
+            Message.status == "received",
+        )
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(ConversationState)
+        .where(ConversationState.wa_id.in_(wa_ids))
+        .values(unread_count=unread, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def mark_read(db: AsyncSession, wa_id: str):
+    """Zera as não lidas do contato (chamar depois do UPDATE em messages)."""
+    await recount_unread(db, [wa_id])
+
+
+async def rebuild(db: AsyncSession, wa_id: str | None = None) -> int:
+    """
+    Recalcula o estado a partir de messages (todos os contatos ou um só).
+    Contatos sem mensagens também ganham linha, para continuarem na caixa de entrada.
+    """
+    params = {"wa_id": wa_id}
+    contact_filter = "WHERE c.wa_id = :wa_id" if wa_id else ""
+    result = await db.execute(text(f"""
+        INSERT INTO conversation_state
+            (wa_id, channel_id, last_message_preview, last_message_at, last_direction,
+             unread_count, last_inbound_at, updated_at)
+        SELECT c.wa_id, c.channel_id, last.content, last.timestamp, last.direction,
+               COALESCE(agg.unread, 0), agg.last_inbound_at, now()
+          FROM contacts c
+          LEFT JOIN LATERAL (
+                SELECT left(m.content, {PREVIEW_MAX_CHARS}) AS content, m.timestamp, m.direction
+                  FROM messages m
+                 WHERE m.contact_wa_id = c.wa_id
+                 ORDER BY m.timestamp DESC
+                 LIMIT 1
+          ) last ON true
+          LEFT JOIN LATERAL (
+                SELECT count(*) FILTER (WHERE m.status = 'received') AS unread,
+                       max(m.timestamp) AS last_inbound_at
+                  FROM messages m
+                 WHERE m.contact_wa_id = c.wa_id AND m.direction = 'inbound'
+          ) agg ON true
+          {contact_filter}
+        ON CONFLICT (wa_id) DO UPDATE SET
+            channel_id = EXCLUDED.channel_id,
+            last_message_preview = EXCLUDED.last_message_preview,
+            last_message_at = EXCLUDED.last_message_at,
+            last_direction = EXCLUDED.last_direction,
+            unread_count = EXCLUDED.unread_count,
+            last_inbound_at = EXCLUDED.last_inbound_at,
+            updated_at = EXCLUDED.updated_at
+    """), params)
+    return result.rowcount
+
+
+@event.listens_for(Contact, "after_insert")
+def _create_state(mapper, connection, target):
+    """Todo contato ganha linha (sem mensagens) já na criação, para aparecer na caixa de entrada."""
+    connection.execute(
+        insert(ConversationState)
+        .values(wa_id=target.wa_id, channel_id=target.channel_id, unread_count=0)
+        .on_conflict_do_nothing()
+    )
+
+
+def inbox_query(
+    limit: int,
+    cursor: str | None = None,
+    channel_id: int | None = None,
+    lead_status: str | None = None,
+    assigned_to: int | None = None,
+    unassigned: bool = False,
+    tag_id: int | None = None,
+    unread_only: bool = False,
+    wa_ids: list[str] | None = None,
+):
+    """
+    Caixa de entrada numa única consulta: contato + última mensagem + não lidas + etiquetas,
+    percorrendo ix_conversation_state_inbox na ordem da lista (sem ordenar a tabela toda).
+    Linhas: (ConversationState, Contact, tags). Traz limit + 1 para saber se há próxima página.
+    """
+    cs = ConversationState
+    tags_json = (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(
+                func.json_build_object("id", Tag.id, "name", Tag.name, "color", Tag.color), Tag.id,
+            )),
+            literal_column("'[]'::json"),
+        ))
+        .select_from(contact_tags.join(Tag, Tag.id == contact_tags.c.tag_id))
+        .where(contact_tags.c.contact_wa_id == cs.wa_id)
+        .scalar_subquery()
+    )
+
+    query = (
+        select(cs, Contact, tags_json.label("tags"))
+        .join(Contact, Contact.wa_id == cs.wa_id)
+        .order_by(cs.last_message_at.desc().nullslast(), cs.wa_id.desc())
+        .limit(limit + 1)
+    )
+
+    if channel_id:
+        query = query.where(cs.channel_id == channel_id)
+    if lead_status:
+        query = query.where(Contact.lead_status == lead_status)
+    if unassigned:
+        query = query.where(Contact.assigned_to.is_(None))
+    elif assigned_to:
+        query = query.where(Contact.assigned_to == assigned_to)
+    if tag_id:
+        query = query.where(exists().where(contact_tags.c.contact_wa_id == cs.wa_id, contact_tags.c.tag_id == tag_id))
+    if unread_only:
+        query = query.where(cs.unread_count > 0)
+    if wa_ids is not None:
+        query = query.where(cs.wa_id.in_(wa_ids))
+
+    if cursor:
+        cursor_ts, cursor_wa_id = decode_cursor(cursor)
+        if cursor_ts is None:
+            query = query.where(cs.last_message_at.is_(None), cs.wa_id < cursor_wa_id)
+        else:
+            query = query.where(or_(
+                tuple_(cs.last_message_at, cs.wa_id) < tuple_(cursor_ts, cursor_wa_id),
+                cs.last_message_at.is_(None),
+            ))
+    return query
+
+
+def inbox_row(state: ConversationState, contact: Contact, tags: list | None) -> dict:
+    """Item da caixa de entrada (GET /contacts e evento contact.updated)."""
+    return {
+        "wa_id": contact.wa_id,
+        "name": contact.name or contact.wa_id,
+        "lead_status": contact.lead_status or "novo",
+        "notes": contact.notes,
+        "channel_id": contact.channel_id,
+        "last_message": state.last_message_preview or "",
+        "last_message_time": state.last_message_at.isoformat() if state.last_message_at else None,
+        "direction": state.last_direction,
+        "tags": tags or [],
+        "unread": state.unread_count or 0,
+        "ai_active": contact.ai_active or False,
+        "created_at": contact.created_at.isoformat() if contact.created_at else None,
+        "assigned_to": contact.assigned_to,
+    }
+
+
+def encode_cursor(last_message_at: datetime | None, wa_id: str) -> str:
+    return f"{last_message_at.isoformat() if last_message_at else ''}|{wa_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, str]:
+    ts, _, wa_id = cursor.partition("|")
+    return (datetime.fromisoformat(ts) if ts else None), wa_id
@@ -1,11 +1,16 @@
 import asyncio
 from app.database import engine, Base
 from app.models import Contact, Message, ExactLead
+from app.partitions import ensure_partitions
+import app.metrics  # noqa: F401 — triggers dos rollups (after_create)
+import app.ingestion  # noqa: F401 — trigger de message_ids (after_create)
 
 
 async def create_all():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # messages e activities são particionadas: sem partição não dá para inserir
+        await ensure_partitions(conn)
     print("✅ Tabelas criadas com sucesso!")
 
 
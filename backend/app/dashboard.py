@@ -0,0 +1,246 @@
+"""
+Consultas dos dashboards (GET /api/dashboard/stats e /api/dashboard/advanced).
+Contagens vêm dos rollups (app/metrics.py): contadores por hora de canal/corretor e totais
+atuais de contatos, então o custo não cresce com o histórico. O tempo de primeira resposta
+ainda lê messages, só o período pedido, com funções de janela (exato, sobre todas as
+conversas do período). Período opcional: date_from/date_to (YYYY-MM-DD, inclusive).
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import (
+    Message, Tag, User, contact_tags,
+    MetricsAgentHourly, MetricsChannelHourly, MetricsContactCounts,
+)
+
+# Resposta acima disso não entra na média (provavelmente fora do horário de atendimento)
+FIRST_RESPONSE_MAX = timedelta(hours=24)
+PERIOD_MAX_DAYS = 366
+
+
+def period(date_from: str | None, date_to: str | None, default_days: int) -> tuple[datetime, datetime]:
+    """
+    [início, fim) do período pedido. Sem datas: os últimos `default_days` dias até hoje.
+    ValueError se a data for inválida, o fim vier antes do início ou passar de um ano.
+    """
+    today = date.today()
+    end = date.fromisoformat(date_to) if date_to else today
+    start = date.fromisoformat(date_from) if date_from else end - timedelta(days=default_days - 1)
+    if start > end or (end - start).days >= PERIOD_MAX_DAYS:
+        raise ValueError("Período inválido")
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+def _days(start: datetime, end: datetime) -> list[datetime]:
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+async def stats(db: AsyncSession, channel_id: int | None, start: datetime, end: datetime) -> dict:
+    """Visão geral: totais atuais de metrics_contact_counts + contadores por hora do canal."""
+    now = datetime.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today_start - timedelta(days=today_start.weekday())
+    tomorrow = today_start + timedelta(days=1)
+
+    # --- Contatos atuais por status ---
+    contacts_q = (
+        select(MetricsContactCounts.lead_status.label("status"), func.sum(MetricsContactCounts.contacts).label("total"))
+        .group_by(MetricsContactCounts.lead_status)
+    )
+    if channel_id:
+        contacts_q = contacts_q.where(MetricsContactCounts.channel_id == channel_id)
+    status_counts = {r.status: r.total for r in (await db.execute(contacts_q)).all() if r.total}
+
+    # --- Mensagens e novos contatos: uma linha por dia cobrindo hoje, a semana e o período ---
+    hourly = MetricsChannelHourly
+    day = func.date_trunc("day", hourly.hour)
+    days_q = (
+        select(
+            day.label("day"),
+            func.sum(hourly.inbound).label("inbound"),
+            func.sum(hourly.outbound).label("outbound"),
+            func.sum(hourly.new_contacts).label("new_contacts"),
+            func.sum(hourly.conversions).label("conversions"),
+        )
+        .where(hourly.hour >= min(start, week_start, today_start), hourly.hour < max(end, tomorrow))
+        .group_by(day)
+    )
+    if channel_id:
+        days_q = days_q.where(hourly.channel_id == channel_id)
+    by_day = {row.day: row for row in (await db.execute(days_q)).all()}
+
+    def total(since: datetime, until: datetime, *keys: str) -> int:
+        keys = keys or ("inbound", "outbound")
+        return sum(getattr(row, key) for d, row in by_day.items() if since <= d < until for key in keys)
+
+    return {
+        "total_contacts": sum(status_counts.values()),
+        "new_today": total(today_start, tomorrow, "new_contacts"),
+        "messages_today": total(today_start, tomorrow),
+        "inbound_today": total(today_start, tomorrow, "inbound"),
+        "outbound_today": total(today_start, tomorrow, "outbound"),
+        "messages_week": total(week_start, tomorrow),
+        "status_counts": status_counts,
+        "daily_messages": [
+            {
+                "date": d.strftime("%d/%m"),
+                "day": d.strftime("%a"),
+                "count": total(d, d + timedelta(days=1)),
+            }
+            for d in _days(start, end)
+        ],
+        "period": {
+            "from": start.date().isoformat(),
+            "to": (end - timedelta(days=1)).date().isoformat(),
+            "messages": total(start, end),
+            "inbound": total(start, end, "inbound"),
+            "outbound": total(start, end, "outbound"),
+            "new_contacts": total(start, end, "new_contacts"),
+            "conversions": total(start, end, "conversions"),
+        },
+    }
+
+
+async def first_response(db: AsyncSession, channel_id: int | None, start: datetime, end: datetime) -> dict:
+    """
+    Tempo até a primeira resposta, para toda conversa com mensagem recebida no período:
+    primeira inbound do contato no período -> primeira outbound depois dela (até 24h).
+    Uma passada nas mensagens do período (+24h para achar a resposta) com janela por contato.
+    """
+    filters = [Message.timestamp >= start, Message.timestamp < end + FIRST_RESPONSE_MAX]
+    if channel_id:
+        filters.append(Message.channel_id == channel_id)
+
+    ordered = (
+        select(
+            Message.contact_wa_id,
+            Message.direction,
+            Message.timestamp,
+            func.min(Message.timestamp)
+            .filter(Message.direction == "inbound")
+            .over(partition_by=Message.contact_wa_id)
+            .label("first_in"),
+        )
+        .where(*filters)
+        .subquery()
+    )
+    per_contact = (
+        select(
+            ordered.c.first_in,
+            func.min(ordered.c.timestamp)
+            .filter(ordered.c.direction == "outbound", ordered.c.timestamp > ordered.c.first_in)
+            .label("first_out"),
+        )
+        .where(ordered.c.first_in < end)
+        .group_by(ordered.c.contact_wa_id, ordered.c.first_in)
+        .subquery()
+    )
+    minutes = func.extract("epoch", per_contact.c.first_out - per_contact.c.first_in) / 60
+    answered = and_(
+        per_contact.c.first_out.isnot(None),
+        per_contact.c.first_out - per_contact.c.first_in <= FIRST_RESPONSE_MAX,
+    )
+    row = (await db.execute(
+        select(
+            func.count().label("conversations"),
+            func.count().filter(answered).label("answered"),
+            func.avg(minutes).filter(answered).label("avg_minutes"),
+            func.percentile_cont(0.5).within_group(minutes).filter(answered).label("median_minutes"),
+        )
+    )).one()
+
+    return {
+        "conversations": row.conversations,
+        "answered": row.answered,
+        "avg_minutes": round(float(row.avg_minutes), 1) if row.avg_minutes is not None else None,
+        "median_minutes": round(float(row.median_minutes), 1) if row.median_minutes is not None else None,
+    }
+
+
+async def advanced(db: AsyncSession, channel_id: int | None, start: datetime, end: datetime) -> dict:
+    """Atendentes, conversão, etiquetas, tendência de novos leads e primeira resposta."""
+    previous_start = start - (end - start)
+
+    # --- Contatos atuais por atendente (0 = não atribuídos) ---
+    counts = MetricsContactCounts
+    contacts_q = (
+        select(
+            counts.agent_id,
+            func.sum(counts.contacts).label("leads"),
+            func.coalesce(func.sum(counts.contacts).filter(counts.lead_status == "convertido"), 0).label("converted"),
+        )
+        .group_by(counts.agent_id)
+    )
+    if channel_id:
+        contacts_q = contacts_q.where(counts.channel_id == channel_id)
+    contact_rows = [r for r in (await db.execute(contacts_q)).all() if r.leads]
+
+    # --- Novos contatos no período e no anterior ---
+    hourly = MetricsChannelHourly
+    new_q = select(
+        func.coalesce(func.sum(hourly.new_contacts).filter(hourly.hour >= start), 0).label("new_period"),
+        func.coalesce(func.sum(hourly.new_contacts).filter(hourly.hour < start), 0).label("new_previous"),
+    ).where(hourly.hour >= previous_start, hourly.hour < end)
+    if channel_id:
+        new_q = new_q.where(hourly.channel_id == channel_id)
+    new_counts = (await db.execute(new_q)).one()
+
+    # --- Mensagens enviadas no período por atendente (o do contato quando a mensagem saiu) ---
+    agent_msgs_q = (
+        select(MetricsAgentHourly.agent_id, func.sum(MetricsAgentHourly.outbound).label("messages"))
+        .where(MetricsAgentHourly.hour >= start, MetricsAgentHourly.hour < end)
+        .group_by(MetricsAgentHourly.agent_id)
+    )
+    if channel_id:
+        agent_msgs_q = agent_msgs_q.where(MetricsAgentHourly.channel_id == channel_id)
+    agent_messages = {row.agent_id: row.messages for row in (await db.execute(agent_msgs_q)).all()}
+
+    users_q = await db.execute(select(User.id, User.name).where(User.is_active == True))
+    users_map = {row.id: row.name for row in users_q.all()}
+
+    # --- Leads por tag (top 8) ---
+    tag_count = func.count(contact_tags.c.contact_wa_id)
+    tags_q = await db.execute(
+        select(Tag.name, Tag.color, tag_count)
+        .join(Tag, Tag.id == contact_tags.c.tag_id)
+        .group_by(Tag.name, Tag.color)
+        .order_by(tag_count.desc())
+        .limit(8)
+    )
+
+    response = await first_response(db, channel_id, start, end)
+
+    agents = sorted(
+        (
+            {
+                "user_id": r.agent_id,
+                "name": users_map.get(r.agent_id, f"#{r.agent_id}"),
+                "leads": r.leads,
+                "messages_week": agent_messages.get(r.agent_id, 0),
+            }
+            for r in contact_rows if r.agent_id
+        ),
+        key=lambda x: x["leads"],
+        reverse=True,
+    )
+    total = sum(r.leads for r in contact_rows)
+    converted = sum(r.converted for r in contact_rows)
+    new_this_week = new_counts.new_period
+    new_last_week = new_counts.new_previous
+
+    return {
+        "agents": agents,
+        "unassigned_leads": next((r.leads for r in contact_rows if not r.agent_id), 0),
+        "conversion_rate": round((converted / total * 100), 1) if total > 0 else 0,
+        "converted": converted,
+        "total": total,
+        "tags": [{"name": r[0], "color": r[1], "count": r[2]} for r in tags_q.all()],
+        "new_this_week": new_this_week,
+        "new_last_week": new_last_week,
+        "trend_pct": round(((new_this_week - new_last_week) / max(new_last_week, 1)) * 100, 1),
+        "avg_response_minutes": response["avg_minutes"],
+        "first_response": response,
+        "period": {"from": start.date().isoformat(), "to": (end - timedelta(days=1)).date().isoformat()},
+    }
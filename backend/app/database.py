@@ -1,16 +1,103 @@
+import os
+import time
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
-import os
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://localhost:5432/eduflow_db")
+# Réplica de leitura (dashboards, exportações, relatórios). Sem ela, usa o banco principal.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Cache de prepared statements por conexão (0 desliga; necessário atrás de PgBouncer em modo transaction)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_READ_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_READ_STATEMENT_TIMEOUT_MS", str(DB_STATEMENT_TIMEOUT_MS)))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+
+# Contador de comandos enviados ao banco (round trips), usado pelos benchmarks
+db_stats = {"statements": 0}
+
+# Espera para conseguir uma conexão do pool, por engine
+_pool_waits: dict[str, dict] = {}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Pool padrão do engine async que mede quanto tempo cada checkout esperou."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited_ms = (time.perf_counter() - started) * 1000
+            stats = _pool_waits.setdefault(self._metrics_name, {"checkouts": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0})
+            stats["checkouts"] += 1
+            stats["total_wait_ms"] += waited_ms
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited_ms)
+
+
+def _build_engine(url: str, name: str, pool_size: int, max_overflow: int, statement_timeout_ms: int, read_only: bool = False):
+    server_settings = {"application_name": f"imbohub-{name}"}
+    if statement_timeout_ms > 0:
+        server_settings["statement_timeout"] = str(statement_timeout_ms)
+    if read_only:
+        server_settings["default_transaction_read_only"] = "on"
+
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args = {
+            # Cache do asyncpg e o cache de prepared statements do dialeto do SQLAlchemy
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        }
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+    new_engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    new_engine.sync_engine.pool._metrics_name = name
+
+    @event.listens_for(new_engine.sync_engine, "before_cursor_execute")
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        db_stats["statements"] += 1
+
+    return new_engine
+
+
+engine = _build_engine(DATABASE_URL, "primary", DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS)
 
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+if DATABASE_READ_URL:
+    read_engine = _build_engine(
+        DATABASE_READ_URL, "replica", DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW,
+        DB_READ_STATEMENT_TIMEOUT_MS, read_only=True,
+    )
+else:
+    read_engine = engine
+
+async_read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
 
 class Base(DeclarativeBase):
     pass
@@ -18,4 +105,34 @@ class Base(DeclarativeBase):
 
 async def get_db():
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+async def get_read_db():
+    """Sessão somente leitura (réplica, se configurada) para dashboards, exportações e relatórios."""
+    async with async_read_session() as session:
+        yield session
+
+
+def pool_metrics() -> dict:
+    """Conexões em uso/livres e tempo de espera no checkout de cada pool."""
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+
+    metrics = {}
+    for name, eng in engines.items():
+        pool = eng.sync_engine.pool
+        waits = _pool_waits.get(name, {"checkouts": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0})
+        metrics[name] = {
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": waits["checkouts"],
+            "avg_wait_ms": round(waits["total_wait_ms"] / waits["checkouts"], 3) if waits["checkouts"] else 0.0,
+            "max_wait_ms": round(waits["max_wait_ms"], 3),
+        }
+    metrics["statements"] = db_stats["statements"]
+    return metrics
@@ -0,0 +1,101 @@
+"""
+Armazenamento dos embeddings da base de conhecimento (knowledge_documents).
+A coluna embedding guardava o vetor em JSON: ~30 KB de texto para 1536 dimensões e um
+json.loads a cada leitura. Agora o vetor fica em embedding_vec como float32 empacotado
+(little-endian, 6 KB para 1536 dimensões), com embedding_dim e embedding_model ao lado; a
+leitura é numpy.frombuffer direto sobre os bytes, sem parse nem cópia.
+
+Linhas antigas (só JSON) continuam legíveis até python -m app.migrate_knowledge_embeddings
+convertê-las.
+
+pgvector (opcional): com a extensão instalada e a migração rodada com --pgvector, a coluna
+embedding_pgv vector(N) com índice HNSW guarda o mesmo vetor, e KNOWLEDGE_SEARCH_BACKEND=pgvector
+(app/knowledge_index.py) faz o top-k no próprio Postgres em vez do índice em memória. A
+presença da coluna é lida uma vez por processo: depois da migração, reinicie os workers.
+"""
+import os
+import json
+
+import numpy as np
+from sqlalchemy import text
+
+# Candidatos examinados pelo HNSW por consulta (padrão do pgvector: 40); mais = recall maior
+KNOWLEDGE_PGVECTOR_EF_SEARCH = int(os.getenv("KNOWLEDGE_PGVECTOR_EF_SEARCH", "100"))
+# Ordem de bytes fixa: o banco não depende da arquitetura do servidor que gravou
+EMBEDDING_DTYPE = np.dtype("<f4")
+PGVECTOR_COLUMN = "embedding_pgv"
+
+_pgvector: dict = {}
+
+
+def pack(vector) -> bytes:
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def unpack(raw: bytes) -> np.ndarray:
+    """Vetor somente leitura apontando para os próprios bytes (sem cópia)."""
+    return np.frombuffer(raw, dtype=EMBEDDING_DTYPE)
+
+
+def columns(vector, model: str) -> dict:
+    """Valores das colunas de embedding de um KnowledgeDocument novo."""
+    return {"embedding_vec": pack(vector), "embedding_dim": len(vector), "embedding_model": model}
+
+
+def decode(raw: bytes | None, legacy: str | None) -> np.ndarray | None:
+    """Vetor de uma linha: embedding_vec se houver, senão o JSON antigo; None se ilegível."""
+    if raw is not None:
+        return unpack(raw)
+    if legacy is None:
+        return None
+    try:
+        return np.asarray(json.loads(legacy), dtype=np.float32)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return None
+
+
+# ============================================================
+# PGVECTOR (OPCIONAL)
+# ============================================================
+
+async def pgvector_dim(db) -> int | None:
+    """Dimensão de knowledge_documents.embedding_pgv, ou None se a coluna não existe."""
+    if "dim" not in _pgvector:
+        result = await db.execute(text("""
+            SELECT atttypmod FROM pg_attribute
+             WHERE attrelid = to_regclass('knowledge_documents') AND attname = :column AND NOT attisdropped
+        """), {"column": PGVECTOR_COLUMN})
+        dim = result.scalar()
+        _pgvector["dim"] = dim if dim and dim > 0 else None
+    return _pgvector["dim"]
+
+
+def to_pgvector(vector) -> str:
+    return json.dumps(np.asarray(vector, dtype=np.float32).tolist())
+
+
+async def store_pgvector(db, rows: list[tuple[int, list[float]]]):
+    """Preenche embedding_pgv dos ids informados (nada se a coluna não existe)."""
+    dim = await pgvector_dim(db)
+    rows = [(doc_id, vector) for doc_id, vector in rows if dim and len(vector) == dim]
+    if not rows:
+        return
+    await db.execute(text(f"""
+        UPDATE knowledge_documents d SET {PGVECTOR_COLUMN} = CAST(t.v AS vector)
+          FROM unnest(CAST(:ids AS int[]), CAST(:vectors AS text[])) AS t(id, v)
+         WHERE d.id = t.id
+    """), {"ids": [doc_id for doc_id, _ in rows], "vectors": [to_pgvector(v) for _, v in rows]})
+
+
+async def pgvector_top_k(db, channel_id: int, query, top_k: int) -> list[tuple[int, float]]:
+    """(id, cosseno) dos top_k chunks do canal pelo índice HNSW de embedding_pgv."""
+    # Vale só para a transação corrente
+    await db.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": str(KNOWLEDGE_PGVECTOR_EF_SEARCH)})
+    result = await db.execute(text(f"""
+        SELECT id, 1 - ({PGVECTOR_COLUMN} <=> CAST(:q AS vector)) AS score
+          FROM knowledge_documents
+         WHERE channel_id = :channel_id AND {PGVECTOR_COLUMN} IS NOT NULL
+         ORDER BY {PGVECTOR_COLUMN} <=> CAST(:q AS vector)
+         LIMIT :k
+    """), {"q": to_pgvector(query), "channel_id": channel_id, "k": top_k})
+    return [(row.id, float(row.score)) for row in result]
@@ -0,0 +1,274 @@
+"""
+Barramento de eventos entre workers (LISTEN/NOTIFY do Postgres).
+Estado em memória (hub de eventos SSE, caches, fila de webhooks) é por processo; com vários
+workers do uvicorn, o que um worker grava precisa chegar aos outros. publish() encena o
+evento na sessão e, no commit, grava no outbox (bus_events) e dispara pg_notify na mesma
+transação: rollback não publica nada. Cada worker mantém uma conexão LISTEN e entrega os
+eventos aos handlers registrados com subscribe().
+
+Entrega pelo menos uma vez: ao reconectar, o listener relê do outbox o que foi gravado
+enquanto estava fora (janela EVENT_BUS_CATCHUP_SEC) e descarta ids já vistos. Handlers
+devem ser idempotentes. Payload maior que o limite do NOTIFY (8000 bytes) vai só pelo
+outbox: a notificação leva o id e o listener busca o resto na tabela.
+
+Com EVENT_BUS_ENABLED=false (um worker só) os eventos são entregues no próprio processo,
+logo depois do commit.
+"""
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import event as sa_event, insert, text
+from sqlalchemy.orm import Session
+
+from app.database import DATABASE_URL, engine
+from app.models import BusEvent
+
+EVENT_BUS_ENABLED = os.getenv("EVENT_BUS_ENABLED", "false").lower() == "true"
+EVENT_BUS_CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "imbohub_events")
+# O NOTIFY aceita até 8000 bytes; acima disso o payload fica só no outbox
+EVENT_BUS_NOTIFY_MAX_BYTES = int(os.getenv("EVENT_BUS_NOTIFY_MAX_BYTES", "7500"))
+EVENT_BUS_CATCHUP_SEC = float(os.getenv("EVENT_BUS_CATCHUP_SEC", "30"))
+EVENT_BUS_PING_SEC = float(os.getenv("EVENT_BUS_PING_SEC", "5"))
+EVENT_BUS_RETENTION_HOURS = int(os.getenv("EVENT_BUS_RETENTION_HOURS", "24"))
+EVENT_BUS_SEEN_SIZE = int(os.getenv("EVENT_BUS_SEEN_SIZE", "20000"))
+
+# Handler recebe o payload (dict); roda no loop do worker e não deve bloquear
+Handler = Callable[[dict], None]
+
+_STAGED_KEY = "bus_staged"
+_CLEANUP_EVERY_PINGS = 120
+
+_handlers: dict[str, list[Handler]] = {}
+_seen_order: deque[int] = deque()
+_seen: set[int] = set()
+_inbox: asyncio.Queue = asyncio.Queue()
+_tasks: list[asyncio.Task] = []
+_state = {"connected": False, "last_alive": None}
+
+_counters = {
+    "published": 0,
+    "received": 0,
+    "spilled": 0,
+    "fetched": 0,
+    "caught_up": 0,
+    "duplicates": 0,
+    "reconnects": 0,
+    "handler_errors": 0,
+}
+
+
+def subscribe(topic: str, handler: Handler):
+    """Registra um handler para o tópico (todos os workers que registrarem recebem)."""
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def publish(db, topic: str, payload: dict, durable: bool = True):
+    """
+    Publica no commit da sessão `db` (AsyncSession ou Session).
+    durable=False: só NOTIFY, sem outbox (avisos que podem se perder, ex.: acordar workers
+    que de qualquer forma fazem polling). Payload grande sempre vai para o outbox.
+    """
+    db.info.setdefault(_STAGED_KEY, []).append((topic, payload, durable))
+
+
+async def publish_now(topic: str, payload: dict, durable: bool = True):
+    """Publica fora de uma transação da rota (abre e commita a própria)."""
+    from app.database import async_session
+    async with async_session() as db:
+        publish(db, topic, payload, durable)
+        await db.commit()
+
+
+def _notify_message(event_id: int | None, topic: str, payload: dict) -> str | None:
+    """Mensagem do NOTIFY; None se não cabe (vai pelo outbox)."""
+    message = json.dumps({"id": event_id, "topic": topic, "payload": payload}, ensure_ascii=False, default=str)
+    return message if len(message.encode()) <= EVENT_BUS_NOTIFY_MAX_BYTES else None
+
+
+@sa_event.listens_for(Session, "before_commit")
+def _write_staged(session):
+    """Outbox + pg_notify dentro da transação (o NOTIFY só é entregue se o commit passar)."""
+    if not EVENT_BUS_ENABLED:
+        return
+    # O flush do commit vem depois deste hook; antecipa para os hooks de flush publicarem
+    # (ex.: invalidação do cache de respostas)
+    session.flush()
+    staged = session.info.pop(_STAGED_KEY, None)
+    if not staged:
+        return
+
+    messages: list[str | None] = []
+    durable = []
+    for topic, payload, is_durable in staged:
+        message = None if is_durable else _notify_message(None, topic, payload)
+        messages.append(message)
+        if message is None:
+            durable.append((len(messages) - 1, topic, payload))
+
+    if durable:
+        result = session.execute(
+            insert(BusEvent).returning(BusEvent.id, sort_by_parameter_order=True),
+            [{"topic": topic, "payload": json.dumps(payload, ensure_ascii=False, default=str)}
+             for _, topic, payload in durable],
+        )
+        for (position, topic, payload), event_id in zip(durable, result.scalars().all()):
+            message = _notify_message(event_id, topic, payload)
+            if message is None:
+                message = json.dumps({"id": event_id, "topic": topic, "spilled": True})
+                _counters["spilled"] += 1
+            messages[position] = message
+
+    session.execute(
+        text("SELECT pg_notify(:channel, m) FROM unnest(CAST(:messages AS text[])) WITH ORDINALITY AS t(m, n) ORDER BY n"),
+        {"channel": EVENT_BUS_CHANNEL, "messages": messages},
+    )
+    _counters["published"] += len(messages)
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _deliver_local(session):
+    """Sem barramento: entrega no próprio processo, depois do commit."""
+    staged = session.info.pop(_STAGED_KEY, None)
+    for topic, payload, _ in staged or []:
+        _counters["published"] += 1
+        _dispatch(topic, payload)
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _discard_staged(session):
+    session.info.pop(_STAGED_KEY, None)
+
+
+def _dispatch(topic: str, payload: dict, event_id: int | None = None):
+    if event_id is not None:
+        if event_id in _seen:
+            _counters["duplicates"] += 1
+            return
+        _seen.add(event_id)
+        _seen_order.append(event_id)
+        if len(_seen_order) > EVENT_BUS_SEEN_SIZE:
+            _seen.discard(_seen_order.popleft())
+    _counters["received"] += 1
+    for handler in _handlers.get(topic, []):
+        try:
+            handler(payload)
+        except Exception as e:
+            _counters["handler_errors"] += 1
+            print(f"❌ Erro no handler do barramento [{topic}]: {e}")
+
+
+# ============================================================
+# LISTENER (um por worker)
+# ============================================================
+
+def _dsn() -> str:
+    return DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+
+
+def _on_notify(connection, pid, channel, message):
+    _inbox.put_nowait(message)
+
+
+async def _consume():
+    """Entrega as notificações na ordem; payloads grandes são buscados no outbox."""
+    while True:
+        raw = await _inbox.get()
+        try:
+            message = json.loads(raw)
+            payload = message.get("payload")
+            if message.get("spilled"):
+                if message["id"] in _seen:
+                    _counters["duplicates"] += 1
+                    continue
+                async with engine.connect() as conn:
+                    result = await conn.execute(
+                        text("SELECT payload FROM bus_events WHERE id = :id"), {"id": message["id"]}
+                    )
+                    stored = result.scalar()
+                if stored is None:
+                    continue
+                payload = json.loads(stored)
+                _counters["fetched"] += 1
+            _dispatch(message["topic"], payload, message.get("id"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Erro ao processar notificação do barramento: {e}")
+
+
+async def _catch_up(conn: asyncpg.Connection, since):
+    """Relê do outbox o que foi gravado enquanto o LISTEN estava fora (ids vistos são ignorados)."""
+    rows = await conn.fetch(
+        "SELECT id, topic, payload FROM bus_events WHERE created_at >= $1::timestamp - make_interval(secs => $2) ORDER BY id",
+        since, EVENT_BUS_CATCHUP_SEC,
+    )
+    missed = [r for r in rows if r["id"] not in _seen]
+    for r in missed:
+        _dispatch(r["topic"], json.loads(r["payload"]), r["id"])
+    _counters["caught_up"] += len(missed)
+    if missed:
+        print(f"♻️ Barramento de eventos: {len(missed)} eventos relidos do outbox")
+
+
+async def _listen_forever():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(
+                _dsn(), server_settings={"application_name": f"imbohub-bus-{os.getpid()}"},
+            )
+            await conn.add_listener(EVENT_BUS_CHANNEL, _on_notify)
+            _state["connected"] = True
+            if _state["last_alive"] is not None:
+                await _catch_up(conn, _state["last_alive"])
+            backoff = 1
+            pings = 0
+            while True:
+                _state["last_alive"] = await conn.fetchval("SELECT now()::timestamp")
+                pings += 1
+                if pings % _CLEANUP_EVERY_PINGS == 0:
+                    await conn.execute(
+                        "DELETE FROM bus_events WHERE created_at < now() - make_interval(hours => $1)",
+                        EVENT_BUS_RETENTION_HOURS,
+                    )
+                await asyncio.sleep(EVENT_BUS_PING_SEC)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _counters["reconnects"] += 1
+            print(f"⚠️ Barramento de eventos: conexão LISTEN perdida ({e}); reconectando em {backoff}s")
+        finally:
+            _state["connected"] = False
+            if conn is not None:
+                conn.terminate()
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+async def start():
+    """Sobe o listener e o consumidor (chamado no lifespan quando o barramento está habilitado)."""
+    _tasks.append(asyncio.create_task(_consume()))
+    _tasks.append(asyncio.create_task(_listen_forever()))
+    print(f"📡 Barramento de eventos ativo (LISTEN {EVENT_BUS_CHANNEL}, pid {os.getpid()})")
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def stats() -> dict:
+    return {
+        "enabled": EVENT_BUS_ENABLED,
+        "connected": _state["connected"],
+        "pid": os.getpid(),
+        "pending": _inbox.qsize(),
+        "counters": dict(_counters),
+    }
@@ -0,0 +1,332 @@
+"""
+Eventos em tempo real da caixa de entrada (GET /api/events, Server-Sent Events).
+As rotas "encenam" os eventos na sessão (stage_*) e eles só são publicados depois do
+commit, em todos os workers (via app/event_bus.py); rollback descarta. Cada conexão tem um buffer limitado e um filtro por canal e
+corretor. O id de cada evento é o token de retomada: ao reconectar com Last-Event-ID o
+cliente recebe só o que perdeu (ou um evento resync, se o token for velho demais).
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import event as sa_event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Contact
+from app import conversation_state, event_bus
+
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "256"))
+EVENTS_REPLAY_SIZE = int(os.getenv("EVENTS_REPLAY_SIZE", "5000"))
+EVENTS_HEARTBEAT_SEC = float(os.getenv("EVENTS_HEARTBEAT_SEC", "15"))
+
+EVENT_TYPES = ("message.created", "message.status", "contact.updated", "card.moved")
+
+_BATCH_KEY = "inbox_events"
+
+@dataclass
+class Event:
+    seq: int
+    type: str
+    data: dict
+    channel_id: int | None
+    assignees: frozenset
+
+    def frame(self, epoch: str) -> str:
+        return f"id: {epoch}.{self.seq}\nevent: {self.type}\ndata: {json.dumps(self.data, ensure_ascii=False, default=str)}\n\n"
+
+
+class Subscription:
+    """Uma conexão: filtro + buffer limitado. Estourou o buffer, o cliente recebe resync."""
+
+    def __init__(self, channel_id: int | None, assigned_to: int | None, unassigned: bool, buffer_size: int):
+        self.channel_id = channel_id
+        self.assigned_to = assigned_to
+        self.unassigned = unassigned
+        self.buffer_size = buffer_size
+        self.buffer: deque[Event] = deque()
+        # Último seq já coberto (replay/resync); overflowed_at = seq do evento que estourou
+        self.start_seq = 0
+        self.overflowed_at: int | None = None
+        self._wakeup = asyncio.Event()
+
+    def matches(self, ev: Event) -> bool:
+        # Mesmos filtros da caixa de entrada (inbox_query)
+        if self.channel_id and ev.channel_id != self.channel_id:
+            return False
+        if self.unassigned:
+            return None in ev.assignees
+        if self.assigned_to:
+            return self.assigned_to in ev.assignees
+        return True
+
+    def push(self, ev: Event) -> bool:
+        if len(self.buffer) >= self.buffer_size:
+            # Cliente lento: descarta o buffer e manda recarregar em vez de crescer sem limite
+            self.buffer.clear()
+            self.overflowed_at = ev.seq
+            self._wakeup.set()
+            return False
+        self.buffer.append(ev)
+        self._wakeup.set()
+        return True
+
+    async def wait(self, timeout: float) -> bool:
+        """Espera por eventos; False se deu o timeout (hora do heartbeat)."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._wakeup.clear()
+        return True
+
+    def drain(self) -> list[Event]:
+        items = list(self.buffer)
+        self.buffer.clear()
+        return items
+
+
+class EventHub:
+    """Distribui os eventos publicados às conexões e guarda os últimos para retomada."""
+
+    def __init__(self, replay_size: int = EVENTS_REPLAY_SIZE, buffer_size: int = EVENTS_BUFFER_SIZE):
+        # Época do processo: token de outro worker (ou de antes de um restart) pede resync
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.buffer_size = buffer_size
+        self._seq = 0
+        self._recent: deque[Event] = deque(maxlen=replay_size)
+        self._subscribers: set[Subscription] = set()
+        self._counters = {
+            "published": 0,
+            "delivered": 0,
+            "replayed": 0,
+            "overflows": 0,
+            "resyncs": 0,
+        }
+
+    @property
+    def token(self) -> str:
+        return f"{self.epoch}.{self._seq}"
+
+    def publish(self, type: str, data: dict, channel_id: int | None = None, assignees: Iterable = (None,)) -> Event:
+        self._seq += 1
+        ev = Event(self._seq, type, data, channel_id, frozenset(assignees))
+        self._recent.append(ev)
+        self._counters["published"] += 1
+        for sub in self._subscribers:
+            if not sub.matches(ev):
+                continue
+            if sub.push(ev):
+                self._counters["delivered"] += 1
+            else:
+                self._counters["overflows"] += 1
+        return ev
+
+    def subscribe(
+        self,
+        channel_id: int | None = None,
+        assigned_to: int | None = None,
+        unassigned: bool = False,
+        resume: str | None = None,
+    ) -> tuple[Subscription, list[Event] | None]:
+        """
+        Registra a conexão e devolve os eventos perdidos desde o token `resume`.
+        None no lugar da lista = não dá para retomar (outra época, token fora do histórico
+        ou replay maior que o buffer): o cliente deve recarregar a caixa de entrada.
+        """
+        sub = Subscription(channel_id, assigned_to, unassigned, self.buffer_size)
+        sub.start_seq = self._seq
+        self._subscribers.add(sub)
+        if not resume:
+            return sub, []
+
+        replay = self._replay(sub, resume)
+        if replay is None:
+            self._counters["resyncs"] += 1
+        else:
+            self._counters["replayed"] += len(replay)
+        return sub, replay
+
+    def _replay(self, sub: Subscription, resume: str) -> list[Event] | None:
+        epoch, _, seq = resume.partition(".")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        # O evento seguinte ao token já saiu do histórico
+        if seq < self._seq and (not self._recent or self._recent[0].seq > seq + 1):
+            return None
+        missed = [ev for ev in self._recent if ev.seq > seq and sub.matches(ev)]
+        if len(missed) > self.buffer_size:
+            return None
+        return missed
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "connections": len(self._subscribers),
+            "buffered": sum(len(s.buffer) for s in self._subscribers),
+            "token": self.token,
+        }
+
+
+hub = EventHub()
+
+
+# ============================================================
+# PUBLICAÇÃO NO COMMIT
+# ============================================================
+
+def stage(db: AsyncSession, type: str, data: dict, channel_id: int | None = None, assignees: Iterable = (None,)):
+    """Publica no commit da sessão, em todos os workers (app/event_bus.py); rollback descarta."""
+    batch = db.info.get(_BATCH_KEY)
+    if batch is None:
+        # Uma mensagem do barramento por transação com todos os eventos dela (serializada no commit)
+        batch = db.info[_BATCH_KEY] = []
+        event_bus.publish(db, "inbox", {"events": batch})
+    batch.append({"type": type, "data": data, "channel_id": channel_id, "assignees": list(assignees)})
+
+
+@sa_event.listens_for(Session, "after_commit")
+@sa_event.listens_for(Session, "after_rollback")
+def _reset_batch(session):
+    session.info.pop(_BATCH_KEY, None)
+
+
+def _on_bus_event(payload: dict):
+    for ev in payload["events"]:
+        hub.publish(ev["type"], ev["data"], ev["channel_id"], ev["assignees"])
+
+
+event_bus.subscribe("inbox", _on_bus_event)
+
+
+def message_payload(m) -> dict:
+    """Mensagem no formato do histórico (GET /contacts/{wa_id}/messages); aceita dict ou Message."""
+    get = m.get if isinstance(m, dict) else (lambda key: getattr(m, key, None))
+    ts = get("timestamp")
+    return {
+        "id": get("id"),
+        "wa_message_id": get("wa_message_id"),
+        "contact_wa_id": get("contact_wa_id"),
+        "direction": get("direction"),
+        "type": get("message_type"),
+        "content": get("content"),
+        "timestamp": ts.isoformat() if ts else None,
+        "status": get("status"),
+        "sent_by_ai": get("sent_by_ai") or False,
+        "channel_id": get("channel_id"),
+    }
+
+
+async def _inbox_rows(db: AsyncSession, wa_ids: set[str]) -> dict:
+    """Linhas da caixa de entrada dos contatos (uma consulta, dentro da transação)."""
+    if not wa_ids:
+        return {}
+    result = await db.execute(conversation_state.inbox_query(len(wa_ids), wa_ids=list(wa_ids)))
+    return {c.wa_id: (state, c, tags) for state, c, tags in result.all()}
+
+
+def _stage_contact(db: AsyncSession, row, notify: Iterable = ()):
+    state, c, tags = row
+    stage(db, "contact.updated", conversation_state.inbox_row(state, c, tags),
+          state.channel_id, {c.assigned_to, *notify})
+
+
+async def stage_messages(db: AsyncSession, created: list = (), statuses: list[dict] = ()):
+    """
+    message.created / message.status e o contact.updated dos contatos afetados.
+    `created`: mensagens com id (dicts do IngestBatch ou objetos Message já no flush);
+    `statuses`: dicts com id, wa_message_id, contact_wa_id, channel_id, direction e status.
+    """
+    wa_ids = {payload["contact_wa_id"] for payload in map(message_payload, created)}
+    # Status só muda a linha da caixa de entrada quando mexe nas não lidas (mensagem recebida)
+    touched = wa_ids | {s["contact_wa_id"] for s in statuses if s["direction"] == "inbound"}
+    rows = await _inbox_rows(db, wa_ids | {s["contact_wa_id"] for s in statuses})
+
+    def assignees(wa_id):
+        row = rows.get(wa_id)
+        return (row[1].assigned_to if row else None,)
+
+    for m in created:
+        payload = message_payload(m)
+        stage(db, "message.created", payload, payload["channel_id"], assignees(payload["contact_wa_id"]))
+    for s in statuses:
+        stage(db, "message.status", {
+            "id": s["id"],
+            "wa_message_id": s["wa_message_id"],
+            "contact_wa_id": s["contact_wa_id"],
+            "status": s["status"],
+        }, s["channel_id"], assignees(s["contact_wa_id"]))
+    for wa_id in touched:
+        if wa_id in rows:
+            _stage_contact(db, rows[wa_id])
+
+
+async def stage_contacts(db: AsyncSession, wa_ids: list[str], notify: Iterable = ()):
+    """
+    contact.updated para contatos alterados por rota (status, notas, corretor, lidas).
+    `notify`: corretores que também devem receber (ex.: o anterior, numa troca de atribuição).
+    """
+    notify = tuple(notify)
+    for row in (await _inbox_rows(db, set(wa_ids))).values():
+        _stage_contact(db, row, notify)
+
+
+async def stage_card_moved(db: AsyncSession, card, previous_status: str | None):
+    result = await db.execute(select(Contact.assigned_to).where(Contact.wa_id == card.contact_wa_id))
+    stage(db, "card.moved", {
+        "id": card.id,
+        "contact_wa_id": card.contact_wa_id,
+        "status": card.status,
+        "previous_status": previous_status,
+    }, card.channel_id, (result.scalar_one_or_none(),))
+
+
+# ============================================================
+# STREAM SSE
+# ============================================================
+
+def _control_frame(name: str, seq: int) -> str:
+    # O id é o seq até onde o cliente está coberto; o que vier depois já está no buffer
+    return f"id: {hub.epoch}.{seq}\nevent: {name}\ndata: {{}}\n\n"
+
+
+async def stream(
+    channel_id: int | None = None,
+    assigned_to: int | None = None,
+    unassigned: bool = False,
+    resume: str | None = None,
+):
+    """
+    Gerador do corpo text/event-stream de uma conexão: replay do que foi perdido, `ready`
+    (ou `resync`, quando o cliente precisa recarregar a caixa de entrada) e os eventos novos.
+    A inscrição acontece aqui dentro para o finally sempre removê-la.
+    """
+    sub, replay = hub.subscribe(channel_id, assigned_to, unassigned, resume)
+    try:
+        yield "retry: 3000\n\n"
+        for ev in replay or []:
+            yield ev.frame(hub.epoch)
+        yield _control_frame("ready" if replay is not None else "resync", sub.start_seq)
+        while True:
+            if not await sub.wait(EVENTS_HEARTBEAT_SEC):
+                # Comentário SSE: mantém proxies/balanceadores com a conexão aberta
+                yield ": ping\n\n"
+                continue
+            if sub.overflowed_at is not None:
+                seq, sub.overflowed_at = sub.overflowed_at, None
+                hub._counters["resyncs"] += 1
+                yield _control_frame("resync", seq)
+            for ev in sub.drain():
+                yield ev.frame(hub.epoch)
+    finally:
+        hub.unsubscribe(sub)
@@ -8,7 +8,10 @@ from openai import AsyncOpenAI
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models import Contact, Message
+from app.ai_engine import drop_current_turn
 from app.evolution.client import send_text
+from app.conversation_state import record_messages
+from app import events
 from datetime import datetime, timezone, timedelta
 
 SP_TZ = timezone(timedelta(hours=-3))
@@ -90,8 +93,12 @@ async def process_message(
     instance_name: str,
     channel_id: int,
     db: AsyncSession,
+    pending_messages: list[str] | None = None,
 ) -> dict:
-    """Processa mensagem do lead e gera resposta da IA."""
+    """
+    Processa mensagem do lead e gera resposta da IA. pending_messages: mensagens seguidas
+    agrupadas em user_message pelo dispatcher, na ordem.
+    """
 
     # Buscar contexto do contato
     contact_result = await db.execute(
@@ -116,6 +123,9 @@ async def process_message(
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "system", "content": f"Dados do lead: Nome={contact_name}, Curso de interesse={course or 'não informado'}"},
     ]
+    # As mensagens do lead já estão no histórico; tirar as do turno atual para não duplicar
+    drop_current_turn(history, user_message, pending_messages)
+
     messages.extend(history)
     messages.append({"role": "user", "content": user_message})
 
@@ -197,6 +207,7 @@ async def process_message(
                 sent_by_ai=True,
             )
             db.add(ai_msg)
+            await record_messages(db, [ai_msg])
 
             # Atualizar dados coletados nas notas do contato
             if contact and any(v for v in collected.values() if v and v != "null"):
@@ -211,6 +222,8 @@ async def process_message(
 
                 contact.notes = json.dumps(existing_notes, ensure_ascii=False)
 
+            await db.flush()
+            await events.stage_messages(db, [ai_msg])
             await db.commit()
 
         return {
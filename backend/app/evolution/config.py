@@ -3,3 +3,13 @@ import os
 EVOLUTION_API_URL = os.getenv("EVOLUTION_API_URL", "http://13.221.209.242:8080")
 EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY", "c4772f6289bb10feced615a15607a38dba72a8eb06efc304")
 EDUFLOW_WEBHOOK_URL = os.getenv("EDUFLOW_WEBHOOK_URL", "https://portal.eduflowia.com/api/evolution/webhook")
+
+# Fila do agente IA: workers globais e limite de mensagens pendentes por contato
+EVOLUTION_AI_WORKERS = int(os.getenv("EVOLUTION_AI_WORKERS", "8"))
+EVOLUTION_AI_MAILBOX_SIZE = int(os.getenv("EVOLUTION_AI_MAILBOX_SIZE", "50"))
+# Intervalo entre tentativas do lock por contato (turno do mesmo lead em outro worker)
+AI_CONTACT_LOCK_POLL_SEC = float(os.getenv("AI_CONTACT_LOCK_POLL_SEC", "0.2"))
+
+# Agrupamento de mensagens seguidas do lead antes de chamar a IA (padrão quando o canal não define)
+AI_COALESCE_WINDOW_MS = int(os.getenv("AI_COALESCE_WINDOW_MS", "2500"))
+AI_COALESCE_MAX_WAIT_MS = int(os.getenv("AI_COALESCE_MAX_WAIT_MS", "8000"))
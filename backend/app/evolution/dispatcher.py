@@ -0,0 +1,141 @@
+"""
+Fila serial por contato para o agente IA da Evolution.
+Cada wa_id tem sua própria caixa de mensagens, processada estritamente em ordem;
+contatos diferentes rodam em paralelo, limitados por um pool global de workers.
+Mensagens seguidas do mesmo lead dentro da janela de agrupamento viram um único turno.
+
+A caixa é do processo: com vários workers do uvicorn, mensagens do mesmo lead podem cair em
+workers diferentes. O `lock` (um por wa_id, ex.: advisory lock do Postgres) faz os turnos do
+mesmo lead esperarem uns pelos outros entre processos; a ordem entre workers é a de chegada
+ao lock. A caixa fica só em memória: jobs pendentes se perdem num restart (o webhook já
+respondeu 200).
+"""
+import asyncio
+from collections import deque
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable
+
+Job = dict
+JobHandler = Callable[[Job], Awaitable[None]]
+JobMerger = Callable[[list[Job]], Job]
+ContactLock = Callable[[str], AsyncContextManager]
+
+
+class ContactDispatcher:
+    """Um "ator" por contato: nunca processa duas mensagens do mesmo lead ao mesmo tempo."""
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        max_workers: int = 8,
+        mailbox_size: int = 50,
+        merger: JobMerger | None = None,
+        lock: ContactLock | None = None,
+    ):
+        self._handler = handler
+        self._merger = merger
+        self._lock = lock
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._mailbox_size = mailbox_size
+        self._max_workers = max_workers
+        self._mailboxes: dict[str, deque] = {}
+        self._signals: dict[str, asyncio.Event] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._counters = {"submitted": 0, "processed": 0, "failed": 0, "dropped": 0}
+        # Por canal: turnos com uma mensagem, turnos agrupados e mensagens absorvidas
+        self._coalescing: dict[str, dict] = {}
+
+    def submit(self, wa_id: str, job: Job) -> bool:
+        """Enfileira um job para o contato. Retorna False se a caixa do contato estiver cheia."""
+        mailbox = self._mailboxes.setdefault(wa_id, deque())
+        if len(mailbox) >= self._mailbox_size:
+            self._counters["dropped"] += 1
+            print(f"⚠️ Fila da IA cheia para {wa_id}, mensagem descartada")
+            return False
+
+        mailbox.append(job)
+        self._counters["submitted"] += 1
+        self._signals.setdefault(wa_id, asyncio.Event()).set()
+
+        if wa_id not in self._tasks:
+            self._tasks[wa_id] = asyncio.create_task(self._drain(wa_id))
+        return True
+
+    async def _drain(self, wa_id: str):
+        mailbox = self._mailboxes[wa_id]
+        try:
+            while mailbox:
+                job = await self._next_turn(wa_id, mailbox)
+                async with self._semaphore:
+                    try:
+                        async with self._lock(wa_id) if self._lock else nullcontext():
+                            await self._handler(job)
+                        self._counters["processed"] += 1
+                    except Exception as e:
+                        self._counters["failed"] += 1
+                        print(f"❌ Erro ao processar mensagem da IA para {wa_id}: {e}")
+        finally:
+            # Sem await entre o teste e a remoção: submit() não consegue se intrometer aqui
+            self._tasks.pop(wa_id, None)
+            if not mailbox:
+                self._mailboxes.pop(wa_id, None)
+                self._signals.pop(wa_id, None)
+
+    async def _next_turn(self, wa_id: str, mailbox: deque) -> Job:
+        """
+        Tira o próximo job da caixa. Se o job pede agrupamento, espera até
+        coalesce_window_ms sem mensagens novas (no máximo coalesce_max_wait_ms
+        desde a primeira) e junta tudo que chegou em um único job.
+        """
+        first = mailbox.popleft()
+        window = (first.get("coalesce_window_ms") or 0) / 1000
+        if not self._merger or window <= 0:
+            self._count_turn(first, 1)
+            return first
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(first.get("coalesce_max_wait_ms") or 0, 0) / 1000
+        signal = self._signals.setdefault(wa_id, asyncio.Event())
+        jobs = [first]
+        while True:
+            while mailbox:
+                jobs.append(mailbox.popleft())
+            remaining = min(window, deadline - loop.time())
+            if remaining <= 0:
+                break
+            signal.clear()
+            try:
+                await asyncio.wait_for(signal.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+
+        self._count_turn(first, len(jobs))
+        return self._merger(jobs) if len(jobs) > 1 else first
+
+    def _count_turn(self, job: Job, size: int):
+        stats = self._coalescing.setdefault(
+            str(job.get("channel_id")), {"single_turns": 0, "merged_turns": 0, "merged_messages": 0}
+        )
+        if size > 1:
+            stats["merged_turns"] += 1
+            stats["merged_messages"] += size
+        else:
+            stats["single_turns"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self._max_workers,
+            "active_contacts": len(self._tasks),
+            "pending_jobs": sum(len(m) for m in self._mailboxes.values()),
+            "counters": dict(self._counters),
+            "coalescing": {channel: dict(c) for channel, c in self._coalescing.items()},
+        }
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._mailboxes.clear()
+        self._signals.clear()
@@ -5,12 +5,20 @@ Gerencia instâncias WhatsApp e recebe webhooks.
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import get_db
+from sqlalchemy import select, text
+from app.database import get_db, async_session, engine
 import json
+import asyncio
+from contextlib import asynccontextmanager
 from app.models import Channel, Contact, Message, Schedule
-from app.models import Channel, Contact, Message
+from app.models import Channel, Contact, Message, AIConfig
 from app.evolution import client
+from app.ingestion import IngestBatch, collect_evolution_messages
+from app.evolution.config import (
+    EVOLUTION_AI_WORKERS, EVOLUTION_AI_MAILBOX_SIZE,
+    AI_COALESCE_WINDOW_MS, AI_COALESCE_MAX_WAIT_MS, AI_CONTACT_LOCK_POLL_SEC,
+)
+from app.evolution.dispatcher import ContactDispatcher
 
 router = APIRouter(prefix="/api/evolution", tags=["Evolution API"])
 
@@ -131,6 +139,142 @@ async def logout_instance(instance_name: str, db: AsyncSession = Depends(get_db)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================================
+# AGENTE IA (fila por contato)
+# ============================================================
+
+async def _run_ai_turn(job: dict):
+    """Processa uma mensagem do lead com o agente IA, fora da requisição do webhook."""
+    phone = job["wa_id"]
+    text = job["text"]
+    sender_name = job["sender_name"]
+    instance_name = job["instance_name"]
+    channel_id = job["channel_id"]
+
+    async with async_session() as db:
+        # A IA pode ter sido desligada enquanto a mensagem esperava na fila
+        contact_check = await db.execute(
+            select(Contact).where(Contact.wa_id == phone)
+        )
+        ct = contact_check.scalar_one_or_none()
+        if not ct or not ct.ai_active:
+            return
+
+        # Processar com agente IA
+        from app.evolution.ai_agent import process_message
+        result = await process_message(
+            wa_id=phone,
+            user_message=text,
+            contact_name=sender_name,
+            instance_name=instance_name,
+            channel_id=channel_id,
+            db=db,
+            pending_messages=job.get("texts"),
+        ) or {}
+
+        action = result.get("action", "continue")
+        merged = f" ({job['merged_count']} msgs agrupadas)" if job.get("merged_count") else ""
+        print(f"🤖 IA respondeu para {phone}{merged}: {result.get('message', '')[:80]} [action={action}]")
+
+        # Disparar ligação se lead aceitou
+        if action == "trigger_call":
+            try:
+                from app.voice_ai_elevenlabs.voice_pipeline import make_outbound_call
+                notes = json.loads(ct.notes or "{}")
+                course = notes.get("course", "Pós-graduação")
+                await make_outbound_call(phone, sender_name, course)
+                print(f"📞 Ligação disparada para {phone}")
+            except Exception as e:
+                print(f"❌ Erro ao disparar ligação: {e}")
+        # Agendar ligação se lead não pode agora
+        elif action == "schedule_call":
+            try:
+                from app.models import Schedule
+                notes_data = json.loads(ct.notes or "{}")
+                course = notes_data.get("course", "Pós-graduação")
+                collected = result.get("collected", {})
+
+                dia = collected.get("dia_agendamento", "")
+                horario = collected.get("horario_agendamento", "")
+
+                if dia and horario:
+                    # Converter dia/horário para datetime
+                    from app.evolution.scheduler import parse_schedule_datetime
+                    scheduled_dt = parse_schedule_datetime(dia, horario)
+
+                    if scheduled_dt:
+                        schedule = Schedule(
+                            type="voice_ai",
+                            contact_wa_id=phone,
+                            contact_name=sender_name,
+                            phone=phone,
+                            course=course,
+                            scheduled_date=scheduled_dt.strftime("%Y-%m-%d"),
+                            scheduled_time=scheduled_dt.strftime("%H:%M"),
+                            scheduled_at=scheduled_dt,
+                            status="pending",
+                            channel_id=channel_id,
+                        )
+                        db.add(schedule)
+                        await db.commit()
+                        print(f"📅 Agendamento criado: {sender_name} → {scheduled_dt}")
+                    else:
+                        print(f"⚠️ Não conseguiu parsear data: dia={dia}, horario={horario}")
+                else:
+                    print(f"⚠️ Agendamento sem dia/horário: {collected}")
+            except Exception as e:
+                print(f"❌ Erro ao agendar: {e}")
+
+
+def _merge_ai_jobs(jobs: list[dict]) -> dict:
+    """Junta mensagens seguidas do lead em um único turno para a IA."""
+    merged = dict(jobs[-1])
+    merged["texts"] = [text for job in jobs for text in job.get("texts", [job["text"]])]
+    merged["text"] = "\n".join(merged["texts"])
+    merged["merged_count"] = len(jobs)
+    return merged
+
+
+@asynccontextmanager
+async def _contact_ai_lock(wa_id: str):
+    """
+    Um turno da IA por lead entre todos os workers do uvicorn: advisory lock de sessão numa
+    conexão em autocommit (sem transação aberta durante a chamada ao LLM). Tenta de novo a
+    cada AI_CONTACT_LOCK_POLL_SEC em vez de bloquear (o statement_timeout cortaria a espera).
+    """
+    params = {"wa_id": wa_id}
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        while not (await conn.execute(text(
+            "SELECT pg_try_advisory_lock(hashtext('evolution.ai'), hashtext(:wa_id))"
+        ), params)).scalar():
+            await asyncio.sleep(AI_CONTACT_LOCK_POLL_SEC)
+        try:
+            yield
+        finally:
+            try:
+                await conn.execute(text("SELECT pg_advisory_unlock(hashtext('evolution.ai'), hashtext(:wa_id))"), params)
+            except Exception:
+                # Conexão com o lock não pode voltar para o pool
+                await conn.invalidate()
+                raise
+
+
+ai_dispatcher = ContactDispatcher(
+    _run_ai_turn,
+    max_workers=EVOLUTION_AI_WORKERS,
+    mailbox_size=EVOLUTION_AI_MAILBOX_SIZE,
+    merger=_merge_ai_jobs,
+    lock=_contact_ai_lock,
+)
+
+
+@router.get("/ai/queue")
+async def ai_queue_stats():
+    """Estado da fila do agente IA (contatos ativos, jobs pendentes, turnos agrupados por canal)."""
+    return ai_dispatcher.stats()
+
+
 # ============================================================
 # WEBHOOK
 # ============================================================
@@ -183,194 +327,59 @@ async def webhook(instance_name: str, request: Request, db: AsyncSession = Depen
             channel = result.scalar_one_or_none()
             channel_id = channel.id if channel else None
 
-            for msg in messages:
-                key = msg.get("key", {})
-                from_me = key.get("fromMe", False)
-                remote_jid = key.get("remoteJid", "")
-                msg_id = key.get("id", "")
-
-                # Ignorar grupos
-                if "@g.us" in remote_jid:
-                    continue
-
-                # Extrair número limpo
-                phone = remote_jid.replace("@s.whatsapp.net", "")
-                sender_name = msg.get("pushName", phone)
-
-                # Extrair texto
-                message_content = msg.get("message", {})
-                msg_type = msg.get("messageType", "text")
-                text = (
-                    message_content.get("conversation", "")
-                    or message_content.get("extendedTextMessage", {}).get("text", "")
-                )
-
-                if not text and msg_type not in ("image", "audio", "video", "document", "sticker"):
-                    continue
-
-                # Direção
-                direction = "outbound" if from_me else "inbound"
-                contact_phone = phone
-
-                # Criar ou atualizar contato (só pra mensagens recebidas)
-                if not from_me:
-                    contact_result = await db.execute(
-                        select(Contact).where(Contact.wa_id == contact_phone)
-                    )
-                    contact = contact_result.scalar_one_or_none()
-
-                    if not contact:
-                        contact = Contact(
-                            wa_id=contact_phone,
-                            name=sender_name,
-                            channel_id=channel_id,
-                            lead_status="novo",
-                        )
-                        db.add(contact)
-                        await db.flush()
-                        print(f"👤 Novo contato: {sender_name} ({contact_phone})")
-                    else:
-                        if sender_name and sender_name != contact_phone:
-                            contact.name = sender_name
-                        if not contact.channel_id and channel_id:
-                            contact.channel_id = channel_id
-
-                # Verificar duplicata
-                existing = await db.execute(
-                    select(Message).where(Message.wa_message_id == msg_id)
-                )
-                if existing.scalar_one_or_none():
-                    continue
-
-                # Conteúdo baseado no tipo
-                if msg_type in ("image", "audio", "video", "document", "sticker"):
-                    media = message_content.get(msg_type, {})
-                    media_id = media.get("id", "")
-                    mime = media.get("mimetype", "")
-                    caption = media.get("caption", "")
-                    text = f"media:{media_id}|{mime}|{caption}"
-
-                # Timestamp
-                ts = msg.get("messageTimestamp", 0)
-                from datetime import datetime, timezone, timedelta
-                SP_TZ = timezone(timedelta(hours=-3))
-                msg_time = datetime.fromtimestamp(int(ts), tz=SP_TZ).replace(tzinfo=None) if ts else datetime.now(SP_TZ).replace(tzinfo=None)
-
-                # Salvar mensagem
-                new_msg = Message(
-                    wa_message_id=msg_id,
-                    contact_wa_id=contact_phone,
-                    channel_id=channel_id,
-                    direction=direction,
-                    message_type=msg_type if msg_type != "conversation" else "text",
-                    content=text,
-                    timestamp=msg_time,
-                    status="received" if not from_me else "sent",
-                )
-                db.add(new_msg)
-
-                # Atualizar updated_at do contato
-                if not from_me:
-                    contact_update = await db.execute(
-                        select(Contact).where(Contact.wa_id == contact_phone)
-                    )
-                    ct = contact_update.scalar_one_or_none()
-                    if ct:
-                        ct.updated_at = msg_time
-
-                print(f"💬 {'📤' if from_me else '📥'} [{instance_name}] {sender_name} ({contact_phone}): {text[:100]}")
-
+            # Gravar contatos e mensagens do payload em lote (duplicadas são ignoradas)
+            batch = IngestBatch()
+            parsed = collect_evolution_messages(messages, batch, channel_id)
+            inserted = await batch.flush(db)
             await db.commit()
-            # === AGENTE IA: Responder se ai_active ===
-            for msg in messages:
-                key = msg.get("key", {})
-                if key.get("fromMe", False):
-                    continue
-                remote_jid = key.get("remoteJid", "")
-                if "@g.us" in remote_jid:
-                    continue
 
-                phone = remote_jid.replace("@s.whatsapp.net", "")
-                sender_name = msg.get("pushName", phone)
+            inserted_ids = {m["wa_message_id"] for m in inserted}
+            for item in parsed:
+                from_me = item["from_me"]
+                print(f"💬 {'📤' if from_me else '📥'} [{instance_name}] {item['sender_name']} ({item['phone']}): {item['content'][:100]}")
 
-                message_content = msg.get("message", {})
-                text = (
-                    message_content.get("conversation", "")
-                    or message_content.get("extendedTextMessage", {}).get("text", "")
+            # === AGENTE IA: Responder se ai_active ===
+            # Só mensagens de texto novas (reentregas do webhook não geram resposta duplicada)
+            ai_items = [
+                item for item in parsed
+                if not item["from_me"] and item["text"] and item["wa_message_id"] in inserted_ids
+            ]
+            ai_contacts = {}
+            if ai_items:
+                contacts_result = await db.execute(
+                    select(Contact).where(
+                        Contact.wa_id.in_({item["phone"] for item in ai_items}),
+                        Contact.ai_active == True,
+                    )
                 )
-                if not text:
-                    continue
-
-                # Verificar se IA está ativa para este contato
-                contact_check = await db.execute(
-                    select(Contact).where(Contact.wa_id == phone)
+                ai_contacts = {c.wa_id: c for c in contacts_result.scalars().all()}
+
+            # Janela de agrupamento do canal (AIConfig) ou padrão do servidor
+            coalesce_window_ms = AI_COALESCE_WINDOW_MS
+            coalesce_max_wait_ms = AI_COALESCE_MAX_WAIT_MS
+            if ai_contacts and channel_id:
+                config_result = await db.execute(
+                    select(AIConfig).where(AIConfig.channel_id == channel_id)
                 )
-                ct = contact_check.scalar_one_or_none()
-                if not ct or not ct.ai_active:
+                ai_config = config_result.scalar_one_or_none()
+                if ai_config and ai_config.coalesce_window_ms is not None:
+                    coalesce_window_ms = ai_config.coalesce_window_ms
+                if ai_config and ai_config.coalesce_max_wait_ms is not None:
+                    coalesce_max_wait_ms = ai_config.coalesce_max_wait_ms
+
+            # Resposta da IA sai da requisição: fila serial por contato, em ordem de chegada
+            for item in ai_items:
+                if item["phone"] not in ai_contacts:
                     continue
-
-                # Processar com agente IA
-                from app.evolution.ai_agent import process_message
-                result = await process_message(
-                    wa_id=phone,
-                    user_message=text,
-                    contact_name=sender_name,
-                    instance_name=instance_name,
-                    channel_id=channel_id,
-                    db=db,
-                )
-
-                action = result.get("action", "continue")
-                print(f"🤖 IA respondeu para {phone}: {result.get('message', '')[:80]} [action={action}]")
-
-                # Disparar ligação se lead aceitou
-                if action == "trigger_call":
-                    try:
-                        from app.voice_ai_elevenlabs.voice_pipeline import make_outbound_call
-                        notes = json.loads(ct.notes or "{}")
-                        course = notes.get("course", "Pós-graduação")
-                        await make_outbound_call(phone, sender_name, course)
-                        print(f"📞 Ligação disparada para {phone}")
-                    except Exception as e:
-                        print(f"❌ Erro ao disparar ligação: {e}")
-                # Agendar ligação se lead não pode agora
-                elif action == "schedule_call":
-                    try:
-                        from app.models import Schedule
-                        notes_data = json.loads(ct.notes or "{}")
-                        course = notes_data.get("course", "Pós-graduação")
-                        collected = result.get("collected", {})
-
-                        dia = collected.get("dia_agendamento", "")
-                        horario = collected.get("horario_agendamento", "")
-
-                        if dia and horario:
-                            # Converter dia/horário para datetime
-                            from app.evolution.scheduler import parse_schedule_datetime
-                            scheduled_dt = parse_schedule_datetime(dia, horario)
-
-                            if scheduled_dt:
-                                schedule = Schedule(
-                                    type="voice_ai",
-                                    contact_wa_id=phone,
-                                    contact_name=sender_name,
-                                    phone=phone,
-                                    course=course,
-                                    scheduled_date=scheduled_dt.strftime("%Y-%m-%d"),
-                                    scheduled_time=scheduled_dt.strftime("%H:%M"),
-                                    scheduled_at=scheduled_dt,
-                                    status="pending",
-                                    channel_id=channel_id,
-                                )
-                                db.add(schedule)
-                                await db.commit()
-                                print(f"📅 Agendamento criado: {sender_name} → {scheduled_dt}")
-                            else:
-                                print(f"⚠️ Não conseguiu parsear data: dia={dia}, horario={horario}")
-                        else:
-                            print(f"⚠️ Agendamento sem dia/horário: {collected}")
-                    except Exception as e:
-                        print(f"❌ Erro ao agendar: {e}")
+                ai_dispatcher.submit(item["phone"], {
+                    "wa_id": item["phone"],
+                    "text": item["text"],
+                    "sender_name": item["sender_name"],
+                    "instance_name": instance_name,
+                    "channel_id": channel_id,
+                    "coalesce_window_ms": coalesce_window_ms,
+                    "coalesce_max_wait_ms": coalesce_max_wait_ms,
+                })
 
         return {"status": "ok"}
 
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import ExactLead
 from app.exact_spotter import sync_exact_leads
 
@@ -59,7 +59,7 @@ async def trigger_sync(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/stats")
-async def exact_leads_stats(db: AsyncSession = Depends(get_db)):
+async def exact_leads_stats(db: AsyncSession = Depends(get_read_db)):
     total = await db.execute(select(func.count(ExactLead.id)))
     total = total.scalar()
 
@@ -154,6 +154,7 @@ async def bulk_send_template(
     db: AsyncSession = Depends(get_db)
 ):
     from app.models import Channel, Contact, Message
+    from app.conversation_state import record_messages
     from app.whatsapp import send_template_message
     from datetime import datetime, timedelta, timezone
     import asyncio
@@ -240,6 +241,7 @@ async def bulk_send_template(
                     status="sent",
                 )
                 db.add(msg)
+                await record_messages(db, [msg])
                 sent += 1
             else:
                 failed += 1
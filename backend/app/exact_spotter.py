@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models import ExactLead, Contact, Channel, Message, AIConversationSummary
 from app.whatsapp import send_template_message
+from app.conversation_state import record_messages
 
 BASE_URL = "https://api.exactspotter.com/v3"
 
@@ -173,6 +174,7 @@ async def send_welcome_to_new_lead(lead_data: dict, db: AsyncSession):
             status="sent",
         )
         db.add(message)
+        await record_messages(db, [message])
 
         # Criar card no Kanban
         summary = AIConversationSummary(
@@ -6,7 +6,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 import io
 
-from app.database import get_db
+from app.database import get_read_db
 from app.models import Contact, Message, User, Tag, contact_tags
 from app.auth import get_current_user
 
@@ -71,7 +71,7 @@ STATUS_LABELS = {
 async def export_contacts(
     channel_id: Optional[int] = None,
     status: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
 ):
     """Exporta relatório de contatos em Excel"""
@@ -184,7 +184,7 @@ async def export_contacts(
 @router.get("/pipeline")
 async def export_pipeline(
     channel_id: Optional[int] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
 ):
     """Exporta relatório do funil/pipeline em Excel"""
@@ -262,7 +262,7 @@ async def export_pipeline(
 async def export_messages(
     days: int = Query(default=7, ge=1, le=90),
     channel_id: Optional[int] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(get_current_user),
 ):
     """Exporta relatório de mensagens dos últimos N dias"""
@@ -0,0 +1,350 @@
+"""
+Ingestão em lote de webhooks (Meta e Evolution).
+Junta todos os contatos, mensagens e status de um payload (ou de um micro-lote
+de payloads) e grava tudo com poucos comandos set-based, em vez de um SELECT por item.
+"""
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import event, select, update, values, column, String, func, case, or_, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Base
+from app.models import Channel, Contact, Message, MessageId
+from app.conversation_state import record_messages, recount_unread
+from app import events
+
+SP_TZ = timezone(timedelta(hours=-3))
+
+# asyncpg aceita até 32767 parâmetros por comando; 1000 linhas cabem com folga
+MAX_ROWS_PER_STATEMENT = 1000
+
+EVOLUTION_MEDIA_TYPES = ("image", "audio", "video", "document", "sticker")
+
+
+def _now() -> datetime:
+    return datetime.now(SP_TZ).replace(tzinfo=None)
+
+
+def _chunks(rows: list, size: int = MAX_ROWS_PER_STATEMENT):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+# Todo INSERT em messages (ingestão, rotas, IA, SQL manual) registra o id em message_ids.
+# Um comando por item (o asyncpg não aceita vários num execute)
+MESSAGE_IDS_SETUP_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION message_ids_register() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO message_ids (wa_message_id)
+        SELECT DISTINCT wa_message_id FROM message_ids_new_messages ORDER BY 1
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_message_ids ON messages",
+    """
+    CREATE TRIGGER trg_message_ids AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS message_ids_new_messages
+    FOR EACH STATEMENT EXECUTE FUNCTION message_ids_register()
+    """,
+]
+
+
+async def setup(conn):
+    """Cria/atualiza a função e o trigger de message_ids (idempotente)."""
+    for sql in MESSAGE_IDS_SETUP_SQL:
+        await conn.execute(text(sql))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_message_ids_trigger(target, connection, **kw):
+    if "message_ids" in target.tables:
+        for sql in MESSAGE_IDS_SETUP_SQL:
+            connection.execute(text(sql))
+
+
+async def claim_message_ids(db: AsyncSession, wa_message_ids: list[str]) -> set[str]:
+    """
+    Reserva os ids em message_ids e devolve só os que ainda não existiam (mensagens novas).
+    Outra transação gravando o mesmo id espera o commit dela; em ordem de chave para não dar
+    deadlock entre lotes.
+    """
+    claimed = set()
+    for chunk in _chunks(sorted(set(wa_message_ids))):
+        result = await db.execute(
+            insert(MessageId)
+            .values([{"wa_message_id": wa_message_id} for wa_message_id in chunk])
+            .on_conflict_do_nothing(index_elements=[MessageId.wa_message_id])
+            .returning(MessageId.wa_message_id)
+        )
+        claimed.update(result.scalars().all())
+    return claimed
+
+
+class IngestBatch:
+    """Acumula contatos, mensagens e status e grava tudo em um flush()."""
+
+    def __init__(self):
+        self.contacts: dict[str, dict] = {}
+        self.messages: dict[str, dict] = {}
+        self.statuses: dict[str, str] = {}
+
+    def add_contact(self, wa_id: str, name: str, channel_id: int | None, updated_at: datetime | None = None):
+        # Último dado do lote vence (mesmo comportamento do processamento item a item)
+        previous = self.contacts.get(wa_id)
+        self.contacts[wa_id] = {
+            "wa_id": wa_id,
+            "name": name or (previous["name"] if previous else ""),
+            "channel_id": channel_id or (previous["channel_id"] if previous else None),
+            "lead_status": "novo",
+            "updated_at": updated_at or _now(),
+        }
+
+    def add_message(
+        self,
+        wa_message_id: str,
+        contact_wa_id: str,
+        channel_id: int | None,
+        direction: str,
+        message_type: str,
+        content: str,
+        timestamp: datetime,
+        status: str,
+    ):
+        if wa_message_id in self.messages:
+            return
+        self.messages[wa_message_id] = {
+            "wa_message_id": wa_message_id,
+            "contact_wa_id": contact_wa_id,
+            "channel_id": channel_id,
+            "direction": direction,
+            "message_type": message_type,
+            "content": content,
+            "timestamp": timestamp,
+            "status": status,
+            "sent_by_ai": False,
+        }
+
+    def add_status(self, wa_message_id: str, status: str):
+        self.statuses[wa_message_id] = status
+
+    def __len__(self):
+        return len(self.contacts) + len(self.messages) + len(self.statuses)
+
+    async def flush(self, db: AsyncSession) -> list[dict]:
+        """
+        Grava o lote (sem commit). Retorna as mensagens efetivamente inseridas,
+        já sem as duplicadas que o provedor reenviou.
+        """
+        await self._upsert_contacts(db)
+        inserted = await self._insert_messages(db)
+        await record_messages(db, inserted)
+        statuses = await self._update_statuses(db)
+        await events.stage_messages(db, inserted, statuses)
+        return inserted
+
+    async def _upsert_contacts(self, db: AsyncSession):
+        rows = list(self.contacts.values())
+        for chunk in _chunks(rows):
+            stmt = insert(Contact).values(chunk)
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Contact.wa_id],
+                set_={
+                    # Nome vazio ou igual ao telefone não sobrescreve o nome salvo
+                    "name": case(
+                        (or_(excluded.name.is_(None), excluded.name == "", excluded.name == excluded.wa_id), Contact.name),
+                        else_=excluded.name,
+                    ),
+                    "channel_id": func.coalesce(Contact.channel_id, excluded.channel_id),
+                    "updated_at": excluded.updated_at,
+                },
+            )
+            await db.execute(stmt)
+
+    async def _insert_messages(self, db: AsyncSession) -> list[dict]:
+        # A chave única de messages inclui o timestamp: a deduplicação é por message_ids
+        claimed = await claim_message_ids(db, list(self.messages))
+        rows = [row for row in self.messages.values() if row["wa_message_id"] in claimed]
+        inserted_ids = {}
+        for chunk in _chunks(rows):
+            stmt = (
+                insert(Message)
+                .values(chunk)
+                .on_conflict_do_nothing()
+                .returning(Message.id, Message.wa_message_id)
+            )
+            result = await db.execute(stmt)
+            inserted_ids.update((r.wa_message_id, r.id) for r in result.all())
+        return [{**row, "id": inserted_ids[row["wa_message_id"]]} for row in rows if row["wa_message_id"] in inserted_ids]
+
+    async def _update_statuses(self, db: AsyncSession) -> list[dict]:
+        """Aplica os status; retorna as mensagens alteradas (para os eventos message.status)."""
+        items = list(self.statuses.items())
+        changed = []
+        for chunk in _chunks(items):
+            v = values(
+                column("wa_message_id", String),
+                column("status", String),
+                name="v",
+            ).data(chunk)
+            result = await db.execute(
+                update(Message)
+                .where(Message.wa_message_id == v.c.wa_message_id)
+                .values(status=v.c.status)
+                .returning(Message.id, Message.wa_message_id, Message.contact_wa_id, Message.channel_id,
+                           Message.direction, Message.status)
+                .execution_options(synchronize_session=False)
+            )
+            rows = [dict(row._mapping) for row in result.all()]
+            changed.extend(rows)
+            # Status em mensagem recebida muda as não lidas da conversa
+            inbound = {row["contact_wa_id"] for row in rows if row["direction"] == "inbound"}
+            await recount_unread(db, list(inbound))
+        return changed
+
+
+# ============================================================
+# META (WhatsApp Cloud API)
+# ============================================================
+
+async def resolve_meta_channels(payloads: list[dict], db: AsyncSession) -> dict[str, int]:
+    """Mapeia phone_number_id -> channel_id para todos os payloads com uma única consulta."""
+    phone_ids = {
+        change.get("value", {}).get("metadata", {}).get("phone_number_id")
+        for body in payloads
+        for entry in body.get("entry", [])
+        for change in entry.get("changes", [])
+    }
+    phone_ids.discard(None)
+    if not phone_ids:
+        return {}
+
+    result = await db.execute(
+        select(Channel.phone_number_id, Channel.id).where(Channel.phone_number_id.in_(phone_ids))
+    )
+    return {row[0]: row[1] for row in result.all()}
+
+
+def meta_message_content(msg: dict) -> str:
+    """Converte a mensagem da Meta no formato de conteúdo salvo no banco."""
+    msg_type = msg["type"]
+    if msg_type == "text":
+        return msg["text"]["body"]
+    if msg_type == "image":
+        media = msg.get("image", {})
+        return f'media:{media.get("id", "")}|{media.get("mime_type", "image/jpeg")}|{media.get("caption", "")}'
+    if msg_type == "audio":
+        media = msg.get("audio", {})
+        return f'media:{media.get("id", "")}|{media.get("mime_type", "audio/ogg")}|'
+    if msg_type == "video":
+        media = msg.get("video", {})
+        return f'media:{media.get("id", "")}|{media.get("mime_type", "video/mp4")}|{media.get("caption", "")}'
+    if msg_type == "document":
+        media = msg.get("document", {})
+        return f'media:{media.get("id", "")}|{media.get("mime_type", "")}|{media.get("filename", "documento")}'
+    if msg_type == "sticker":
+        media = msg.get("sticker", {})
+        return f'media:{media.get("id", "")}|{media.get("mime_type", "image/webp")}|'
+    return ""
+
+
+def collect_meta_payload(body: dict, batch: IngestBatch, channels: dict[str, int]):
+    """Adiciona ao lote os contatos, mensagens e status de um payload da Meta."""
+    for entry in body.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            phone_number_id = value.get("metadata", {}).get("phone_number_id")
+            channel_id = channels.get(phone_number_id)
+
+            for contact_data in value.get("contacts", []):
+                batch.add_contact(
+                    wa_id=contact_data["wa_id"],
+                    name=contact_data.get("profile", {}).get("name", ""),
+                    channel_id=channel_id,
+                )
+
+            for msg in value.get("messages", []):
+                batch.add_message(
+                    wa_message_id=msg["id"],
+                    contact_wa_id=msg["from"],
+                    channel_id=channel_id,
+                    direction="inbound",
+                    message_type=msg["type"],
+                    content=meta_message_content(msg),
+                    timestamp=datetime.fromtimestamp(int(msg["timestamp"]), tz=SP_TZ).replace(tzinfo=None),
+                    status="received",
+                )
+
+            for status_update in value.get("statuses", []):
+                batch.add_status(status_update["id"], status_update["status"])
+
+
+# ============================================================
+# EVOLUTION API
+# ============================================================
+
+def collect_evolution_messages(messages: list[dict], batch: IngestBatch, channel_id: int | None) -> list[dict]:
+    """
+    Adiciona ao lote as mensagens de um MESSAGES_UPSERT da Evolution.
+    Retorna os itens já normalizados (usados depois pelo agente IA).
+    """
+    parsed = []
+    for msg in messages:
+        key = msg.get("key", {})
+        from_me = key.get("fromMe", False)
+        remote_jid = key.get("remoteJid", "")
+        msg_id = key.get("id", "")
+
+        # Ignorar grupos
+        if "@g.us" in remote_jid:
+            continue
+
+        phone = remote_jid.replace("@s.whatsapp.net", "")
+        sender_name = msg.get("pushName", phone)
+
+        message_content = msg.get("message", {})
+        msg_type = msg.get("messageType", "text")
+        text = (
+            message_content.get("conversation", "")
+            or message_content.get("extendedTextMessage", {}).get("text", "")
+        )
+
+        if not text and msg_type not in EVOLUTION_MEDIA_TYPES:
+            continue
+
+        ts = msg.get("messageTimestamp", 0)
+        msg_time = datetime.fromtimestamp(int(ts), tz=SP_TZ).replace(tzinfo=None) if ts else _now()
+
+        # Contato só é criado/atualizado para mensagens recebidas
+        if not from_me:
+            batch.add_contact(wa_id=phone, name=sender_name, channel_id=channel_id, updated_at=msg_time)
+
+        content = text
+        if msg_type in EVOLUTION_MEDIA_TYPES:
+            media = message_content.get(msg_type, {})
+            content = f"media:{media.get('id', '')}|{media.get('mimetype', '')}|{media.get('caption', '')}"
+
+        batch.add_message(
+            wa_message_id=msg_id,
+            contact_wa_id=phone,
+            channel_id=channel_id,
+            direction="outbound" if from_me else "inbound",
+            message_type=msg_type if msg_type != "conversation" else "text",
+            content=content,
+            timestamp=msg_time,
+            status="received" if not from_me else "sent",
+        )
+
+        parsed.append({
+            "wa_message_id": msg_id,
+            "phone": phone,
+            "sender_name": sender_name,
+            "from_me": from_me,
+            "text": text,
+            "content": content,
+        })
+
+    return parsed
@@ -8,8 +8,9 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import AIConversationSummary, Contact
+from app import events, response_cache
 from app.ai_engine import generate_conversation_summary
 
 router = APIRouter(prefix="/api/kanban", tags=["kanban"])
@@ -66,8 +67,15 @@ async def list_kanban_cards(
 
 # === Estatísticas do Kanban ===
 
+stats_cache = response_cache.register("kanban_stats", domains=("ai_conversation_summaries",))
+
+
 @router.get("/stats")
-async def kanban_stats(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+async def kanban_stats(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_read_db)):
+    return await stats_cache.get({"channel_id": channel_id}, lambda: _kanban_stats(db, channel_id))
+
+
+async def _kanban_stats(db: AsyncSession, channel_id: Optional[int]) -> dict:
     base_filter = []
     if channel_id:
         base_filter.append(AIConversationSummary.channel_id == channel_id)
@@ -119,6 +127,7 @@ async def move_card(card_id: int, req: MoveCardRequest, db: AsyncSession = Depen
     if not card:
         raise HTTPException(status_code=404, detail="Card não encontrado")
 
+    previous_status = card.status
     card.status = req.status
 
     if req.status == "finalizado":
@@ -134,6 +143,7 @@ async def move_card(card_id: int, req: MoveCardRequest, db: AsyncSession = Depen
         if contact:
             contact.ai_active = False
 
+    await events.stage_card_moved(db, card, previous_status)
     await db.commit()
     return {"status": "moved", "new_status": req.status}
 
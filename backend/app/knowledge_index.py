@@ -0,0 +1,256 @@
+"""
+Índice vetorial em memória da base de conhecimento (um por canal, por processo).
+search_knowledge lia todos os KnowledgeDocument do canal a cada mensagem, fazia json.loads
+de cada embedding e calculava o cosseno par a par. Aqui os embeddings do canal ficam numa
+matriz float32 contígua com as linhas já normalizadas: o top-k é um produto
+matriz-vetor + argpartition, e título/conteúdo são buscados só para os k escolhidos.
+
+O índice do canal é montado na primeira busca (uma montagem por canal, mesmo com buscas
+simultâneas). Upload e remoção de documento publicam "knowledge.changed" no barramento
+(app/event_bus.py) com os ids incluídos/removidos; no commit, cada worker que já tem o
+índice do canal aplica a mudança sem remontar. As mudanças de um canal são aplicadas na
+ordem, depois de uma montagem em andamento. Busca em índice grande roda numa thread
+(o numpy solta o GIL), sem travar o loop.
+
+Com KNOWLEDGE_SEARCH_BACKEND=pgvector (e a coluna embedding_pgv migrada) o top-k vai para
+o Postgres e o índice em memória não é montado.
+"""
+import os
+import asyncio
+
+import numpy as np
+from sqlalchemy import or_, select
+
+from app import embedding_store, event_bus
+from app.database import async_session
+from app.models import KnowledgeDocument
+
+# memory: índice em memória deste módulo; pgvector: top-k no Postgres (ver app/embedding_store.py)
+KNOWLEDGE_SEARCH_BACKEND = os.getenv("KNOWLEDGE_SEARCH_BACKEND", "memory").lower()
+# Acima disso (linhas x dimensão) a busca sai do loop para uma thread
+KNOWLEDGE_INDEX_THREAD_MIN = int(os.getenv("KNOWLEDGE_INDEX_THREAD_MIN", "2000000"))
+KNOWLEDGE_INDEX_LOAD_BATCH = int(os.getenv("KNOWLEDGE_INDEX_LOAD_BATCH", "500"))
+
+_indexes: dict[int, "ChannelIndex"] = {}
+_locks: dict[int, asyncio.Lock] = {}
+_tasks: set[asyncio.Task] = set()
+_counters = {"builds": 0, "searches": 0, "added": 0, "removed": 0, "skipped_rows": 0}
+
+
+class ChannelIndex:
+    """
+    Embeddings normalizados de um canal. Linhas novas entram no fim do buffer (a capacidade
+    cresce 50%); remoção gera um buffer novo. Assim uma busca em andamento numa thread
+    continua lendo uma fotografia consistente (ids[:n], buffer[:n]).
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.size = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._buffer = np.empty((0, dim), dtype=np.float32)
+        self._positions: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self._buffer.nbytes + self._ids.nbytes
+
+    def add(self, ids: list[int], vectors: np.ndarray) -> int:
+        """Inclui linhas (ids já presentes são ignorados); devolve quantas entraram."""
+        keep = [i for i, doc_id in enumerate(ids) if doc_id not in self._positions]
+        if not keep:
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32)[keep]
+        norms = np.linalg.norm(vectors, axis=1)
+        valid = norms > 0
+        vectors = vectors[valid] / norms[valid, None]
+        new_ids = [ids[i] for i, ok in zip(keep, valid) if ok]
+
+        needed = self.size + len(new_ids)
+        if needed > len(self._buffer):
+            capacity = max(needed, len(self._buffer) * 3 // 2, 64)
+            buffer = np.empty((capacity, self.dim), dtype=np.float32)
+            buffer[:self.size] = self._buffer[:self.size]
+            ids_array = np.empty(capacity, dtype=np.int64)
+            ids_array[:self.size] = self._ids[:self.size]
+            self._buffer, self._ids = buffer, ids_array
+        self._buffer[self.size:needed] = vectors
+        self._ids[self.size:needed] = new_ids
+        for offset, doc_id in enumerate(new_ids):
+            self._positions[doc_id] = self.size + offset
+        self.size = needed
+        return len(new_ids)
+
+    def remove(self, ids) -> int:
+        """Tira as linhas dos ids informados; devolve quantas saíram."""
+        gone = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+        if not gone:
+            return 0
+        mask = np.ones(self.size, dtype=bool)
+        mask[gone] = False
+        self._buffer = np.ascontiguousarray(self._buffer[:self.size][mask])
+        self._ids = self._ids[:self.size][mask]
+        self.size = len(self._ids)
+        self._positions = {int(doc_id): position for position, doc_id in enumerate(self._ids)}
+        return len(gone)
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray]:
+        return self._ids[:self.size], self._buffer[:self.size]
+
+    @staticmethod
+    def top_k(ids: np.ndarray, matrix: np.ndarray, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+        """(id, cosseno) dos k mais próximos de `query` (já normalizada), do maior para o menor."""
+        if not len(ids) or k <= 0:
+            return []
+        scores = matrix @ query
+        if k < len(scores):
+            best = np.argpartition(scores, -k)[-k:]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+
+def normalize(vector) -> np.ndarray | None:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+def _decode(rows) -> tuple[list[int], list[np.ndarray]]:
+    """Converte (id, embedding_vec, embedding JSON) em vetores; linhas ilegíveis são puladas."""
+    ids, vectors = [], []
+    for doc_id, raw, legacy in rows:
+        vector = embedding_store.decode(raw, legacy)
+        if vector is None:
+            _counters["skipped_rows"] += 1
+            continue
+        ids.append(doc_id)
+        vectors.append(vector)
+    return ids, vectors
+
+
+def _add_rows(index: ChannelIndex | None, ids: list[int], vectors: list[np.ndarray]) -> ChannelIndex | None:
+    """Inclui no índice (criado com a dimensão da primeira linha); dimensão diferente é pulada."""
+    if index is None and vectors:
+        index = ChannelIndex(len(vectors[0]))
+    if index is None:
+        return None
+    same = [i for i, v in enumerate(vectors) if v.shape == (index.dim,)]
+    _counters["skipped_rows"] += len(vectors) - len(same)
+    if same:
+        index.add([ids[i] for i in same], np.stack([vectors[i] for i in same]))
+    return index
+
+
+async def _load(channel_id: int, only_ids: list[int] | None = None):
+    """Lê os embeddings do canal em lotes e decodifica fora do loop."""
+    query = select(
+        KnowledgeDocument.id, KnowledgeDocument.embedding_vec, KnowledgeDocument.embedding,
+    ).where(
+        KnowledgeDocument.channel_id == channel_id,
+        or_(KnowledgeDocument.embedding_vec.isnot(None), KnowledgeDocument.embedding.isnot(None)),
+    ).order_by(KnowledgeDocument.id)
+    if only_ids is not None:
+        query = query.where(KnowledgeDocument.id.in_(only_ids))
+    async with async_session() as db:
+        result = await db.stream(query.execution_options(yield_per=KNOWLEDGE_INDEX_LOAD_BATCH))
+        async for rows in result.partitions():
+            yield await asyncio.to_thread(_decode, rows)
+
+
+def _lock(channel_id: int) -> asyncio.Lock:
+    return _locks.setdefault(channel_id, asyncio.Lock())
+
+
+async def get_index(channel_id: int) -> ChannelIndex | None:
+    """Índice do canal, montado na primeira chamada; None se o canal não tem embeddings."""
+    index = _indexes.get(channel_id)
+    if index is not None:
+        return index
+    async with _lock(channel_id):
+        if channel_id in _indexes:
+            return _indexes[channel_id]
+        index = None
+        async for ids, vectors in _load(channel_id):
+            index = _add_rows(index, ids, vectors)
+        _counters["builds"] += 1
+        if index is not None:
+            _indexes[channel_id] = index
+            print(f"🧭 Índice de conhecimento do canal {channel_id}: {len(index)} chunks "
+                  f"({index.nbytes / 1024 / 1024:.1f} MB)")
+        return index
+
+
+async def search(channel_id: int, query_embedding, top_k: int = 3) -> list[tuple[int, float]]:
+    """(id, score) dos top_k chunks do canal mais próximos do embedding da consulta."""
+    if KNOWLEDGE_SEARCH_BACKEND == "pgvector":
+        async with async_session() as db:
+            if await embedding_store.pgvector_dim(db):
+                _counters["searches"] += 1
+                return await embedding_store.pgvector_top_k(db, channel_id, query_embedding, top_k)
+    index = await get_index(channel_id)
+    if index is None:
+        return []
+    query = normalize(query_embedding)
+    if query is None or query.shape != (index.dim,):
+        print(f"⚠️ Embedding da consulta com dimensão {np.shape(query_embedding)} ≠ índice ({index.dim})")
+        return []
+    _counters["searches"] += 1
+    ids, matrix = index.snapshot()
+    if matrix.size >= KNOWLEDGE_INDEX_THREAD_MIN:
+        return await asyncio.to_thread(ChannelIndex.top_k, ids, matrix, query, top_k)
+    return ChannelIndex.top_k(ids, matrix, query, top_k)
+
+
+# ============================================================
+# MUDANÇAS NO ACERVO -> ATUALIZAÇÃO INCREMENTAL
+# ============================================================
+
+def publish_changes(db, channel_id: int, added: list[int] = (), removed: list[int] = ()):
+    """Encena a mudança na sessão `db`; no commit, todos os workers atualizam o índice do canal."""
+    if added or removed:
+        event_bus.publish(db, "knowledge.changed", {
+            "channel_id": channel_id, "added": list(added), "removed": list(removed),
+        })
+
+
+async def _apply(channel_id: int, added: list[int], removed: list[int]):
+    async with _lock(channel_id):
+        index = _indexes.get(channel_id)
+        if index is None:
+            # Ainda não montado neste worker: a montagem vai ler o estado atual
+            return
+        if removed:
+            _counters["removed"] += index.remove(removed)
+        if added:
+            before = len(index)
+            async for ids, vectors in _load(channel_id, added):
+                _add_rows(index, ids, vectors)
+            _counters["added"] += len(index) - before
+        if not len(index):
+            del _indexes[channel_id]
+
+
+def _on_changed(payload: dict):
+    task = asyncio.get_running_loop().create_task(
+        _apply(int(payload["channel_id"]), payload.get("added") or [], payload.get("removed") or [])
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+event_bus.subscribe("knowledge.changed", _on_changed)
+
+
+def stats() -> dict:
+    return {
+        **_counters,
+        "channels": {
+            channel_id: {"chunks": len(index), "dim": index.dim, "mb": round(index.nbytes / 1024 / 1024, 2)}
+            for channel_id, index in _indexes.items()
+        },
+    }
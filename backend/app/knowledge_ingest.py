@@ -0,0 +1,417 @@
+"""
+Ingestão de documentos na base de conhecimento.
+upload_document gerava o embedding de um chunk por vez, em série, com a requisição HTTP
+aberta. Aqui os chunks vão para a API de embeddings em lotes (a API aceita lista; até
+KNOWLEDGE_EMBED_BATCH textos e KNOWLEDGE_EMBED_BATCH_TOKENS tokens por chamada), com até
+KNOWLEDGE_EMBED_CONCURRENCY chamadas simultâneas e nova tentativa com backoff exponencial
+(respeitando Retry-After) em 429, 5xx, timeout e falha de conexão. Os chunks do documento
+entram num INSERT só; o índice vetorial (app/knowledge_index.py) é avisado no commit.
+
+Se algum lote falhar depois das tentativas nada é gravado: o documento não fica pela metade.
+Os embeddings são gerados antes de abrir a transação que grava (ver ingest()): nenhuma
+conexão nem lock fica preso enquanto a API responde.
+
+Reenvio (mesmo título no canal): cada chunk guarda o sha256 do texto (content_hash) e o
+modelo do embedding. Chunk com texto e modelo iguais aos de uma linha do documento fica com
+a linha; texto já embedado em outra linha do canal copia o vetor; só o resto vai para a API.
+As linhas antigas sem correspondente são apagadas na mesma transação do INSERT. A resposta
+(e o job) informa os chunks reaproveitados, as chamadas à API evitadas e o tempo estimado
+economizado.
+
+Documento com KNOWLEDGE_INGEST_BACKGROUND_MIN_CHUNKS chunks ou mais vira um job em segundo
+plano no worker que recebeu o upload. A rota responde 202 com o id e o progresso fica em
+knowledge_ingest_jobs (GET /api/ai/documents/jobs/{id}, de qualquer worker). Job sem
+atualização há KNOWLEDGE_INGEST_STALE_SEC (o worker caiu no meio) aparece como "interrupted".
+"""
+import os
+import math
+import time
+import hashlib
+import random
+import asyncio
+
+from openai import APIConnectionError, APIStatusError
+from sqlalchemy import delete, insert, literal_column, select, text, update, func
+
+from app import embedding_store, knowledge_index
+from app.ai_engine import EMBEDDING_MODEL, client
+from app.database import async_session
+from app.models import KnowledgeDocument, KnowledgeIngestJob
+
+KNOWLEDGE_EMBED_BATCH = int(os.getenv("KNOWLEDGE_EMBED_BATCH", "96"))
+KNOWLEDGE_EMBED_BATCH_TOKENS = int(os.getenv("KNOWLEDGE_EMBED_BATCH_TOKENS", "60000"))
+KNOWLEDGE_EMBED_CONCURRENCY = int(os.getenv("KNOWLEDGE_EMBED_CONCURRENCY", "4"))
+KNOWLEDGE_EMBED_MAX_RETRIES = int(os.getenv("KNOWLEDGE_EMBED_MAX_RETRIES", "6"))
+KNOWLEDGE_EMBED_BACKOFF_SEC = float(os.getenv("KNOWLEDGE_EMBED_BACKOFF_SEC", "1"))
+KNOWLEDGE_INGEST_BACKGROUND_MIN_CHUNKS = int(os.getenv("KNOWLEDGE_INGEST_BACKGROUND_MIN_CHUNKS", "40"))
+KNOWLEDGE_INGEST_STALE_SEC = int(os.getenv("KNOWLEDGE_INGEST_STALE_SEC", "300"))
+
+_BACKOFF_MAX_SEC = 60
+_RETRY_STATUS = {408, 409, 429}
+
+# O mesmo que content_hash(), calculado no Postgres (linhas gravadas antes da coluna existir)
+CONTENT_HASH_SQL = "encode(sha256(convert_to(content, 'UTF8')), 'hex')"
+
+_tasks: set[asyncio.Task] = set()
+_counters = {
+    "api_calls": 0, "retries": 0, "chunks": 0, "jobs": 0, "failed_jobs": 0,
+    "reused_chunks": 0, "removed_chunks": 0, "saved_api_calls": 0, "saved_tokens": 0,
+}
+# Latência das chamadas que deram certo (para estimar o tempo economizado no reenvio)
+_latency = {"calls": 0, "seconds": 0.0}
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _retryable(error: Exception) -> bool:
+    # APITimeoutError é subclasse de APIConnectionError
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in _RETRY_STATUS or error.status_code >= 500)
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _batches(chunks: list[dict]) -> list[list[int]]:
+    """Posições dos chunks agrupadas por limite de itens e de tokens por chamada."""
+    batches, current, tokens = [], [], 0
+    for position, chunk in enumerate(chunks):
+        size = chunk.get("token_count") or 0
+        if current and (len(current) >= KNOWLEDGE_EMBED_BATCH or tokens + size > KNOWLEDGE_EMBED_BATCH_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(position)
+        tokens += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def embed_chunks(chunks: list[dict], on_batch=None, stats: dict | None = None) -> list[list[float]]:
+    """
+    Embeddings dos chunks, na mesma ordem. on_batch(quantidade) é aguardado a cada lote
+    concluído; stats recebe api_calls e retries desta chamada.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("api_calls", 0)
+    stats.setdefault("retries", 0)
+    # As novas tentativas são feitas aqui (com backoff e limite de concorrência), não no cliente
+    api = client.with_options(max_retries=0)
+    semaphore = asyncio.Semaphore(KNOWLEDGE_EMBED_CONCURRENCY)
+    vectors: list = [None] * len(chunks)
+
+    async def run(batch: list[int]):
+        async with semaphore:
+            for attempt in range(KNOWLEDGE_EMBED_MAX_RETRIES + 1):
+                stats["api_calls"] += 1
+                _counters["api_calls"] += 1
+                try:
+                    call_started = time.perf_counter()
+                    response = await api.embeddings.create(
+                        model=EMBEDDING_MODEL, input=[chunks[i]["content"] for i in batch],
+                    )
+                    _latency["calls"] += 1
+                    _latency["seconds"] += time.perf_counter() - call_started
+                    break
+                except Exception as e:
+                    if attempt == KNOWLEDGE_EMBED_MAX_RETRIES or not _retryable(e):
+                        raise
+                    stats["retries"] += 1
+                    _counters["retries"] += 1
+                    delay = _retry_after(e) or KNOWLEDGE_EMBED_BACKOFF_SEC * 2 ** attempt * random.uniform(0.5, 1.5)
+                    await asyncio.sleep(min(delay, _BACKOFF_MAX_SEC))
+        for item in response.data:
+            vectors[batch[item.index]] = item.embedding
+        if on_batch is not None:
+            await on_batch(len(batch))
+
+    tasks = [asyncio.create_task(run(batch)) for batch in _batches(chunks)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return vectors
+
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embeddings de textos soltos (ex.: aquecimento do cache de perguntas), em lotes com nova tentativa."""
+    return await embed_chunks([{"content": content} for content in texts])
+
+
+async def save_chunks(db, channel_id: int, chunks: list[dict], vectors: list[list[float]]) -> list[int]:
+    """Um INSERT para todos os chunks; o commit (de quem chamou) publica no índice vetorial."""
+    if not chunks:
+        return []
+    result = await db.execute(
+        insert(KnowledgeDocument).returning(KnowledgeDocument.id, sort_by_parameter_order=True),
+        [
+            {
+                "channel_id": channel_id,
+                "title": chunk["title"],
+                "content": chunk["content"],
+                "chunk_index": chunk["chunk_index"],
+                "token_count": chunk["token_count"],
+                "content_hash": content_hash(chunk["content"]),
+                **embedding_store.columns(vector, EMBEDDING_MODEL),
+            }
+            for chunk, vector in zip(chunks, vectors)
+        ],
+    )
+    ids = list(result.scalars().all())
+    await embedding_store.store_pgvector(db, list(zip(ids, vectors)))
+    knowledge_index.publish_changes(db, channel_id, added=ids)
+    _counters["chunks"] += len(ids)
+    return ids
+
+
+async def diff_document(db, channel_id: int, title: str, chunks: list[dict]) -> dict:
+    """
+    Chunks novos x linhas já gravadas do documento (channel_id, title), por posição do chunk:
+      keep:   {posição: linha}  mesmo texto e mesmo modelo de embedding, a linha fica
+      reuse:  {posição: vetor}  texto já embedado em outra linha do canal, o vetor é copiado
+      embed:  [posição]         precisa de embedding
+      remove: [id]              linhas antigas sem correspondente
+    """
+    hashes = [content_hash(c["content"]) for c in chunks]
+    result = await db.execute(
+        select(
+            KnowledgeDocument.id,
+            KnowledgeDocument.chunk_index,
+            KnowledgeDocument.content_hash.is_(None).label("unhashed"),
+            func.coalesce(KnowledgeDocument.content_hash, literal_column(CONTENT_HASH_SQL)).label("hash"),
+            KnowledgeDocument.embedding_model,
+        )
+        .where(KnowledgeDocument.channel_id == channel_id, KnowledgeDocument.title == title)
+        .order_by(KnowledgeDocument.chunk_index, KnowledgeDocument.id)
+    )
+    stored: dict[str, list] = {}
+    remove = []
+    for row in result.all():
+        if row.embedding_model == EMBEDDING_MODEL:
+            stored.setdefault(row.hash, []).append(row)
+        else:
+            remove.append(row.id)
+
+    keep, missing = {}, []
+    for position, digest in enumerate(hashes):
+        if stored.get(digest):
+            keep[position] = stored[digest].pop(0)
+        else:
+            missing.append(position)
+    remove += [row.id for rows in stored.values() for row in rows]
+
+    reuse = {}
+    wanted = {hashes[p] for p in missing}
+    if wanted:
+        result = await db.execute(
+            select(KnowledgeDocument.content_hash, KnowledgeDocument.embedding_vec)
+            .where(
+                KnowledgeDocument.channel_id == channel_id,
+                KnowledgeDocument.content_hash.in_(wanted),
+                KnowledgeDocument.embedding_model == EMBEDDING_MODEL,
+                KnowledgeDocument.embedding_vec.is_not(None),
+            )
+            .distinct(KnowledgeDocument.content_hash)
+        )
+        vectors = {row.content_hash: embedding_store.unpack(row.embedding_vec) for row in result}
+        reuse = {p: vectors[hashes[p]] for p in missing if hashes[p] in vectors}
+    embed = [p for p in missing if p not in reuse]
+    return {"hashes": hashes, "keep": keep, "reuse": reuse, "embed": embed, "remove": remove}
+
+
+def _seconds_saved(chunks: list[dict], embed_seconds: float) -> float | None:
+    """Estimativa: chamadas que o documento inteiro faria, em ondas de CONCURRENCY, x latência média."""
+    if not _latency["calls"]:
+        return None
+    average = _latency["seconds"] / _latency["calls"]
+    full = math.ceil(len(_batches(chunks)) / KNOWLEDGE_EMBED_CONCURRENCY) * average
+    return round(max(0.0, full - embed_seconds), 2)
+
+
+async def ingest(db, channel_id: int, chunks: list[dict], on_batch=None, stats: dict | None = None,
+                 diff: dict | None = None) -> list[int]:
+    """
+    Grava o documento (o título dos chunks) na sessão `db`, sem commit; devolve os ids na
+    ordem dos chunks. Se o documento já existe, só o que mudou vai para a API e as linhas
+    que sobraram são apagadas. stats recebe também kept_chunks, reused_chunks,
+    embedded_chunks, removed_chunks, saved_api_calls, saved_tokens e seconds_saved_est.
+
+    Os embeddings (minutos, num documento grande) são gerados sem transação nem conexão
+    aberta: o diff sai de uma sessão curta (ou vem pronto em `diff`, calculado fora de
+    transação) e `db` só é usada no fim, para gravar. Ali, com o lock do documento, o diff
+    é refeito (outro envio pode ter gravado no meio) e só o que apareceu de novo é embedado.
+    """
+    stats = stats if stats is not None else {}
+    title = chunks[0]["title"]
+    if diff is None:
+        async with async_session() as read:
+            diff = await diff_document(read, channel_id, title, chunks)
+    if on_batch is not None and (diff["keep"] or diff["reuse"]):
+        await on_batch(len(diff["keep"]) + len(diff["reuse"]))
+
+    pending = [chunks[p] for p in diff["embed"]]
+    started = time.perf_counter()
+    embedded = dict(zip((diff["hashes"][p] for p in diff["embed"]), await embed_chunks(pending, on_batch, stats))) \
+        if pending else {}
+    embed_seconds = time.perf_counter() - started
+
+    # Um envio por vez do mesmo documento, até o commit de quem chamou
+    await db.execute(text("SELECT pg_advisory_xact_lock(:channel_id, hashtext(:title))"),
+                     {"channel_id": channel_id, "title": title})
+    diff = await diff_document(db, channel_id, title, chunks)
+    keep, reuse, hashes = diff["keep"], diff["reuse"], diff["hashes"]
+    # Linhas que o diff de fora da transação ia manter ou copiar e que sumiram no meio
+    late = [p for p in diff["embed"] if hashes[p] not in embedded]
+    if late:
+        embedded.update(zip((hashes[p] for p in late), await embed_chunks([chunks[p] for p in late], stats=stats)))
+    vectors = {p: embedded[hashes[p]] for p in diff["embed"]}
+    vectors.update(reuse)
+
+    if diff["remove"]:
+        await db.execute(delete(KnowledgeDocument).where(KnowledgeDocument.id.in_(diff["remove"])))
+        knowledge_index.publish_changes(db, channel_id, removed=diff["remove"])
+    # Linhas que ficam: só posição (e o hash, nas gravadas antes da coluna existir)
+    moved = [
+        {"id": row.id, "chunk_index": chunks[p]["chunk_index"], "content_hash": hashes[p]}
+        for p, row in keep.items() if row.unhashed or row.chunk_index != chunks[p]["chunk_index"]
+    ]
+    if moved:
+        await db.execute(update(KnowledgeDocument), moved)
+    positions = sorted(vectors)
+    new_ids = await save_chunks(db, channel_id, [chunks[p] for p in positions], [vectors[p] for p in positions])
+
+    skipped = [chunks[p] for p in (*keep, *reuse)]
+    saved_calls = len(_batches(chunks)) - len(_batches(pending)) - len(_batches([chunks[p] for p in late]))
+    stats.update(
+        kept_chunks=len(keep),
+        reused_chunks=len(reuse),
+        embedded_chunks=len(diff["embed"]),
+        removed_chunks=len(diff["remove"]),
+        saved_api_calls=saved_calls,
+        saved_tokens=sum(c["token_count"] for c in skipped),
+        seconds_saved_est=_seconds_saved(chunks, embed_seconds) if skipped else 0.0,
+    )
+    _counters["reused_chunks"] += len(skipped)
+    _counters["removed_chunks"] += len(diff["remove"])
+    _counters["saved_api_calls"] += saved_calls
+    _counters["saved_tokens"] += stats["saved_tokens"]
+
+    ids = {p: row.id for p, row in keep.items()}
+    ids.update(zip(positions, new_ids))
+    return [ids[p] for p in range(len(chunks))]
+
+
+# ============================================================
+# JOBS EM SEGUNDO PLANO
+# ============================================================
+
+async def start_job(db, channel_id: int, title: str, chunks: list[dict]) -> KnowledgeIngestJob:
+    job = KnowledgeIngestJob(
+        channel_id=channel_id,
+        title=title,
+        status="running",
+        total_chunks=len(chunks),
+        total_tokens=sum(c["token_count"] for c in chunks),
+    )
+    db.add(job)
+    await db.commit()
+    task = asyncio.create_task(_run_job(job.id, channel_id, chunks))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    _counters["jobs"] += 1
+    return job
+
+
+async def _update_job(job_id: int, **values):
+    async with async_session() as db:
+        await db.execute(
+            update(KnowledgeIngestJob).where(KnowledgeIngestJob.id == job_id).values(updated_at=func.now(), **values)
+        )
+        await db.commit()
+
+
+async def _run_job(job_id: int, channel_id: int, chunks: list[dict]):
+    stats = {"api_calls": 0, "retries": 0}
+    started = time.perf_counter()
+
+    async def on_batch(done: int):
+        await _update_job(
+            job_id,
+            embedded_chunks=KnowledgeIngestJob.embedded_chunks + done,
+            api_calls=stats["api_calls"],
+            retries=stats["retries"],
+        )
+
+    try:
+        # A sessão só pega conexão na gravação, depois dos embeddings
+        async with async_session() as db:
+            ids = await ingest(db, channel_id, chunks, on_batch, stats)
+            # Chunks e status "done" no mesmo commit
+            await db.execute(
+                update(KnowledgeIngestJob).where(KnowledgeIngestJob.id == job_id).values(
+                    status="done", saved_chunks=len(ids), api_calls=stats["api_calls"], retries=stats["retries"],
+                    reused_chunks=stats["kept_chunks"] + stats["reused_chunks"],
+                    removed_chunks=stats["removed_chunks"], saved_api_calls=stats["saved_api_calls"],
+                    updated_at=func.now(), finished_at=func.now(),
+                )
+            )
+            await db.commit()
+        print(f"📚 Documento do job {job_id}: {len(ids)} chunks em {time.perf_counter() - started:.1f}s "
+              f"({stats['api_calls']} chamadas, {stats['retries']} novas tentativas, "
+              f"{stats['kept_chunks'] + stats['reused_chunks']} reaproveitados)")
+    except Exception as e:
+        _counters["failed_jobs"] += 1
+        print(f"❌ Erro no job de ingestão {job_id}: {e}")
+        await _update_job(
+            job_id, status="failed", error=str(e)[:1000], api_calls=stats["api_calls"], retries=stats["retries"],
+            finished_at=func.now(),
+        )
+
+
+def job_status(job: KnowledgeIngestJob, stale: bool = False) -> dict:
+    return {
+        "job_id": job.id,
+        "channel_id": job.channel_id,
+        "title": job.title,
+        "status": "interrupted" if job.status == "running" and stale else job.status,
+        "total_chunks": job.total_chunks,
+        "embedded_chunks": job.embedded_chunks,
+        "saved_chunks": job.saved_chunks,
+        "total_tokens": job.total_tokens,
+        "progress": round(job.embedded_chunks / job.total_chunks, 3) if job.total_chunks else 1.0,
+        "api_calls": job.api_calls,
+        "retries": job.retries,
+        "reused_chunks": job.reused_chunks,
+        "removed_chunks": job.removed_chunks,
+        "saved_api_calls": job.saved_api_calls,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+async def get_jobs(db, channel_id: int | None = None, job_id: int | None = None, limit: int = 20) -> list[dict]:
+    # Relógio do banco, o mesmo de updated_at
+    stale = KnowledgeIngestJob.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, KNOWLEDGE_INGEST_STALE_SEC)
+    query = select(KnowledgeIngestJob, stale).order_by(KnowledgeIngestJob.id.desc()).limit(limit)
+    if channel_id is not None:
+        query = query.where(KnowledgeIngestJob.channel_id == channel_id)
+    if job_id is not None:
+        query = query.where(KnowledgeIngestJob.id == job_id)
+    result = await db.execute(query)
+    return [job_status(job, bool(is_stale)) for job, is_stale in result.all()]
+
+
+def stats() -> dict:
+    return {**_counters, "running_jobs": len(_tasks)}
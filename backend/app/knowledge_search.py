@@ -0,0 +1,365 @@
+"""
+Busca híbrida na base de conhecimento: índice lexical BM25 + índice vetorial.
+Só com embedding, termos exatos — código do imóvel, nome do empreendimento, nome de rua —
+ficavam de fora do top-k, e toda pergunta dependia da API de embeddings. Aqui cada chunk
+(título + conteúdo) também vira termos (minúsculas, sem acento, sem stopwords; letras e
+números separados, então "AP-1203", "ap1203" e "AP 1203" dão os mesmos termos) num índice
+invertido BM25 em memória, um por canal e por processo. hybrid_search junta o ranking BM25
+e o do índice vetorial (app/knowledge_index.py) por reciprocal-rank fusion (RRF).
+
+Se o embedding da pergunta não chega em KNOWLEDGE_EMBED_TIMEOUT_SEC (API lenta ou fora),
+a resposta sai só com o BM25 e, por KNOWLEDGE_EMBED_COOLDOWN_SEC, as buscas nem esperam a
+API. A chamada lenta não é cancelada: quando termina, o vetor fica no cache de perguntas
+(app/query_embeddings.py).
+
+O índice do canal é montado na primeira busca e atualizado pelo mesmo "knowledge.changed"
+do índice vetorial (upload, reenvio e remoção), na ordem, sem remontar.
+
+KNOWLEDGE_SEARCH_MODE: hybrid (padrão), vector (só embedding, como antes: score = cosseno
+e erro da API sobe) ou lexical (sem chamar a API).
+"""
+import os
+import math
+import time
+import asyncio
+import unicodedata
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import select
+
+from app import event_bus, knowledge_index
+from app.database import async_session
+from app.models import KnowledgeDocument
+
+KNOWLEDGE_SEARCH_MODE = os.getenv("KNOWLEDGE_SEARCH_MODE", "hybrid").lower()
+# Candidatos de cada ranking que entram na fusão
+KNOWLEDGE_HYBRID_CANDIDATES = int(os.getenv("KNOWLEDGE_HYBRID_CANDIDATES", "20"))
+# Constante do RRF: score = soma de 1 / (k + posição) nos rankings
+KNOWLEDGE_RRF_K = int(os.getenv("KNOWLEDGE_RRF_K", "60"))
+KNOWLEDGE_EMBED_TIMEOUT_SEC = float(os.getenv("KNOWLEDGE_EMBED_TIMEOUT_SEC", "1.5"))
+KNOWLEDGE_EMBED_COOLDOWN_SEC = float(os.getenv("KNOWLEDGE_EMBED_COOLDOWN_SEC", "30"))
+# Fração de posições de chunks removidos que dispara a compactação do índice
+KNOWLEDGE_LEXICAL_COMPACT_RATIO = float(os.getenv("KNOWLEDGE_LEXICAL_COMPACT_RATIO", "0.25"))
+KNOWLEDGE_LEXICAL_LOAD_BATCH = int(os.getenv("KNOWLEDGE_LEXICAL_LOAD_BATCH", "1000"))
+
+# Parâmetros usuais do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TERM = re.compile(r"[a-z]+|[0-9]+")
+# Já sem acento (o texto é comparado depois de tirar os acentos)
+_STOPWORDS = frozenset("""
+    a o as os e de da do das dos em no na nos nas num numa um uma uns umas para pra por pelo pela
+    pelos pelas com sem que se ao aos ou como mais mas muito seu sua seus suas ele ela eles elas
+    isso isto este esta esse essa aquele aquela lhe me te voce voces eu tu nos vos ja nao sim
+    qual quais quem onde quando ha tem ter sao ser foi era esta estao ate sobre entre
+""".split())
+
+_indexes: dict[int, "LexicalIndex"] = {}
+_locks: dict[int, asyncio.Lock] = {}
+_tasks: set[asyncio.Task] = set()
+_embedding = {"down_until": 0.0}
+_counters = {
+    "builds": 0, "added": 0, "removed": 0, "compactions": 0,
+    "searches": 0, "hybrid": 0, "lexical_only": 0, "vector_only": 0, "embed_timeouts": 0, "embed_errors": 0,
+}
+
+
+def terms(text: str) -> list[str]:
+    """Termos do texto: minúsculas, sem acento, letras e números separados, sem stopwords."""
+    ascii_text = unicodedata.normalize("NFKD", text.casefold()).encode("ascii", "ignore").decode("ascii")
+    return [t for t in _TERM.findall(ascii_text) if t not in _STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 de um canal. Cada chunk ganha uma posição no fim; para cada termo,
+    posições e frequências ficam em arrays compactos (4 bytes cada). Remover só marca a
+    posição como morta; com KNOWLEDGE_LEXICAL_COMPACT_RATIO das posições mortas os arrays
+    são reescritos sem elas. A busca é síncrona (no loop, entre duas atualizações).
+    """
+
+    def __init__(self):
+        self._ids = array("q")
+        self._lengths = array("f")
+        self._alive = bytearray()
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._positions: dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @property
+    def nbytes(self) -> int:
+        postings = sum(p.itemsize * len(p) + f.itemsize * len(f) for p, f in self._postings.values())
+        return postings + self._ids.itemsize * len(self._ids) + self._lengths.itemsize * len(self._lengths) + len(self._alive)
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
+
+    def add(self, docs: list[tuple[int, list[str]]]) -> int:
+        """Inclui (id, termos); id já presente é ignorado (a mesma mudança pode chegar duas vezes)."""
+        added = 0
+        for doc_id, doc_terms in docs:
+            if doc_id in self._positions:
+                continue
+            position = len(self._ids)
+            self._positions[doc_id] = position
+            self._ids.append(doc_id)
+            self._lengths.append(len(doc_terms))
+            self._alive.append(1)
+            self.total_length += len(doc_terms)
+            for term, frequency in Counter(doc_terms).items():
+                entry = self._postings.get(term)
+                if entry is None:
+                    entry = self._postings[term] = (array("i"), array("i"))
+                entry[0].append(position)
+                entry[1].append(frequency)
+            added += 1
+        return added
+
+    def remove(self, ids) -> int:
+        removed = 0
+        for doc_id in ids:
+            position = self._positions.pop(doc_id, None)
+            if position is None:
+                continue
+            self._alive[position] = 0
+            self.total_length -= int(self._lengths[position])
+            removed += 1
+        dead = len(self._ids) - len(self._positions)
+        if removed and dead >= KNOWLEDGE_LEXICAL_COMPACT_RATIO * len(self._ids):
+            self._compact()
+        return removed
+
+    def _compact(self):
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        remap = (np.cumsum(alive) - 1).astype(np.int32)
+        postings = {}
+        for term, (positions, frequencies) in self._postings.items():
+            old = np.frombuffer(positions, dtype=np.int32)
+            keep = alive[old]
+            if keep.any():
+                postings[term] = (
+                    array("i", remap[old[keep]].tobytes()),
+                    array("i", np.frombuffer(frequencies, dtype=np.int32)[keep].tobytes()),
+                )
+        ids = np.frombuffer(self._ids, dtype=np.int64)[alive]
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)[alive]
+        self._postings = postings
+        self._ids = array("q", ids.tobytes())
+        self._lengths = array("f", lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(ids))
+        self._positions = {int(doc_id): position for position, doc_id in enumerate(ids)}
+        _counters["compactions"] += 1
+
+    def search(self, query_terms: list[str], k: int) -> list[tuple[int, float]]:
+        """(id, score BM25) dos k melhores chunks para os termos, do maior para o menor."""
+        n = len(self._positions)
+        if not n or not query_terms or k <= 0:
+            return []
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        average = self.total_length / n or 1.0
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        for term in set(query_terms):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            positions = np.frombuffer(entry[0], dtype=np.int32)
+            live = alive[positions]
+            df = int(np.count_nonzero(live))
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tf = np.frombuffer(entry[1], dtype=np.int32).astype(np.float32)
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[positions] / average)
+            # Posições são únicas dentro de um termo: a soma indexada não perde nada
+            scores[positions] += live * (idf * tf * (BM25_K1 + 1) / norm)
+        best = np.flatnonzero(scores)
+        if k < len(best):
+            best = best[np.argpartition(scores[best], -k)[-k:]]
+        best = best[np.argsort(-scores[best])]
+        ids = np.frombuffer(self._ids, dtype=np.int64)
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+
+def _tokenize(rows) -> list[tuple[int, list[str]]]:
+    return [(doc_id, terms(f"{title or ''}\n{content or ''}")) for doc_id, title, content in rows]
+
+
+def _build(rows) -> "LexicalIndex":
+    index = LexicalIndex()
+    index.add(_tokenize(rows))
+    return index
+
+
+async def _load(channel_id: int, only_ids: list[int] | None = None):
+    """Lê título/conteúdo dos chunks do canal em lotes."""
+    query = select(KnowledgeDocument.id, KnowledgeDocument.title, KnowledgeDocument.content).where(
+        KnowledgeDocument.channel_id == channel_id,
+    ).order_by(KnowledgeDocument.id)
+    if only_ids is not None:
+        query = query.where(KnowledgeDocument.id.in_(only_ids))
+    async with async_session() as db:
+        result = await db.stream(query.execution_options(yield_per=KNOWLEDGE_LEXICAL_LOAD_BATCH))
+        async for rows in result.partitions():
+            yield rows
+
+
+def _lock(channel_id: int) -> asyncio.Lock:
+    return _locks.setdefault(channel_id, asyncio.Lock())
+
+
+async def get_index(channel_id: int) -> LexicalIndex | None:
+    """Índice do canal, montado na primeira chamada; None se o canal não tem chunks."""
+    index = _indexes.get(channel_id)
+    if index is not None:
+        return index
+    async with _lock(channel_id):
+        if channel_id in _indexes:
+            return _indexes[channel_id]
+        rows = []
+        async for batch in _load(channel_id):
+            rows.extend(batch)
+        # Tokenização e índice numa thread; o índice só fica visível depois de pronto
+        index = await asyncio.to_thread(_build, rows)
+        _counters["builds"] += 1
+        if not len(index):
+            return None
+        _indexes[channel_id] = index
+        print(f"🔤 Índice lexical do canal {channel_id}: {len(index)} chunks, {index.terms} termos "
+              f"({index.nbytes / 1024 / 1024:.1f} MB)")
+        return index
+
+
+async def search(channel_id: int, query: str, top_k: int) -> list[tuple[int, float]]:
+    """(id, score BM25) dos top_k chunks do canal para o texto da pergunta."""
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+    index = await get_index(channel_id)
+    if index is None:
+        return []
+    return index.search(query_terms, top_k)
+
+
+# ============================================================
+# FUSÃO COM O ÍNDICE VETORIAL
+# ============================================================
+
+def reciprocal_rank_fusion(rankings: list[list[tuple[int, float]]], top_k: int,
+                           k: int = KNOWLEDGE_RRF_K) -> list[tuple[int, float]]:
+    """
+    (id, score) dos top_k pela soma de 1 / (k + posição) em cada ranking. O score é dividido
+    pelo máximo possível (primeiro em todos os rankings = 1.0).
+    """
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1) if rankings else 1.0
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [(doc_id, score / best) for doc_id, score in ordered]
+
+
+def _forget(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled():
+        task.exception()  # chamada que passou do prazo e falhou depois: já contabilizada
+
+
+async def _query_vector(query: str, embed):
+    """Embedding da pergunta, ou None se a API não respondeu no prazo (ou falhou)."""
+    if time.monotonic() < _embedding["down_until"]:
+        return None
+    task = asyncio.ensure_future(embed(query))
+    _tasks.add(task)
+    task.add_done_callback(_forget)
+    try:
+        # shield: passado o prazo a chamada continua e abastece o cache de perguntas
+        return await asyncio.wait_for(asyncio.shield(task), KNOWLEDGE_EMBED_TIMEOUT_SEC)
+    except asyncio.TimeoutError:
+        _counters["embed_timeouts"] += 1
+        reason = f"sem resposta em {KNOWLEDGE_EMBED_TIMEOUT_SEC}s"
+    except Exception as e:
+        _counters["embed_errors"] += 1
+        reason = f"erro: {e}"
+    _embedding["down_until"] = time.monotonic() + KNOWLEDGE_EMBED_COOLDOWN_SEC
+    print(f"⚠️ Embedding da pergunta {reason} — busca só lexical por {KNOWLEDGE_EMBED_COOLDOWN_SEC:.0f}s")
+    return None
+
+
+async def hybrid_search(channel_id: int, query: str, top_k: int, embed) -> list[tuple[int, float]]:
+    """
+    (id, score) dos top_k chunks do canal para a pergunta, conforme KNOWLEDGE_SEARCH_MODE.
+    embed(pergunta) devolve o embedding (ai_engine.embed_query).
+    """
+    _counters["searches"] += 1
+    if KNOWLEDGE_SEARCH_MODE == "vector":
+        _counters["vector_only"] += 1
+        return await knowledge_index.search(channel_id, await embed(query), top_k)
+
+    candidates = max(top_k, KNOWLEDGE_HYBRID_CANDIDATES)
+    # Embedding (rede) em paralelo com o BM25 (local)
+    vector = asyncio.ensure_future(_query_vector(query, embed)) if KNOWLEDGE_SEARCH_MODE == "hybrid" else None
+    try:
+        rankings = [await search(channel_id, query, candidates)]
+    except BaseException:
+        if vector is not None:
+            vector.cancel()
+        raise
+    query_embedding = await vector if vector is not None else None
+    if query_embedding is not None:
+        rankings.append(await knowledge_index.search(channel_id, query_embedding, candidates))
+        _counters["hybrid"] += 1
+    else:
+        _counters["lexical_only"] += 1
+    return reciprocal_rank_fusion(rankings, top_k)
+
+
+# ============================================================
+# MUDANÇAS NO ACERVO -> ATUALIZAÇÃO INCREMENTAL
+# ============================================================
+
+async def _apply(channel_id: int, added: list[int], removed: list[int]):
+    async with _lock(channel_id):
+        index = _indexes.get(channel_id)
+        if index is None:
+            # Ainda não montado neste worker: a montagem vai ler o estado atual
+            return
+        if removed:
+            _counters["removed"] += index.remove(removed)
+        if added:
+            async for rows in _load(channel_id, added):
+                _counters["added"] += index.add(await asyncio.to_thread(_tokenize, rows))
+        if not len(index):
+            del _indexes[channel_id]
+
+
+def _on_changed(payload: dict):
+    task = asyncio.get_running_loop().create_task(
+        _apply(int(payload["channel_id"]), payload.get("added") or [], payload.get("removed") or [])
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+event_bus.subscribe("knowledge.changed", _on_changed)
+
+
+def stats() -> dict:
+    return {
+        "mode": KNOWLEDGE_SEARCH_MODE,
+        **_counters,
+        "embeddings_paused_sec": round(max(0.0, _embedding["down_until"] - time.monotonic()), 1),
+        "channels": {
+            channel_id: {"chunks": len(index), "terms": index.terms, "mb": round(index.nbytes / 1024 / 1024, 2)}
+            for channel_id, index in _indexes.items()
+        },
+    }
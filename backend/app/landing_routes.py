@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from app.database import get_db
-from app.models import LandingPage, FormSubmission, Contact, Channel
+from app.database import get_db, get_read_db
+from app.models import LandingPage, FormSubmission, Contact, Channel, MetricsFormsHourly, MetricsContactCounts
 from app.auth import get_current_user
 import json
 
@@ -112,7 +112,7 @@ async def delete_landing_page(page_id: int, db: AsyncSession = Depends(get_db),
 # === Stats ===
 
 @router.get("/{page_id}/stats")
-async def landing_page_stats(page_id: int, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
+async def landing_page_stats(page_id: int, db: AsyncSession = Depends(get_read_db), user=Depends(get_current_user)):
     total = await db.execute(
         select(func.count(FormSubmission.id)).where(FormSubmission.landing_page_id == page_id)
     )
@@ -120,67 +120,54 @@ async def landing_page_stats(page_id: int, db: AsyncSession = Depends(get_db), u
 # === Dashboard ROI ===
 
 @router.get("/dashboard/roi")
-async def dashboard_roi(db: AsyncSession = Depends(get_db), user=Depends(get_current_user)):
-    from sqlalchemy import case, distinct
+async def dashboard_roi(db: AsyncSession = Depends(get_read_db), user=Depends(get_current_user)):
+    # Tudo dos rollups (app/metrics.py): envios por hora/LP/origem/campanha e contatos por origem
+    from datetime import datetime, timedelta
+    m = MetricsFormsHourly
+    total = func.sum(m.submissions)
 
     # Total de submissions
-    total_leads = await db.execute(select(func.count(FormSubmission.id)))
+    total_leads = await db.execute(select(total))
 
     # Leads por origem (utm_source)
     leads_by_source = await db.execute(
-        select(
-            FormSubmission.utm_source,
-            func.count(FormSubmission.id).label("total")
-        ).where(FormSubmission.utm_source != None, FormSubmission.utm_source != "")
-        .group_by(FormSubmission.utm_source)
-        .order_by(func.count(FormSubmission.id).desc())
+        select(m.utm_source, total.label("total"))
+        .where(m.utm_source != "")
+        .group_by(m.utm_source)
+        .order_by(total.desc())
     )
 
     # Leads por campanha
     leads_by_campaign = await db.execute(
-        select(
-            FormSubmission.utm_campaign,
-            func.count(FormSubmission.id).label("total")
-        ).where(FormSubmission.utm_campaign != None, FormSubmission.utm_campaign != "")
-        .group_by(FormSubmission.utm_campaign)
-        .order_by(func.count(FormSubmission.id).desc())
+        select(m.utm_campaign, total.label("total"))
+        .where(m.utm_campaign != "")
+        .group_by(m.utm_campaign)
+        .order_by(total.desc())
     )
 
     # Leads por landing page
     leads_by_page = await db.execute(
-        select(
-            LandingPage.title,
-            LandingPage.slug,
-            func.count(FormSubmission.id).label("total")
-        ).join(LandingPage, FormSubmission.landing_page_id == LandingPage.id)
+        select(LandingPage.title, LandingPage.slug, total.label("total"))
+        .join(LandingPage, m.landing_page_id == LandingPage.id)
         .group_by(LandingPage.title, LandingPage.slug)
-        .order_by(func.count(FormSubmission.id).desc())
+        .order_by(total.desc())
     )
 
     # Leads por dia (últimos 30 dias)
-    from datetime import datetime, timedelta
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    day_trunc = func.date_trunc('day', FormSubmission.created_at)
+    thirty_days_ago = (datetime.now() - timedelta(days=30)).replace(minute=0, second=0, microsecond=0)
+    day_trunc = func.date_trunc('day', m.hour)
     leads_by_day = await db.execute(
-        select(
-            day_trunc.label("day"),
-            func.count(FormSubmission.id).label("total")
-        ).where(FormSubmission.created_at >= thirty_days_ago)
+        select(day_trunc.label("day"), total.label("total"))
+        .where(m.hour >= thirty_days_ago)
         .group_by(day_trunc)
         .order_by(day_trunc)
     )
 
     # Status dos contatos vindos de LPs
-    from sqlalchemy import exists
     contacts_from_lp = await db.execute(
-        select(
-            Contact.lead_status,
-            func.count(Contact.id).label("total")
-        ).where(
-            Contact.wa_id.in_(
-                select(distinct(FormSubmission.phone))
-            )
-        ).group_by(Contact.lead_status)
+        select(MetricsContactCounts.lead_status, func.sum(MetricsContactCounts.contacts))
+        .where(MetricsContactCounts.from_landing == True)
+        .group_by(MetricsContactCounts.lead_status)
     )
 
     return {
@@ -189,7 +176,7 @@ async def dashboard_roi(db: AsyncSession = Depends(get_db), user=Depends(get_cur
         "by_campaign": [{"campaign": r[0] or "sem campanha", "total": r[1]} for r in leads_by_campaign.all()],
         "by_page": [{"title": r[0], "slug": r[1], "total": r[2]} for r in leads_by_page.all()],
         "by_day": [{"day": str(r[0])[:10], "total": r[1]} for r in leads_by_day.all()],
-        "funnel": {r[0]: r[1] for r in contacts_from_lp.all()},
+        "funnel": {r[0]: r[1] for r in contacts_from_lp.all() if r[1]},
     }
 
 # === Rota Pública (sem auth) ===
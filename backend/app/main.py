@@ -27,12 +27,15 @@ import asyncio
 
 SP_TZ = timezone(timedelta(hours=-3))
 
-from app.database import get_db, async_session
-from app.models import Channel, Contact, Message
+from app.database import get_db, async_session, db_stats, pool_metrics
 from app.routes import router
 from app.auth_routes import router as auth_router
 from app.exact_routes import router as exact_router
 from app.exact_spotter import sync_exact_leads
+from app import webhook_queue, event_bus, chunker, knowledge_ingest, query_embeddings
+from app.ai_engine import EMBEDDING_MODEL
+from app.partitions import partition_maintenance_job
+from app.ingestion import IngestBatch, resolve_meta_channels, collect_meta_payload
 
 load_dotenv()
 
@@ -104,11 +107,25 @@ async def lifespan(app: FastAPI):
     print("✅ Sync Exact Spotter agendado (a cada 10 min)")
     scheduler_task = asyncio.create_task(scheduler_job())
     print("📅 Scheduler de ligações agendado (a cada 1 min)")
+    partitions_task = asyncio.create_task(partition_maintenance_job())
+    if event_bus.EVENT_BUS_ENABLED:
+        await event_bus.start()
+    if webhook_queue.QUEUE_ENABLED:
+        webhook_queue.register_handler("meta", process_meta_payloads)
+        await webhook_queue.start_workers()
+    if query_embeddings.QUERY_EMBEDDING_CACHE_WARM > 0:
+        query_embeddings.start_warm(knowledge_ingest.embed_texts, EMBEDDING_MODEL)
     yield
     # Shutdown: cancela o job
     task.cancel()
     cleanup_task.cancel()
     scheduler_task.cancel()
+    partitions_task.cancel()
+    await webhook_queue.stop_workers()
+    await event_bus.stop()
+    from app.evolution.routes import ai_dispatcher
+    await ai_dispatcher.shutdown()
+    chunker.shutdown()
 
 
 app = FastAPI(title="EduFlow API", lifespan=lifespan)
@@ -119,6 +136,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Token"],
 )
 
 app.include_router(router)
@@ -160,167 +178,121 @@ async def receive_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     if body.get("object") != "whatsapp_business_account":
         return {"status": "ignored"}
 
-    for entry in body.get("entry", []):
-        for change in entry.get("changes", []):
-            value = change.get("value", {})
-            metadata = value.get("metadata", {})
-            phone_number_id = metadata.get("phone_number_id")
-
-            # Identificar canal
-            channel_id = None
-            if phone_number_id:
-                result = await db.execute(
-                    select(Channel).where(Channel.phone_number_id == phone_number_id)
-                )
-                channel = result.scalar_one_or_none()
-                if channel:
-                    channel_id = channel.id
-
-            # Salvar contato
-            for contact_data in value.get("contacts", []):
-                wa_id = contact_data["wa_id"]
-                name = contact_data.get("profile", {}).get("name", "")
-
-                result = await db.execute(select(Contact).where(Contact.wa_id == wa_id))
-                contact = result.scalar_one_or_none()
-
-                if not contact:
-                    contact = Contact(wa_id=wa_id, name=name, channel_id=channel_id)
-                    db.add(contact)
-                else:
-                    contact.name = name
-                    if not contact.channel_id and channel_id:
-                        contact.channel_id = channel_id
-
-            # Salvar mensagens
-            for msg in value.get("messages", []):
-                wa_message_id = msg["id"]
-
-                result = await db.execute(select(Message).where(Message.wa_message_id == wa_message_id))
-                if result.scalar_one_or_none():
-                    continue
-
-                msg_type = msg["type"]
-                content = ""
-
-                if msg_type == "text":
-                    content = msg["text"]["body"]
-                elif msg_type == "image":
-                    media = msg.get("image", {})
-                    content = f'media:{media.get("id", "")}|{media.get("mime_type", "image/jpeg")}|{media.get("caption", "")}'
-                elif msg_type == "audio":
-                    media = msg.get("audio", {})
-                    content = f'media:{media.get("id", "")}|{media.get("mime_type", "audio/ogg")}|'
-                elif msg_type == "video":
-                    media = msg.get("video", {})
-                    content = f'media:{media.get("id", "")}|{media.get("mime_type", "video/mp4")}|{media.get("caption", "")}'
-                elif msg_type == "document":
-                    media = msg.get("document", {})
-                    content = f'media:{media.get("id", "")}|{media.get("mime_type", "")}|{media.get("filename", "documento")}'
-                elif msg_type == "sticker":
-                    media = msg.get("sticker", {})
-                    content = f'media:{media.get("id", "")}|{media.get("mime_type", "image/webp")}|'
-
-                message = Message(
-                    wa_message_id=wa_message_id,
-                    contact_wa_id=msg["from"],
-                    channel_id=channel_id,
-                    direction="inbound",
-                    message_type=msg_type,
-                    content=content,
-                    timestamp=datetime.fromtimestamp(int(msg["timestamp"]), tz=SP_TZ).replace(tzinfo=None),
-                    status="received",
-                )
-                db.add(message)
-
-            # Atualizar status de mensagens enviadas
-            for status_update in value.get("statuses", []):
-                wa_message_id = status_update["id"]
-                new_status = status_update["status"]
-
-                result = await db.execute(select(Message).where(Message.wa_message_id == wa_message_id))
-                existing = result.scalar_one_or_none()
-                if existing:
-                    existing.status = new_status
-
-            # === AGENTE IA: DESATIVADO TEMPORARIAMENTE ===
-            # for msg in value.get("messages", []):
-            #     sender_wa_id = msg["from"]
-            #     msg_type = msg["type"]
-            #
-            #     # Só responde mensagens de texto
-            #     if msg_type != "text":
-            #         continue
-            #
-            #     # Buscar contato para verificar se IA está ativa
-            #     contact_result = await db.execute(
-            #         select(Contact).where(Contact.wa_id == sender_wa_id)
-            #     )
-            #     ai_contact = contact_result.scalar_one_or_none()
-            #
-            #     if not ai_contact or not ai_contact.ai_active or not channel_id:
-            #         continue
-            #
-            #     # Buscar canal para enviar resposta
-            #     channel_result = await db.execute(
-            #         select(Channel).where(Channel.id == channel_id)
-            #     )
-            #     ai_channel = channel_result.scalar_one_or_none()
-            #     if not ai_channel:
-            #         continue
-            #
-            #     # Gerar resposta da IA
-            #     user_text = msg.get("text", {}).get("body", "")
-            #     ai_response = await generate_ai_response(
-            #         contact_wa_id=sender_wa_id,
-            #         user_message=user_text,
-            #         channel_id=channel_id,
-            #         db=db,
-            #     )
-            #
-            #     if ai_response:
-            #         # Enviar via WhatsApp
-            #         send_result = await send_text_message(
-            #             to=sender_wa_id,
-            #             text=ai_response,
-            #             phone_number_id=ai_channel.phone_number_id,
-            #             token=ai_channel.whatsapp_token,
-            #         )
-            #
-            #         # Salvar mensagem da IA no banco
-            #         if "messages" in send_result:
-            #             ai_msg = Message(
-            #                 wa_message_id=send_result["messages"][0]["id"],
-            #                 contact_wa_id=sender_wa_id,
-            #                 channel_id=channel_id,
-            #                 direction="outbound",
-            #                 message_type="text",
-            #                 content=ai_response,
-            #                 timestamp=datetime.now(SP_TZ).replace(tzinfo=None),
-            #                 status="sent",
-            #             )
-            #             db.add(ai_msg)
-            #
-            #             # Atualizar contador no summary do kanban
-            #             from app.models import AIConversationSummary
-            #             summary_result = await db.execute(
-            #                 select(AIConversationSummary).where(
-            #                     AIConversationSummary.contact_wa_id == sender_wa_id,
-            #                     AIConversationSummary.status == "em_atendimento_ia",
-            #                 )
-            #             )
-            #             summary = summary_result.scalar_one_or_none()
-            #             if summary:
-            #                 summary.ai_messages_count = (summary.ai_messages_count or 0) + 1
-            #
-            #         print(f"🤖 IA respondeu para {sender_wa_id}")
-
-            await db.commit()
-            print(f"💾 Dados salvos no banco!")
+    # Modo fila: grava o payload bruto e responde na hora; os workers processam depois
+    if webhook_queue.QUEUE_ENABLED:
+        await webhook_queue.enqueue("meta", body, db)
+        return {"status": "queued"}
 
+    await process_meta_payloads([body], db)
     return {"status": "ok"}
 
 
+@app.get("/webhook/metrics")
+async def webhook_metrics(db: AsyncSession = Depends(get_db)):
+    """Profundidade e atraso da fila de webhooks + total de comandos enviados ao banco."""
+    metrics = await webhook_queue.queue_metrics(db)
+    metrics["db_statements"] = db_stats["statements"]
+    return metrics
+
+
+@app.get("/db/metrics")
+async def db_metrics():
+    """Conexões em uso e tempo de espera no checkout dos pools (principal e réplica)."""
+    return pool_metrics()
+
+
+async def process_meta_payloads(payloads: list[dict], db: AsyncSession):
+    """Salva contatos, mensagens e status de um lote de payloads da Meta com poucos comandos."""
+    channels = await resolve_meta_channels(payloads, db)
+    batch = IngestBatch()
+    for body in payloads:
+        collect_meta_payload(body, batch, channels)
+
+    if not len(batch):
+        return
+
+    await batch.flush(db)
+    await db.commit()
+    print(f"💾 Dados salvos no banco! ({len(batch.messages)} msgs, {len(batch.statuses)} status)")
+
+    # === AGENTE IA: DESATIVADO TEMPORARIAMENTE ===
+    # for body in payloads:
+    #     for entry in body.get("entry", []):
+    #         for change in entry.get("changes", []):
+    #             value = change.get("value", {})
+    #             channel_id = channels.get(value.get("metadata", {}).get("phone_number_id"))
+    #             for msg in value.get("messages", []):
+    #                 sender_wa_id = msg["from"]
+    #                 msg_type = msg["type"]
+    #
+    #                 # Só responde mensagens de texto
+    #                 if msg_type != "text":
+    #                     continue
+    #
+    #                 # Buscar contato para verificar se IA está ativa
+    #                 contact_result = await db.execute(
+    #                     select(Contact).where(Contact.wa_id == sender_wa_id)
+    #                 )
+    #                 ai_contact = contact_result.scalar_one_or_none()
+    #
+    #                 if not ai_contact or not ai_contact.ai_active or not channel_id:
+    #                     continue
+    #
+    #                 # Buscar canal para enviar resposta
+    #                 channel_result = await db.execute(
+    #                     select(Channel).where(Channel.id == channel_id)
+    #                 )
+    #                 ai_channel = channel_result.scalar_one_or_none()
+    #                 if not ai_channel:
+    #                     continue
+    #
+    #                 # Gerar resposta da IA
+    #                 user_text = msg.get("text", {}).get("body", "")
+    #                 ai_response = await generate_ai_response(
+    #                     contact_wa_id=sender_wa_id,
+    #                     user_message=user_text,
+    #                     channel_id=channel_id,
+    #                     db=db,
+    #                 )
+    #
+    #                 if ai_response:
+    #                     # Enviar via WhatsApp
+    #                     send_result = await send_text_message(
+    #                         to=sender_wa_id,
+    #                         text=ai_response,
+    #                         phone_number_id=ai_channel.phone_number_id,
+    #                         token=ai_channel.whatsapp_token,
+    #                     )
+    #
+    #                     # Salvar mensagem da IA no banco
+    #                     if "messages" in send_result:
+    #                         ai_msg = Message(
+    #                             wa_message_id=send_result["messages"][0]["id"],
+    #                             contact_wa_id=sender_wa_id,
+    #                             channel_id=channel_id,
+    #                             direction="outbound",
+    #                             message_type="text",
+    #                             content=ai_response,
+    #                             timestamp=datetime.now(SP_TZ).replace(tzinfo=None),
+    #                             status="sent",
+    #                         )
+    #                         db.add(ai_msg)
+    #
+    #                         # Atualizar contador no summary do kanban
+    #                         from app.models import AIConversationSummary
+    #                         summary_result = await db.execute(
+    #                             select(AIConversationSummary).where(
+    #                                 AIConversationSummary.contact_wa_id == sender_wa_id,
+    #                                 AIConversationSummary.status == "em_atendimento_ia",
+    #                             )
+    #                         )
+    #                         summary = summary_result.scalar_one_or_none()
+    #                         if summary:
+    #                             summary.ai_messages_count = (summary.ai_messages_count or 0) + 1
+    #
+    #                     print(f"🤖 IA respondeu para {sender_wa_id}")
+
+
 @app.get("/health")
 async def health():
     return {"status": "online"}
\ No newline at end of file
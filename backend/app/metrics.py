@@ -0,0 +1,414 @@
+"""
+Rollups dos dashboards (tabelas metrics_*, modelos em app/models.py).
+Os dashboards liam o histórico inteiro a cada acesso; agora leem contadores por hora
+(canal e corretor), por ligação da IA, por formulário de LP e os totais atuais de
+contatos. Quem mantém os contadores são triggers no banco, na mesma transação da escrita:
+qualquer caminho que grave (ingestão em lote, rotas, IA, Voice AI, Exact Spotter, SQL
+manual) atualiza os rollups, e rollback desfaz os dois juntos.
+
+- messages: trigger por comando com a tabela de transição (um upsert por canal/hora do
+  lote, não um por mensagem), em ordem de chave para não dar deadlock entre lotes;
+- contacts: novos (no canal/corretor atual), conversões (status virou "convertido") e os
+  totais por status/corretor;
+- ai_calls: cada UPDATE tira a contribuição antiga da ligação e soma a nova;
+- form_submissions: envios por LP/origem/campanha e o contato passa a contar como "de LP".
+
+Mensagem conta para o corretor atribuído ao contato no momento em que foi gravada.
+Reconstrução (idempotente, também serve de carga inicial):
+    python -m app.metrics rebuild [--since 2026-01-01]
+Conversões não têm histórico completo nas tabelas de origem: a reconstrução mantém as já
+contadas. Partições arquivadas (app/partitions.py) saem de messages: use --since para não
+zerar as horas delas.
+"""
+import sys
+import asyncio
+import argparse
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from app.database import Base, engine
+
+ROLLUP_TABLES = (
+    "metrics_channel_hourly",
+    "metrics_agent_hourly",
+    "metrics_ai_calls_hourly",
+    "metrics_forms_hourly",
+    "metrics_contact_counts",
+)
+
+# Um comando por item (o asyncpg não aceita vários num execute)
+METRICS_SETUP_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION metrics_add_hour(
+        p_channel_id int, p_agent_id int, p_at timestamp,
+        p_new_contacts int, p_conversions int, p_forms int
+    ) RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO metrics_channel_hourly AS m (channel_id, hour, new_contacts, conversions, form_submissions)
+        VALUES (coalesce(p_channel_id, 0), date_trunc('hour', coalesce(p_at, localtimestamp)),
+                p_new_contacts, p_conversions, p_forms)
+        ON CONFLICT (channel_id, hour) DO UPDATE
+           SET new_contacts = m.new_contacts + EXCLUDED.new_contacts,
+               conversions = m.conversions + EXCLUDED.conversions,
+               form_submissions = m.form_submissions + EXCLUDED.form_submissions;
+        IF p_agent_id IS NOT NULL AND (p_new_contacts <> 0 OR p_conversions <> 0) THEN
+            INSERT INTO metrics_agent_hourly AS m (agent_id, channel_id, hour, new_contacts, conversions)
+            VALUES (p_agent_id, coalesce(p_channel_id, 0), date_trunc('hour', coalesce(p_at, localtimestamp)),
+                    p_new_contacts, p_conversions)
+            ON CONFLICT (agent_id, channel_id, hour) DO UPDATE
+               SET new_contacts = m.new_contacts + EXCLUDED.new_contacts,
+                   conversions = m.conversions + EXCLUDED.conversions;
+        END IF;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_count_contact(
+        p_channel_id int, p_agent_id int, p_status text, p_from_landing boolean, p_delta int
+    ) RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO metrics_contact_counts AS m (channel_id, agent_id, lead_status, from_landing, contacts)
+        VALUES (coalesce(p_channel_id, 0), coalesce(p_agent_id, 0),
+                coalesce(nullif(p_status, ''), 'novo'), p_from_landing, p_delta)
+        ON CONFLICT (channel_id, agent_id, lead_status, from_landing) DO UPDATE
+           SET contacts = m.contacts + EXCLUDED.contacts;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_messages_inserted() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO metrics_channel_hourly AS m (channel_id, hour, inbound, outbound)
+        SELECT coalesce(channel_id, 0), date_trunc('hour', coalesce(timestamp, localtimestamp)),
+               count(*) FILTER (WHERE direction = 'inbound'),
+               count(*) FILTER (WHERE direction = 'outbound')
+          FROM metrics_new_messages
+         GROUP BY 1, 2
+         ORDER BY 1, 2
+        ON CONFLICT (channel_id, hour) DO UPDATE
+           SET inbound = m.inbound + EXCLUDED.inbound,
+               outbound = m.outbound + EXCLUDED.outbound;
+
+        INSERT INTO metrics_agent_hourly AS m (agent_id, channel_id, hour, inbound, outbound)
+        SELECT c.assigned_to, coalesce(n.channel_id, 0), date_trunc('hour', coalesce(n.timestamp, localtimestamp)),
+               count(*) FILTER (WHERE n.direction = 'inbound'),
+               count(*) FILTER (WHERE n.direction = 'outbound')
+          FROM metrics_new_messages n
+          JOIN contacts c ON c.wa_id = n.contact_wa_id
+         WHERE c.assigned_to IS NOT NULL
+         GROUP BY 1, 2, 3
+         ORDER BY 1, 2, 3
+        ON CONFLICT (agent_id, channel_id, hour) DO UPDATE
+           SET inbound = m.inbound + EXCLUDED.inbound,
+               outbound = m.outbound + EXCLUDED.outbound;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_metrics_messages ON messages",
+    """
+    CREATE TRIGGER trg_metrics_messages AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS metrics_new_messages
+    FOR EACH STATEMENT EXECUTE FUNCTION metrics_messages_inserted()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_contacts_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        old_status text;
+        new_status text;
+        from_landing boolean;
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            old_status := coalesce(nullif(OLD.lead_status, ''), 'novo');
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_status := coalesce(nullif(NEW.lead_status, ''), 'novo');
+        END IF;
+        IF TG_OP = 'UPDATE' AND new_status = old_status
+           AND NEW.channel_id IS NOT DISTINCT FROM OLD.channel_id
+           AND NEW.assigned_to IS NOT DISTINCT FROM OLD.assigned_to THEN
+            RETURN NULL;
+        END IF;
+
+        from_landing := EXISTS (SELECT 1 FROM form_submissions f
+                                 WHERE f.phone = coalesce(NEW.wa_id, OLD.wa_id));
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM metrics_count_contact(OLD.channel_id, OLD.assigned_to, old_status, from_landing, -1);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM metrics_count_contact(NEW.channel_id, NEW.assigned_to, new_status, from_landing, 1);
+        END IF;
+
+        IF TG_OP = 'INSERT' THEN
+            PERFORM metrics_add_hour(NEW.channel_id, NEW.assigned_to, NEW.created_at,
+                                     1, (new_status = 'convertido')::int, 0);
+            RETURN NULL;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM metrics_add_hour(OLD.channel_id, OLD.assigned_to, OLD.created_at, -1, 0, 0);
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'UPDATE' AND (NEW.channel_id IS DISTINCT FROM OLD.channel_id
+                                 OR NEW.assigned_to IS DISTINCT FROM OLD.assigned_to) THEN
+            -- O contato novo passa a contar no canal/corretor atual (como na reconstrução)
+            PERFORM metrics_add_hour(OLD.channel_id, OLD.assigned_to, OLD.created_at, -1, 0, 0);
+            PERFORM metrics_add_hour(NEW.channel_id, NEW.assigned_to, NEW.created_at, 1, 0, 0);
+        END IF;
+        IF TG_OP = 'UPDATE' AND new_status = 'convertido' AND old_status <> 'convertido' THEN
+            PERFORM metrics_add_hour(NEW.channel_id, NEW.assigned_to, localtimestamp, 0, 1, 0);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_metrics_contacts ON contacts",
+    """
+    CREATE TRIGGER trg_metrics_contacts
+    AFTER INSERT OR DELETE OR UPDATE OF lead_status, channel_id, assigned_to ON contacts
+    FOR EACH ROW EXECUTE FUNCTION metrics_contacts_changed()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_form_submitted() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        c record;
+    BEGIN
+        PERFORM metrics_add_hour(NEW.channel_id, NULL, NEW.created_at, 0, 0, 1);
+        INSERT INTO metrics_forms_hourly AS m (hour, landing_page_id, utm_source, utm_campaign, submissions)
+        VALUES (date_trunc('hour', coalesce(NEW.created_at, localtimestamp)), NEW.landing_page_id,
+                coalesce(NEW.utm_source, ''), coalesce(NEW.utm_campaign, ''), 1)
+        ON CONFLICT (hour, landing_page_id, utm_source, utm_campaign) DO UPDATE
+           SET submissions = m.submissions + 1;
+
+        -- Primeiro envio de um contato que já existe: ele passa a contar como vindo de LP
+        IF NOT EXISTS (SELECT 1 FROM form_submissions f WHERE f.phone = NEW.phone AND f.id <> NEW.id) THEN
+            SELECT channel_id, assigned_to, lead_status INTO c FROM contacts WHERE wa_id = NEW.phone;
+            IF FOUND THEN
+                PERFORM metrics_count_contact(c.channel_id, c.assigned_to, c.lead_status, false, -1);
+                PERFORM metrics_count_contact(c.channel_id, c.assigned_to, c.lead_status, true, 1);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_metrics_form_submissions ON form_submissions",
+    """
+    CREATE TRIGGER trg_metrics_form_submissions AFTER INSERT ON form_submissions
+    FOR EACH ROW EXECUTE FUNCTION metrics_form_submitted()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_add_ai_call(
+        p_at timestamp, p_outcome text, p_course text, p_status text,
+        p_score int, p_latency int, p_duration int, p_delta int
+    ) RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO metrics_ai_calls_hourly AS m (
+            hour, outcome, course, calls, completed, score_sum, score_count,
+            latency_sum, latency_count, duration_sum, duration_count
+        )
+        VALUES (
+            date_trunc('hour', coalesce(p_at, localtimestamp)), coalesce(p_outcome, ''), coalesce(p_course, ''),
+            p_delta,
+            p_delta * (p_status IS NOT DISTINCT FROM 'completed')::int,
+            p_delta * greatest(coalesce(p_score, 0), 0), p_delta * (coalesce(p_score, 0) > 0)::int,
+            p_delta * greatest(coalesce(p_latency, 0), 0), p_delta * (coalesce(p_latency, 0) > 0)::int,
+            p_delta * greatest(coalesce(p_duration, 0), 0), p_delta * (coalesce(p_duration, 0) > 0)::int
+        )
+        ON CONFLICT (hour, outcome, course) DO UPDATE
+           SET calls = m.calls + EXCLUDED.calls,
+               completed = m.completed + EXCLUDED.completed,
+               score_sum = m.score_sum + EXCLUDED.score_sum,
+               score_count = m.score_count + EXCLUDED.score_count,
+               latency_sum = m.latency_sum + EXCLUDED.latency_sum,
+               latency_count = m.latency_count + EXCLUDED.latency_count,
+               duration_sum = m.duration_sum + EXCLUDED.duration_sum,
+               duration_count = m.duration_count + EXCLUDED.duration_count;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION metrics_ai_calls_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND (NEW.created_at, NEW.outcome, NEW.course, NEW.status, NEW.score, NEW.avg_latency_ms, NEW.duration_seconds)
+               IS NOT DISTINCT FROM
+               (OLD.created_at, OLD.outcome, OLD.course, OLD.status, OLD.score, OLD.avg_latency_ms, OLD.duration_seconds) THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM metrics_add_ai_call(OLD.created_at, OLD.outcome, OLD.course, OLD.status,
+                                        OLD.score, OLD.avg_latency_ms, OLD.duration_seconds, -1);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM metrics_add_ai_call(NEW.created_at, NEW.outcome, NEW.course, NEW.status,
+                                        NEW.score, NEW.avg_latency_ms, NEW.duration_seconds, 1);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    DO $$
+    BEGIN
+        -- ai_calls é do módulo de Voice AI (app/voice_ai/models.py) e pode não existir
+        IF to_regclass('ai_calls') IS NOT NULL THEN
+            DROP TRIGGER IF EXISTS trg_metrics_ai_calls ON ai_calls;
+            CREATE TRIGGER trg_metrics_ai_calls
+            AFTER INSERT OR DELETE OR UPDATE OF created_at, outcome, course, status, score, avg_latency_ms, duration_seconds
+            ON ai_calls FOR EACH ROW EXECUTE FUNCTION metrics_ai_calls_changed();
+        END IF;
+    END $$
+    """,
+]
+
+
+async def setup(conn):
+    """Cria/atualiza as funções e triggers (idempotente)."""
+    for sql in METRICS_SETUP_SQL:
+        await conn.execute(text(sql))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_metrics_triggers(target, connection, **kw):
+    # create_all (create_tables.py, schemas de teste) já sai com os rollups mantidos
+    if "metrics_channel_hourly" in target.tables:
+        for sql in METRICS_SETUP_SQL:
+            connection.execute(text(sql))
+
+
+# ============================================================
+# RECONSTRUÇÃO
+# ============================================================
+
+REBUILD_SQL = [
+    # Totais atuais: sempre por inteiro
+    "DELETE FROM metrics_contact_counts",
+    """
+    INSERT INTO metrics_contact_counts (channel_id, agent_id, lead_status, from_landing, contacts)
+    SELECT coalesce(c.channel_id, 0), coalesce(c.assigned_to, 0), coalesce(nullif(c.lead_status, ''), 'novo'),
+           EXISTS (SELECT 1 FROM form_submissions f WHERE f.phone = c.wa_id), count(*)
+      FROM contacts c
+     GROUP BY 1, 2, 3, 4
+    """,
+    # Contadores por hora a partir de :since; conversões ficam como estão
+    """
+    UPDATE metrics_channel_hourly SET inbound = 0, outbound = 0, new_contacts = 0, form_submissions = 0
+     WHERE hour >= :since
+    """,
+    """
+    INSERT INTO metrics_channel_hourly AS m (channel_id, hour, inbound, outbound, new_contacts, form_submissions)
+    SELECT channel_id, hour, sum(inbound), sum(outbound), sum(new_contacts), sum(forms)
+      FROM (
+            SELECT coalesce(channel_id, 0) AS channel_id, date_trunc('hour', timestamp) AS hour,
+                   count(*) FILTER (WHERE direction = 'inbound') AS inbound,
+                   count(*) FILTER (WHERE direction = 'outbound') AS outbound,
+                   0 AS new_contacts, 0 AS forms
+              FROM messages WHERE timestamp >= :since GROUP BY 1, 2
+            UNION ALL
+            SELECT coalesce(channel_id, 0), date_trunc('hour', created_at), 0, 0, count(*), 0
+              FROM contacts WHERE created_at >= :since GROUP BY 1, 2
+            UNION ALL
+            SELECT channel_id, date_trunc('hour', created_at), 0, 0, 0, count(*)
+              FROM form_submissions WHERE created_at >= :since GROUP BY 1, 2
+           ) t
+     GROUP BY channel_id, hour
+    ON CONFLICT (channel_id, hour) DO UPDATE
+       SET inbound = EXCLUDED.inbound, outbound = EXCLUDED.outbound,
+           new_contacts = EXCLUDED.new_contacts, form_submissions = EXCLUDED.form_submissions
+    """,
+    """
+    DELETE FROM metrics_channel_hourly
+     WHERE hour >= :since AND inbound = 0 AND outbound = 0 AND new_contacts = 0
+       AND conversions = 0 AND form_submissions = 0
+    """,
+    # Sem histórico de atribuição: a reconstrução usa o corretor atual do contato
+    "UPDATE metrics_agent_hourly SET inbound = 0, outbound = 0, new_contacts = 0 WHERE hour >= :since",
+    """
+    INSERT INTO metrics_agent_hourly AS m (agent_id, channel_id, hour, inbound, outbound, new_contacts)
+    SELECT agent_id, channel_id, hour, sum(inbound), sum(outbound), sum(new_contacts)
+      FROM (
+            SELECT c.assigned_to AS agent_id, coalesce(m.channel_id, 0) AS channel_id,
+                   date_trunc('hour', m.timestamp) AS hour,
+                   count(*) FILTER (WHERE m.direction = 'inbound') AS inbound,
+                   count(*) FILTER (WHERE m.direction = 'outbound') AS outbound,
+                   0 AS new_contacts
+              FROM messages m JOIN contacts c ON c.wa_id = m.contact_wa_id
+             WHERE m.timestamp >= :since AND c.assigned_to IS NOT NULL
+             GROUP BY 1, 2, 3
+            UNION ALL
+            SELECT assigned_to, coalesce(channel_id, 0), date_trunc('hour', created_at), 0, 0, count(*)
+              FROM contacts WHERE created_at >= :since AND assigned_to IS NOT NULL GROUP BY 1, 2, 3
+           ) t
+     GROUP BY agent_id, channel_id, hour
+    ON CONFLICT (agent_id, channel_id, hour) DO UPDATE
+       SET inbound = EXCLUDED.inbound, outbound = EXCLUDED.outbound, new_contacts = EXCLUDED.new_contacts
+    """,
+    """
+    DELETE FROM metrics_agent_hourly
+     WHERE hour >= :since AND inbound = 0 AND outbound = 0 AND new_contacts = 0 AND conversions = 0
+    """,
+    "DELETE FROM metrics_forms_hourly WHERE hour >= :since",
+    """
+    INSERT INTO metrics_forms_hourly (hour, landing_page_id, utm_source, utm_campaign, submissions)
+    SELECT date_trunc('hour', created_at), landing_page_id, coalesce(utm_source, ''), coalesce(utm_campaign, ''), count(*)
+      FROM form_submissions WHERE created_at >= :since
+     GROUP BY 1, 2, 3, 4
+    """,
+]
+
+REBUILD_AI_CALLS_SQL = [
+    "DELETE FROM metrics_ai_calls_hourly WHERE hour >= :since",
+    """
+    INSERT INTO metrics_ai_calls_hourly (
+        hour, outcome, course, calls, completed, score_sum, score_count,
+        latency_sum, latency_count, duration_sum, duration_count
+    )
+    SELECT date_trunc('hour', created_at), coalesce(outcome, ''), coalesce(course, ''),
+           count(*), count(*) FILTER (WHERE status = 'completed'),
+           coalesce(sum(score) FILTER (WHERE score > 0), 0), count(*) FILTER (WHERE score > 0),
+           coalesce(sum(avg_latency_ms) FILTER (WHERE avg_latency_ms > 0), 0), count(*) FILTER (WHERE avg_latency_ms > 0),
+           coalesce(sum(duration_seconds) FILTER (WHERE duration_seconds > 0), 0), count(*) FILTER (WHERE duration_seconds > 0)
+      FROM ai_calls WHERE created_at >= :since
+     GROUP BY 1, 2, 3
+    """,
+]
+
+
+async def rebuild(conn, since: datetime | None = None) -> dict:
+    """
+    Recalcula os rollups a partir das tabelas de origem (tudo, ou as horas a partir de
+    `since`). Idempotente; rodar numa transação só (engine.begin()). O LOCK segura as
+    escritas concorrentes no ponto do trigger até o commit, então nada é contado duas vezes
+    nem perdido.
+    """
+    since = (since or datetime(1970, 1, 1)).replace(minute=0, second=0, microsecond=0)
+    await conn.execute(text(f"LOCK TABLE {', '.join(ROLLUP_TABLES)} IN EXCLUSIVE MODE"))
+    for sql in REBUILD_SQL:
+        await conn.execute(text(sql), {"since": since})
+    has_ai_calls = (await conn.execute(text("SELECT to_regclass('ai_calls') IS NOT NULL"))).scalar()
+    if has_ai_calls:
+        for sql in REBUILD_AI_CALLS_SQL:
+            await conn.execute(text(sql), {"since": since})
+
+    counts = {}
+    for table in ROLLUP_TABLES:
+        counts[table] = (await conn.execute(text(f"SELECT count(*) FROM {table}"))).scalar()
+    return counts
+
+
+async def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description="Rollups dos dashboards (tabelas metrics_*)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("setup")
+    rebuild_cmd = sub.add_parser("rebuild")
+    rebuild_cmd.add_argument("--since", help="YYYY-MM-DD; sem isso recalcula todo o histórico")
+    args = parser.parse_args(argv)
+
+    async with engine.begin() as conn:
+        if args.command == "setup":
+            await setup(conn)
+            print("✅ Triggers dos rollups criados")
+        elif args.command == "rebuild":
+            since = datetime.fromisoformat(args.since) if args.since else None
+            counts = await rebuild(conn, since)
+            for table, rows in counts.items():
+                print(f"✅ {table}: {rows} linhas")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -74,6 +74,15 @@ async def migrate():
         """))
         print("✅ Índices criados")
 
+        # 6. Janela de agrupamento de mensagens por canal
+        await conn.execute(text("""
+            ALTER TABLE ai_configs ADD COLUMN IF NOT EXISTS coalesce_window_ms INTEGER;
+        """))
+        await conn.execute(text("""
+            ALTER TABLE ai_configs ADD COLUMN IF NOT EXISTS coalesce_max_wait_ms INTEGER;
+        """))
+        print("✅ Colunas de agrupamento adicionadas em ai_configs")
+
     print("\n🎉 Migração concluída com sucesso!")
 
 
@@ -0,0 +1,53 @@
+"""
+Migração: cria a tabela conversation_state (caixa de entrada) e preenche a partir de messages
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_conversation_state
+
+Pode ser rodado de novo a qualquer momento para recalcular o estado de todas as conversas.
+"""
+import asyncio
+import time
+from sqlalchemy import text
+from app.database import engine, async_session
+from app.conversation_state import rebuild
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        # 1. Tabela conversation_state
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS conversation_state (
+                wa_id VARCHAR(20) PRIMARY KEY REFERENCES contacts(wa_id),
+                channel_id INTEGER REFERENCES channels(id),
+                last_message_preview TEXT,
+                last_message_at TIMESTAMP,
+                last_direction VARCHAR(10),
+                unread_count INTEGER NOT NULL DEFAULT 0,
+                last_inbound_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT now()
+            );
+        """))
+        print("✅ Tabela conversation_state criada")
+
+        # 2. Índices na mesma ordem da caixa de entrada (keyset)
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_conversation_state_inbox
+                ON conversation_state (last_message_at DESC NULLS LAST, wa_id DESC);
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_conversation_state_channel_inbox
+                ON conversation_state (channel_id, last_message_at DESC NULLS LAST, wa_id DESC);
+        """))
+        print("✅ Índices criados")
+
+    # 3. Backfill
+    started = time.perf_counter()
+    async with async_session() as db:
+        total = await rebuild(db)
+        await db.commit()
+    print(f"✅ {total} conversas recalculadas em {time.perf_counter() - started:.1f}s")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,32 @@
+"""
+Migração: cria a tabela do barramento de eventos entre workers (bus_events)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_event_bus
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS bus_events (
+                id BIGSERIAL PRIMARY KEY,
+                topic VARCHAR(100) NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """))
+        print("✅ Tabela bus_events criada")
+
+        # Releitura após reconexão e limpeza por retenção filtram por created_at
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_bus_events_created_at ON bus_events(created_at);
+        """))
+        print("✅ Índices criados")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,122 @@
+"""
+Migração: índices compostos e parciais para os caminhos quentes de mensagens e contatos
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_indexes
+
+Os índices são criados com CREATE INDEX CONCURRENTLY (não travam escrita em messages),
+por isso cada comando roda fora de transação. A versão aplicada fica em schema_migrations.
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+from app.partitions import is_partitioned, list_partitions
+
+VERSION = "20261017_hot_path_indexes"
+
+INDEXES = [
+    # Histórico da conversa, última mensagem e IA: WHERE contact_wa_id = ? ORDER BY timestamp
+    ("ix_messages_contact_timestamp",
+     "ON messages (contact_wa_id, timestamp)"),
+    # Dashboard e exportação por canal/período
+    ("ix_messages_channel_timestamp",
+     "ON messages (channel_id, timestamp)"),
+    # Contadores por direção/status de cada contato
+    ("ix_messages_contact_direction_status",
+     "ON messages (contact_wa_id, direction, status)"),
+    # Não lidas: só as recebidas que ainda não foram marcadas como lidas
+    ("ix_messages_unread_inbound",
+     "ON messages (contact_wa_id) WHERE direction = 'inbound' AND status = 'received'"),
+    ("ix_contacts_channel_created",
+     "ON contacts (channel_id, created_at)"),
+    ("ix_contacts_assigned_to",
+     "ON contacts (assigned_to)"),
+    # Scheduler de ligações: status = 'pending' AND type = 'voice_ai' AND scheduled_at <= agora
+    ("ix_schedules_status_type_at",
+     "ON schedules (status, type, scheduled_at)"),
+    ("ix_ai_calls_created_source",
+     "ON ai_calls (created_at, source)"),
+]
+
+
+async def _create_partitioned_index(conn, name: str, table: str, definition: str):
+    """
+    Tabela particionada não aceita CREATE INDEX CONCURRENTLY: cria o índice só no pai
+    (ON ONLY), cria CONCURRENTLY em cada partição e anexa ao pai.
+    """
+    parent_definition = definition.replace(f"ON {table} ", f"ON ONLY {table} ", 1)
+    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} {parent_definition}"))
+    for partition in await list_partitions(conn, table):
+        partition_table = partition["name"]
+        # Partição que já tem índice anexado ao pai (ex.: criado por create_all, com nome do Postgres)
+        existing = await conn.execute(text("""
+            SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid
+             WHERE i.inhparent = CAST(:name AS regclass) AND x.indrelid = CAST(:partition AS regclass)
+        """), {"name": name, "partition": partition_table})
+        if existing.scalar():
+            continue
+        child = f"{name}_{partition_table.removeprefix(table + '_')}"[:63]
+        child_definition = definition.replace(f"ON {table} ", f"ON {partition_table} ", 1)
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} {child_definition}"))
+        attached = await conn.execute(text("""
+            SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE c.relname = :child AND pg_table_is_visible(c.oid)
+        """), {"child": child})
+        if not attached.scalar():
+            await conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+
+async def create_indexes(conn, indexes: list[tuple[str, str]] = INDEXES):
+    """Cria os índices (a conexão precisa estar em AUTOCOMMIT por causa do CONCURRENTLY)."""
+    tables = set()
+    for name, definition in indexes:
+        table = definition.split()[1]
+        tables.add(table)
+
+        if await is_partitioned(conn, table):
+            await _create_partitioned_index(conn, name, table, definition)
+            print(f"✅ Índice {name} (particionado)")
+            continue
+
+        # Um CONCURRENTLY interrompido deixa o índice inválido; recria do zero
+        invalid = await conn.execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+             WHERE c.relname = :name AND pg_table_is_visible(c.oid) AND NOT i.indisvalid
+        """), {"name": name})
+        if invalid.scalar():
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+        print(f"✅ Índice {name}")
+
+    for table in sorted(tables):
+        await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(100) PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT now()
+            );
+        """))
+        result = await conn.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": VERSION}
+        )
+        if result.scalar():
+            print(f"ℹ️ Migração {VERSION} já aplicada")
+            return
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await create_indexes(conn)
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:v) ON CONFLICT DO NOTHING"), {"v": VERSION}
+        )
+
+    print(f"\n🎉 Migração {VERSION} concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
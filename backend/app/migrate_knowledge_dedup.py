@@ -0,0 +1,51 @@
+"""
+Migração: hash do conteúdo dos chunks da base de conhecimento (reenvio sem refazer embeddings)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_knowledge_dedup [--batch 5000]
+
+1. Coluna content_hash em knowledge_documents + índice (channel_id, content_hash).
+2. Preenchimento em lotes (sha256 do content, calculado no Postgres), um commit por lote;
+   interrompida, recomeça pelas linhas ainda sem hash.
+3. Colunas reused_chunks, removed_chunks e saved_api_calls em knowledge_ingest_jobs.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.knowledge_ingest import CONTENT_HASH_SQL
+
+
+async def migrate(batch: int = 5000):
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_knowledge_documents_channel_hash
+                ON knowledge_documents(channel_id, content_hash)
+        """))
+        for column in ("reused_chunks", "removed_chunks", "saved_api_calls"):
+            await conn.execute(text(
+                f"ALTER TABLE knowledge_ingest_jobs ADD COLUMN IF NOT EXISTS {column} INTEGER NOT NULL DEFAULT 0"
+            ))
+    print("✅ Coluna content_hash e índice (channel_id, content_hash)")
+
+    filled = 0
+    while True:
+        async with engine.begin() as conn:
+            result = await conn.execute(text(f"""
+                UPDATE knowledge_documents SET content_hash = {CONTENT_HASH_SQL}
+                 WHERE id IN (SELECT id FROM knowledge_documents WHERE content_hash IS NULL LIMIT :batch)
+            """), {"batch": batch})
+        if not result.rowcount:
+            break
+        filled += result.rowcount
+        print(f"   ... {filled} chunks com hash")
+    print(f"✅ {filled} chunks preenchidos")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash do conteúdo dos chunks da base de conhecimento")
+    parser.add_argument("--batch", type=int, default=5000, help="Linhas por transação no preenchimento")
+    asyncio.run(migrate(parser.parse_args().batch))
@@ -0,0 +1,172 @@
+"""
+Migração: embeddings da base de conhecimento em float32 binário (ver app/embedding_store.py)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_knowledge_embeddings
+          [--batch 500] [--max-batches N] [--keep-json] [--pgvector [--dim 1536]] [--vacuum]
+
+1. Colunas embedding_vec (bytea), embedding_dim e embedding_model em knowledge_documents.
+2. Conversão em lotes: cada lote lê o JSON, grava os float32 empacotados e apaga o JSON
+   (--keep-json mantém) numa transação própria. Interrompida (ou limitada com
+   --max-batches), recomeça de onde parou: só linhas sem embedding_vec são lidas.
+3. --pgvector: extensão vector (se o servidor tiver), coluna embedding_pgv vector(--dim),
+   preenchimento em lotes a partir de embedding_vec (também retomável) e índice HNSW por
+   cosseno. Depois, reinicie os workers e use KNOWLEDGE_SEARCH_BACKEND=pgvector.
+4. Tamanho da tabela antes/depois. O espaço do JSON apagado só volta ao disco com
+   VACUUM FULL (--vacuum; trava a tabela enquanto roda).
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app import embedding_store
+from app.ai_engine import EMBEDDING_MODEL
+from app.database import engine as default_engine
+
+
+async def add_columns(engine):
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS embedding_vec BYTEA"))
+        await conn.execute(text("ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS embedding_dim INTEGER"))
+        await conn.execute(text("ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(100)"))
+    print("✅ Colunas embedding_vec, embedding_dim, embedding_model")
+
+
+async def convert(engine, batch: int = 500, keep_json: bool = False, model: str = EMBEDDING_MODEL,
+                  max_batches: int | None = None) -> dict:
+    """JSON -> embedding_vec em lotes (um commit por lote). JSON ilegível fica como está."""
+    counts = {"converted": 0, "unreadable": 0, "batches": 0}
+    clear_json = "" if keep_json else ", embedding = NULL"
+    last_id = 0
+    while max_batches is None or counts["batches"] < max_batches:
+        async with engine.begin() as conn:
+            result = await conn.execute(text("""
+                SELECT id, embedding FROM knowledge_documents
+                 WHERE embedding_vec IS NULL AND embedding IS NOT NULL AND id > :last_id
+                 ORDER BY id
+                 LIMIT :batch
+            """), {"last_id": last_id, "batch": batch})
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            ids, blobs, dims = [], [], []
+            for row in rows:
+                vector = embedding_store.decode(None, row.embedding)
+                if vector is None:
+                    counts["unreadable"] += 1
+                    continue
+                ids.append(row.id)
+                blobs.append(embedding_store.pack(vector))
+                dims.append(len(vector))
+            if ids:
+                await conn.execute(text(f"""
+                    UPDATE knowledge_documents d
+                       SET embedding_vec = t.vec, embedding_dim = t.dim, embedding_model = :model{clear_json}
+                      FROM unnest(CAST(:ids AS int[]), CAST(:blobs AS bytea[]), CAST(:dims AS int[])) AS t(id, vec, dim)
+                     WHERE d.id = t.id
+                """), {"ids": ids, "blobs": blobs, "dims": dims, "model": model})
+        counts["converted"] += len(ids)
+        counts["batches"] += 1
+        print(f"   ... {counts['converted']} convertidos (até id {last_id})")
+    return counts
+
+
+async def setup_pgvector(engine, dim: int) -> bool:
+    """Extensão vector + coluna embedding_pgv; False se o servidor não tem a extensão."""
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            DO $$
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS vector;
+            EXCEPTION WHEN OTHERS THEN NULL;
+            END $$;
+        """))
+        installed = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'vector'"))
+        if not installed.scalar():
+            print("⚠️ Extensão vector indisponível — seguindo só com embedding_vec")
+            return False
+        await conn.execute(text(
+            f"ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS {embedding_store.PGVECTOR_COLUMN} vector({dim})"
+        ))
+    print(f"✅ Coluna {embedding_store.PGVECTOR_COLUMN} vector({dim})")
+    return True
+
+
+async def fill_pgvector(engine, dim: int, batch: int = 500) -> int:
+    """embedding_vec -> embedding_pgv em lotes (só vetores com a dimensão da coluna)."""
+    filled, last_id = 0, 0
+    while True:
+        async with engine.begin() as conn:
+            result = await conn.execute(text(f"""
+                SELECT id, embedding_vec FROM knowledge_documents
+                 WHERE {embedding_store.PGVECTOR_COLUMN} IS NULL AND embedding_vec IS NOT NULL
+                   AND embedding_dim = :dim AND id > :last_id
+                 ORDER BY id
+                 LIMIT :batch
+            """), {"dim": dim, "last_id": last_id, "batch": batch})
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            await embedding_store.store_pgvector(conn, [(row.id, embedding_store.unpack(row.embedding_vec)) for row in rows])
+        filled += len(rows)
+        print(f"   ... {filled} vetores no pgvector (até id {last_id})")
+    async with engine.begin() as conn:
+        await conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS ix_knowledge_documents_embedding_pgv
+                ON knowledge_documents USING hnsw ({embedding_store.PGVECTOR_COLUMN} vector_cosine_ops)
+        """))
+    print("✅ Índice HNSW ix_knowledge_documents_embedding_pgv")
+    return filled
+
+
+async def table_size(engine) -> int:
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT pg_total_relation_size('knowledge_documents')"))
+        return result.scalar()
+
+
+async def vacuum_full(engine):
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM FULL knowledge_documents"))
+
+
+async def migrate(args, engine=default_engine):
+    started = time.perf_counter()
+    size_before = await table_size(engine)
+    await add_columns(engine)
+
+    counts = await convert(engine, args.batch, args.keep_json, args.model, args.max_batches)
+    print(f"✅ {counts['converted']} embeddings convertidos em {counts['batches']} lotes"
+          + (f" ({counts['unreadable']} com JSON ilegível mantidos)" if counts["unreadable"] else ""))
+
+    if args.pgvector and await setup_pgvector(engine, args.dim):
+        await fill_pgvector(engine, args.dim, args.batch)
+
+    if args.vacuum:
+        await vacuum_full(engine)
+        print("✅ VACUUM FULL knowledge_documents")
+    size_after = await table_size(engine)
+    print(f"\n📦 knowledge_documents: {size_before / 1024 / 1024:.1f} MB → {size_after / 1024 / 1024:.1f} MB"
+          + ("" if args.vacuum else " (sem --vacuum o espaço do JSON apagado fica reservado na tabela)"))
+    print(f"🎉 Migração concluída em {time.perf_counter() - started:.1f}s")
+    await engine.dispose()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Converte os embeddings da base de conhecimento para float32 binário")
+    parser.add_argument("--batch", type=int, default=500, help="Linhas por lote (uma transação cada)")
+    parser.add_argument("--max-batches", type=int, default=None, help="Para depois de N lotes (roda de novo para continuar)")
+    parser.add_argument("--keep-json", action="store_true", help="Não apaga a coluna embedding (JSON) convertida")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Modelo registrado nas linhas convertidas")
+    parser.add_argument("--pgvector", action="store_true", help="Cria e preenche embedding_pgv (extensão vector)")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimensão da coluna embedding_pgv")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM FULL no final (devolve o espaço do JSON)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(parse_args()))
@@ -0,0 +1,39 @@
+"""
+Migração: cria a tabela dos jobs de ingestão da base de conhecimento (knowledge_ingest_jobs)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_knowledge_ingest
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS knowledge_ingest_jobs (
+                id SERIAL PRIMARY KEY,
+                channel_id INTEGER NOT NULL REFERENCES channels(id),
+                title VARCHAR(255) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'running',
+                total_chunks INTEGER NOT NULL DEFAULT 0,
+                embedded_chunks INTEGER NOT NULL DEFAULT 0,
+                saved_chunks INTEGER NOT NULL DEFAULT 0,
+                total_tokens INTEGER NOT NULL DEFAULT 0,
+                api_calls INTEGER NOT NULL DEFAULT 0,
+                retries INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT now(),
+                updated_at TIMESTAMP DEFAULT now(),
+                finished_at TIMESTAMP
+            );
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_knowledge_ingest_jobs_channel_id ON knowledge_ingest_jobs(channel_id);
+        """))
+        print("✅ Tabela knowledge_ingest_jobs criada")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,48 @@
+"""
+Migração: chave global de deduplicação das mensagens (tabela message_ids)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_message_ids
+
+Com messages particionada, a chave única virou (wa_message_id, timestamp) e o mesmo id com
+outro horário era gravado de novo (eco fromMe da Evolution, reentregas sem timestamp).
+1. Tabela message_ids (wa_message_id PK) e o trigger que a preenche a cada INSERT em messages.
+2. Carga com os ids já gravados (na mesma transação do trigger: nada escapa entre os dois).
+3. Mostra quantos ids ficaram duplicados em messages desde o particionamento.
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+from app.ingestion import setup
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS message_ids (
+                wa_message_id VARCHAR(255) PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT now()
+            );
+        """))
+        await setup(conn)
+        print("✅ Tabela message_ids e trigger trg_message_ids")
+
+        result = await conn.execute(text("""
+            INSERT INTO message_ids (wa_message_id, created_at)
+            SELECT wa_message_id, min(timestamp) FROM messages GROUP BY wa_message_id
+            ON CONFLICT DO NOTHING
+        """))
+        print(f"✅ {result.rowcount} ids carregados")
+
+        duplicated = await conn.execute(text("""
+            SELECT count(*) FROM (
+                SELECT wa_message_id FROM messages GROUP BY wa_message_id HAVING count(*) > 1
+            ) d
+        """))
+        count = duplicated.scalar()
+        if count:
+            print(f"⚠️ {count} ids com mais de uma linha em messages (gravados antes desta migração)")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,59 @@
+"""
+Migração: paginação por cursor e sincronização incremental do histórico de mensagens
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_message_sync
+
+Adiciona messages.updated_at (marca mudanças de status) e os índices usados por
+GET /api/contacts/{wa_id}/messages com before_id / after_id.
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+from app.migrate_indexes import create_indexes
+
+VERSION = "20261017_message_sync"
+
+INDEXES = [
+    # Abrir a conversa e rolar para trás: WHERE contact_wa_id = ? AND id < ? ORDER BY id DESC
+    ("ix_messages_contact_id",
+     "ON messages (contact_wa_id, id)"),
+    # Mudanças de status desde a última sincronização
+    ("ix_messages_contact_updated",
+     "ON messages (contact_wa_id, updated_at)"),
+]
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(100) PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT now()
+            );
+        """))
+        result = await conn.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": VERSION}
+        )
+        if result.scalar():
+            print(f"ℹ️ Migração {VERSION} já aplicada")
+            return
+
+        # 1. Coluna updated_at (linhas antigas ficam NULL: não há mudança a sincronizar)
+        await conn.execute(text("ALTER TABLE messages ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"))
+        await conn.execute(text("ALTER TABLE messages ALTER COLUMN updated_at SET DEFAULT now()"))
+        print("✅ Coluna messages.updated_at")
+
+    # 2. Índices
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await create_indexes(conn, INDEXES)
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:v) ON CONFLICT DO NOTHING"), {"v": VERSION}
+        )
+
+    print(f"\n🎉 Migração {VERSION} concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,99 @@
+"""
+Migração: cria os rollups dos dashboards (metrics_*), os triggers que os mantêm e faz a
+carga inicial a partir do histórico (ver app/metrics.py)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_metrics
+
+Pode ser rodado de novo a qualquer momento (python -m app.metrics rebuild recalcula só os rollups).
+"""
+import asyncio
+import time
+from sqlalchemy import text
+from app.database import engine
+from app.metrics import setup, rebuild
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        # 1. Tabelas
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metrics_channel_hourly (
+                channel_id INTEGER NOT NULL,
+                hour TIMESTAMP NOT NULL,
+                inbound INTEGER NOT NULL DEFAULT 0,
+                outbound INTEGER NOT NULL DEFAULT 0,
+                new_contacts INTEGER NOT NULL DEFAULT 0,
+                conversions INTEGER NOT NULL DEFAULT 0,
+                form_submissions INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (channel_id, hour)
+            );
+        """))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metrics_agent_hourly (
+                agent_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                hour TIMESTAMP NOT NULL,
+                inbound INTEGER NOT NULL DEFAULT 0,
+                outbound INTEGER NOT NULL DEFAULT 0,
+                new_contacts INTEGER NOT NULL DEFAULT 0,
+                conversions INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (agent_id, channel_id, hour)
+            );
+        """))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metrics_ai_calls_hourly (
+                hour TIMESTAMP NOT NULL,
+                outcome VARCHAR(30) NOT NULL,
+                course VARCHAR(255) NOT NULL,
+                calls INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                score_sum BIGINT NOT NULL DEFAULT 0,
+                score_count INTEGER NOT NULL DEFAULT 0,
+                latency_sum BIGINT NOT NULL DEFAULT 0,
+                latency_count INTEGER NOT NULL DEFAULT 0,
+                duration_sum BIGINT NOT NULL DEFAULT 0,
+                duration_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, outcome, course)
+            );
+        """))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metrics_forms_hourly (
+                hour TIMESTAMP NOT NULL,
+                landing_page_id INTEGER NOT NULL,
+                utm_source VARCHAR(100) NOT NULL,
+                utm_campaign VARCHAR(100) NOT NULL,
+                submissions INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, landing_page_id, utm_source, utm_campaign)
+            );
+        """))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metrics_contact_counts (
+                channel_id INTEGER NOT NULL,
+                agent_id INTEGER NOT NULL,
+                lead_status VARCHAR(30) NOT NULL,
+                from_landing BOOLEAN NOT NULL,
+                contacts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (channel_id, agent_id, lead_status, from_landing)
+            );
+        """))
+        print("✅ Tabelas metrics_* criadas")
+
+        # 2. Os triggers procuram os envios de LP pelo telefone do contato
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_form_submissions_phone ON form_submissions(phone);
+        """))
+        print("✅ Índices criados")
+
+        # 3. Triggers
+        await setup(conn)
+        print("✅ Triggers criados")
+
+        # 4. Carga inicial (na mesma transação: nenhuma escrita fica de fora)
+        started = time.perf_counter()
+        counts = await rebuild(conn)
+        print(f"✅ Rollups calculados em {time.perf_counter() - started:.1f}s: {counts}")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,132 @@
+"""
+Migração: converte messages e activities em tabelas particionadas por mês
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_partitions [--drop-legacy]
+
+Para cada tabela: renomeia a atual para <tabela>_legacy, cria a nova tabela particionada
+a partir do modelo (mesmas colunas e índices), cria as partições do mês mais antigo até
+os próximos meses, copia os dados e ajusta a sequência de ids. Tudo numa transação por
+tabela; rodar numa janela sem tráfego (a tabela fica travada durante a cópia).
+A tabela _legacy é mantida até rodar de novo com --drop-legacy.
+Pré-requisito: app.migrate_message_sync (coluna messages.updated_at). A função f_unaccent e
+a configuração pt_unaccent (coluna gerada messages.search_vector) são criadas aqui se
+app.migrate_search ainda não rodou. Os triggers de messages (message_ids, metrics_*) ficam
+na tabela renomeada: são recriados na nova depois da cópia, se as tabelas deles existem, e
+removidos da _legacy. Ordem completa no README (4.2).
+"""
+import sys
+import asyncio
+from sqlalchemy import text
+from app import ingestion, metrics
+from app.database import engine
+from app.models import Message, Activity, SEARCH_SETUP_SQL
+from app.partitions import PARTITIONED_TABLES, is_partitioned, ensure_partitions, table_columns
+
+VERSION = "20261017_partition_messages_activities"
+
+MODELS = {"messages": Message, "activities": Activity}
+
+# Triggers mantidos por outras migrações: tabela de que dependem -> setup (idempotente).
+# Table.create não dispara os hooks after_create do Base.metadata; recriados depois da cópia
+# (antes dela, a cópia contaria o histórico de novo nos rollups)
+TRIGGER_SETUPS = {
+    "messages": [("message_ids", ingestion.setup), ("metrics_channel_hourly", metrics.setup)],
+}
+
+
+async def _move_triggers(conn, table: str):
+    legacy = f"{table}_legacy"
+    triggers = await conn.execute(text("""
+        SELECT tgname FROM pg_trigger WHERE tgrelid = CAST(:legacy AS regclass) AND NOT tgisinternal
+    """), {"legacy": legacy})
+    for (trigger_name,) in triggers.all():
+        await conn.execute(text(f'DROP TRIGGER "{trigger_name}" ON {legacy}'))
+        print(f"🗑️ {legacy}: trigger {trigger_name} removido")
+    for dependency, setup in TRIGGER_SETUPS.get(table, []):
+        if (await conn.execute(text("SELECT to_regclass(:t)"), {"t": dependency})).scalar():
+            await setup(conn)
+            print(f"✅ {table}: triggers de {dependency} recriados")
+
+
+async def _rename_legacy(conn, table: str):
+    legacy = f"{table}_legacy"
+    await conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+
+    # Índices e sequência mantêm o nome antigo; libera os nomes para a tabela nova
+    indexes = await conn.execute(text("""
+        SELECT indexname FROM pg_indexes WHERE tablename = :legacy AND schemaname = current_schema()
+    """), {"legacy": legacy})
+    for (index_name,) in indexes.all():
+        new_name = f"{index_name[:55]}_legacy"
+        await conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{new_name}"'))
+
+    seq = await conn.execute(text("SELECT pg_get_serial_sequence(:legacy, 'id')"), {"legacy": legacy})
+    seq_name = seq.scalar()
+    if seq_name:
+        await conn.execute(text(f"ALTER SEQUENCE {seq_name} RENAME TO {table}_legacy_id_seq"))
+
+
+async def _convert(conn, table: str):
+    column = PARTITIONED_TABLES[table]
+    legacy = f"{table}_legacy"
+
+    await _rename_legacy(conn, table)
+    # messages.search_vector usa f_unaccent/pt_unaccent
+    await conn.execute(text(SEARCH_SETUP_SQL))
+    await conn.run_sync(lambda sync_conn: MODELS[table].__table__.create(sync_conn))
+    print(f"✅ {table}: tabela particionada criada")
+
+    oldest = await conn.execute(text(f"SELECT min({column})::date FROM {legacy}"))
+    created = await ensure_partitions(conn, start=oldest.scalar())
+    print(f"✅ {table}: {len([c for c in created if c.startswith(table)])} partições criadas")
+
+    # Colunas geradas (messages.search_vector) não entram no INSERT: o Postgres recalcula
+    legacy_columns = set(await table_columns(conn, legacy))
+    columns = ", ".join(
+        f'"{c.name}"' for c in MODELS[table].__table__.columns
+        if c.computed is None and c.name in legacy_columns
+    )
+    result = await conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}"))
+    print(f"✅ {table}: {result.rowcount} linhas copiadas")
+
+    await conn.execute(text(f"""
+        SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)
+    """))
+    await _move_triggers(conn, table)
+
+
+async def migrate(drop_legacy: bool = False):
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(100) PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT now()
+            );
+        """))
+
+    for table in PARTITIONED_TABLES:
+        async with engine.begin() as conn:
+            if await is_partitioned(conn, table):
+                print(f"ℹ️ {table} já é particionada")
+                continue
+            await _convert(conn, table)
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"ANALYZE {table}"))
+
+    if drop_legacy:
+        async with engine.begin() as conn:
+            for table in PARTITIONED_TABLES:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {table}_legacy"))
+                print(f"🗑️ {table}_legacy removida")
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:v) ON CONFLICT DO NOTHING"), {"v": VERSION}
+        )
+
+    print(f"\n🎉 Migração {VERSION} concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(drop_legacy="--drop-legacy" in sys.argv))
@@ -0,0 +1,34 @@
+"""
+Migração: cria a tabela do cache persistente de embeddings das perguntas (query_embeddings)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_query_embeddings
+Depois: QUERY_EMBEDDING_CACHE_PERSIST=true
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model VARCHAR(100) NOT NULL,
+                query_hash VARCHAR(64) NOT NULL,
+                query TEXT NOT NULL,
+                embedding BYTEA NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT now(),
+                last_used_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (model, query_hash)
+            );
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_query_embeddings_last_used_at ON query_embeddings(last_used_at);
+        """))
+        print("✅ Tabela query_embeddings criada")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
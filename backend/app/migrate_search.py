@@ -0,0 +1,93 @@
+"""
+Migração: índices da busca global (GET /api/search)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_search
+
+1. Extensões unaccent e pg_trgm (se o servidor tiver), função f_unaccent() e a
+   configuração de busca pt_unaccent (ver SEARCH_SETUP_SQL em app/models.py).
+2. Coluna gerada messages.search_vector. O ADD COLUMN reescreve todas as partições de
+   messages com a tabela travada: rodar numa janela sem tráfego.
+3. Índices GIN: tsvector das mensagens e, com pg_trgm, trigram no nome e telefone dos
+   contatos e no título/endereço dos imóveis.
+Só os passos 2 e o índice tsvector ficam atrás do registro em schema_migrations. As
+extensões e os índices trigram são conferidos a cada execução (IF NOT EXISTS): se a
+pg_trgm for instalada depois, basta rodar de novo.
+Se a extensão unaccent for instalada depois, apague f_unaccent e pt_unaccent
+(DROP ... CASCADE remove a coluna e os índices) e rode de novo.
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+from app.models import Message, SEARCH_SETUP_SQL
+from app.migrate_indexes import create_indexes
+from app.search import CONTACT_NAME_TEXT, PROPERTY_TEXT
+
+VERSION = "20261017_search"
+
+TSVECTOR_INDEXES = [
+    ("ix_messages_search_vector",
+     "ON messages USING gin (search_vector)"),
+]
+
+TRGM_INDEXES = [
+    # Mesmas expressões usadas em app/search.py (senão o índice não é usado)
+    ("ix_contacts_name_trgm",
+     f"ON contacts USING gin ({CONTACT_NAME_TEXT} gin_trgm_ops)"),
+    ("ix_contacts_wa_id_trgm",
+     "ON contacts USING gin (wa_id gin_trgm_ops)"),
+    ("ix_properties_search_trgm",
+     f"ON properties USING gin ({PROPERTY_TEXT} gin_trgm_ops)"),
+]
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(100) PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT now()
+            );
+        """))
+
+        # 1. Extensões, f_unaccent() e pt_unaccent (idempotente: roda sempre)
+        await conn.execute(text(SEARCH_SETUP_SQL))
+        extensions = await conn.execute(text(
+            "SELECT extname FROM pg_extension WHERE extname IN ('unaccent', 'pg_trgm')"
+        ))
+        installed = {r[0] for r in extensions.all()}
+        for extension in ("unaccent", "pg_trgm"):
+            print(f"✅ Extensão {extension}" if extension in installed else f"⚠️ Extensão {extension} indisponível")
+
+        result = await conn.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": VERSION}
+        )
+        applied = bool(result.scalar())
+        if applied:
+            print(f"ℹ️ Migração {VERSION} já aplicada")
+        else:
+            # 2. messages.search_vector
+            expression = Message.__table__.c.search_vector.computed.sqltext
+            await conn.execute(text(f"""
+                ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS ({expression}) STORED
+            """))
+            print("✅ Coluna messages.search_vector")
+
+    # 3. Índices (trigram fora do registro: entram quando a pg_trgm aparecer)
+    indexes = ([] if applied else TSVECTOR_INDEXES) + (TRGM_INDEXES if "pg_trgm" in installed else [])
+    if indexes:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await create_indexes(conn, indexes)
+    if "pg_trgm" not in installed:
+        print("⚠️ Índices trigram pulados: instale a pg_trgm e rode esta migração de novo")
+
+    if not applied:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version) VALUES (:v) ON CONFLICT DO NOTHING"), {"v": VERSION}
+            )
+        print(f"\n🎉 Migração {VERSION} concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
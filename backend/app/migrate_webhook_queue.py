@@ -0,0 +1,42 @@
+"""
+Migração: cria a tabela da fila de webhooks (webhook_inbox)
+Executar: cd backend && source venv/bin/activate && python -m app.migrate_webhook_queue
+"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+
+async def migrate():
+    async with engine.begin() as conn:
+        # 1. Tabela webhook_inbox
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS webhook_inbox (
+                id BIGSERIAL PRIMARY KEY,
+                source VARCHAR(30) NOT NULL DEFAULT 'meta',
+                payload TEXT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                received_at TIMESTAMP DEFAULT now(),
+                locked_at TIMESTAMP,
+                processed_at TIMESTAMP
+            );
+        """))
+        print("✅ Tabela webhook_inbox criada")
+
+        # 2. Índice parcial: os workers só olham para o que ainda não terminou
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_webhook_inbox_pending
+                ON webhook_inbox(source, id) WHERE status IN ('pending', 'processing');
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_webhook_inbox_received_at ON webhook_inbox(received_at);
+        """))
+        print("✅ Índices criados")
+
+    print("\n🎉 Migração concluída com sucesso!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -1,8 +1,61 @@
-from sqlalchemy import Column, String, Text, DateTime, BigInteger, Integer, Boolean, ForeignKey, Numeric, func, Table
+from sqlalchemy import Column, String, Text, DateTime, BigInteger, Integer, Boolean, ForeignKey, Numeric, LargeBinary, func, Table, Index, UniqueConstraint, Computed, event, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
+# ==================== BUSCA ====================
+# f_unaccent(): unaccent imutável (pode ir em índice e coluna gerada). Sem a extensão
+# unaccent cai num translate() com os acentos do português.
+# pt_unaccent: configuração de busca textual em português, ignorando acentos quando a
+# extensão unaccent existe (usada em messages.search_vector e no ts_headline).
+# pg_trgm é opcional: sem ela a busca por nome/endereço cai em ILIKE (ver app/search.py).
+SEARCH_SETUP_SQL = """
+DO $$
+DECLARE
+    ext_schema text;
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS unaccent;
+    EXCEPTION WHEN OTHERS THEN NULL;
+    END;
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN OTHERS THEN NULL;
+    END;
+
+    SELECT n.nspname INTO ext_schema
+      FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+     WHERE e.extname = 'unaccent';
+
+    IF to_regprocedure('f_unaccent(text)') IS NULL THEN
+        IF ext_schema IS NOT NULL THEN
+            EXECUTE 'CREATE FUNCTION f_unaccent(text) RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS '
+                 || quote_literal('SELECT ' || quote_ident(ext_schema) || '.unaccent('
+                                  || quote_literal(quote_ident(ext_schema) || '.unaccent') || '::regdictionary, $1)');
+        ELSE
+            CREATE FUNCTION f_unaccent(text) RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+            $f$ SELECT translate($1, 'áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ',
+                                     'aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN') $f$;
+        END IF;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent' AND pg_ts_config_is_visible(oid)) THEN
+        CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = pg_catalog.portuguese);
+        IF ext_schema IS NOT NULL THEN
+            EXECUTE 'ALTER TEXT SEARCH CONFIGURATION pt_unaccent ALTER MAPPING FOR hword, hword_part, word WITH '
+                 || quote_ident(ext_schema) || '.unaccent, portuguese_stem';
+        END IF;
+    END IF;
+END $$;
+"""
+
+
+@event.listens_for(Base.metadata, "before_create")
+def _create_search_setup(target, connection, **kw):
+    connection.execute(text(SEARCH_SETUP_SQL))
+
+
 contact_tags = Table(
     "contact_tags",
     Base.metadata,
@@ -74,6 +127,10 @@ class Channel(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index("ix_contacts_channel_created", "channel_id", "created_at"),
+        Index("ix_contacts_assigned_to", "assigned_to"),
+    )
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     wa_id = Column(String(20), unique=True, nullable=False, index=True)
@@ -108,24 +165,61 @@ class Contact(Base):
 # ==================== MENSAGENS ====================
 
 class Message(Base):
+    """Particionada por mês em timestamp (ver app/partitions.py)."""
     __tablename__ = "messages"
+    __table_args__ = (
+        # Tabela particionada: toda chave única precisa incluir a coluna de partição
+        UniqueConstraint("wa_message_id", "timestamp", name="uq_messages_wa_message_id_timestamp"),
+        Index("ix_messages_contact_timestamp", "contact_wa_id", "timestamp"),
+        Index("ix_messages_channel_timestamp", "channel_id", "timestamp"),
+        Index("ix_messages_contact_direction_status", "contact_wa_id", "direction", "status"),
+        # Paginação por id e sincronização de status (GET /contacts/{wa_id}/messages)
+        Index("ix_messages_contact_id", "contact_wa_id", "id"),
+        Index("ix_messages_contact_updated", "contact_wa_id", "updated_at"),
+        # Só as mensagens recebidas ainda não lidas (contador de não lidas)
+        Index(
+            "ix_messages_unread_inbound", "contact_wa_id",
+            postgresql_where=text("direction = 'inbound' AND status = 'received'"),
+        ),
+        # Busca textual (GET /api/search)
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    wa_message_id = Column(String(255), unique=True, nullable=False, index=True)
+    wa_message_id = Column(String(255), nullable=False, index=True)
     contact_wa_id = Column(String(20), ForeignKey("contacts.wa_id"), nullable=False, index=True)
     channel_id = Column(Integer, ForeignKey("channels.id"))
     direction = Column(String(10), nullable=False)
     message_type = Column(String(20), nullable=False)
     content = Column(Text, nullable=True)
-    timestamp = Column(DateTime, nullable=False)
+    timestamp = Column(DateTime, nullable=False, primary_key=True)
     status = Column(String(20), default="received")
     sent_by_ai = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Mantida pelo Postgres a cada INSERT/UPDATE de content
+    search_vector = Column(TSVECTOR, Computed(
+        "to_tsvector('pt_unaccent'::regconfig, f_unaccent(coalesce(content, '')))", persisted=True,
+    ))
 
     contact = relationship("Contact", back_populates="messages")
     channel = relationship("Channel", back_populates="messages")
 
 
+class MessageId(Base):
+    """
+    Chave global de deduplicação das mensagens. A chave única de messages inclui o timestamp
+    (partição); o mesmo id com outro horário — eco fromMe da Evolution de uma mensagem enviada
+    pelo CRM, reentrega sem messageTimestamp — passaria por ela. Preenchida por trigger em
+    todo INSERT em messages (ver app/ingestion.py).
+    """
+    __tablename__ = "message_ids"
+
+    wa_message_id = Column(String(255), primary_key=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+
 # ==================== TAGS ====================
 
 class Tag(Base):
@@ -260,6 +354,9 @@ class AIConfig(Base):
     model = Column(String(50), default="gpt-5")
     temperature = Column(String(10), default="0.7")
     max_tokens = Column(Integer, default=500)
+    # Janela para juntar mensagens seguidas do lead em um único turno (NULL = padrão do servidor)
+    coalesce_window_ms = Column(Integer, nullable=True)
+    coalesce_max_wait_ms = Column(Integer, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -273,13 +370,62 @@ class KnowledgeDocument(Base):
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
+    # JSON antigo; convertido para embedding_vec por app/migrate_knowledge_embeddings.py
     embedding = Column(Text, nullable=True)
+    # float32 little-endian empacotado (ver app/embedding_store.py)
+    embedding_vec = Column(LargeBinary, nullable=True)
+    embedding_dim = Column(Integer, nullable=True)
+    embedding_model = Column(String(100), nullable=True)
+    # sha256 do content: reenvio do documento reaproveita o embedding (app/knowledge_ingest.py)
+    content_hash = Column(String(64), nullable=True)
     chunk_index = Column(Integer, default=0)
     token_count = Column(Integer, default=0)
     created_at = Column(DateTime, server_default=func.now())
 
     channel = relationship("Channel", backref="knowledge_documents")
 
+    __table_args__ = (
+        Index("ix_knowledge_documents_channel_hash", "channel_id", "content_hash"),
+    )
+
+
+class KnowledgeIngestJob(Base):
+    """Upload grande da base de conhecimento processado em segundo plano (app/knowledge_ingest.py)."""
+    __tablename__ = "knowledge_ingest_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False, index=True)
+    title = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running, done, failed
+    total_chunks = Column(Integer, nullable=False, default=0)
+    embedded_chunks = Column(Integer, nullable=False, default=0)
+    saved_chunks = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    api_calls = Column(Integer, nullable=False, default=0)
+    retries = Column(Integer, nullable=False, default=0)
+    # Reenvio: chunks que aproveitaram embedding já gravado, linhas antigas apagadas e
+    # chamadas à API evitadas
+    reused_chunks = Column(Integer, nullable=False, default=0)
+    removed_chunks = Column(Integer, nullable=False, default=0)
+    saved_api_calls = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+
+class QueryEmbedding(Base):
+    """Cache persistente do embedding das perguntas do RAG (app/query_embeddings.py)."""
+    __tablename__ = "query_embeddings"
+
+    model = Column(String(100), primary_key=True)
+    query_hash = Column(String(64), primary_key=True)  # sha256 do texto normalizado
+    query = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)    # float32 little-endian (app/embedding_store.py)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    last_used_at = Column(DateTime, server_default=func.now(), index=True)
+
 
 class AIConversationSummary(Base):
     __tablename__ = "ai_conversation_summaries"
@@ -349,6 +495,10 @@ class LandingPage(Base):
 
 class FormSubmission(Base):
     __tablename__ = "form_submissions"
+    __table_args__ = (
+        # Contatos vindos de LP (funil do dashboard de ROI, app/metrics.py)
+        Index("ix_form_submissions_phone", "phone"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     landing_page_id = Column(Integer, ForeignKey("landing_pages.id"), nullable=False)
@@ -375,6 +525,9 @@ class FormSubmission(Base):
 
 class Schedule(Base):
     __tablename__ = "schedules"
+    __table_args__ = (
+        Index("ix_schedules_status_type_at", "status", "type", "scheduled_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     type = Column(String(20), nullable=False)  # visita, voice_ai, consultant
@@ -402,10 +555,125 @@ class Schedule(Base):
 # ==================== ATIVIDADES ====================
 
 class Activity(Base):
+    """Particionada por mês em created_at (ver app/partitions.py)."""
     __tablename__ = "activities"
+    __table_args__ = (
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     contact_wa_id = Column(String(20), ForeignKey("contacts.wa_id"), nullable=False, index=True)
     type = Column(String(30), nullable=False)
     description = Column(Text, nullable=False)
     extra_data = Column("metadata", Text, nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, server_default=func.now(), primary_key=True)
+
+# ==================== FILA DE WEBHOOKS ====================
+
+class WebhookInbox(Base):
+    __tablename__ = "webhook_inbox"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    source = Column(String(30), nullable=False, default="meta")  # meta, evolution
+    payload = Column(Text, nullable=False)  # JSON bruto recebido
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, done, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, server_default=func.now(), index=True)
+    locked_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+
+class BusEvent(Base):
+    """Outbox do barramento entre workers (app/event_bus.py): releitura após reconexão e payloads grandes."""
+    __tablename__ = "bus_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+
+# ==================== ESTADO DAS CONVERSAS ====================
+
+class ConversationState(Base):
+    """Resumo de cada conversa para a caixa de entrada (mantido a cada mensagem gravada)."""
+    __tablename__ = "conversation_state"
+    __table_args__ = (
+        Index("ix_conversation_state_inbox", text("last_message_at DESC NULLS LAST"), text("wa_id DESC")),
+        Index("ix_conversation_state_channel_inbox", "channel_id", text("last_message_at DESC NULLS LAST"), text("wa_id DESC")),
+    )
+
+    wa_id = Column(String(20), ForeignKey("contacts.wa_id"), primary_key=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=True)
+    last_message_preview = Column(Text, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    last_direction = Column(String(10), nullable=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    last_inbound_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+# ==================== MÉTRICAS ====================
+# Rollups dos dashboards, mantidos por triggers na mesma transação das escritas
+# (ver app/metrics.py). channel_id/agent_id 0 = sem canal/sem corretor.
+
+class MetricsChannelHourly(Base):
+    __tablename__ = "metrics_channel_hourly"
+
+    channel_id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    inbound = Column(Integer, nullable=False, server_default="0")
+    outbound = Column(Integer, nullable=False, server_default="0")
+    new_contacts = Column(Integer, nullable=False, server_default="0")
+    conversions = Column(Integer, nullable=False, server_default="0")
+    form_submissions = Column(Integer, nullable=False, server_default="0")
+
+
+class MetricsAgentHourly(Base):
+    __tablename__ = "metrics_agent_hourly"
+
+    agent_id = Column(Integer, primary_key=True)
+    channel_id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    inbound = Column(Integer, nullable=False, server_default="0")
+    outbound = Column(Integer, nullable=False, server_default="0")
+    new_contacts = Column(Integer, nullable=False, server_default="0")
+    conversions = Column(Integer, nullable=False, server_default="0")
+
+
+class MetricsAICallsHourly(Base):
+    """Ligações da IA por hora, resultado e curso; somas + contagens para as médias."""
+    __tablename__ = "metrics_ai_calls_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    outcome = Column(String(30), primary_key=True)  # '' = sem resultado
+    course = Column(String(255), primary_key=True)  # '' = sem curso
+    calls = Column(Integer, nullable=False, server_default="0")
+    completed = Column(Integer, nullable=False, server_default="0")
+    score_sum = Column(BigInteger, nullable=False, server_default="0")
+    score_count = Column(Integer, nullable=False, server_default="0")
+    latency_sum = Column(BigInteger, nullable=False, server_default="0")
+    latency_count = Column(Integer, nullable=False, server_default="0")
+    duration_sum = Column(BigInteger, nullable=False, server_default="0")
+    duration_count = Column(Integer, nullable=False, server_default="0")
+
+
+class MetricsFormsHourly(Base):
+    __tablename__ = "metrics_forms_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    landing_page_id = Column(Integer, primary_key=True)
+    utm_source = Column(String(100), primary_key=True)  # '' = direto
+    utm_campaign = Column(String(100), primary_key=True)  # '' = sem campanha
+    submissions = Column(Integer, nullable=False, server_default="0")
+
+
+class MetricsContactCounts(Base):
+    """Contatos atuais por canal, corretor, status e origem (LP): totais sem varrer contacts."""
+    __tablename__ = "metrics_contact_counts"
+
+    channel_id = Column(Integer, primary_key=True)
+    agent_id = Column(Integer, primary_key=True)
+    lead_status = Column(String(30), primary_key=True)
+    from_landing = Column(Boolean, primary_key=True)
+    contacts = Column(Integer, nullable=False, server_default="0")
@@ -0,0 +1,247 @@
+"""
+Partições mensais de messages (por timestamp) e activities (por created_at).
+- ensure_partitions(): cria as partições do mês atual e dos próximos meses (roda no startup e todo dia).
+- archive: desanexa partições antigas, grava em .csv.gz no disco local e apaga a tabela.
+- restore: recria a partição a partir do arquivo e anexa de volta.
+
+Executar:
+    python -m app.partitions list
+    python -m app.partitions ensure
+    python -m app.partitions archive --keep-months 12
+    python -m app.partitions restore messages_2024_01
+"""
+import os
+import sys
+import json
+import gzip
+import asyncio
+import argparse
+from datetime import date, datetime, timezone, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.database import engine
+
+# Tabela -> coluna de partição
+PARTITIONED_TABLES = {"messages": "timestamp", "activities": "created_at"}
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive/partitions")
+
+SP_TZ = timezone(timedelta(hours=-3))
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    month = d.month - 1 + months
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+         WHERE c.relname = :table AND pg_table_is_visible(c.oid)
+    """), {"table": table})
+    return bool(result.scalar())
+
+
+async def ensure_partitions(conn: AsyncConnection, start: date | None = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    """
+    Cria (se faltarem) as partições mensais de `start` (padrão: mês atual) até
+    months_ahead meses à frente, mais a partição default. Retorna as criadas.
+    """
+    today = datetime.now(SP_TZ).date()
+    first = _month_start(start or today)
+    last = _add_months(_month_start(today), months_ahead)
+
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            continue
+
+        existing = {p["name"] for p in await list_partitions(conn, table)}
+        month = first
+        while month <= last:
+            name = partition_name(table, month)
+            if name not in existing:
+                await conn.execute(text(f"""
+                    CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+                    FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')
+                """))
+                created.append(name)
+            month = _add_months(month, 1)
+
+        # Linhas fora de qualquer mês criado (datas muito antigas/futuras) caem aqui
+        if f"{table}_default" not in existing:
+            await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+            created.append(f"{table}_default")
+
+    return created
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> list[dict]:
+    result = await conn.execute(text("""
+        SELECT c.relname AS name,
+               pg_get_expr(c.relpartbound, c.oid) AS bound,
+               c.reltuples::bigint AS rows_estimate,
+               pg_total_relation_size(c.oid) AS total_bytes,
+               pg_indexes_size(c.oid) AS index_bytes
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+          JOIN pg_class p ON p.oid = i.inhparent
+         WHERE p.relname = :table AND pg_table_is_visible(p.oid)
+         ORDER BY c.relname
+    """), {"table": table})
+    return [dict(r._mapping) for r in result.all()]
+
+
+def _parse_month(name: str) -> date | None:
+    """messages_2024_01 -> date(2024, 1, 1); None para a default."""
+    try:
+        year, month = name.rsplit("_", 2)[-2:]
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+async def table_columns(conn: AsyncConnection, table: str) -> list[str]:
+    """Colunas gravadas no arquivo; as geradas (messages.search_vector) o Postgres recalcula no restore."""
+    result = await conn.execute(text("""
+        SELECT a.attname FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+         WHERE c.relname = :table AND pg_table_is_visible(c.oid) AND a.attnum > 0 AND NOT a.attisdropped
+           AND a.attgenerated = ''
+         ORDER BY a.attnum
+    """), {"table": table})
+    return [r[0] for r in result.all()]
+
+
+async def archive_partition(conn: AsyncConnection, table: str, name: str, archive_dir: str = PARTITION_ARCHIVE_DIR) -> dict:
+    """Desanexa a partição, grava em <archive_dir>/<name>.csv.gz (+ manifesto .json) e apaga a tabela."""
+    month = _parse_month(name)
+    if not month:
+        raise ValueError(f"Partição sem mês no nome: {name}")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    data_path = os.path.join(archive_dir, f"{name}.csv.gz")
+    columns = await table_columns(conn, table)
+
+    await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+
+    raw = (await conn.get_raw_connection()).driver_connection
+    with gzip.open(data_path, "wb", compresslevel=6) as f:
+        async def write(chunk: bytes):
+            f.write(chunk)
+        status = await raw.copy_from_table(name, output=write, columns=columns, format="csv")
+    rows = int(status.split()[-1]) if status else 0
+
+    manifest = {
+        "table": table,
+        "partition": name,
+        "from": month.isoformat(),
+        "to": _add_months(month, 1).isoformat(),
+        "columns": columns,
+        "rows": rows,
+        "archived_at": datetime.now(SP_TZ).replace(tzinfo=None).isoformat(),
+        "file": os.path.basename(data_path),
+        "bytes": os.path.getsize(data_path),
+    }
+    with open(os.path.join(archive_dir, f"{name}.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    await conn.execute(text(f"DROP TABLE {name}"))
+    return manifest
+
+
+async def restore_partition(conn: AsyncConnection, name: str, archive_dir: str = PARTITION_ARCHIVE_DIR) -> dict:
+    """Recria a partição a partir do arquivo e anexa de volta à tabela pai."""
+    with open(os.path.join(archive_dir, f"{name}.json")) as f:
+        manifest = json.load(f)
+    table = manifest["table"]
+
+    # Carrega numa tabela solta e só depois anexa (não passa pelo roteamento de partições)
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"))
+    raw = (await conn.get_raw_connection()).driver_connection
+    with gzip.open(os.path.join(archive_dir, manifest["file"]), "rb") as f:
+        await raw.copy_to_table(name, source=f, columns=manifest["columns"], format="csv")
+    await conn.execute(text(f"""
+        ALTER TABLE {table} ATTACH PARTITION {name}
+        FOR VALUES FROM ('{manifest["from"]}') TO ('{manifest["to"]}')
+    """))
+    await conn.execute(text(f"ANALYZE {name}"))
+    return manifest
+
+
+async def archive_older_than(conn: AsyncConnection, keep_months: int, archive_dir: str = PARTITION_ARCHIVE_DIR) -> list[dict]:
+    """Arquiva todas as partições mensais anteriores aos últimos keep_months meses."""
+    cutoff = _add_months(_month_start(datetime.now(SP_TZ).date()), -keep_months)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            continue
+        for partition in await list_partitions(conn, table):
+            month = _parse_month(partition["name"])
+            if month and month < cutoff:
+                manifest = await archive_partition(conn, table, partition["name"], archive_dir)
+                print(f"📦 {partition['name']}: {manifest['rows']} linhas -> {manifest['file']} ({manifest['bytes'] / 1024:.0f} KB)")
+                archived.append(manifest)
+    return archived
+
+
+async def partition_maintenance_job():
+    """Job diário: garante as partições dos próximos meses."""
+    while True:
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                created = await ensure_partitions(conn)
+            if created:
+                print(f"🗂️ Partições criadas: {', '.join(created)}")
+        except Exception as e:
+            print(f"❌ Erro ao criar partições: {e}")
+        await asyncio.sleep(86400)  # 24 horas
+
+
+async def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description="Partições mensais de messages/activities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    sub.add_parser("ensure")
+    archive = sub.add_parser("archive")
+    archive.add_argument("--keep-months", type=int, default=12)
+    archive.add_argument("--dir", default=PARTITION_ARCHIVE_DIR)
+    restore = sub.add_parser("restore")
+    restore.add_argument("partition")
+    restore.add_argument("--dir", default=PARTITION_ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        if args.command == "list":
+            for table in PARTITIONED_TABLES:
+                for p in await list_partitions(conn, table):
+                    print(f"{p['name']:<24} {p['rows_estimate']:>10} linhas  "
+                          f"{p['total_bytes'] / 1024 / 1024:>8.1f} MB (índices {p['index_bytes'] / 1024 / 1024:.1f} MB)  {p['bound']}")
+        elif args.command == "ensure":
+            created = await ensure_partitions(conn)
+            print(f"✅ {len(created)} partições criadas {created if created else ''}")
+        elif args.command == "archive":
+            archived = await archive_older_than(conn, args.keep_months, args.dir)
+            print(f"✅ {len(archived)} partições arquivadas em {args.dir}")
+        elif args.command == "restore":
+            manifest = await restore_partition(conn, args.partition, args.dir)
+            print(f"✅ {manifest['partition']} restaurada ({manifest['rows']} linhas)")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -8,8 +8,9 @@ from pydantic import BaseModel
 import httpx
 import os
 from typing import Optional, List
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Property, PropertyNearbyPlace, PropertyInterest, Contact
+from app import response_cache
 import json
 
 router = APIRouter(prefix="/api/properties", tags=["properties"])
@@ -430,8 +431,16 @@ async def delete_property(property_id: int, db: AsyncSession = Depends(get_db)):
 
 # ==================== ESTATÍSTICAS ====================
 
+# Imóveis mudam pouco: cache mais longo, invalidado a cada escrita em properties
+stats_cache = response_cache.register("property_stats", domains=("properties",), ttl=60)
+
+
 @router.get("/stats/summary")
-async def property_stats(db: AsyncSession = Depends(get_db)):
+async def property_stats(db: AsyncSession = Depends(get_read_db)):
+    return await stats_cache.get({}, lambda: _property_stats(db))
+
+
+async def _property_stats(db: AsyncSession) -> dict:
     # Total por status
     status_result = await db.execute(
         select(Property.status, func.count(Property.id)).group_by(Property.status)
@@ -0,0 +1,309 @@
+"""
+Cache do embedding das perguntas do RAG (search_knowledge: mensagens recebidas, /test-chat
+e o início da ligação de voz).
+Cada busca na base de conhecimento chamava a API de embeddings com o texto da mensagem,
+mesmo para as perguntas que se repetem o dia inteiro ("qual o valor?", "onde fica?"). A
+chave aqui é o texto normalizado (minúsculas, espaços colapsados, sem pontuação nas pontas)
++ modelo, e o embedding é o do texto normalizado, então "Qual o valor??" e "qual o valor"
+dão o mesmo vetor.
+
+- Em memória: LRU de até QUERY_EMBEDDING_CACHE_MAX_ENTRIES vetores float32 por processo;
+  a mesma pergunta chegando junto gera uma chamada só (single-flight).
+- Persistente (QUERY_EMBEDDING_CACHE_PERSIST=true, tabela query_embeddings, criada por
+  python -m app.migrate_query_embeddings): compartilhado entre workers e reinícios; falta
+  na memória consulta a tabela antes da API. Linhas sem uso há
+  QUERY_EMBEDDING_CACHE_RETENTION_DAYS são apagadas no aquecimento.
+- Aquecimento: QUERY_EMBEDDING_CACHE_WARM=N carrega, no startup, as N mensagens recebidas
+  mais frequentes dos últimos QUERY_EMBEDDING_CACHE_WARM_DAYS dias (também sob demanda em
+  POST /api/ai/query-cache/warm).
+
+Pergunta maior que QUERY_EMBEDDING_CACHE_MAX_CHARS (quase sempre única) vai direto para a
+API, sem normalizar. QUERY_EMBEDDING_CACHE_ENABLED=false desliga tudo.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import unicodedata
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import numpy as np
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app import embedding_store
+from app.database import async_session
+from app.models import Message, QueryEmbedding
+
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "2000"))
+QUERY_EMBEDDING_CACHE_MAX_CHARS = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_CHARS", "300"))
+QUERY_EMBEDDING_CACHE_PERSIST = os.getenv("QUERY_EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+QUERY_EMBEDDING_CACHE_RETENTION_DAYS = int(os.getenv("QUERY_EMBEDDING_CACHE_RETENTION_DAYS", "90"))
+QUERY_EMBEDDING_CACHE_WARM = int(os.getenv("QUERY_EMBEDDING_CACHE_WARM", "0"))
+QUERY_EMBEDDING_CACHE_WARM_DAYS = int(os.getenv("QUERY_EMBEDDING_CACHE_WARM_DAYS", "30"))
+
+# Pontuação e símbolos que não mudam a pergunta quando estão nas pontas
+_EDGE = " \t\n.,;:!?¿¡…\"'`´()[]*_~-"
+
+Embed = Callable[[str], Awaitable[list[float]]]
+EmbedMany = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+_entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+_inflight: dict[tuple[str, str], asyncio.Future] = {}
+_tasks: set[asyncio.Task] = set()
+_counters = {
+    "hits": 0,
+    "table_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "uncached": 0,
+    "errors": 0,
+    "table_errors": 0,
+    "evictions": 0,
+    "warmed": 0,
+}
+# Latência das chamadas à API feitas pelo cache (estimativa do tempo economizado)
+_latency = {"calls": 0, "seconds": 0.0}
+
+
+def normalize_query(query: str) -> str:
+    collapsed = " ".join(unicodedata.normalize("NFC", query).casefold().split())
+    return collapsed.strip(_EDGE) or collapsed
+
+
+def query_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _remember(key: tuple[str, str], vector: np.ndarray):
+    # Compartilhado entre as buscas: somente leitura
+    vector.flags.writeable = False
+    _entries[key] = vector
+    _entries.move_to_end(key)
+    while len(_entries) > QUERY_EMBEDDING_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+        _counters["evictions"] += 1
+
+
+async def _embed(compute: Embed, content: str) -> np.ndarray:
+    started = time.perf_counter()
+    vector = np.asarray(await compute(content), dtype=np.float32)
+    _latency["calls"] += 1
+    _latency["seconds"] += time.perf_counter() - started
+    return vector
+
+
+async def get(query: str, model: str, compute: Embed) -> np.ndarray:
+    """Embedding (float32) da pergunta; compute(texto) chama a API quando não está em cache."""
+    normalized = normalize_query(query)
+    if not QUERY_EMBEDDING_CACHE_ENABLED or len(normalized) > QUERY_EMBEDDING_CACHE_MAX_CHARS:
+        _counters["uncached"] += 1
+        return await _embed(compute, query)
+    key = (model, normalized)
+
+    vector = _entries.get(key)
+    if vector is not None:
+        _entries.move_to_end(key)
+        _counters["hits"] += 1
+        return vector
+
+    while (flight := _inflight.get(key)) is not None:
+        _counters["coalesced"] += 1
+        try:
+            # shield: quem espera pode desistir (timeout do RAG na voz) sem cancelar a chamada
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            if not flight.cancelled():
+                raise
+            # Quem chamava a API foi cancelado: o próximo assume
+
+    flight = asyncio.get_running_loop().create_future()
+    _inflight[key] = flight
+    try:
+        vector = await _load(model, normalized) if QUERY_EMBEDDING_CACHE_PERSIST else None
+        if vector is not None:
+            _counters["table_hits"] += 1
+        else:
+            _counters["misses"] += 1
+            vector = await _embed(compute, normalized)
+            if QUERY_EMBEDDING_CACHE_PERSIST:
+                await _store(model, [(normalized, vector)])
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as e:
+        _counters["errors"] += 1
+        flight.set_exception(e)
+        flight.exception()  # quem espera recebe o mesmo erro; evita o aviso de "never retrieved"
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    flight.set_result(vector)
+    _remember(key, vector)
+    return vector
+
+
+# ============================================================
+# TABELA PERSISTENTE (OPCIONAL)
+# ============================================================
+
+async def _load(model: str, normalized: str) -> np.ndarray | None:
+    """Vetor da tabela (marcando o uso), ou None. Erro na tabela não impede a busca."""
+    try:
+        async with async_session() as db:
+            result = await db.execute(
+                update(QueryEmbedding)
+                .where(QueryEmbedding.model == model, QueryEmbedding.query_hash == query_hash(normalized))
+                .values(hits=QueryEmbedding.hits + 1, last_used_at=func.now())
+                .returning(QueryEmbedding.embedding)
+            )
+            raw = result.scalar()
+            await db.commit()
+    except Exception as e:
+        _counters["table_errors"] += 1
+        print(f"⚠️ Cache de embeddings: erro ao ler query_embeddings: {e}")
+        return None
+    return None if raw is None else embedding_store.unpack(raw)
+
+
+async def _store(model: str, rows: list[tuple[str, np.ndarray]]):
+    try:
+        async with async_session() as db:
+            await db.execute(
+                insert(QueryEmbedding).on_conflict_do_nothing(),
+                [
+                    {"model": model, "query_hash": query_hash(q), "query": q, "embedding": embedding_store.pack(v)}
+                    for q, v in rows
+                ],
+            )
+            await db.commit()
+    except Exception as e:
+        _counters["table_errors"] += 1
+        print(f"⚠️ Cache de embeddings: erro ao gravar query_embeddings: {e}")
+
+
+# ============================================================
+# AQUECIMENTO COM AS PERGUNTAS MAIS FREQUENTES
+# ============================================================
+
+async def frequent_queries(limit: int, days: int) -> list[str]:
+    """Textos normalizados das mensagens recebidas mais frequentes, do mais para o menos frequente."""
+    # Normalização aproximada no banco (agrupa "Qual o valor??" com "qual o valor"); a exata,
+    # em Python, soma o que o banco ainda separou
+    content = func.btrim(func.lower(func.regexp_replace(Message.content, r"\s+", " ", "g")), _EDGE)
+    async with async_session() as db:
+        result = await db.execute(
+            select(content.label("content"), func.count().label("total"))
+            .where(
+                Message.direction == "inbound",
+                Message.message_type == "text",
+                Message.timestamp >= datetime.now() - timedelta(days=days),
+                Message.content.is_not(None),
+                func.length(Message.content).between(1, QUERY_EMBEDDING_CACHE_MAX_CHARS),
+            )
+            .group_by(content)
+            .order_by(func.count().desc())
+            .limit(limit * 3)
+        )
+        totals = Counter()
+        for row in result:
+            normalized = normalize_query(row.content)
+            if normalized:
+                totals[normalized] += row.total
+    return [normalized for normalized, _ in totals.most_common(limit)]
+
+
+async def warm(embed_many: EmbedMany, model: str, limit: int | None = None, days: int | None = None) -> dict:
+    """
+    Carrega na memória as `limit` perguntas mais frequentes: da tabela persistente quando
+    estão lá, senão pela API em lotes (embed_many). Com a tabela ligada, um worker aquece
+    por vez e os outros encontram os vetores já gravados.
+    """
+    limit = min(limit or QUERY_EMBEDDING_CACHE_WARM, QUERY_EMBEDDING_CACHE_MAX_ENTRIES)
+    days = days or QUERY_EMBEDDING_CACHE_WARM_DAYS
+    started = time.perf_counter()
+    counts = {"candidates": 0, "already_cached": 0, "from_table": 0, "embedded": 0, "pruned": 0}
+    if not QUERY_EMBEDDING_CACHE_ENABLED or limit <= 0:
+        return counts
+
+    async with async_session() as lock_db:
+        if QUERY_EMBEDDING_CACHE_PERSIST:
+            await lock_db.execute(text("SELECT pg_advisory_xact_lock(hashtext('query_embeddings.warm'))"))
+            result = await lock_db.execute(
+                delete(QueryEmbedding).where(
+                    QueryEmbedding.last_used_at < datetime.now() - timedelta(days=QUERY_EMBEDDING_CACHE_RETENTION_DAYS)
+                )
+            )
+            counts["pruned"] = result.rowcount
+
+        queries = await frequent_queries(limit, days)
+        counts["candidates"] = len(queries)
+        pending = [q for q in queries if (model, q) not in _entries]
+        counts["already_cached"] = len(queries) - len(pending)
+
+        if pending and QUERY_EMBEDDING_CACHE_PERSIST:
+            result = await lock_db.execute(
+                select(QueryEmbedding.query, QueryEmbedding.embedding).where(
+                    QueryEmbedding.model == model,
+                    QueryEmbedding.query_hash.in_([query_hash(q) for q in pending]),
+                )
+            )
+            stored = {row.query: embedding_store.unpack(row.embedding) for row in result}
+            for q, vector in stored.items():
+                _remember((model, q), vector)
+            counts["from_table"] = len(stored)
+            pending = [q for q in pending if q not in stored]
+
+        if pending:
+            vectors = [np.asarray(v, dtype=np.float32) for v in await embed_many(pending)]
+            for q, vector in zip(pending, vectors):
+                _remember((model, q), vector)
+            counts["embedded"] = len(pending)
+            if QUERY_EMBEDDING_CACHE_PERSIST:
+                await _store(model, list(zip(pending, vectors)))
+        # Libera o lock
+        await lock_db.commit()
+
+    _counters["warmed"] += counts["from_table"] + counts["embedded"]
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def start_warm(embed_many: EmbedMany, model: str):
+    """Aquecimento em segundo plano no startup (o worker já atende enquanto isso)."""
+    async def run():
+        try:
+            counts = await warm(embed_many, model)
+            print(f"🔥 Cache de embeddings aquecido: {counts['from_table']} da tabela, "
+                  f"{counts['embedded']} pela API, {counts['already_cached']} já em memória ({counts['seconds']}s)")
+        except Exception as e:
+            print(f"❌ Erro ao aquecer o cache de embeddings: {e}")
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def clear():
+    _entries.clear()
+
+
+def stats() -> dict:
+    served = _counters["hits"] + _counters["table_hits"] + _counters["coalesced"]
+    lookups = served + _counters["misses"]
+    average = _latency["seconds"] / _latency["calls"] if _latency["calls"] else None
+    return {
+        "enabled": QUERY_EMBEDDING_CACHE_ENABLED,
+        "persist": QUERY_EMBEDDING_CACHE_PERSIST,
+        "entries": len(_entries),
+        "max_entries": QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+        **_counters,
+        "hit_ratio": round(served / lookups, 3) if lookups else None,
+        "memory_hit_ratio": round(_counters["hits"] / lookups, 3) if lookups else None,
+        "api_ms_avg": round(average * 1000, 1) if average is not None else None,
+        "seconds_saved_est": round(served * average, 2) if average is not None else None,
+    }
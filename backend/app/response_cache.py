@@ -0,0 +1,231 @@
+"""
+Cache curto das respostas de dashboards e estatísticas (por processo).
+Quando a equipe abre o CRM de manhã, as mesmas consultas chegam juntas de vários
+corretores: a primeira requisição de uma chave calcula e as outras esperam por ela
+(single-flight); o resultado fica guardado por alguns segundos.
+
+Cada rota cacheada declara as tabelas de que depende. Escritas nessas tabelas pela sessão
+do SQLAlchemy (objetos no flush ou insert/update/delete do ORM, inclusive em lote) publicam
+"cache.invalidate" no barramento (app/event_bus.py) no commit, e todos os workers descartam
+as entradas afetadas. Escrita fora do ORM (SQL puro) só expira pelo TTL. Resultado calculado
+enquanto chegava uma invalidação é devolvido mas não é guardado.
+
+Domínio "tabela.coluna" (ex.: "contacts.lead_status") só é invalidado por UPDATE que muda a
+coluna; inserts e deletes da tabela não contam. Serve para rotas sobre tabelas muito escritas
+(mensagens, contatos tocados a cada mensagem), em que invalidar a cada escrita zeraria o
+cache e mandaria um NOTIFY por mensagem: o resto da mudança aparece pelo TTL.
+
+TTL por rota: RESPONSE_CACHE_TTLS="dashboard_stats=30,property_stats=120" (segundos; 0
+desliga a rota). RESPONSE_CACHE_ENABLED=false desliga tudo.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import event as sa_event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app import event_bus
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", "15"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+RESPONSE_CACHE_TTLS = {
+    name.strip(): float(ttl)
+    for name, _, ttl in (item.partition("=") for item in os.getenv("RESPONSE_CACHE_TTLS", "").split(","))
+    if name.strip() and ttl.strip()
+}
+
+_DOMAINS_KEY = "cache_domains"
+
+_counters = {
+    "hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "stale_skipped": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    "errors": 0,
+}
+# Geração por tabela: muda a cada invalidação (resultado calculado antes dela não é guardado)
+_generations: dict[str, int] = {}
+_routes: dict[str, "CachedRoute"] = {}
+# Tabelas observadas por alguma rota (fixo desde o import, igual em todos os workers)
+_watched: set[str] = set()
+# Domínios por coluna: tabela -> colunas observadas
+_watched_columns: dict[str, set[str]] = {}
+
+
+class CachedRoute:
+    """Entradas de uma rota: chave = parâmetros (canal incluído) -> (expira_em, valor)."""
+
+    def __init__(self, name: str, domains: tuple[str, ...], ttl: float):
+        self.name = name
+        self.domains = domains
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    async def get(self, params: dict, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Valor em cache para `params` ou o resultado de `compute()` (uma execução por chave)."""
+        if not RESPONSE_CACHE_ENABLED or self.ttl <= 0:
+            return await compute()
+        key = tuple(sorted(params.items()))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                _counters["hits"] += 1
+                return value
+            del self._entries[key]
+
+        while (flight := self._inflight.get(key)) is not None:
+            _counters["coalesced"] += 1
+            try:
+                # shield: quem espera pode desistir (cliente desconectou) sem cancelar o cálculo
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # A requisição que calculava foi cancelada: a próxima assume
+
+        _counters["misses"] += 1
+        flight = asyncio.get_running_loop().create_future()
+        self._inflight[key] = flight
+        generations = [_generations.get(d, 0) for d in self.domains]
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            _counters["errors"] += 1
+            flight.set_exception(e)
+            flight.exception()  # quem espera recebe o mesmo erro; evita o aviso de "never retrieved"
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        flight.set_result(value)
+        if generations == [_generations.get(d, 0) for d in self.domains]:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            if len(self._entries) > RESPONSE_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+                _counters["evictions"] += 1
+        else:
+            _counters["stale_skipped"] += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+def register(name: str, domains: tuple[str, ...], ttl: float | None = None) -> CachedRoute:
+    """Declara uma rota cacheada e as tabelas que invalidam as respostas dela (no import do módulo)."""
+    route = CachedRoute(name, tuple(domains), RESPONSE_CACHE_TTLS.get(name, RESPONSE_CACHE_TTL_SEC if ttl is None else ttl))
+    _routes[name] = route
+    for domain in route.domains:
+        table, _, column = domain.partition(".")
+        if column:
+            _watched_columns.setdefault(table, set()).add(column)
+        else:
+            _watched.add(domain)
+    return route
+
+
+def invalidate_local(domains):
+    domains = set(domains)
+    for domain in domains:
+        _generations[domain] = _generations.get(domain, 0) + 1
+    for route in _routes.values():
+        if domains.intersection(route.domains):
+            route.clear()
+    _counters["invalidations"] += 1
+
+
+event_bus.subscribe("cache.invalidate", lambda payload: invalidate_local(payload["domains"]))
+
+
+# ============================================================
+# ESCRITAS -> INVALIDAÇÃO NO COMMIT
+# ============================================================
+
+def _stage(session, tables):
+    touched = _watched.intersection(tables) | {t for t in tables if "." in t}
+    if not touched:
+        return
+    domains = session.info.get(_DOMAINS_KEY)
+    if domains is None:
+        # Uma mensagem por transação; a lista é serializada só no commit
+        domains = session.info[_DOMAINS_KEY] = []
+        event_bus.publish(session, "cache.invalidate", {"domains": domains}, durable=False)
+    domains.extend(t for t in touched if t not in domains)
+
+
+def _changed_columns(obj) -> set[str]:
+    """Domínios "tabela.coluna" observados que o objeto (dirty) mudou."""
+    table = obj.__table__.name
+    columns = _watched_columns.get(table)
+    if not columns:
+        return set()
+    attrs = sa_inspect(obj).attrs
+    return {f"{table}.{column}" for column in columns if column in attrs and attrs[column].history.has_changes()}
+
+
+def _statement_columns(state, table: str) -> set[str]:
+    """Domínios "tabela.coluna" de um UPDATE em lote (sem saber as colunas, todas as observadas)."""
+    columns = _watched_columns.get(table)
+    if not columns:
+        return set()
+    keys = {getattr(key, "key", key) for key in (getattr(state.statement, "_values", None) or {})}
+    parameters = state.parameters
+    for row in parameters if isinstance(parameters, list) else [parameters or {}]:
+        keys.update(row)
+    return {f"{table}.{column}" for column in (columns.intersection(keys) if keys else columns)}
+
+
+@sa_event.listens_for(Session, "after_flush")
+def _on_flush(session, flush_context):
+    tables = {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if hasattr(obj, "__table__")
+    }
+    for obj in session.dirty:
+        if hasattr(obj, "__table__"):
+            tables |= _changed_columns(obj)
+    _stage(session, tables)
+
+
+@sa_event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(state):
+    # insert/update/delete em lote (ex.: ingestão de webhooks) não passam pelo flush
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        tables = {table.name for table in state.bind_mapper.tables}
+        if state.is_update:
+            for table in list(tables):
+                tables |= _statement_columns(state, table)
+        _stage(state.session, tables)
+
+
+@sa_event.listens_for(Session, "after_commit")
+@sa_event.listens_for(Session, "after_rollback")
+def _reset_domains(session):
+    session.info.pop(_DOMAINS_KEY, None)
+
+
+def stats() -> dict:
+    lookups = _counters["hits"] + _counters["misses"] + _counters["coalesced"]
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        **_counters,
+        "hit_rate": round((_counters["hits"] + _counters["coalesced"]) / lookups, 3) if lookups else None,
+        "routes": {
+            name: {"ttl": route.ttl, "entries": len(route._entries), "inflight": len(route._inflight), "domains": list(route.domains)}
+            for name, route in _routes.items()
+        },
+    }
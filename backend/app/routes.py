@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Query, Response, Request, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, tuple_
 from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
 from typing import Optional
@@ -9,12 +10,25 @@ import uuid
 
 SP_TZ = timezone(timedelta(hours=-3))
 
-from app.database import get_db
-from app.models import Channel, Contact, Message, Tag, contact_tags, Activity
+from app.database import get_db, get_read_db, async_session
+from app.models import Channel, Contact, ConversationState, Message, Tag, contact_tags, Activity, User
+from app.auth import get_current_user, user_from_token
+from app import conversation_state, dashboard, event_bus, events, response_cache, search
+from app.ingestion import claim_message_ids
 from app.whatsapp import send_text_message, send_template_message
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+# Tamanho de página da caixa de entrada (GET /contacts)
+CONTACTS_PAGE_DEFAULT = 500
+CONTACTS_PAGE_MAX = 1000
+
+# Histórico da conversa (GET /contacts/{wa_id}/messages)
+MESSAGES_PAGE_DEFAULT = 100
+MESSAGES_PAGE_MAX = 500
+MESSAGES_DELTA_MAX = 500
+MESSAGES_SYNC_OVERLAP_SEC = 5
+
 
 # === Schemas ===
 
@@ -109,80 +123,31 @@ async def create_channel(req: ChannelRequest, db: AsyncSession = Depends(get_db)
 
 # === Dashboard ===
 
-@router.get("/dashboard/stats")
-async def dashboard_stats(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=today_start.weekday())
-
-    # Filtro base por canal
-    contact_filter = [] if not channel_id else [Contact.channel_id == channel_id]
-    message_filter = [] if not channel_id else [Message.channel_id == channel_id]
-
-    total_contacts = await db.execute(
-        select(func.count(Contact.id)).where(*contact_filter)
-    )
-    total_contacts = total_contacts.scalar()
-
-    new_today = await db.execute(
-        select(func.count(Contact.id)).where(Contact.created_at >= today_start, *contact_filter)
-    )
-    new_today = new_today.scalar()
-
-    messages_today = await db.execute(
-        select(func.count(Message.id)).where(Message.timestamp >= today_start, *message_filter)
-    )
-    messages_today = messages_today.scalar()
+# Contagens vêm dos rollups, mantidos a partir de contacts/messages (app/metrics.py). Cada
+# mensagem grava nas duas tabelas: invalidar por elas zeraria o cache a cada mensagem, então
+# os totais ficam só no TTL e o avançado muda na hora só com status/atendente do contato
+dashboard_stats_cache = response_cache.register("dashboard_stats", domains=())
+dashboard_advanced_cache = response_cache.register(
+    "dashboard_advanced", domains=("contacts.lead_status", "contacts.assigned_to", "users", "tags"),
+)
 
-    inbound_today = await db.execute(
-        select(func.count(Message.id)).where(
-            Message.timestamp >= today_start, Message.direction == "inbound", *message_filter
-        )
-    )
-    inbound_today = inbound_today.scalar()
 
-    outbound_today = await db.execute(
-        select(func.count(Message.id)).where(
-            Message.timestamp >= today_start, Message.direction == "outbound", *message_filter
-        )
-    )
-    outbound_today = outbound_today.scalar()
-
-    messages_week = await db.execute(
-        select(func.count(Message.id)).where(Message.timestamp >= week_start, *message_filter)
-    )
-    messages_week = messages_week.scalar()
-
-    status_result = await db.execute(
-        select(Contact.lead_status, func.count(Contact.id)).where(*contact_filter).group_by(Contact.lead_status)
+@router.get("/dashboard/stats")
+async def dashboard_stats(
+    channel_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Totais de contatos e mensagens (hoje, semana e período) + mensagens por dia do período (padrão: 7 dias)."""
+    try:
+        start, end = dashboard.period(date_from, date_to, default_days=7)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    return await dashboard_stats_cache.get(
+        {"channel_id": channel_id, "from": start, "to": end},
+        lambda: dashboard.stats(db, channel_id, start, end),
     )
-    status_counts = {row[0] or "novo": row[1] for row in status_result.all()}
-
-    daily_messages = []
-    for i in range(6, -1, -1):
-        day = today_start - timedelta(days=i)
-        next_day = day + timedelta(days=1)
-        count = await db.execute(
-            select(func.count(Message.id)).where(
-                Message.timestamp >= day, Message.timestamp < next_day, *message_filter
-            )
-        )
-        daily_messages.append({
-            "date": day.strftime("%d/%m"),
-            "day": day.strftime("%a"),
-            "count": count.scalar()
-        })
-
-    return {
-        "total_contacts": total_contacts,
-        "new_today": new_today,
-        "messages_today": messages_today,
-        "inbound_today": inbound_today,
-        "outbound_today": outbound_today,
-        "messages_week": messages_week,
-        "status_counts": status_counts,
-        "daily_messages": daily_messages,
-    }
 
 
 # === Envio de Mensagens ===
@@ -216,17 +181,22 @@ async def send_text(req: SendTextRequest, db: AsyncSession = Depends(get_db)):
             db.add(contact)
             await db.flush()
 
-        message = Message(
-            wa_message_id=msg_id,
-            contact_wa_id=wa_id,
-            channel_id=req.channel_id,
-            direction="outbound",
-            message_type="text",
-            content=req.text,
-            timestamp=datetime.now(SP_TZ).replace(tzinfo=None),
-            status="sent",
-        )
-        db.add(message)
+        # O eco fromMe do webhook pode ter chegado antes e já gravado a mensagem
+        if await claim_message_ids(db, [msg_id]):
+            message = Message(
+                wa_message_id=msg_id,
+                contact_wa_id=wa_id,
+                channel_id=req.channel_id,
+                direction="outbound",
+                message_type="text",
+                content=req.text,
+                timestamp=datetime.now(SP_TZ).replace(tzinfo=None),
+                status="sent",
+            )
+            db.add(message)
+            await conversation_state.record_messages(db, [message])
+            await db.flush()
+            await events.stage_messages(db, [message])
         await db.commit()
         return result
 
@@ -251,6 +221,9 @@ async def send_text(req: SendTextRequest, db: AsyncSession = Depends(get_db)):
             status="sent",
         )
         db.add(message)
+        await conversation_state.record_messages(db, [message])
+        await db.flush()
+        await events.stage_messages(db, [message])
         await db.commit()
     return result
 
@@ -286,6 +259,9 @@ async def send_template(req: SendTemplateRequest, db: AsyncSession = Depends(get
             status="sent",
         )
         db.add(message)
+        await conversation_state.record_messages(db, [message])
+        await db.flush()
+        await events.stage_messages(db, [message])
         await db.commit()
 
     return result
@@ -352,72 +328,113 @@ async def send_media(
         status="sent",
     )
     db.add(message)
+    await conversation_state.record_messages(db, [message])
+    await db.flush()
+    await events.stage_messages(db, [message])
     await db.commit()
     return {"status": "ok", "message_id": msg_id}
 
 
+# === Eventos em tempo real ===
+
+@router.get("/events")
+async def event_stream(
+    request: Request,
+    token: Optional[str] = None,
+    channel_id: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    unassigned: bool = False,
+    resume: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    Server-Sent Events da caixa de entrada: message.created, message.status, contact.updated
+    e card.moved, filtrados por canal e corretor (mesmos filtros de GET /contacts).
+    EventSource não manda header, então o JWT pode vir em ?token=. Na reconexão o navegador
+    manda Last-Event-ID (ou ?resume=) e só recebe o que perdeu; `resync` = recarregar a lista.
+    """
+    auth = request.headers.get("authorization", "")
+    token = token or auth.removeprefix("Bearer ").strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="Token ausente")
+    # Sessão só para autenticar: o stream não segura conexão do pool
+    async with async_session() as db:
+        await user_from_token(token, db)
+
+    return StreamingResponse(
+        events.stream(channel_id, assigned_to, unassigned, resume=last_event_id or resume),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/events/stats")
+async def event_stats():
+    """Conexões abertas, eventos publicados/entregues, estouros de buffer, resyncs e o barramento."""
+    return {**events.hub.stats(), "bus": event_bus.stats()}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Contadores do cache de respostas deste worker (hits, misses, coalesced...)."""
+    return response_cache.stats()
+
+
 # === Contatos ===
 
 @router.get("/contacts")
-async def list_contacts(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
-    from sqlalchemy.orm import aliased
-    from sqlalchemy import case
-
-    latest_msg = (
-        select(
-            Message.contact_wa_id,
-            func.max(Message.timestamp).label("last_ts")
+async def list_contacts(
+    response: Response,
+    channel_id: Optional[int] = None,
+    status: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    unassigned: bool = False,
+    tag_id: Optional[int] = None,
+    unread_only: bool = False,
+    limit: int = Query(default=CONTACTS_PAGE_DEFAULT, ge=1, le=CONTACTS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Caixa de entrada numa única consulta (contato, última mensagem, não lidas e etiquetas),
+    ordenada pela última mensagem. Filtros: canal, status do lead, corretor (ou sem corretor),
+    etiqueta e só não lidas. Sempre paginada (no máximo CONTACTS_PAGE_MAX por chamada): o
+    cursor da próxima página vem no header X-Next-Cursor.
+    """
+    try:
+        query = conversation_state.inbox_query(
+            limit,
+            cursor=cursor,
+            channel_id=channel_id,
+            lead_status=status,
+            assigned_to=assigned_to,
+            unassigned=unassigned,
+            tag_id=tag_id,
+            unread_only=unread_only,
         )
-        .group_by(Message.contact_wa_id)
-        .subquery()
-    )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
-    query = (
-        select(Contact)
-        .outerjoin(latest_msg, Contact.wa_id == latest_msg.c.contact_wa_id)
-        .order_by(latest_msg.c.last_ts.desc().nullslast())
-    )
-    if channel_id:
-        query = query.where(Contact.channel_id == channel_id)
     result = await db.execute(query)
-    contacts = result.scalars().all()
+    rows = result.all()
 
-    contacts_list = []
-    for c in contacts:
-        msg_result = await db.execute(
-            select(Message).where(Message.contact_wa_id == c.wa_id).order_by(Message.timestamp.desc()).limit(1)
-        )
-        last_msg = msg_result.scalar_one_or_none()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_state = rows[-1][0]
+        response.headers["X-Next-Cursor"] = conversation_state.encode_cursor(last_state.last_message_at, last_state.wa_id)
 
-        tag_result = await db.execute(
-            select(Tag).join(contact_tags).where(contact_tags.c.contact_wa_id == c.wa_id)
-        )
-        tags = tag_result.scalars().all()
+    return [conversation_state.inbox_row(state, c, tags) for state, c, tags in rows]
 
-        unread_result = await db.execute(
-            select(func.count(Message.id)).where(
-                Message.contact_wa_id == c.wa_id, Message.direction == "inbound", Message.status == "received"
-            )
-        )
-        unread = unread_result.scalar()
-
-        contacts_list.append({
-            "wa_id": c.wa_id,
-            "name": c.name or c.wa_id,
-            "lead_status": c.lead_status or "novo",
-            "notes": c.notes,
-            "channel_id": c.channel_id,
-            "last_message": last_msg.content if last_msg else "",
-            "last_message_time": last_msg.timestamp.isoformat() if last_msg else None,
-            "direction": last_msg.direction if last_msg else None,
-            "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in tags],
-            "unread": unread,
-            "ai_active": c.ai_active or False,
-            "created_at": c.created_at.isoformat() if c.created_at else None,
-            "assigned_to": c.assigned_to,
-        })
+@router.get("/contacts/unread-count")
+async def unread_count(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Conversas com mensagens não lidas e total de não lidas (badge do menu), sem listar contatos."""
+    cs = ConversationState
+    query = select(func.count(), func.coalesce(func.sum(cs.unread_count), 0)).where(cs.unread_count > 0)
+    if channel_id:
+        query = query.where(cs.channel_id == channel_id)
+    conversations, messages = (await db.execute(query)).one()
+    return {"conversations": conversations, "messages": int(messages)}
 
-    return contacts_list
 
 @router.post("/contacts/{wa_id}/read")
 async def mark_as_read(wa_id: str, db: AsyncSession = Depends(get_db)):
@@ -430,6 +447,8 @@ async def mark_as_read(wa_id: str, db: AsyncSession = Depends(get_db)):
             Message.status == "received",
         ).values(status="read")
     )
+    await conversation_state.mark_read(db, wa_id)
+    await events.stage_contacts(db, [wa_id])
     await db.commit()
     return {"status": "ok"}
 
@@ -477,6 +496,8 @@ async def update_contact(wa_id: str, req: UpdateContactRequest, db: AsyncSession
         contact.notes = req.notes
         await log_activity(db, wa_id, "note", "Notas atualizadas")
 
+    await db.flush()
+    await events.stage_contacts(db, [wa_id])
     await db.commit()
     return {"status": "updated"}
 
@@ -505,27 +526,179 @@ async def remove_tag_from_contact(wa_id: str, tag_id: int, db: AsyncSession = De
 
 # === Mensagens ===
 
+def _serialize_message(m: Message) -> dict:
+    return {
+        "id": m.id,
+        "wa_message_id": m.wa_message_id,
+        "direction": m.direction,
+        "type": m.message_type,
+        "content": m.content,
+        "timestamp": m.timestamp.isoformat(),
+        "status": m.status,
+        "sent_by_ai": m.sent_by_ai or False,
+        "channel_id": m.channel_id,
+    }
+
+
 @router.get("/contacts/{wa_id}/messages")
-async def get_messages(wa_id: str, db: AsyncSession = Depends(get_db)):
+async def get_messages(
+    wa_id: str,
+    response: Response,
+    limit: int = Query(default=MESSAGES_PAGE_DEFAULT, ge=1, le=MESSAGES_PAGE_MAX),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    since: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Histórico da conversa em ordem crescente de envio (timestamp, id).
+    - Sem after_id: as `limit` mensagens mais recentes (ou anteriores à mensagem before_id, para rolar para trás).
+    - Com after_id (delta): as mensagens novas (id maior que after_id, mais as de id menor que
+      commitaram depois, na folga de `since`) e as mudanças de status desde `since`.
+    O header X-Sync-Token traz o valor a mandar como `since` na próxima sincronização.
+    """
+    if after_id is None:
+        query = select(Message).where(Message.contact_wa_id == wa_id)
+        if before_id is not None:
+            # Cursor (timestamp, id) da mensagem before_id: reentrega atrasada fica no lugar em que foi enviada
+            anchor = (
+                select(Message.timestamp)
+                .where(Message.contact_wa_id == wa_id, Message.id == before_id)
+                .scalar_subquery()
+            )
+            query = query.where(tuple_(Message.timestamp, Message.id) < tuple_(anchor, before_id))
+        result = await db.execute(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit))
+        messages = list(reversed(result.scalars().all()))
+
+        sync_token = max((m.updated_at for m in messages if m.updated_at), default=None)
+        if sync_token:
+            response.headers["X-Sync-Token"] = sync_token.isoformat()
+        return [_serialize_message(m) for m in messages]
+
+    try:
+        since_dt = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since inválido")
+
     result = await db.execute(
-        select(Message).where(Message.contact_wa_id == wa_id).order_by(Message.timestamp.asc())
+        select(Message)
+        .where(Message.contact_wa_id == wa_id, Message.id > after_id)
+        .order_by(Message.id.asc())
+        .limit(MESSAGES_DELTA_MAX + 1)
     )
-    messages = result.scalars().all()
+    new_messages = result.scalars().all()
+    has_more = len(new_messages) > MESSAGES_DELTA_MAX
+    new_messages = new_messages[:MESSAGES_DELTA_MAX]
+
+    changed = []
+    if since_dt:
+        # Folga para transações que gravaram antes do último token mas commitaram depois: o id
+        # sai da sequência no INSERT, então a mensagem 100 pode aparecer depois da 101 (o
+        # cliente ignora as que já tem). updated_at >= created_at usa o índice por contato.
+        overlap = since_dt - timedelta(seconds=MESSAGES_SYNC_OVERLAP_SEC)
+        result = await db.execute(
+            select(Message)
+            .where(
+                Message.contact_wa_id == wa_id,
+                Message.updated_at > overlap,
+                Message.created_at > overlap,
+                Message.id <= after_id,
+            )
+            .order_by(Message.id.asc())
+        )
+        new_messages = sorted([*result.scalars().all(), *new_messages], key=lambda m: (m.timestamp, m.id))
+
+        result = await db.execute(
+            select(Message.id, Message.wa_message_id, Message.status, Message.updated_at)
+            .where(
+                Message.contact_wa_id == wa_id,
+                Message.updated_at > overlap,
+                Message.updated_at > Message.created_at,
+                Message.id <= after_id,
+            )
+        )
+        changed = result.all()
 
-    return [
-        {
-            "id": m.id,
-            "wa_message_id": m.wa_message_id,
-            "direction": m.direction,
-            "type": m.message_type,
-            "content": m.content,
-            "timestamp": m.timestamp.isoformat(),
-            "status": m.status,
-            "sent_by_ai": m.sent_by_ai or False,
-            "channel_id": m.channel_id,
-        }
-        for m in messages
-    ]
+    sync_token = max(
+        [since_dt] + [m.updated_at for m in new_messages] + [c.updated_at for c in changed],
+        key=lambda ts: ts or datetime.min,
+    )
+    if sync_token:
+        response.headers["X-Sync-Token"] = sync_token.isoformat()
+
+    return {
+        "messages": [_serialize_message(m) for m in new_messages],
+        "status_changes": [{"id": c.id, "wa_message_id": c.wa_message_id, "status": c.status} for c in changed],
+        "has_more": has_more,
+        "sync_token": sync_token.isoformat() if sync_token else None,
+    }
+
+
+def _conversation_search_response(hits: list, around: dict, limit: int) -> dict:
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    results = []
+    for hit in hits:
+        context = around.get(hit.id, [])
+        results.append({
+            "message": _serialize_message(hit),
+            "contact_wa_id": hit.contact_wa_id,
+            "contact_name": hit.contact_name or hit.contact_wa_id,
+            "highlight": hit.highlight,
+            "context_before": [_serialize_message(m) for m in context if m.id < hit.id],
+            "context_after": [_serialize_message(m) for m in context if m.id > hit.id],
+            # GET /contacts/{wa_id}/messages?before_id=... abre o histórico terminando nesta mensagem
+            "history_before_id": hit.id + 1,
+        })
+    return {
+        "results": results,
+        "has_more": has_more,
+        "next_cursor": str(hits[-1].id) if has_more else None,
+    }
+
+
+def _parse_search_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@router.get("/contacts/{wa_id}/messages/search")
+async def search_contact_messages(
+    wa_id: str,
+    q: str = Query(min_length=2),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=search.CONVERSATION_SEARCH_LIMIT_DEFAULT, ge=1, le=search.CONVERSATION_SEARCH_LIMIT_MAX),
+    context: int = Query(default=2, ge=0, le=search.CONVERSATION_CONTEXT_MAX),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Busca textual no histórico de um contato (mais recentes primeiro), com `context`
+    mensagens antes e depois de cada resultado. Próxima página: cursor=next_cursor.
+    """
+    hits, around = await search.search_conversation(
+        db, q, wa_id=wa_id, before_id=_parse_search_cursor(cursor), limit=limit, context=context,
+    )
+    return _conversation_search_response(hits, around, limit)
+
+
+@router.get("/messages/search")
+async def search_my_messages(
+    q: str = Query(min_length=2),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=search.CONVERSATION_SEARCH_LIMIT_DEFAULT, ge=1, le=search.CONVERSATION_SEARCH_LIMIT_MAX),
+    context: int = Query(default=2, ge=0, le=search.CONVERSATION_CONTEXT_MAX),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Mesma busca, em todas as conversas atribuídas ao usuário logado."""
+    hits, around = await search.search_conversation(
+        db, q, assigned_to=current_user.id, before_id=_parse_search_cursor(cursor), limit=limit, context=context,
+    )
+    return _conversation_search_response(hits, around, limit)
 
 
 @router.get("/contacts/{wa_id}/picture")
@@ -638,36 +811,35 @@ async def get_media(media_id: str, channel_id: int = 1, db: AsyncSession = Depen
 # === Busca Global ===
 
 @router.get("/search")
-async def global_search(q: str = "", db: AsyncSession = Depends(get_db)):
-    """Busca contatos por nome ou telefone (wa_id)"""
+async def global_search(
+    q: str = "",
+    scope: Optional[str] = Query(default=None, alias="type", pattern="^(contacts|messages|properties)$"),
+    limit: int = Query(default=search.SEARCH_LIMIT_DEFAULT, ge=1, le=search.SEARCH_LIMIT_MAX),
+    offset: int = Query(default=0, ge=0, le=search.SEARCH_OFFSET_MAX),
+    days: int = Query(default=search.SEARCH_MESSAGES_DAYS, ge=0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Busca contatos (nome/telefone), mensagens (texto) e imóveis (título/endereço), ordenados
+    por relevância e com o trecho encontrado em "highlight". Com type=contacts|messages|properties
+    busca só aquela seção (para paginar com offset); has_more indica se há próxima página.
+    """
     if not q or len(q.strip()) < 2:
-        return {"contacts": [], "pages": []}
-
-    term = f"%{q.strip()}%"
-
-    result = await db.execute(
-        select(Contact)
-        .where(
-            (Contact.name.ilike(term)) | (Contact.wa_id.ilike(term))
-        )
-        .order_by(Contact.name.asc())
-        .limit(10)
-    )
-    contacts = result.scalars().all()
-
-    contacts_list = []
-    for c in contacts:
-        tag_result = await db.execute(
-            select(Tag).join(contact_tags).where(contact_tags.c.contact_wa_id == c.wa_id)
-        )
-        tags = tag_result.scalars().all()
+        return {"contacts": [], "messages": [], "properties": [], "pages": [], "has_more": {}}
 
-        contacts_list.append({
-            "wa_id": c.wa_id,
-            "name": c.name or c.wa_id,
-            "lead_status": c.lead_status or "novo",
-            "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in tags],
-        })
+    sections = {
+        "contacts": lambda: search.search_contacts(db, q, limit + 1, offset),
+        "messages": lambda: search.search_messages(db, q, limit + 1, offset, days),
+        "properties": lambda: search.search_properties(db, q, limit + 1, offset),
+    }
+    results, has_more = {}, {}
+    for name, run in sections.items():
+        if scope and name != scope:
+            results[name] = []
+            continue
+        items = await run()
+        has_more[name] = len(items) > limit
+        results[name] = items[:limit]
 
     # Busca de páginas estática (match no label)
     pages = [
@@ -683,9 +855,9 @@ async def global_search(q: str = "", db: AsyncSession = Depends(get_db)):
         {"label": "Canais", "href": "/canais", "icon": "Radio"},
     ]
     q_lower = q.strip().lower()
-    matched_pages = [p for p in pages if q_lower in p["label"].lower()]
+    matched_pages = [p for p in pages if q_lower in p["label"].lower()] if not scope else []
 
-    return {"contacts": contacts_list, "pages": matched_pages}
+    return {**results, "pages": matched_pages, "has_more": has_more}
 
 # Cole este código no FINAL do arquivo backend/app/routes.py
 # (logo após o endpoint /search que você adicionou na Sprint 4)
@@ -808,6 +980,7 @@ async def assign_contact(wa_id: str, req: dict, db: AsyncSession = Depends(get_d
         raise HTTPException(status_code=404, detail="Contato não encontrado")
 
     user_id = req.get("assigned_to")
+    previous = contact.assigned_to
     contact.assigned_to = user_id
 
     if user_id:
@@ -818,179 +991,32 @@ async def assign_contact(wa_id: str, req: dict, db: AsyncSession = Depends(get_d
     else:
         await log_activity(db, wa_id, "assigned", "Atribuição removida")
 
+    await db.flush()
+    # O corretor anterior também recebe, para tirar a conversa da lista dele
+    await events.stage_contacts(db, [wa_id], notify=[previous])
     await db.commit()
     return {"status": "assigned", "assigned_to": user_id}
 # === Dashboard Avançado ===
 
 @router.get("/dashboard/advanced")
-async def dashboard_advanced(channel_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
-    from app.models import User, Activity
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    seven_days_ago = today_start - timedelta(days=7)
-    fourteen_days_ago = today_start - timedelta(days=14)
-
-    contact_filter = [] if not channel_id else [Contact.channel_id == channel_id]
-    message_filter = [] if not channel_id else [Message.channel_id == channel_id]
-
-    # --- Métricas por atendente ---
-    agent_stats_q = await db.execute(
-        select(
-            Contact.assigned_to,
-            func.count(Contact.id)
-        ).where(
-            Contact.assigned_to.isnot(None),
-            *contact_filter
-        ).group_by(Contact.assigned_to)
-    )
-    agent_leads = {row[0]: row[1] for row in agent_stats_q.all()}
-
-    agent_msgs_q = await db.execute(
-        select(func.count(Message.id)).where(
-            Message.direction == "outbound",
-            Message.timestamp >= seven_days_ago,
-            *message_filter
-        )
-    )
-    total_outbound_week = agent_msgs_q.scalar() or 0
-
-    # Buscar nomes dos usuários
-    users_q = await db.execute(select(User).where(User.is_active == True))
-    users_map = {u.id: u.name for u in users_q.scalars().all()}
-
-    agents = []
-    for user_id, lead_count in agent_leads.items():
-        # Mensagens enviadas por contatos deste atendente nos últimos 7 dias
-        assigned_contacts_q = await db.execute(
-            select(Contact.wa_id).where(Contact.assigned_to == user_id, *contact_filter)
-        )
-        assigned_wa_ids = [r[0] for r in assigned_contacts_q.all()]
-
-        msg_count = 0
-        if assigned_wa_ids:
-            mc = await db.execute(
-                select(func.count(Message.id)).where(
-                    Message.direction == "outbound",
-                    Message.timestamp >= seven_days_ago,
-                    Message.contact_wa_id.in_(assigned_wa_ids),
-                    *message_filter
-                )
-            )
-            msg_count = mc.scalar() or 0
-
-        agents.append({
-            "user_id": user_id,
-            "name": users_map.get(user_id, f"#{user_id}"),
-            "leads": lead_count,
-            "messages_week": msg_count,
-        })
-
-    agents.sort(key=lambda x: x["leads"], reverse=True)
-
-    # --- Não atribuídos ---
-    unassigned_q = await db.execute(
-        select(func.count(Contact.id)).where(
-            Contact.assigned_to.is_(None),
-            *contact_filter
-        )
-    )
-    unassigned_count = unassigned_q.scalar() or 0
-
-    # --- Taxa de conversão ---
-    total_q = await db.execute(select(func.count(Contact.id)).where(*contact_filter))
-    total = total_q.scalar() or 0
-    converted_q = await db.execute(
-        select(func.count(Contact.id)).where(Contact.lead_status == "convertido", *contact_filter)
-    )
-    converted = converted_q.scalar() or 0
-    conversion_rate = round((converted / total * 100), 1) if total > 0 else 0
-
-    # --- Leads por tag (top 8) ---
-    from app.models import contact_tags, Tag
-    tags_q = await db.execute(
-        select(
-            Tag.name,
-            Tag.color,
-            func.count(contact_tags.c.contact_wa_id)
-        ).join(Tag, Tag.id == contact_tags.c.tag_id)
-        .group_by(Tag.name, Tag.color)
-        .order_by(func.count(contact_tags.c.contact_wa_id).desc())
-        .limit(8)
-    )
-    tags_data = [{"name": r[0], "color": r[1], "count": r[2]} for r in tags_q.all()]
-
-    # --- Novos leads: esta semana vs semana passada ---
-    new_this_week_q = await db.execute(
-        select(func.count(Contact.id)).where(
-            Contact.created_at >= seven_days_ago, *contact_filter
-        )
-    )
-    new_this_week = new_this_week_q.scalar() or 0
-
-    new_last_week_q = await db.execute(
-        select(func.count(Contact.id)).where(
-            Contact.created_at >= fourteen_days_ago,
-            Contact.created_at < seven_days_ago,
-            *contact_filter
-        )
-    )
-    new_last_week = new_last_week_q.scalar() or 0
-
-    trend_pct = round(((new_this_week - new_last_week) / max(new_last_week, 1)) * 100, 1)
-
-    # --- Tempo médio de primeira resposta (últimos 7 dias) ---
-    # Calcula tempo entre primeira msg inbound e primeira msg outbound por contato
-    avg_response = None
+async def dashboard_advanced(
+    channel_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Atendentes, conversão, etiquetas, novos leads (período vs período anterior) e tempo de
+    primeira resposta de todas as conversas do período (padrão: últimos 7 dias).
+    """
     try:
-        from sqlalchemy import and_
-        recent_contacts_q = await db.execute(
-            select(Contact.wa_id).where(
-                Contact.created_at >= seven_days_ago, *contact_filter
-            ).limit(50)
-        )
-        recent_wa_ids = [r[0] for r in recent_contacts_q.all()]
-
-        response_times = []
-        for wa_id in recent_wa_ids:
-            first_in_q = await db.execute(
-                select(Message.timestamp).where(
-                    Message.contact_wa_id == wa_id,
-                    Message.direction == "inbound"
-                ).order_by(Message.timestamp.asc()).limit(1)
-            )
-            first_in = first_in_q.scalar()
-
-            if first_in:
-                first_out_q = await db.execute(
-                    select(Message.timestamp).where(
-                        Message.contact_wa_id == wa_id,
-                        Message.direction == "outbound",
-                        Message.timestamp > first_in
-                    ).order_by(Message.timestamp.asc()).limit(1)
-                )
-                first_out = first_out_q.scalar()
-                if first_out:
-                    diff = (first_out - first_in).total_seconds() / 60  # em minutos
-                    if diff < 1440:  # ignora se > 24h (provavelmente fora de horário)
-                        response_times.append(diff)
-
-        if response_times:
-            avg_response = round(sum(response_times) / len(response_times), 1)
-    except Exception:
-        avg_response = None
-
-    return {
-        "agents": agents,
-        "unassigned_leads": unassigned_count,
-        "conversion_rate": conversion_rate,
-        "converted": converted,
-        "total": total,
-        "tags": tags_data,
-        "new_this_week": new_this_week,
-        "new_last_week": new_last_week,
-        "trend_pct": trend_pct,
-        "avg_response_minutes": avg_response,
-    }
+        start, end = dashboard.period(date_from, date_to, default_days=7)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    return await dashboard_advanced_cache.get(
+        {"channel_id": channel_id, "from": start, "to": end},
+        lambda: dashboard.advanced(db, channel_id, start, end),
+    )
 
 
 
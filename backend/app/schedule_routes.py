@@ -8,9 +8,10 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timedelta, timezone
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.auth_routes import get_current_user
 from app.models import Schedule, Contact
+from app import response_cache
 
 SP_TZ = timezone(timedelta(hours=-3))
 
@@ -164,15 +165,21 @@ async def delete_schedule(
     return {"status": "deleted"}
 
 
+stats_cache = response_cache.register("schedule_stats", domains=("schedules",))
+
+
 @router.get("/stats")
 async def schedule_stats(
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Estatísticas de agendamentos."""
     now = datetime.now(SP_TZ).replace(tzinfo=None)
     today = now.strftime("%Y-%m-%d")
+    return await stats_cache.get({"today": today}, lambda: _schedule_stats(db, today))
+
 
+async def _schedule_stats(db: AsyncSession, today: str) -> dict:
     # Total pendentes
     pending = await db.execute(
         select(func.count(Schedule.id)).where(Schedule.status == "pending")
@@ -0,0 +1,276 @@
+"""
+Busca global (GET /api/search): contatos, mensagens e imóveis.
+- Contatos e imóveis: índices trigram (pg_trgm) sobre f_unaccent(nome / título + endereço)
+  e sobre o telefone; ordenados por word_similarity. Sem pg_trgm cai em ILIKE sem acento.
+- Mensagens: coluna gerada messages.search_vector (português, sem acento) com índice GIN;
+  ordenadas por ts_rank_cd, com o trecho encontrado destacado por ts_headline.
+Os destaques voltam como texto puro com o termo entre <mark> e </mark>.
+Índices: app/migrate_search.py.
+"""
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Tag, contact_tags
+
+SEARCH_LIMIT_DEFAULT = 10
+SEARCH_LIMIT_MAX = 50
+SEARCH_OFFSET_MAX = 500
+# Janela padrão da busca em mensagens (só lê as partições do período); 0 = todo o histórico
+SEARCH_MESSAGES_DAYS = int(os.getenv("SEARCH_MESSAGES_DAYS", "365"))
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=20, MinWords=8, MaxFragments=2"
+
+# Mesmas expressões dos índices trigram (app/migrate_search.py)
+CONTACT_NAME_TEXT = "f_unaccent(coalesce(name, ''))"
+PROPERTY_TEXT = (
+    "f_unaccent(coalesce(title, '') || ' ' || coalesce(address_street, '') || ' ' || "
+    "coalesce(address_neighborhood, '') || ' ' || coalesce(address_city, ''))"
+)
+MESSAGE_QUERY = "websearch_to_tsquery('pt_unaccent', f_unaccent(:q))"
+
+SP_TZ = timezone(timedelta(hours=-3))
+
+_trgm_available: bool | None = None
+
+
+async def has_trgm(db: AsyncSession) -> bool:
+    """pg_trgm instalada? (consulta uma vez por processo)"""
+    global _trgm_available
+    if _trgm_available is None:
+        result = await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+        _trgm_available = bool(result.scalar())
+        if not _trgm_available:
+            print("⚠️ pg_trgm indisponível: busca de contatos/imóveis sem índice (ILIKE)")
+    return _trgm_available
+
+
+def _like(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _fold(value: str) -> str:
+    """Minúsculas sem acento, caractere a caractere (mantém as posições do texto original)."""
+    return "".join(unicodedata.normalize("NFKD", ch)[0].lower() for ch in value)
+
+
+def highlight(value: str | None, term: str) -> str:
+    """Marca a primeira ocorrência do termo (ignorando acentos e maiúsculas)."""
+    value = value or ""
+    needle = _fold(term.strip())
+    start = _fold(value).find(needle) if needle else -1
+    if start < 0:
+        return value
+    end = start + len(needle)
+    return f"{value[:start]}{HIGHLIGHT_START}{value[start:end]}{HIGHLIGHT_STOP}{value[end:]}"
+
+
+async def tags_by_contact(db: AsyncSession, wa_ids: list[str]) -> dict[str, list[dict]]:
+    """Etiquetas de vários contatos numa consulta só."""
+    tags: dict[str, list[dict]] = {wa_id: [] for wa_id in wa_ids}
+    if not wa_ids:
+        return tags
+    result = await db.execute(
+        select(contact_tags.c.contact_wa_id, Tag)
+        .join(Tag, Tag.id == contact_tags.c.tag_id)
+        .where(contact_tags.c.contact_wa_id.in_(wa_ids))
+        .order_by(Tag.id)
+    )
+    for wa_id, tag in result.all():
+        tags[wa_id].append({"id": tag.id, "name": tag.name, "color": tag.color})
+    return tags
+
+
+async def search_contacts(db: AsyncSession, q: str, limit: int, offset: int = 0) -> list[dict]:
+    """Contatos por nome (sem acento, tolera erro de digitação) ou trecho do telefone."""
+    term = q.strip()
+    digits = re.sub(r"\D", "", term)
+    params = {"q": term, "like": _like(term), "prefix": _like(term)[1:], "limit": limit, "offset": offset}
+
+    if await has_trgm(db):
+        conditions = [f"{CONTACT_NAME_TEXT} ILIKE f_unaccent(:like)", f"f_unaccent(:q) <% {CONTACT_NAME_TEXT}"]
+        rank = f"word_similarity(f_unaccent(:q), {CONTACT_NAME_TEXT})"
+    else:
+        conditions = [f"{CONTACT_NAME_TEXT} ILIKE f_unaccent(:like)"]
+        rank = f"CASE WHEN {CONTACT_NAME_TEXT} ILIKE f_unaccent(:prefix) THEN 1.0 ELSE 0.5 END"
+    if len(digits) >= 3:
+        conditions.append("c.wa_id LIKE :digits")
+        rank = f"GREATEST({rank}, CASE WHEN c.wa_id LIKE :digits THEN 1.0 ELSE 0 END)"
+        params["digits"] = f"%{digits}%"
+
+    result = await db.execute(text(f"""
+        SELECT c.wa_id, c.name, c.lead_status, {rank} AS rank
+          FROM contacts c
+         WHERE {" OR ".join(conditions)}
+         ORDER BY rank DESC, c.name, c.wa_id
+         LIMIT :limit OFFSET :offset
+    """), params)
+    rows = result.all()
+
+    tags = await tags_by_contact(db, [r.wa_id for r in rows])
+    return [
+        {
+            "wa_id": r.wa_id,
+            "name": r.name or r.wa_id,
+            "lead_status": r.lead_status or "novo",
+            "tags": tags[r.wa_id],
+            "highlight": highlight(r.name or r.wa_id, term) if r.name else highlight(r.wa_id, digits or term),
+            "rank": round(float(r.rank), 4),
+        }
+        for r in rows
+    ]
+
+
+async def search_messages(db: AsyncSession, q: str, limit: int, offset: int = 0, days: int = SEARCH_MESSAGES_DAYS) -> list[dict]:
+    """Mensagens por palavras (português, sem acento; aceita "frase exata", -exclusão e OR)."""
+    params = {"q": q.strip(), "limit": limit, "offset": offset, "options": HEADLINE_OPTIONS}
+    period = ""
+    if days:
+        period = "AND m.timestamp >= :since"
+        params["since"] = datetime.now(SP_TZ).replace(tzinfo=None) - timedelta(days=days)
+
+    # ts_headline é caro: só roda nas linhas da página, depois do LIMIT
+    result = await db.execute(text(f"""
+        SELECT hit.id, hit.contact_wa_id, c.name AS contact_name, hit.direction, hit.timestamp, hit.rank,
+               ts_headline('pt_unaccent', hit.content, {MESSAGE_QUERY}, :options) AS highlight
+          FROM (
+                SELECT m.id, m.contact_wa_id, m.direction, m.timestamp, m.content,
+                       ts_rank_cd(m.search_vector, {MESSAGE_QUERY}) AS rank
+                  FROM messages m
+                 WHERE m.search_vector @@ {MESSAGE_QUERY} {period}
+                 ORDER BY rank DESC, m.timestamp DESC
+                 LIMIT :limit OFFSET :offset
+               ) hit
+          JOIN contacts c ON c.wa_id = hit.contact_wa_id
+         ORDER BY hit.rank DESC, hit.timestamp DESC
+    """), params)
+    return [
+        {
+            "id": r.id,
+            "contact_wa_id": r.contact_wa_id,
+            "contact_name": r.contact_name or r.contact_wa_id,
+            "direction": r.direction,
+            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+            "highlight": r.highlight,
+            "rank": round(float(r.rank), 4),
+        }
+        for r in result.all()
+    ]
+
+
+async def search_properties(db: AsyncSession, q: str, limit: int, offset: int = 0) -> list[dict]:
+    """Imóveis por título ou endereço (rua, bairro, cidade)."""
+    term = q.strip()
+    params = {"q": term, "like": _like(term), "limit": limit, "offset": offset}
+    if await has_trgm(db):
+        where = f"{PROPERTY_TEXT} ILIKE f_unaccent(:like) OR f_unaccent(:q) <% {PROPERTY_TEXT}"
+        rank = f"word_similarity(f_unaccent(:q), {PROPERTY_TEXT})"
+    else:
+        where = f"{PROPERTY_TEXT} ILIKE f_unaccent(:like)"
+        rank = "1.0"
+
+    result = await db.execute(text(f"""
+        SELECT p.id, p.title, p.type, p.status, p.price, p.address_neighborhood, p.address_city, {rank} AS rank
+          FROM properties p
+         WHERE {where}
+         ORDER BY rank DESC, p.title, p.id
+         LIMIT :limit OFFSET :offset
+    """), params)
+    items = []
+    for r in result.all():
+        address = " - ".join(part for part in (r.address_neighborhood, r.address_city) if part)
+        items.append({
+            "id": r.id,
+            "title": r.title,
+            "type": r.type,
+            "status": r.status,
+            "price": float(r.price) if r.price is not None else None,
+            "address": address,
+            "highlight": highlight(r.title, term) if _fold(term) in _fold(r.title or "") else highlight(address, term),
+            "rank": round(float(r.rank), 4),
+        })
+    return items
+
+
+# ==================== BUSCA DENTRO DAS CONVERSAS ====================
+
+CONVERSATION_SEARCH_LIMIT_DEFAULT = 20
+CONVERSATION_SEARCH_LIMIT_MAX = 100
+CONVERSATION_CONTEXT_MAX = 10
+
+MESSAGE_COLUMNS = (
+    "m.id, m.wa_message_id, m.contact_wa_id, m.channel_id, m.direction, m.message_type, "
+    "m.content, m.timestamp, m.status, m.sent_by_ai"
+)
+
+
+async def search_conversation(
+    db: AsyncSession,
+    q: str,
+    wa_id: str | None = None,
+    assigned_to: int | None = None,
+    before_id: int | None = None,
+    limit: int = CONVERSATION_SEARCH_LIMIT_DEFAULT,
+    context: int = 2,
+) -> tuple[list, dict[int, list]]:
+    """
+    Busca no histórico de um contato (wa_id) ou de todas as conversas de um corretor
+    (assigned_to), da mais recente para a mais antiga, usando messages.search_vector.
+    Paginação por id (before_id = id do último resultado, igual ao histórico da conversa).
+    Retorna (até limit + 1 mensagens encontradas com highlight e contact_name,
+    {id encontrado: `context` mensagens antes e depois, em ordem}).
+    """
+    params = {"q": q.strip(), "limit": limit + 1, "options": HEADLINE_OPTIONS}
+    filters = [f"m.search_vector @@ {MESSAGE_QUERY}"]
+    if wa_id:
+        filters.append("m.contact_wa_id = :wa_id")
+        params["wa_id"] = wa_id
+    if assigned_to:
+        filters.append("ct.assigned_to = :assigned_to")
+        params["assigned_to"] = assigned_to
+    if before_id:
+        filters.append("m.id < :before_id")
+        params["before_id"] = before_id
+
+    result = await db.execute(text(f"""
+        SELECT hit.*, ts_headline('pt_unaccent', coalesce(hit.content, ''), {MESSAGE_QUERY}, :options) AS highlight
+          FROM (
+                SELECT {MESSAGE_COLUMNS}, ct.name AS contact_name
+                  FROM messages m
+                  JOIN contacts ct ON ct.wa_id = m.contact_wa_id
+                 WHERE {" AND ".join(filters)}
+                 ORDER BY m.id DESC
+                 LIMIT :limit
+               ) hit
+         ORDER BY hit.id DESC
+    """), params)
+    hits = result.all()
+
+    around: dict[int, list] = {hit.id: [] for hit in hits}
+    if hits and context:
+        # Vizinhas de todas as mensagens encontradas numa consulta só (ix_messages_contact_id)
+        result = await db.execute(text(f"""
+            SELECT h.hit_id, ctx.*
+              FROM unnest(CAST(:ids AS bigint[]), CAST(:wa_ids AS varchar[])) AS h(hit_id, wa_id)
+             CROSS JOIN LATERAL (
+                    (SELECT {MESSAGE_COLUMNS} FROM messages m
+                      WHERE m.contact_wa_id = h.wa_id AND m.id < h.hit_id
+                      ORDER BY m.id DESC LIMIT :context)
+                    UNION ALL
+                    (SELECT {MESSAGE_COLUMNS} FROM messages m
+                      WHERE m.contact_wa_id = h.wa_id AND m.id > h.hit_id
+                      ORDER BY m.id ASC LIMIT :context)
+             ) ctx
+             ORDER BY h.hit_id, ctx.id
+        """), {"ids": [h.id for h in hits], "wa_ids": [h.contact_wa_id for h in hits], "context": context})
+        for row in result.all():
+            around[row.hit_id].append(row)
+
+    return hits, around
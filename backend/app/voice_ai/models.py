@@ -4,7 +4,7 @@ Tabelas: ai_calls, ai_call_turns, ai_call_events, voice_scripts, ai_call_qa
 """
 from sqlalchemy import (
     Column, String, Text, DateTime, Integer, Float, Boolean,
-    ForeignKey, JSON, func
+    ForeignKey, JSON, func, Index
 )
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -13,6 +13,9 @@ from app.database import Base
 class AICall(Base):
     """Registro de cada ligação feita pela IA."""
     __tablename__ = "ai_calls"
+    __table_args__ = (
+        Index("ix_ai_calls_created_source", "created_at", "source"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     lead_id = Column(Integer, ForeignKey("exact_leads.id"), nullable=True)
@@ -14,9 +14,9 @@ from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc, case
 
-from app.database import get_db, async_session
+from app.database import get_db, get_read_db, async_session
 from app.auth import get_current_user
-from app.models import Contact, ExactLead, Channel
+from app.models import Contact, ExactLead, Channel, MetricsAICallsHourly
 
 from app.voice_ai.models import AICall, AICallTurn, AICallEvent, AICallQA, VoiceScript
 from app.voice_ai.fsm import FSMEngine, CallSession, State
@@ -524,77 +524,57 @@ async def list_calls(
 async def get_dashboard(
     days: int = 7,
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    """Dashboard com métricas do Voice AI."""
-    since = datetime.now() - timedelta(days=days)
-
-    # Total de chamadas
-    total = (await db.execute(
-        select(func.count(AICall.id)).where(AICall.created_at >= since)
-    )).scalar() or 0
-
-    # Atendidas
-    answered = (await db.execute(
-        select(func.count(AICall.id)).where(
-            AICall.created_at >= since,
-            AICall.status == "completed",
-        )
-    )).scalar() or 0
+    """Dashboard com métricas do Voice AI (lido do rollup por hora, app/metrics.py)."""
+    since = (datetime.now() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    m = MetricsAICallsHourly
+    in_period = m.hour >= since
+
+    totals = (await db.execute(
+        select(
+            func.sum(m.calls), func.sum(m.completed),
+            func.sum(m.score_sum), func.sum(m.score_count),
+            func.sum(m.latency_sum), func.sum(m.latency_count),
+            func.sum(m.duration_sum), func.sum(m.duration_count),
+        ).where(in_period)
+    )).one()
+    total, answered = totals[0] or 0, totals[1] or 0
+
+    def average(value_sum, value_count):
+        return float(value_sum) / value_count if value_count else 0
+
+    avg_score = average(totals[2], totals[3])
+    avg_latency = average(totals[4], totals[5])
+    avg_duration = average(totals[6], totals[7])
 
     # Por outcome
     outcomes = (await db.execute(
-        select(AICall.outcome, func.count(AICall.id))
-        .where(AICall.created_at >= since, AICall.outcome != None)
-        .group_by(AICall.outcome)
+        select(m.outcome, func.sum(m.calls))
+        .where(in_period, m.outcome != "")
+        .group_by(m.outcome)
     )).all()
 
-    # Score médio
-    avg_score = (await db.execute(
-        select(func.avg(AICall.score)).where(
-            AICall.created_at >= since,
-            AICall.score > 0,
-        )
-    )).scalar() or 0
-
-    # Latência média
-    avg_latency = (await db.execute(
-        select(func.avg(AICall.avg_latency_ms)).where(
-            AICall.created_at >= since,
-            AICall.avg_latency_ms > 0,
-        )
-    )).scalar() or 0
-
-    # Duração média
-    avg_duration = (await db.execute(
-        select(func.avg(AICall.duration_seconds)).where(
-            AICall.created_at >= since,
-            AICall.duration_seconds > 0,
-        )
-    )).scalar() or 0
-
     # Por dia
-    from sqlalchemy import text as sa_text
+    day = func.date_trunc("day", m.hour)
     daily = (await db.execute(
-        sa_text("""
-            SELECT date_trunc('day', created_at) AS day,
-                   count(id) AS total,
-                   sum(CASE WHEN outcome = 'scheduled' THEN 1 ELSE 0 END) AS scheduled,
-                   sum(CASE WHEN outcome = 'qualified' THEN 1 ELSE 0 END) AS qualified
-            FROM ai_calls
-            WHERE created_at >= :since
-            GROUP BY date_trunc('day', created_at)
-            ORDER BY date_trunc('day', created_at)
-        """),
-        {"since": since}
+        select(
+            day,
+            func.sum(m.calls),
+            func.coalesce(func.sum(m.calls).filter(m.outcome == "scheduled"), 0),
+            func.coalesce(func.sum(m.calls).filter(m.outcome == "qualified"), 0),
+        )
+        .where(in_period)
+        .group_by(day)
+        .order_by(day)
     )).all()
 
-    # Por curso
+    # Por curso (média do score como no original: inclui as ligações sem nota)
     by_course = (await db.execute(
-        select(AICall.course, func.count(AICall.id), func.avg(AICall.score))
-        .where(AICall.created_at >= since, AICall.course != None)
-        .group_by(AICall.course)
-        .order_by(func.count(AICall.id).desc())
+        select(m.course, func.sum(m.calls), func.sum(m.score_sum) / func.sum(m.calls))
+        .where(in_period, m.course != "")
+        .group_by(m.course)
+        .order_by(func.sum(m.calls).desc())
     )).all()
 
     return {
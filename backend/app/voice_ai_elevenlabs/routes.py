@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, cast, Date
 from datetime import datetime, timezone, timedelta
 from app.voice_ai_elevenlabs.voice_pipeline import make_outbound_call
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.voice_ai.models import AICall, AICallTurn
 
 router = APIRouter(prefix="/api/voice-ai-el", tags=["Voice AI - ElevenLabs"])
@@ -156,7 +156,7 @@ async def post_call_webhook(request: Request, db: AsyncSession = Depends(get_db)
 # ============================================================
 
 @router.get("/dashboard")
-async def get_dashboard(days: int = Query(default=7), db: AsyncSession = Depends(get_db)):
+async def get_dashboard(days: int = Query(default=7), db: AsyncSession = Depends(get_read_db)):
     """Dashboard com métricas das ligações ElevenLabs."""
     cutoff = datetime.now(SP_TZ).replace(tzinfo=None) - timedelta(days=days)
 
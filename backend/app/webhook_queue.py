@@ -0,0 +1,236 @@
+"""
+Fila de ingestão de webhooks (acknowledge-first).
+O endpoint grava o payload bruto em webhook_inbox e responde 200 na hora;
+um pool limitado de workers drena a fila e processa os payloads em segundo plano.
+"""
+import os
+import json
+import time
+import asyncio
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app import event_bus
+from app.models import WebhookInbox
+
+QUEUE_ENABLED = os.getenv("WEBHOOK_QUEUE_ENABLED", "false").lower() == "true"
+QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", "4"))
+QUEUE_BATCH_SIZE = int(os.getenv("WEBHOOK_QUEUE_BATCH_SIZE", "20"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "5"))
+QUEUE_POLL_SEC = float(os.getenv("WEBHOOK_QUEUE_POLL_SEC", "1.0"))
+QUEUE_STALE_SEC = int(os.getenv("WEBHOOK_QUEUE_STALE_SEC", "300"))
+
+# Handler recebe a lista de payloads de um lote e a sessão do worker
+Handler = Callable[[list[dict], AsyncSession], Awaitable[None]]
+
+_handlers: dict[str, Handler] = {}
+_wakeup = asyncio.Event()
+_workers: list[asyncio.Task] = []
+
+_counters = {
+    "enqueued": 0,
+    "processed": 0,
+    "failed": 0,
+    "retried": 0,
+    "batches": 0,
+    "last_batch_ms": 0.0,
+}
+
+
+event_bus.subscribe("webhook.enqueued", lambda payload: _wakeup.set())
+
+
+def register_handler(source: str, handler: Handler):
+    """Registra a função que processa os payloads de uma origem (meta, evolution)."""
+    _handlers[source] = handler
+
+
+async def enqueue(source: str, payload: dict, db: AsyncSession) -> int:
+    """Grava o payload bruto e acorda os workers. Retorna o id da linha."""
+    item = WebhookInbox(source=source, payload=json.dumps(payload, ensure_ascii=False), status="pending")
+    db.add(item)
+    # Acorda também os workers dos outros processos (sem isso eles só veem no próximo polling)
+    event_bus.publish(db, "webhook.enqueued", {"source": source}, durable=False)
+    await db.commit()
+    _counters["enqueued"] += 1
+    _wakeup.set()
+    return item.id
+
+
+async def _claim_batch(db: AsyncSession, source: str) -> list[tuple[int, dict]]:
+    """Reserva um lote de payloads pendentes (SKIP LOCKED permite vários workers/processos)."""
+    result = await db.execute(
+        text("""
+            UPDATE webhook_inbox
+               SET status = 'processing', attempts = attempts + 1, locked_at = now()
+             WHERE id IN (
+                SELECT id FROM webhook_inbox
+                 WHERE status = 'pending' AND source = :source
+                 ORDER BY id
+                 LIMIT :limit
+                 FOR UPDATE SKIP LOCKED
+             )
+            RETURNING id, payload
+        """),
+        {"source": source, "limit": QUEUE_BATCH_SIZE},
+    )
+    rows = result.all()
+    await db.commit()
+    return sorted(((r.id, json.loads(r.payload)) for r in rows), key=lambda r: r[0])
+
+
+async def _finish_batch(db: AsyncSession, ids: list[int]):
+    await db.execute(
+        text("UPDATE webhook_inbox SET status = 'done', processed_at = now(), last_error = NULL WHERE id = ANY(:ids)"),
+        {"ids": ids},
+    )
+    await db.commit()
+
+
+async def _fail_items(db: AsyncSession, failures: list[tuple[int, str]]) -> dict[str, int]:
+    """
+    Devolve os itens com erro para a fila, ou marca como failed após QUEUE_MAX_ATTEMPTS.
+    Retorna quantos ficaram em cada status (pending = nova tentativa).
+    """
+    result = await db.execute(
+        text("""
+            UPDATE webhook_inbox w
+               SET status = CASE WHEN w.attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+                   last_error = f.error,
+                   locked_at = NULL
+              FROM unnest(CAST(:ids AS bigint[]), CAST(:errors AS text[])) AS f(id, error)
+             WHERE w.id = f.id
+            RETURNING w.status
+        """),
+        {
+            "ids": [item_id for item_id, _ in failures],
+            "errors": [error[:2000] for _, error in failures],
+            "max_attempts": QUEUE_MAX_ATTEMPTS,
+        },
+    )
+    statuses = [row.status for row in result.all()]
+    await db.commit()
+    return {status: statuses.count(status) for status in ("pending", "failed")}
+
+
+async def _run_isolating(db: AsyncSession, handler: Handler, batch: list[tuple[int, dict]]) -> tuple[list[int], list[tuple[int, str]]]:
+    """
+    Roda o handler no lote; se falhar, divide ao meio até isolar os payloads com erro, para
+    que um payload inválido não derrube (nem esgote as tentativas de) os outros do lote.
+    Retorna (ids processados, [(id, erro)]).
+    """
+    try:
+        await handler([payload for _, payload in batch], db)
+        return [item_id for item_id, _ in batch], []
+    except Exception as e:
+        await db.rollback()
+        if len(batch) == 1:
+            return [], [(batch[0][0], str(e))]
+    middle = len(batch) // 2
+    done_left, failed_left = await _run_isolating(db, handler, batch[:middle])
+    done_right, failed_right = await _run_isolating(db, handler, batch[middle:])
+    return done_left + done_right, failed_left + failed_right
+
+
+async def requeue_stale():
+    """Devolve para a fila itens presos em 'processing' (worker caiu no meio do lote)."""
+    async with async_session() as db:
+        result = await db.execute(
+            text("""
+                UPDATE webhook_inbox SET status = 'pending', locked_at = NULL
+                 WHERE status = 'processing' AND locked_at < now() - make_interval(secs => :stale)
+            """),
+            {"stale": QUEUE_STALE_SEC},
+        )
+        await db.commit()
+        if result.rowcount:
+            print(f"♻️ Fila de webhooks: {result.rowcount} itens devolvidos para a fila")
+
+
+async def _process_once(source: str, handler: Handler) -> int:
+    """Processa um lote de uma origem. Retorna quantos payloads foram consumidos."""
+    async with async_session() as db:
+        batch = await _claim_batch(db, source)
+        if not batch:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            done, failures = await _run_isolating(db, handler, batch)
+            if done:
+                await _finish_batch(db, done)
+                _counters["processed"] += len(done)
+            if failures:
+                statuses = await _fail_items(db, failures)
+                _counters["retried"] += statuses["pending"]
+                _counters["failed"] += statuses["failed"]
+                for item_id, error in failures[:5]:
+                    print(f"❌ Erro ao processar item {item_id} da fila [{source}]: {error}")
+        finally:
+            _counters["batches"] += 1
+            _counters["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        return len(batch)
+
+
+async def _worker(worker_id: int):
+    while True:
+        try:
+            consumed = 0
+            for source, handler in list(_handlers.items()):
+                consumed += await _process_once(source, handler)
+            if consumed:
+                continue
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=QUEUE_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Erro no worker {worker_id} da fila de webhooks: {e}")
+            await asyncio.sleep(QUEUE_POLL_SEC)
+
+
+async def start_workers():
+    """Sobe o pool de workers (chamado no lifespan quando a fila está habilitada)."""
+    await requeue_stale()
+    for i in range(QUEUE_WORKERS):
+        _workers.append(asyncio.create_task(_worker(i)))
+    print(f"📥 Fila de webhooks ativa ({QUEUE_WORKERS} workers, lote de {QUEUE_BATCH_SIZE})")
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def queue_metrics(db: AsyncSession) -> dict:
+    """Profundidade da fila, atraso do item mais antigo e contadores do processo."""
+    result = await db.execute(
+        text("""
+            SELECT
+                count(*) FILTER (WHERE status = 'pending') AS pending,
+                count(*) FILTER (WHERE status = 'processing') AS processing,
+                count(*) FILTER (WHERE status = 'failed') AS failed,
+                COALESCE(EXTRACT(EPOCH FROM now() - min(received_at) FILTER (WHERE status = 'pending')), 0) AS lag_seconds
+            FROM webhook_inbox
+            WHERE status <> 'done'
+        """)
+    )
+    row = result.one()
+    return {
+        "enabled": QUEUE_ENABLED,
+        "workers": len(_workers),
+        "depth": row.pending,
+        "processing": row.processing,
+        "failed": row.failed,
+        "lag_seconds": round(float(row.lag_seconds), 3),
+        "counters": dict(_counters),
+    }
@@ -0,0 +1,146 @@
+"""
+Benchmark do chunker da base de conhecimento (app/chunker.py) com documentos sintéticos,
+sem banco e sem OpenAI, em ~100 KB, 1 MB e 10 MB:
+  - antigo: o split_into_chunks que estava em app/ai_engine.py (copiado abaixo), que
+    recodifica o chunk inteiro a cada linha acrescentada
+  - novo: uma codificação do documento e cortes direto na lista de tokens
+em dois formatos: texto corrido (parágrafos de várias frases) e linhas curtas (planilha ou
+FAQ colados, uma informação por linha — o pior caso do antigo). O tempo por MB do novo deve
+ficar constante quando o documento cresce. Mostra também quanto o loop do asyncio fica
+parado durante a divisão do maior documento: na thread (GIL) x no processo separado.
+
+Rode com: python bench_chunker.py
+          python bench_chunker.py --sizes 100000 1000000 --old-max 1000000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import tiktoken
+
+from app import chunker
+from app.chunker import split_into_chunks
+
+
+def old_split_into_chunks(text: str, title: str, max_tokens: int = 400) -> list[dict]:
+    enc = tiktoken.encoding_for_model("gpt-4o")
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+
+    chunks = []
+    current_chunk = ""
+    chunk_index = 0
+
+    for paragraph in paragraphs:
+        test_chunk = f"{current_chunk}\n{paragraph}".strip() if current_chunk else paragraph
+        if len(enc.encode(test_chunk)) > max_tokens and current_chunk:
+            tokens = len(enc.encode(current_chunk))
+            chunks.append({"title": title, "content": current_chunk, "chunk_index": chunk_index, "token_count": tokens})
+            chunk_index += 1
+            current_chunk = paragraph
+        else:
+            current_chunk = test_chunk
+
+    if current_chunk:
+        tokens = len(enc.encode(current_chunk))
+        chunks.append({"title": title, "content": current_chunk, "chunk_index": chunk_index, "token_count": tokens})
+
+    return chunks
+
+
+def make_document(size: int, shape: str, rng: random.Random) -> str:
+    bairros = ["Moema", "Pinheiros", "Vila Mariana", "Tatuapé", "Santana", "Butantã"]
+    parts, length, i = [], 0, 0
+    while length < size:
+        i += 1
+        if shape == "linhas":
+            line = f"Unidade {i}; {rng.choice(bairros)}; {rng.randint(1, 4)} quartos; R$ {rng.randint(200, 2000)} mil"
+        else:
+            line = " ".join(
+                f"O empreendimento {i}.{j} fica em {rng.choice(bairros)} e tem {rng.randint(1, 4)} quartos, "
+                f"varanda gourmet e lazer completo."
+                for j in range(rng.randint(2, 10))
+            )
+        parts.append(line)
+        length += len(line) + 1
+    return "\n".join(parts)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+async def loop_stall(run) -> tuple[float, float]:
+    """Maior intervalo sem o loop rodar (ms) enquanto `run` executa, e o tempo total (s)."""
+    stalls = [0.0]
+    done = False
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            stalls.append((now - last - 0.005) * 1000)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    done = True
+    await task
+    return max(stalls), elapsed
+
+
+def main(args) -> bool:
+    rng = random.Random(42)
+    ok = True
+    split_into_chunks("aquecimento", "x")  # carrega o tokenizador fora da medição
+    largest = None
+    for shape in ("texto", "linhas"):
+        print(f"\n=== {shape} ===")
+        per_mb = []
+        for size in args.sizes:
+            text = make_document(size, shape, rng)
+            mb = len(text.encode()) / 1024 / 1024
+            new, new_s = timed(split_into_chunks, text, "bench")
+            per_mb.append(new_s / mb)
+            limit_ok = max(c["token_count"] for c in new) <= 400
+            ok = ok and limit_ok
+            line = f"{mb:6.2f} MB: novo {new_s:6.2f}s ({new_s / mb:.2f} s/MB, {len(new)} chunks)"
+            if size <= args.old_max:
+                old, old_s = timed(old_split_into_chunks, text, "bench")
+                over = sum(c["token_count"] > 400 for c in old)
+                line += f" | antigo {old_s:6.2f}s ({old_s / mb:.2f} s/MB, {len(old)} chunks, {over} acima do limite)"
+                line += f" → {old_s / new_s:.1f}x"
+            print(line + ("" if limit_ok else " ❌ chunk acima do limite"))
+            largest = text
+        linear = max(per_mb) <= 2 * min(per_mb)
+        ok = ok and linear
+        print(("✅" if linear else "❌") + f" novo: {min(per_mb):.2f}–{max(per_mb):.2f} s/MB (linear no tamanho)")
+
+    # Loop do asyncio durante a divisão do maior documento
+    async def stalls():
+        thread = await loop_stall(lambda: asyncio.to_thread(split_into_chunks, largest, "bench"))
+        await chunker.split_into_chunks_async("aquecimento " * (chunker.KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS // 12 + 1), "x")
+        process = await loop_stall(lambda: chunker.split_into_chunks_async(largest, "bench"))
+        chunker.shutdown()
+        return thread, process
+
+    (thread_ms, thread_s), (process_ms, process_s) = asyncio.run(stalls())
+    print(f"\nloop parado durante {len(largest) / 1024 / 1024:.1f} MB: thread {thread_ms:.0f} ms (total {thread_s:.1f}s) | "
+          f"processo separado {process_ms:.0f} ms (total {process_s:.1f}s)")
+
+    print("\n🎉 Chunker OK" if ok else "\n⚠️ Chunker fora do esperado")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do chunker da base de conhecimento")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000], help="Tamanho do documento (caracteres)")
+    parser.add_argument("--old-max", type=int, default=10_000_000, help="Maior documento que roda no chunker antigo")
+    args = parser.parse_args()
+    sys.exit(0 if main(args) else 1)
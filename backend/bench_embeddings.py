@@ -0,0 +1,172 @@
+"""
+Benchmark do armazenamento dos embeddings (app/embedding_store.py) e da migração
+app/migrate_knowledge_embeddings.py num schema temporário:
+  1. popula knowledge_documents com N chunks no formato antigo (embedding em JSON);
+  2. mede o tamanho da tabela e o tempo de carregar todos os vetores do canal;
+  3. converte com a migração, parando no meio (--max-batches) e retomando, e confere que
+     os vetores lidos de embedding_vec são idênticos aos originais em float32;
+  4. VACUUM FULL e mede de novo tamanho e carga;
+  5. com a extensão vector: preenche embedding_pgv + HNSW e compara o top-k no Postgres
+     com o índice em memória (latência e recall).
+
+Rode com: python bench_embeddings.py
+          python bench_embeddings.py --chunks 2000 --runs 3 --keep
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import embedding_store
+from app.database import DATABASE_URL, Base
+from app.knowledge_index import ChannelIndex, _decode, normalize
+from app.migrate_knowledge_embeddings import convert, fill_pgvector, setup_pgvector, table_size, vacuum_full
+from app.models import Channel, KnowledgeDocument
+
+SCHEMA = "embeddings_bench"
+CHANNEL_ID = 1
+
+
+async def seed(engine, vectors: np.ndarray):
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO channels (id, name) VALUES (:id, 'Canal bench')"), {"id": CHANNEL_ID})
+        for start in range(0, len(vectors), 1000):
+            await conn.execute(
+                text("""
+                    INSERT INTO knowledge_documents (channel_id, title, content, embedding, chunk_index, token_count)
+                    VALUES (:channel_id, 'Catálogo', :content, :embedding, :chunk_index, 300)
+                """),
+                [{"channel_id": CHANNEL_ID, "content": f"Trecho {i}", "embedding": json.dumps(vectors[i].tolist()),
+                  "chunk_index": i} for i in range(start, min(start + 1000, len(vectors)))],
+            )
+
+
+async def load(engine) -> tuple[np.ndarray, np.ndarray]:
+    """Mesmo caminho da montagem do índice: lê as linhas e decodifica com _decode."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT id, embedding_vec, embedding FROM knowledge_documents WHERE channel_id = :c ORDER BY id"
+        ), {"c": CHANNEL_ID})
+        ids, vectors = _decode(result.all())
+    return np.array(ids), np.stack(vectors)
+
+
+async def measure_load(engine, runs: int) -> tuple[float, np.ndarray]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _, matrix = await load(engine)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), matrix
+
+
+async def bench_pgvector(engine, vectors: np.ndarray, args) -> bool:
+    if not await setup_pgvector(engine, args.dim):
+        return True
+    await fill_pgvector(engine, args.dim, args.batch)
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE knowledge_documents"))
+
+    index = ChannelIndex(args.dim)
+    async with engine.connect() as conn:
+        ids = (await conn.execute(text("SELECT id FROM knowledge_documents ORDER BY id"))).scalars().all()
+    index.add(list(ids), vectors)
+
+    rng = np.random.default_rng(7)
+    # Consultas perto de chunks existentes (como uma pergunta sobre um trecho do acervo)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + rng.normal(0, 0.05, (args.queries, args.dim)).astype(np.float32)
+    sql_ms, memory_ms, hits, first_hits = [], [], 0, 0
+    async with engine.connect() as conn:
+        for q in queries:
+            started = time.perf_counter()
+            got = await embedding_store.pgvector_top_k(conn, CHANNEL_ID, q, args.top_k)
+            sql_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            expected = ChannelIndex.top_k(*index.snapshot(), normalize(q), args.top_k)
+            memory_ms.append((time.perf_counter() - started) * 1000)
+            hits += len({i for i, _ in got} & {i for i, _ in expected})
+            first_hits += bool(got) and got[0][0] == expected[0][0]
+    recall = hits / (len(queries) * args.top_k)
+    print(f"\n🔎 top-{args.top_k}: pgvector HNSW p50 {statistics.median(sql_ms):.1f} ms | "
+          f"índice em memória p50 {statistics.median(memory_ms):.1f} ms | recall do HNSW {recall:.0%}")
+    # HNSW é aproximado (vetores aleatórios são o pior caso); o trecho mais próximo tem de vir
+    check = first_hits == len(queries)
+    print(("✅" if check else "❌") + f" pgvector achou o trecho mais próximo em {first_hits}/{len(queries)} consultas")
+    return check
+
+
+async def main(args) -> bool:
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}})
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    async with engine.begin() as conn:
+        # search_path inclui public (tipo vector); sem o mapa o create_all veria as tabelas de lá
+        conn = await conn.execution_options(schema_translate_map={None: SCHEMA})
+        await conn.run_sync(Base.metadata.create_all, tables=[Channel.__table__, KnowledgeDocument.__table__])
+
+    ok = True
+    try:
+        vectors = np.random.default_rng(42).standard_normal((args.chunks, args.dim), dtype=np.float32)
+        print(f"🌱 Populando {args.chunks} chunks (dim {args.dim}) em JSON...")
+        await seed(engine, vectors)
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE knowledge_documents"))
+
+        json_size = await table_size(engine)
+        json_ms, _ = await measure_load(engine, args.runs)
+
+        # Conversão interrompida e retomada
+        started = time.perf_counter()
+        first = await convert(engine, args.batch, max_batches=2)
+        rest = await convert(engine, args.batch)
+        convert_s = time.perf_counter() - started
+        converted = first["converted"] + rest["converted"]
+        check = converted == args.chunks
+        print(("✅" if check else "❌") + f" {converted} convertidos ({first['converted']} antes da interrupção) em {convert_s:.1f}s")
+        ok = ok and check
+
+        await vacuum_full(engine)
+        binary_size = await table_size(engine)
+        binary_ms, matrix = await measure_load(engine, args.runs)
+        check = np.array_equal(matrix, vectors)
+        print(("✅" if check else "❌") + " vetores lidos de embedding_vec idênticos aos originais (float32)")
+        ok = ok and check
+
+        print(f"\n📦 Tabela: JSON {json_size / 1024 / 1024:.1f} MB → binário {binary_size / 1024 / 1024:.1f} MB "
+              f"({json_size / binary_size:.1f}x menor)")
+        print(f"⏱️ Carga do canal: JSON {json_ms:.0f} ms → binário {binary_ms:.0f} ms ({json_ms / binary_ms:.1f}x mais rápido)")
+
+        if not args.no_pgvector:
+            ok = await bench_pgvector(engine, vectors, args) and ok
+    finally:
+        if not args.keep:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    print("\n🎉 Armazenamento binário OK" if ok else "\n⚠️ Armazenamento binário falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do armazenamento binário dos embeddings")
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=3, help="Cargas medidas em cada formato")
+    parser.add_argument("--queries", type=int, default=50, help="Consultas do comparativo pgvector")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--no-pgvector", action="store_true", help="Pula o comparativo com pgvector")
+    parser.add_argument("--keep", action="store_true", help="Mantém o schema no final")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
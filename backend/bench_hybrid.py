@@ -0,0 +1,272 @@
+"""
+Benchmark da busca híbrida da base de conhecimento (app/knowledge_search.py), offline (sem
+banco e sem OpenAI), com um acervo sintético de anúncios (código do imóvel, rua, bairro,
+características):
+  1. recall@k de vetorial, BM25 e híbrido (RRF) em três tipos de pergunta:
+     - código: "vocês ainda têm o AP-4821?"
+     - endereço: "tem algo na Rua das Acácias 152?"
+     - paráfrase: a pergunta descreve o imóvel com outras palavras
+  2. latência do BM25 (p50/p95) em 10k e 100k chunks, tempo de montagem e de
+     inclusão/remoção incremental (com e sem compactação);
+  3. o score BM25 do índice confere com um cálculo direto em Python numa amostra.
+
+Os embeddings são simulados: cada chunk recebe a soma de vetores do bairro, do tipo e das
+características mais uma parte própria; a pergunta por código/endereço carrega pouco da
+parte própria do chunk (o que um modelo de embedding costuma fazer com códigos e números),
+a paráfrase fica perto do vetor do chunk. Os números medem a fusão e o índice, não a
+qualidade de um modelo real.
+
+Rode com: python bench_hybrid.py
+          python bench_hybrid.py --sizes 10000 --corpus 5000 --queries 200
+"""
+import argparse
+import math
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from app import knowledge_search
+from app.knowledge_index import ChannelIndex, normalize
+from app.knowledge_search import LexicalIndex, reciprocal_rank_fusion, terms
+
+BAIRROS = ["Boa Viagem", "Pina", "Casa Forte", "Graças", "Espinheiro", "Aflitos", "Madalena", "Torre",
+           "Parnamirim", "Tamarineira", "Rosarinho", "Derby", "Boa Vista", "Imbiribeira", "Ipsep",
+           "Candeias", "Piedade", "Setúbal", "Jaqueira", "Poço da Panela"]
+RUAS = ["Rua das Acácias", "Rua dos Navegantes", "Avenida Boa Viagem", "Rua do Futuro", "Rua Amélia",
+        "Rua da Hora", "Avenida Rosa e Silva", "Rua Real da Torre", "Rua Padre Carapuceiro", "Rua Ribeiro de Brito",
+        "Rua Barão de Souza Leão", "Rua Setúbal", "Avenida Conselheiro Aguiar", "Rua Tenente Domingos de Brito",
+        "Rua Desembargador Góis Cavalcanti", "Rua Santo Elias", "Rua Marquês de Olinda", "Rua Artur Muniz"]
+TIPOS = {"AP": "Apartamento", "CA": "Casa", "ST": "Studio", "CO": "Cobertura", "SL": "Sala comercial"}
+CARACTERISTICAS = {
+    "piscina": "área de lazer com piscina adulto e infantil",
+    "pet": "condomínio pet friendly com espaço para cachorro",
+    "mar": "varanda com vista para o mar",
+    "academia": "academia equipada no térreo",
+    "garagem": "garagem com duas vagas cobertas",
+    "portaria": "portaria 24 horas e circuito de câmeras",
+    "mobiliado": "entregue com móveis planejados",
+    "metro": "a cinco minutos da estação de metrô",
+}
+# Como a paráfrase descreve cada característica (poucas palavras em comum com o anúncio)
+PARAFRASES = {
+    "piscina": "lugar pra nadar", "pet": "meu cachorro pode morar junto", "mar": "janela olhando a praia",
+    "academia": "malhar sem sair do prédio", "garagem": "dois carros", "portaria": "segurança o dia todo",
+    "mobiliado": "já com móveis", "metro": "transporte público do lado",
+}
+PARAFRASE_TIPOS = {"AP": "apê", "CA": "residência térrea", "ST": "kitnet", "CO": "último andar", "SL": "escritório"}
+
+
+def make_corpus(size: int, rng: random.Random) -> list[dict]:
+    codes = rng.sample(range(1000, 1000 + 20 * size), size)
+    listings = []
+    for i in range(size):
+        prefix = rng.choice(list(TIPOS))
+        features = rng.sample(list(CARACTERISTICAS), 3)
+        listing = {
+            "id": i + 1, "code": f"{prefix}-{codes[i]}", "prefix": prefix, "bairro": rng.choice(BAIRROS),
+            "rua": rng.choice(RUAS), "numero": rng.randint(10, 2999), "quartos": rng.randint(1, 4),
+            "area": rng.randint(30, 300), "features": features,
+        }
+        listing["title"] = f"Anúncios {listing['bairro']}"
+        listing["content"] = (
+            f"{TIPOS[prefix]} {listing['code']} com {listing['quartos']} quartos e {listing['area']} m², "
+            f"{listing['rua']}, {listing['numero']}, bairro {listing['bairro']}. "
+            + " ".join(CARACTERISTICAS[f].capitalize() + "." for f in features)
+            + f" Valor R$ {rng.randint(200, 3000) * 1000:,}.".replace(",", ".")
+        )
+        listings.append(listing)
+    return listings
+
+
+class FakeEmbedder:
+    """Embeddings simulados (ver docstring do módulo)."""
+
+    def __init__(self, listings: list[dict], dim: int, rng: np.random.Generator):
+        self.dim, self.rng = dim, rng
+        topics = ["generico"] + BAIRROS + list(TIPOS) + list(CARACTERISTICAS)
+        self.topic = {t: rng.standard_normal(dim, dtype=np.float32) for t in topics}
+        self.own = rng.standard_normal((len(listings), dim), dtype=np.float32)
+        self.vectors = np.stack([self.chunk(listing) for listing in listings])
+
+    def chunk(self, listing: dict) -> np.ndarray:
+        v = self.topic[listing["bairro"]] + self.topic[listing["prefix"]]
+        v = v + sum(0.7 * self.topic[f] for f in listing["features"]) + 1.2 * self.own[listing["id"] - 1]
+        return v
+
+    def noise(self, scale: float) -> np.ndarray:
+        return scale * self.rng.standard_normal(self.dim, dtype=np.float32)
+
+    def code_query(self, listing: dict) -> np.ndarray:
+        return self.topic["generico"] + self.topic[listing["prefix"]] + 0.3 * self.own[listing["id"] - 1] + self.noise(1.0)
+
+    def address_query(self, listing: dict) -> np.ndarray:
+        return self.topic["generico"] + 0.6 * self.topic[listing["bairro"]] + 0.3 * self.own[listing["id"] - 1] + self.noise(1.0)
+
+    def paraphrase_query(self, listing: dict) -> np.ndarray:
+        return self.vectors[listing["id"] - 1] + self.noise(1.2)
+
+
+def make_queries(listings: list[dict], embedder: FakeEmbedder, count: int, rng: random.Random) -> dict:
+    queries = {"código": [], "endereço": [], "paráfrase": []}
+    for listing in rng.sample(listings, min(count, len(listings))):
+        code = listing["code"] if rng.random() < 0.5 else listing["code"].replace("-", "").lower()
+        queries["código"].append((f"Vocês ainda têm o {code}?", embedder.code_query(listing), listing["id"]))
+        queries["endereço"].append((f"Tem algo na {listing['rua']} {listing['numero']}?",
+                                    embedder.address_query(listing), listing["id"]))
+        wishes = ", ".join(PARAFRASES[f] for f in listing["features"])
+        queries["paráfrase"].append((f"Procuro {PARAFRASE_TIPOS[listing['prefix']]} em {listing['bairro']}: {wishes}",
+                                     embedder.paraphrase_query(listing), listing["id"]))
+    return queries
+
+
+def bm25_reference(documents: dict[int, list[str]], query_terms: list[str]) -> dict[int, float]:
+    """BM25 direto, documento a documento (referência)."""
+    n = len(documents)
+    average = sum(len(t) for t in documents.values()) / n
+    counts = {doc_id: Counter(t) for doc_id, t in documents.items()}
+    scores = {}
+    for term in set(query_terms):
+        df = sum(1 for c in counts.values() if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for doc_id, c in counts.items():
+            tf = c.get(term, 0)
+            if tf:
+                norm = tf + knowledge_search.BM25_K1 * (1 - knowledge_search.BM25_B
+                                                        + knowledge_search.BM25_B * len(documents[doc_id]) / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (knowledge_search.BM25_K1 + 1) / norm
+    return scores
+
+
+def bench_recall(args) -> bool:
+    rng = random.Random(7)
+    listings = make_corpus(args.corpus, rng)
+    embedder = FakeEmbedder(listings, args.dim, np.random.default_rng(7))
+    ids = [listing["id"] for listing in listings]
+    vector_index = ChannelIndex(args.dim)
+    vector_index.add(ids, embedder.vectors)
+    lexical = LexicalIndex()
+    lexical.add([(listing["id"], terms(f"{listing['title']}\n{listing['content']}")) for listing in listings])
+    candidates = knowledge_search.KNOWLEDGE_HYBRID_CANDIDATES
+
+    print(f"\n=== recall@k em {args.corpus:,} chunks, {args.queries} perguntas por tipo ===")
+    print(f"{'tipo':<10} {'':>4} {'vetorial':>9} {'BM25':>7} {'híbrido':>8}")
+    totals = {name: {k: 0 for k in args.k} for name in ("vetorial", "BM25", "híbrido")}
+    total_queries = 0
+    fusion_ms = []
+    for kind, queries in make_queries(listings, embedder, args.queries, rng).items():
+        hits = {name: {k: 0 for k in args.k} for name in totals}
+        for question, vector, target in queries:
+            by_vector = ChannelIndex.top_k(*vector_index.snapshot(), normalize(vector), candidates)
+            by_terms = lexical.search(terms(question), candidates)
+            started = time.perf_counter()
+            fused = reciprocal_rank_fusion([by_terms, by_vector], max(args.k))
+            fusion_ms.append((time.perf_counter() - started) * 1000)
+            for name, ranking in (("vetorial", by_vector), ("BM25", by_terms), ("híbrido", fused)):
+                top = [doc_id for doc_id, _ in ranking]
+                for k in args.k:
+                    hits[name][k] += target in top[:k]
+        total_queries += len(queries)
+        for k in args.k:
+            print(f"{kind:<10} @{k:<3} " + " ".join(
+                f"{hits[name][k] / len(queries):>{w}.0%}" for name, w in (("vetorial", 9), ("BM25", 7), ("híbrido", 8))))
+            for name in totals:
+                totals[name][k] += hits[name][k]
+    ok = True
+    for k in args.k:
+        recall = {name: totals[name][k] / total_queries for name in totals}
+        print(f"{'total':<10} @{k:<3} " + " ".join(
+            f"{recall[name]:>{w}.0%}" for name, w in (("vetorial", 9), ("BM25", 7), ("híbrido", 8))))
+        ok = ok and recall["híbrido"] >= max(recall["vetorial"], recall["BM25"])
+    print(f"fusão RRF: {statistics.median(fusion_ms):.3f} ms por pergunta")
+    print(("✅" if ok else "❌") + " híbrido com recall total ≥ vetorial e ≥ BM25 em todos os k")
+
+    # Score do índice x cálculo direto, numa amostra
+    sample = {listing["id"]: terms(f"{listing['title']}\n{listing['content']}") for listing in listings[:500]}
+    small = LexicalIndex()
+    small.add(list(sample.items()))
+    same = True
+    for question, _, _ in queries[:50]:
+        expected = bm25_reference(sample, terms(question))
+        got = dict(small.search(terms(question), len(sample)))
+        same = same and got.keys() == expected.keys() and all(
+            math.isclose(got[d], expected[d], rel_tol=1e-4) for d in expected)
+    print(("✅" if same else "❌") + " score BM25 do índice = cálculo direto (500 chunks, 50 perguntas)")
+    return ok and same
+
+
+def bench_size(size: int, args) -> bool:
+    print(f"\n=== BM25 em {size:,} chunks ===")
+    rng = random.Random(size)
+    listings = make_corpus(size, rng)
+    documents = [(listing["id"], f"{listing['title']}\n{listing['content']}") for listing in listings]
+
+    started = time.perf_counter()
+    tokenized = knowledge_search._tokenize([(doc_id, "", text) for doc_id, text in documents])
+    tokenize_ms = (time.perf_counter() - started) * 1000
+    index = LexicalIndex()
+    started = time.perf_counter()
+    index.add(tokenized)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"montagem: tokenização {tokenize_ms:.0f} ms + índice {build_ms:.0f} ms "
+          f"({index.terms:,} termos, {index.nbytes / 1024 / 1024:.1f} MB)")
+
+    questions = [f"Vocês ainda têm o {listing['code']}?" for listing in rng.sample(listings, args.queries // 2)]
+    questions += [f"apartamento com piscina e vista mar em {rng.choice(BAIRROS)}" for _ in range(args.queries // 2)]
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        index.search(terms(question), knowledge_search.KNOWLEDGE_HYBRID_CANDIDATES)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"busca: p50 {statistics.median(latencies):.2f} ms | p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f} ms "
+          f"(código exato e pergunta com termos comuns)")
+
+    extra = [(size + i + 1, terms(text)) for i, (_, text) in enumerate(documents[:args.delta])]
+    started = time.perf_counter()
+    index.add(extra)
+    add_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    index.remove([doc_id for doc_id, _ in extra])
+    remove_ms = (time.perf_counter() - started) * 1000
+    compactions = knowledge_search._counters["compactions"]
+    started = time.perf_counter()
+    index.remove(range(1, int(size * knowledge_search.KNOWLEDGE_LEXICAL_COMPACT_RATIO) + 2))
+    compact_ms = (time.perf_counter() - started) * 1000
+    compacted = knowledge_search._counters["compactions"] > compactions
+    print(f"incluir {args.delta} chunks: {add_ms:.1f} ms | remover {args.delta}: {remove_ms:.2f} ms | "
+          f"remover {knowledge_search.KNOWLEDGE_LEXICAL_COMPACT_RATIO:.0%} (com compactação): {compact_ms:.0f} ms "
+          f"(remontar: {tokenize_ms + build_ms:.0f} ms)")
+
+    # Depois da compactação o índice continua achando os mesmos chunks
+    survivor = listings[-1]
+    found = index.search(terms(survivor["code"]), 1)
+    ok = compacted and len(index) == size - int(size * knowledge_search.KNOWLEDGE_LEXICAL_COMPACT_RATIO) - 1 \
+        and found and found[0][0] == survivor["id"]
+    print(("✅" if ok else "❌") + " compactação: contagem certa e código exato ainda encontrado")
+    return ok
+
+
+def main(args) -> bool:
+    ok = bench_recall(args)
+    for size in args.sizes:
+        ok = bench_size(size, args) and ok
+    print("\n🎉 Busca híbrida OK" if ok else "\n⚠️ Busca híbrida falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da busca híbrida (BM25 + vetorial) da base de conhecimento")
+    parser.add_argument("--corpus", type=int, default=20_000, help="Chunks no teste de recall")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Chunks no teste de latência")
+    parser.add_argument("--queries", type=int, default=300, help="Perguntas por tipo")
+    parser.add_argument("--dim", type=int, default=256, help="Dimensão dos embeddings simulados")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5])
+    parser.add_argument("--delta", type=int, default=20, help="Chunks incluídos/removidos no teste incremental")
+    args = parser.parse_args()
+    sys.exit(0 if main(args) else 1)
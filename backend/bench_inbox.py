@@ -0,0 +1,233 @@
+"""
+Benchmark da caixa de entrada (GET /api/contacts) numa massa grande.
+Cria um schema temporário com 50k contatos / 5M mensagens e mede:
+  - antigo: 1 consulta de contatos + 3 por contato (última mensagem, etiquetas, não lidas)
+  - lateral: consulta única sem tabela auxiliar, última mensagem e não lidas direto em
+    messages (LEFT JOIN LATERAL) e etiquetas com array_agg
+  - estado: consulta única lendo conversation_state (caminho do endpoint, inbox_query)
+além dos filtros (canal, status, corretor, etiqueta, só não lidas) e da paginação por cursor.
+
+Rode com: python bench_inbox.py
+          python bench_inbox.py --contacts 5000 --messages 500000 --runs 3   # massa menor
+          python bench_inbox.py --keep   # mantém o schema (roda de novo com --reuse)
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.database import DATABASE_URL, Base
+from app.models import Contact, Message, Tag, contact_tags
+import app.voice_ai.models  # noqa: F401 — registra as tabelas
+from app import conversation_state
+from app.partitions import ensure_partitions
+
+SCHEMA = "inbox_bench"
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+DAYS = 180
+
+
+async def seed(conn, contacts: int, messages: int):
+    """180 dias de histórico; ~2% dos contatos com não lidas; 20 etiquetas."""
+    params = {"now": NOW, "contacts": contacts, "messages": messages, "days": DAYS}
+    await conn.execute(text("INSERT INTO channels (id, name) SELECT g, 'Canal ' || g FROM generate_series(1, 4) g"))
+    await conn.execute(text("""
+        INSERT INTO users (id, name, email, password_hash, role)
+        SELECT g, 'Corretor ' || g, 'corretor' || g || '@teste.com', 'x', 'atendente' FROM generate_series(1, 40) g
+    """))
+    await conn.execute(text("INSERT INTO tags (id, name, color) SELECT g, 'Tag ' || g, 'blue' FROM generate_series(1, 20) g"))
+    await conn.execute(text("""
+        INSERT INTO contacts (wa_id, name, channel_id, assigned_to, lead_status, created_at, updated_at)
+        SELECT '55119' || lpad(g::text, 8, '0'), 'Lead ' || g, 1 + g % 4,
+               CASE WHEN g % 10 = 0 THEN NULL ELSE 1 + g % 40 END,
+               (ARRAY['novo', 'em_contato', 'qualificado', 'negociando', 'convertido', 'perdido'])[1 + g % 6],
+               CAST(:now AS timestamp) - make_interval(mins => (g * 37) % (:days * 24 * 60)),
+               CAST(:now AS timestamp)
+          FROM generate_series(1, :contacts) g
+    """), params)
+    await conn.execute(text("""
+        INSERT INTO contact_tags (contact_wa_id, tag_id)
+        SELECT '55119' || lpad(g::text, 8, '0'), 1 + (g * t) % 20
+          FROM generate_series(1, :contacts) g, generate_series(1, 2) t
+        ON CONFLICT DO NOTHING
+    """), params)
+    # Em blocos de 500k para não estourar memória/WAL numa transação só
+    step = 500_000
+    for offset in range(0, messages, step):
+        await conn.execute(text("""
+            INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type,
+                                  content, timestamp, status, sent_by_ai)
+            SELECT 'wamid.' || g,
+                   '55119' || lpad((1 + g % :contacts)::text, 8, '0'),
+                   1 + (1 + g % :contacts) % 4,
+                   CASE WHEN g % 2 = 0 THEN 'inbound' ELSE 'outbound' END,
+                   'text', 'mensagem ' || g,
+                   CAST(:now AS timestamp) - make_interval(secs => (:messages - g) * (:days * 86400.0 / :messages)),
+                   CASE WHEN g % 2 = 1 THEN 'read'
+                        WHEN g > :messages - :contacts / 25 THEN 'received'
+                        ELSE 'read' END,
+                   false
+              FROM generate_series(CAST(:first AS int), CAST(:last AS int)) g
+        """), {**params, "first": offset + 1, "last": min(offset + step, messages)})
+        print(f"   {min(offset + step, messages):>10} mensagens")
+
+
+async def legacy_list(db: AsyncSession, limit: int) -> list[dict]:
+    """Implementação antiga (1 + 3N consultas), limitada a uma página."""
+    latest_msg = (
+        select(Message.contact_wa_id, func.max(Message.timestamp).label("last_ts"))
+        .group_by(Message.contact_wa_id)
+        .subquery()
+    )
+    result = await db.execute(
+        select(Contact)
+        .outerjoin(latest_msg, Contact.wa_id == latest_msg.c.contact_wa_id)
+        .order_by(latest_msg.c.last_ts.desc().nullslast())
+        .limit(limit)
+    )
+    contacts_list = []
+    for c in result.scalars().all():
+        last_msg = (await db.execute(
+            select(Message).where(Message.contact_wa_id == c.wa_id).order_by(Message.timestamp.desc()).limit(1)
+        )).scalar_one_or_none()
+        tags = (await db.execute(
+            select(Tag).join(contact_tags).where(contact_tags.c.contact_wa_id == c.wa_id)
+        )).scalars().all()
+        unread = (await db.execute(
+            select(func.count(Message.id)).where(
+                Message.contact_wa_id == c.wa_id, Message.direction == "inbound", Message.status == "received"
+            )
+        )).scalar()
+        contacts_list.append({"wa_id": c.wa_id, "last": last_msg.content if last_msg else "", "tags": len(tags), "unread": unread})
+    return contacts_list
+
+
+LATERAL_SQL = text("""
+    SELECT c.wa_id, c.name, c.lead_status, c.channel_id, c.assigned_to,
+           last.content, last.timestamp, last.direction, COALESCE(unread.n, 0) AS unread,
+           COALESCE(tags.ids, '{}') AS tag_ids
+      FROM contacts c
+      LEFT JOIN LATERAL (
+            SELECT m.content, m.timestamp, m.direction FROM messages m
+             WHERE m.contact_wa_id = c.wa_id ORDER BY m.timestamp DESC LIMIT 1
+      ) last ON true
+      LEFT JOIN LATERAL (
+            SELECT count(*) AS n FROM messages m
+             WHERE m.contact_wa_id = c.wa_id AND m.direction = 'inbound' AND m.status = 'received'
+      ) unread ON true
+      LEFT JOIN LATERAL (
+            SELECT array_agg(ct.tag_id ORDER BY ct.tag_id) AS ids FROM contact_tags ct WHERE ct.contact_wa_id = c.wa_id
+      ) tags ON true
+     ORDER BY last.timestamp DESC NULLS LAST, c.wa_id DESC
+     LIMIT :limit
+""")
+
+
+async def timed(fn, runs: int) -> dict:
+    await fn()  # aquece cache/planos
+    samples, rows = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 1),
+        "max_ms": round(samples[-1], 1),
+        "rows": rows,
+    }
+
+
+async def main(args) -> dict:
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": SCHEMA}})
+    Session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    if not args.reuse:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await ensure_partitions(conn, start=NOW.date().replace(day=1, month=1))
+            print(f"🌱 Populando {args.contacts} contatos e {args.messages} mensagens...")
+            start = time.perf_counter()
+            await seed(conn, args.contacts, args.messages)
+            print(f"   feito em {time.perf_counter() - start:.0f}s")
+        async with Session() as db:
+            await conversation_state.rebuild(db)
+            await db.commit()
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE"))
+
+    async def run_inbox(**filters):
+        async with Session() as db:
+            result = await db.execute(conversation_state.inbox_query(args.limit, **filters))
+            return len(result.all())
+
+    async def run_lateral():
+        async with Session() as db:
+            result = await db.execute(LATERAL_SQL, {"limit": args.limit + 1})
+            return len(result.all())
+
+    async def run_legacy():
+        async with Session() as db:
+            return len(await legacy_list(db, args.legacy_limit))
+
+    async with Session() as db:
+        first_page = (await db.execute(conversation_state.inbox_query(args.limit))).all()
+        last = first_page[args.limit - 1]
+        cursor = conversation_state.encode_cursor(last[0].last_message_at, last[0].wa_id)
+
+    async def run_second_page():
+        return await run_inbox(cursor=cursor)
+
+    scenarios = {
+        f"antigo 1+3N ({args.legacy_limit} contatos)": (run_legacy, max(1, args.runs // 3)),
+        "lateral em messages": (run_lateral, args.runs),
+        "estado (sem filtro)": (lambda: run_inbox(), args.runs),
+        "estado, 2ª página (cursor)": (run_second_page, args.runs),
+        "estado, canal": (lambda: run_inbox(channel_id=2), args.runs),
+        "estado, status": (lambda: run_inbox(lead_status="qualificado"), args.runs),
+        "estado, corretor": (lambda: run_inbox(assigned_to=7), args.runs),
+        "estado, sem corretor": (lambda: run_inbox(unassigned=True), args.runs),
+        "estado, etiqueta": (lambda: run_inbox(tag_id=5), args.runs),
+        "estado, só não lidas": (lambda: run_inbox(unread_only=True), args.runs),
+    }
+
+    report = {}
+    print(f"\n⏱️ Página de {args.limit} contatos, {args.runs} execuções\n")
+    for name, (fn, runs) in scenarios.items():
+        report[name] = await timed(fn, runs)
+        r = report[name]
+        print(f"   {name:<36} p50 {r['p50_ms']:>9.1f} ms   max {r['max_ms']:>9.1f} ms   {r['rows']} linhas")
+
+    if not args.keep:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await engine.dispose()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da caixa de entrada")
+    parser.add_argument("--contacts", type=int, default=50_000)
+    parser.add_argument("--messages", type=int, default=5_000_000)
+    parser.add_argument("--limit", type=int, default=500, help="Tamanho da página")
+    parser.add_argument("--legacy-limit", type=int, default=500, help="Contatos na versão antiga (1+3N)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="Não apaga o schema no final")
+    parser.add_argument("--reuse", action="store_true", help="Reaproveita o schema de uma execução com --keep")
+    parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+    report = asyncio.run(main(args))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
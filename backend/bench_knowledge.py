@@ -0,0 +1,118 @@
+"""
+Benchmark da busca na base de conhecimento (app/knowledge_index.py) com embeddings
+sintéticos (sem banco e sem OpenAI), em 10k e 100k chunks:
+  - antigo: o que search_knowledge fazia por mensagem depois de ler as linhas — json.loads
+    de cada embedding + cosine_similarity par a par (a leitura das linhas no banco não entra)
+  - índice: produto matriz-vetor + argpartition na matriz float32 normalizada
+além do custo de montar o índice e de incluir/remover chunks sem remontar. Confere que o
+top-k do índice é o mesmo da força bruta em float64.
+
+Com 100k chunks os embeddings em JSON ocupam ~3 GB; por isso o caminho antigo roda numa
+amostra (--old-max) e o tempo é extrapolado linearmente (marcado com *).
+
+Rode com: python bench_knowledge.py
+          python bench_knowledge.py --sizes 10000 --queries 50 --dim 1536
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from app.ai_engine import cosine_similarity
+from app.knowledge_index import ChannelIndex, normalize
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def old_search(stored: list[str], query: list[float], top_k: int) -> list[int]:
+    scored = []
+    for position, raw in enumerate(stored):
+        scored.append((cosine_similarity(query, json.loads(raw)), position))
+    scored.sort(reverse=True)
+    return [position for _, position in scored[:top_k]]
+
+
+def bench_size(size: int, args, rng: np.random.Generator) -> bool:
+    print(f"\n=== {size:,} chunks (dim {args.dim}) ===")
+    vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    ids = list(range(1, size + 1))
+
+    index = ChannelIndex(args.dim)
+    _, build_ms = timed(index.add, ids, vectors)
+    print(f"montagem do índice: {build_ms:.0f} ms ({index.nbytes / 1024 / 1024:.0f} MB)")
+
+    # Índice
+    latencies, results = [], []
+    for q in queries:
+        snapshot = index.snapshot()
+        best, ms = timed(ChannelIndex.top_k, *snapshot, normalize(q), args.top_k)
+        latencies.append(ms)
+        results.append([doc_id for doc_id, _ in best])
+    p50 = statistics.median(latencies)
+    p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+    print(f"índice: p50 {p50:.2f} ms | p95 {p95:.2f} ms por busca")
+
+    # Força bruta em float64 (referência)
+    reference = vectors.astype(np.float64)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    ok = True
+    for q, got in zip(queries, results):
+        scores = reference @ (q / np.linalg.norm(q))
+        expected = [int(i) + 1 for i in np.argsort(-scores)[:args.top_k]]
+        ok = ok and got == expected
+    del reference
+    print(("✅" if ok else "❌") + f" top-{args.top_k} igual à força bruta nas {len(queries)} consultas")
+
+    # Antigo (amostra)
+    sample = min(size, args.old_max)
+    stored = [json.dumps(v.tolist()) for v in vectors[:sample]]
+    old_runs = []
+    for q in queries[:args.old_queries]:
+        positions, ms = timed(old_search, stored, q.tolist(), args.top_k)
+        old_runs.append(ms * size / sample)
+        if sample == size:
+            ok = ok and [p + 1 for p in positions] == results[len(old_runs) - 1]
+    del stored
+    old_ms = statistics.median(old_runs)
+    mark = "*" if sample < size else ""
+    print(f"antigo: {old_ms:.0f}{mark} ms por busca → {old_ms / p50:.0f}x mais lento")
+
+    # Atualização incremental x remontar
+    new_vectors = rng.standard_normal((args.delta, args.dim), dtype=np.float32)
+    new_ids = list(range(size + 1, size + args.delta + 1))
+    _, add_ms = timed(index.add, new_ids, new_vectors)
+    _, remove_ms = timed(index.remove, new_ids)
+    ok = ok and len(index) == size
+    print(f"incluir {args.delta} chunks: {add_ms:.1f} ms | remover {args.delta}: {remove_ms:.0f} ms "
+          f"(remontar: {build_ms:.0f} ms)")
+    return ok
+
+
+def main(args) -> bool:
+    rng = np.random.default_rng(42)
+    ok = True
+    for size in args.sizes:
+        ok = bench_size(size, args, rng) and ok
+    print("\n🎉 Índice de conhecimento OK" if ok else "\n⚠️ Índice de conhecimento divergiu")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do índice vetorial da base de conhecimento")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Quantidade de chunks")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimensão (text-embedding-3-small = 1536)")
+    parser.add_argument("--queries", type=int, default=100, help="Consultas no índice")
+    parser.add_argument("--old-queries", type=int, default=3, help="Consultas no caminho antigo")
+    parser.add_argument("--old-max", type=int, default=10_000, help="Chunks no caminho antigo (extrapola acima)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--delta", type=int, default=20, help="Chunks incluídos/removidos no teste incremental")
+    args = parser.parse_args()
+    sys.exit(0 if main(args) else 1)
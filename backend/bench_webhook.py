@@ -0,0 +1,318 @@
+"""
+Benchmark de ingestão dos webhooks (/webhook da Meta e /api/evolution/webhook/{instance}).
+Reproduz um corpus de payloads (texto, mídia, status, CONNECTION_UPDATE) em uma taxa
+e concorrência configuráveis e mede latência p50/p95/p99, round trips ao banco por
+mensagem e throughput sustentado.
+
+Rode com (Postgres local, tabelas já criadas):
+    python bench_webhook.py --setup --generate 2000 --concurrency 20
+    python bench_webhook.py --corpus corpus.jsonl --rate 200 --json resultado.json
+    python bench_webhook.py --url http://localhost:8001 --generate 2000
+
+Sem --url o app roda no mesmo processo (httpx.ASGITransport), e os round trips vêm
+direto do contador do engine. Com --url eles vêm de GET /webhook/metrics, que só faz
+sentido com um único worker do uvicorn.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+
+BENCH_PHONE_NUMBER_ID = "bench-phone-number-id"
+BENCH_INSTANCE = "bench_instance"
+
+
+# ============================================================
+# CORPUS
+# ============================================================
+
+def _meta_envelope(value: dict) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "bench-waba",
+            "changes": [{"field": "messages", "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "5511999990000", "phone_number_id": BENCH_PHONE_NUMBER_ID},
+                **value,
+            }}],
+        }],
+    }
+
+
+def meta_message(wa_id: str, kind: str) -> tuple[dict, str]:
+    msg_id = f"wamid.bench.{uuid.uuid4().hex}"
+    msg = {"from": wa_id, "id": msg_id, "timestamp": str(int(time.time())), "type": kind}
+    if kind == "text":
+        msg["text"] = {"body": random.choice([
+            "Oi, tudo bem?", "Qual o valor do apartamento?", "Onde fica?",
+            "Tem vaga de garagem?", "Aceita financiamento?", "Quero agendar uma visita",
+        ])}
+    elif kind == "image":
+        msg["image"] = {"id": uuid.uuid4().hex, "mime_type": "image/jpeg", "caption": "olha esse"}
+    elif kind == "audio":
+        msg["audio"] = {"id": uuid.uuid4().hex, "mime_type": "audio/ogg; codecs=opus"}
+    elif kind == "document":
+        msg["document"] = {"id": uuid.uuid4().hex, "mime_type": "application/pdf", "filename": "comprovante.pdf"}
+    payload = _meta_envelope({
+        "contacts": [{"profile": {"name": f"Lead {wa_id[-4:]}"}, "wa_id": wa_id}],
+        "messages": [msg],
+    })
+    return payload, msg_id
+
+
+def meta_statuses(message_ids: list[str], wa_id: str) -> dict:
+    statuses = [
+        {"id": mid, "status": status, "timestamp": str(int(time.time())), "recipient_id": wa_id}
+        for mid in message_ids
+        for status in ("sent", "delivered", "read")
+    ]
+    return _meta_envelope({"statuses": statuses})
+
+
+def evolution_message(phone: str, kind: str) -> dict:
+    data = {
+        "key": {"remoteJid": f"{phone}@s.whatsapp.net", "fromMe": False, "id": uuid.uuid4().hex.upper()[:20]},
+        "pushName": f"Lead {phone[-4:]}",
+        "messageTimestamp": int(time.time()),
+    }
+    if kind == "text":
+        data["messageType"] = "conversation"
+        data["message"] = {"conversation": "Tenho interesse no imóvel do anúncio"}
+    elif kind == "extended":
+        data["messageType"] = "extendedTextMessage"
+        data["message"] = {"extendedTextMessage": {"text": "Vi no Instagram, ainda está disponível?"}}
+    else:
+        data["messageType"] = "image"
+        data["message"] = {"image": {"id": uuid.uuid4().hex, "mimetype": "image/jpeg", "caption": ""}}
+    return {"event": "messages.upsert", "instance": BENCH_INSTANCE, "data": data}
+
+
+def evolution_connection() -> dict:
+    return {"event": "connection.update", "instance": BENCH_INSTANCE, "data": {"state": "open", "instance": BENCH_INSTANCE}}
+
+
+def generate_corpus(size: int, contacts: int = 200) -> list[dict]:
+    """Mistura realista: maioria texto, alguma mídia, rajadas de status e eventos de conexão."""
+    corpus = []
+    phones = [f"55119{random.randint(10000000, 99999999)}" for _ in range(contacts)]
+    sent_ids: list[str] = []
+    while len(corpus) < size:
+        roll = random.random()
+        phone = random.choice(phones)
+        if roll < 0.45:
+            kind = random.choices(["text", "image", "audio", "document"], weights=[80, 10, 7, 3])[0]
+            payload, msg_id = meta_message(phone, kind)
+            sent_ids.append(msg_id)
+            corpus.append({"target": "meta", "payload": payload, "items": 1})
+        elif roll < 0.65 and sent_ids:
+            # Tempestade de status depois de um disparo de template
+            ids = random.sample(sent_ids, min(len(sent_ids), random.randint(1, 5)))
+            corpus.append({"target": "meta", "payload": meta_statuses(ids, phone), "items": len(ids) * 3})
+        elif roll < 0.97:
+            kind = random.choices(["text", "extended", "image"], weights=[70, 20, 10])[0]
+            corpus.append({"target": "evolution", "payload": evolution_message(phone, kind), "items": 1})
+        else:
+            corpus.append({"target": "evolution", "payload": evolution_connection(), "items": 0})
+    return corpus
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ============================================================
+# EXECUÇÃO
+# ============================================================
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+async def setup_database():
+    """Cria as tabelas e os canais usados pelo benchmark."""
+    from sqlalchemy import select
+    import app.main  # noqa: F401 — registra todos os modelos
+    from app.database import engine, async_session, Base
+    from app.models import Channel
+
+    from app.partitions import ensure_partitions
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_partitions(conn)
+
+    async with async_session() as db:
+        result = await db.execute(select(Channel).where(Channel.phone_number_id == BENCH_PHONE_NUMBER_ID))
+        if not result.scalar_one_or_none():
+            db.add(Channel(name="Bench Meta", phone_number_id=BENCH_PHONE_NUMBER_ID, provider="official"))
+        result = await db.execute(select(Channel).where(Channel.instance_name == BENCH_INSTANCE))
+        if not result.scalar_one_or_none():
+            db.add(Channel(name="Bench Evolution", instance_name=BENCH_INSTANCE, provider="evolution"))
+        await db.commit()
+    print("✅ Banco preparado para o benchmark")
+
+
+async def read_db_statements(client: httpx.AsyncClient, in_process: bool) -> int:
+    if in_process:
+        from app.database import db_stats
+        return db_stats["statements"]
+    res = await client.get("/webhook/metrics")
+    # A própria consulta de métricas conta como um comando
+    return res.json().get("db_statements", 0) - 1
+
+
+async def wait_queue_drain(client: httpx.AsyncClient, timeout: float = 300) -> float:
+    """No modo fila, espera os workers esvaziarem a fila. Retorna o tempo de espera."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        res = await client.get("/webhook/metrics")
+        data = res.json()
+        if not data.get("enabled") or (data.get("depth", 0) == 0 and data.get("processing", 0) == 0):
+            break
+        await asyncio.sleep(0.2)
+    return time.perf_counter() - started
+
+
+async def replay(client: httpx.AsyncClient, corpus: list[dict], rate: float, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(item: dict):
+        nonlocal errors
+        url = "/webhook" if item["target"] == "meta" else f"/api/evolution/webhook/{BENCH_INSTANCE}"
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                res = await client.post(url, json=item["payload"])
+                if res.status_code >= 400 or res.json().get("status") == "error":
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    tasks = []
+    for i, item in enumerate(corpus):
+        if rate > 0:
+            # Agenda cada envio no instante certo para manter a taxa pedida
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(item)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+
+async def run(args):
+    if args.setup:
+        await setup_database()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.generate, args.contacts)
+    if args.save_corpus:
+        with open(args.save_corpus, "w") as f:
+            for item in corpus:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        print(f"💾 Corpus salvo em {args.save_corpus}")
+
+    items = sum(item.get("items", 1) for item in corpus)
+    in_process = not args.url
+
+    if in_process:
+        from app.main import app
+        from app.database import engine
+        engine.echo = False
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        lifespan = None
+
+    try:
+        statements_before = await read_db_statements(client, in_process)
+        result = await replay(client, corpus, args.rate, args.concurrency)
+        drain = await wait_queue_drain(client)
+        statements_after = await read_db_statements(client, in_process)
+    finally:
+        await client.aclose()
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+
+    latencies = result["latencies"]
+    statements = statements_after - statements_before
+    total_time = result["elapsed"] + drain
+    summary = {
+        "payloads": len(corpus),
+        "messages_and_statuses": items,
+        "concurrency": args.concurrency,
+        "target_rate": args.rate,
+        "errors": result["errors"],
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0,
+        },
+        "ack_throughput_payloads_s": round(len(corpus) / result["elapsed"], 1),
+        "sustained_throughput_items_s": round(items / total_time, 1),
+        "queue_drain_s": round(drain, 2),
+        "db_round_trips": statements,
+        "db_round_trips_per_item": round(statements / max(items, 1), 2),
+    }
+
+    print("\n📊 RESULTADO")
+    print(f"   Payloads: {summary['payloads']} ({items} mensagens/status), erros: {summary['errors']}")
+    lat = summary["latency_ms"]
+    print(f"   Latência: p50={lat['p50']}ms  p95={lat['p95']}ms  p99={lat['p99']}ms")
+    print(f"   Throughput: {summary['ack_throughput_payloads_s']} payloads/s (ack), "
+          f"{summary['sustained_throughput_items_s']} itens/s (sustentado)")
+    print(f"   Banco: {statements} round trips ({summary['db_round_trips_per_item']} por item)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Resultado salvo em {args.json}")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão dos webhooks")
+    parser.add_argument("--url", help="URL do backend rodando (sem isso, roda o app no mesmo processo)")
+    parser.add_argument("--corpus", help="Arquivo .jsonl com payloads gravados")
+    parser.add_argument("--generate", type=int, default=1000, help="Tamanho do corpus sintético")
+    parser.add_argument("--contacts", type=int, default=200, help="Quantidade de leads no corpus sintético")
+    parser.add_argument("--save-corpus", help="Salva o corpus usado em .jsonl (para repetir a mesma carga)")
+    parser.add_argument("--rate", type=float, default=0, help="Payloads por segundo (0 = sem limite)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requisições simultâneas")
+    parser.add_argument("--setup", action="store_true", help="Cria tabelas e canais do benchmark")
+    parser.add_argument("--json", help="Salva o resumo em JSON para comparar execuções")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if not os.getenv("DATABASE_URL"):
+        print("⚠️ DATABASE_URL não definida, usando o padrão de app/database.py")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Teste do lock por contato do agente IA entre workers (ContactDispatcher com
+_contact_ai_lock de app/evolution/routes.py) contra o Postgres de DATABASE_URL. Dois
+dispatchers no mesmo processo fazem o papel de dois workers do uvicorn (cada um com a
+própria caixa), recebendo mensagens alternadas do mesmo lead:
+  1. nunca dois turnos do mesmo lead ao mesmo tempo, e todos processados;
+  2. leads diferentes continuam em paralelo;
+  3. nenhum lock nem conexão sobra no fim, nem quando o turno falha.
+Falha (exit 1) se algo não bater.
+
+Rode com: python test_ai_dispatch.py
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.evolution.dispatcher import ContactDispatcher
+from app.evolution.routes import _contact_ai_lock
+
+LEAD = "5500999990055"
+OTHER = "5500999990056"
+
+
+async def main(args) -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+    overlap = {"leads": 0}
+    done: list[tuple[str, int]] = []
+
+    async def handler(job: dict):
+        wa_id = job["wa_id"]
+        running[wa_id] = running.get(wa_id, 0) + 1
+        peak[wa_id] = max(peak.get(wa_id, 0), running[wa_id])
+        if len([w for w, n in running.items() if n]) > 1:
+            overlap["leads"] += 1
+        try:
+            await asyncio.sleep(args.turn)
+            if job.get("fail"):
+                raise RuntimeError("turno com erro")
+            done.append((wa_id, job["n"]))
+        finally:
+            running[wa_id] -= 1
+
+    workers = [ContactDispatcher(handler, lock=_contact_ai_lock) for _ in range(2)]
+    try:
+        # 1 e 2. Mesmo lead nos dois workers; outro lead em paralelo
+        for n in range(args.messages):
+            workers[n % 2].submit(LEAD, {"wa_id": LEAD, "n": n, "fail": n == 1})
+        workers[0].submit(OTHER, {"wa_id": OTHER, "n": 0})
+        while any(w.stats()["active_contacts"] for w in workers):
+            await asyncio.sleep(0.05)
+
+        processed = sum(w.stats()["counters"]["processed"] for w in workers)
+        failed = sum(w.stats()["counters"]["failed"] for w in workers)
+        check(peak.get(LEAD) == 1, f"mesmo lead em 2 workers: no máximo {peak.get(LEAD)} turno por vez")
+        check(processed == args.messages and failed == 1,
+              f"{processed} turnos concluídos, {failed} com erro (de {args.messages + 1})")
+        check(overlap["leads"] > 0, "lead diferente rodou em paralelo")
+
+        # 3. Nada sobra
+        async with engine.connect() as conn:
+            locks = (await conn.execute(text("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'"))).scalar()
+        check(locks == 0 and engine.pool.checkedout() == 0,
+              f"no fim: {locks} advisory locks, {engine.pool.checkedout()} conexões em uso")
+    finally:
+        for worker in workers:
+            await worker.shutdown()
+        await engine.dispose()
+
+    print("\n🎉 Lock por contato da IA OK" if ok else "\n⚠️ Lock por contato da IA falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste do lock por contato do agente IA entre workers")
+    parser.add_argument("--messages", type=int, default=6, help="Mensagens do mesmo lead, alternadas entre os workers")
+    parser.add_argument("--turn", type=float, default=0.2, help="Duração de cada turno (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,73 @@
+"""
+Teste do turno da IA com mensagens agrupadas (app.ai_engine.drop_current_turn e o agrupamento
+do dispatcher em app/evolution/routes.py), sem banco e sem OpenAI. As mensagens do lead do
+turno atual já estão no fim do histórico e precisam sair de lá uma vez, nem mais nem menos:
+  1. uma mensagem só, com quebras de linha;
+  2. várias mensagens seguidas agrupadas pelo dispatcher;
+  3. mensagem anterior do lead com o mesmo texto de uma linha do turno fica no histórico.
+Falha (exit 1) se algo não bater.
+
+Rode com: python test_ai_turn.py
+"""
+import sys
+
+from app.ai_engine import drop_current_turn
+from app.evolution.routes import _merge_ai_jobs
+
+
+def user(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+def assistant(content: str) -> dict:
+    return {"role": "assistant", "content": content}
+
+
+def prompt(history: list[dict], user_message: str, pending: list[str] | None = None) -> list[dict]:
+    """Mensagens enviadas ao modelo (sem o system), como em generate_ai_response/process_message."""
+    return drop_current_turn(list(history), user_message, pending) + [user(user_message)]
+
+
+def main() -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    # 1. Uma mensagem com quebras de linha
+    multiline = "Oi!\nQueria saber do apartamento\nda Rua das Acácias"
+    history = [assistant("Olá, como posso ajudar?"), user(multiline)]
+    messages = prompt(history, multiline)
+    check(messages == [assistant("Olá, como posso ajudar?"), user(multiline)],
+          "mensagem única com quebras de linha aparece uma vez")
+
+    # 2. Mensagens seguidas agrupadas pelo dispatcher
+    jobs = [{"wa_id": "55", "text": t} for t in ("Oi", "tudo bem?", "Tem vaga de garagem?\nDuas vagas")]
+    turn = _merge_ai_jobs(jobs)
+    history = [assistant("Olá!"), user("Oi"), user("tudo bem?"), user("Tem vaga de garagem?\nDuas vagas")]
+    messages = prompt(history, turn["text"], turn["texts"])
+    check(turn["merged_count"] == 3 and messages == [assistant("Olá!"), user(turn["text"])],
+          "3 mensagens agrupadas (uma com quebra de linha) saem do histórico e entram como um turno")
+
+    # Agrupamento de um turno já agrupado mantém as mensagens originais
+    again = _merge_ai_jobs([turn, {"wa_id": "55", "text": "?"}])
+    check(again["texts"] == ["Oi", "tudo bem?", "Tem vaga de garagem?\nDuas vagas", "?"],
+          "turno reagrupado mantém a lista das mensagens originais")
+
+    # 3. Mensagem antiga igual a uma linha do turno não é removida
+    history = [user("Oi"), assistant("Olá!"), user("Oi"), user("quero visitar")]
+    messages = prompt(history, "Oi\nquero visitar", ["Oi", "quero visitar"])
+    check(messages == [user("Oi"), assistant("Olá!"), user("Oi\nquero visitar")],
+          "só as mensagens do turno saem; o 'Oi' da conversa anterior fica")
+    history = [user("Oi"), assistant("Olá!"), user("Oi")]
+    messages = prompt(history, "Oi")
+    check(messages == [user("Oi"), assistant("Olá!"), user("Oi")], "turno de uma mensagem tira só a última")
+
+    print("\n🎉 Turno da IA OK" if ok else "\n⚠️ Turno da IA falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,106 @@
+"""
+Teste do chunker da base de conhecimento (app/chunker.py), sem banco nem API:
+  1. nenhum chunk passa de max_tokens (recodificado com o tiktoken) e token_count confere;
+  2. nada do documento se perde: toda frase (ou palavra, no texto sem pontuação) aparece
+     em algum chunk;
+  3. os cortes caem em fim de parágrafo ou de frase quando o texto tem onde cortar, e
+     chunks vizinhos se sobrepõem;
+  4. documento grande no processo separado dá o mesmo resultado.
+Casos: documento comum, parágrafo único gigante, texto sem pontuação nem quebra de linha,
+texto com acentos/emojis (tokens que cortam caracteres) e documento minúsculo.
+Falha (exit 1) se algo não bater.
+
+Rode com: python test_chunker.py
+"""
+import asyncio
+import random
+import re
+import sys
+
+from app.chunker import KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS, _encoding, normalize, split_into_chunks, split_into_chunks_async
+
+BUDGETS = (100, 400, 800)
+SENTENCE = re.compile(r"[^.!?…]+[.!?…]")
+
+
+def sentences(rng: random.Random, count: int) -> list[str]:
+    bairros = ["Moema", "Pinheiros", "Vila Mariana", "Tatuapé", "Santana", "Butantã"]
+    return [
+        f"O {rng.choice(['apartamento', 'sobrado', 'studio'])} {i} fica em {rng.choice(bairros)}, "
+        f"tem {rng.randint(1, 4)} quartos e custa R$ {rng.randint(200, 2000)} mil"
+        + ", com varanda gourmet e vaga coberta" * rng.randint(0, 3) + rng.choice([".", "!", "?"])
+        for i in range(count)
+    ]
+
+
+def documents() -> dict[str, str]:
+    rng = random.Random(7)
+    paragraphs = []
+    for _ in range(300):
+        paragraphs.append(" ".join(sentences(rng, rng.randint(1, 8))))
+        if rng.random() < 0.2:
+            paragraphs.append("")
+    return {
+        "comum": "\n".join(paragraphs),
+        "parágrafo único": " ".join(sentences(rng, 800)),
+        "sem pontuação": " ".join(f"palavra{i}" for i in range(20000)),
+        "acentos e emojis": "\n".join("🏠🌳 Condomínio à beira-mar — ação, coração, pão! 😀 " * rng.randint(1, 30) for _ in range(200)),
+        "minúsculo": "Casa à venda.",
+    }
+
+
+def check_document(name: str, text: str, max_tokens: int, check):
+    enc = _encoding("gpt-4o")
+    chunks = split_into_chunks(text, name, max_tokens=max_tokens)
+    label = f"[{name}, {max_tokens}]"
+
+    counts = [len(enc.encode_ordinary(c["content"])) for c in chunks]
+    check(all(n <= max_tokens for n in counts) and counts == [c["token_count"] for c in chunks],
+          f"{label} {len(chunks)} chunks, maior com {max(counts)} tokens", quiet=True)
+    check([c["chunk_index"] for c in chunks] == list(range(len(chunks))) and all(c["content"] for c in chunks),
+          f"{label} índices em sequência, nenhum chunk vazio", quiet=True)
+
+    by_sentence = any(mark in text for mark in ".!?…")
+    split = (lambda t: [s.strip() for s in SENTENCE.findall(t)]) if by_sentence else str.split
+    units = [u for u in split(normalize(text)) if len(enc.encode_ordinary(u)) < max_tokens // 2]
+    found = {u for c in chunks for u in split(c["content"])}
+    missing = [u for u in units if u not in found]
+    check(not missing, f"{label} todas as {len(units)} frases/palavras presentes" + (f" (faltou: {missing[0][:60]})" if missing else ""), quiet=True)
+
+
+def main() -> bool:
+    ok = True
+
+    def check(condition: bool, message: str, quiet: bool = False):
+        nonlocal ok
+        if not condition or not quiet:
+            print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    docs = documents()
+    for max_tokens in BUDGETS:
+        for name, text in docs.items():
+            check_document(name, text, max_tokens, check)
+    check(ok, f"limite de tokens, ordem e cobertura em {len(docs)} documentos x {len(BUDGETS)} limites")
+
+    # Cortes em fronteiras e sobreposição (documento comum)
+    chunks = split_into_chunks(docs["comum"], "comum", max_tokens=400)
+    at_boundary = sum(c["content"][-1] in ".!?…" for c in chunks[:-1]) / (len(chunks) - 1)
+    overlapping = sum(
+        bool(SENTENCE.findall(b["content"])) and SENTENCE.findall(b["content"])[0].strip() in a["content"]
+        for a, b in zip(chunks, chunks[1:])
+    ) / (len(chunks) - 1)
+    check(at_boundary == 1.0, f"{at_boundary:.0%} dos cortes em fim de frase/parágrafo")
+    check(overlapping >= 0.9, f"{overlapping:.0%} dos chunks começam com sobreposição do anterior")
+
+    # Processo separado
+    big = (docs["comum"] + "\n") * (KNOWLEDGE_CHUNK_PROCESS_MIN_CHARS // len(docs["comum"]) + 1)
+    same = asyncio.run(split_into_chunks_async(big, "grande")) == split_into_chunks(big, "grande")
+    check(same, f"documento de {len(big) / 1024:.0f} KB no processo separado igual ao inline")
+
+    print("\n🎉 Chunker OK" if ok else "\n⚠️ Chunker falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
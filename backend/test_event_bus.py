@@ -0,0 +1,177 @@
+"""
+Teste do barramento de eventos entre workers (LISTEN/NOTIFY).
+Sobe dois processos do app (uvicorn app.main:app) com EVENT_BUS_ENABLED=true contra o
+Postgres de DATABASE_URL, abre o stream SSE (GET /api/events) no worker B e:
+  1. manda um webhook da Meta para o worker A: B precisa emitir message.created;
+  2. mensagem maior que o limite do NOTIFY: vai pelo outbox e chega inteira em B;
+  3. derruba a conexão LISTEN de B (pg_terminate_backend) e publica em A logo em seguida:
+     B precisa reler do outbox ao reconectar (pelo menos uma vez).
+Falha (exit 1) se algum evento não chegar. Os dados de teste são apagados no final.
+
+Rode com: python -m app.migrate_event_bus && python test_event_bus.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.auth import create_access_token
+from app.database import async_session, engine
+
+WA_ID = "5500999990001"
+EMAIL = "bus-test@teste.com"
+
+
+def meta_payload(wamid: str, body: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {
+            "metadata": {"phone_number_id": "bus-test"},
+            "contacts": [{"wa_id": WA_ID, "profile": {"name": "Teste Barramento"}}],
+            "messages": [{"from": WA_ID, "id": wamid, "timestamp": str(int(time.time())),
+                          "type": "text", "text": {"body": body}}],
+        }}]}],
+    }
+
+
+def start_worker(port: int) -> subprocess.Popen:
+    env = {**os.environ, "EVENT_BUS_ENABLED": "true", "EVENT_BUS_PING_SEC": "1", "WEBHOOK_QUEUE_ENABLED": "false"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str):
+    for _ in range(100):
+        try:
+            r = await client.get(f"{url}/api/events/stats")
+            if r.status_code == 200 and r.json()["bus"]["connected"]:
+                return r.json()["bus"]["pid"]
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"worker {url} não subiu")
+
+
+class EventReader:
+    """Lê o stream SSE de um worker em segundo plano e guarda os eventos por tipo."""
+
+    def __init__(self, client: httpx.AsyncClient, url: str, token: str):
+        self.events: list[dict] = []
+        self._task = asyncio.create_task(self._run(client, url, token))
+
+    async def _run(self, client, url, token):
+        async with client.stream("GET", f"{url}/api/events", params={"token": token}, timeout=None) as r:
+            current = {}
+            async for line in r.aiter_lines():
+                if line.startswith("event: "):
+                    current["event"] = line[7:]
+                elif line.startswith("data: "):
+                    current["data"] = json.loads(line[6:])
+                elif line == "" and current:
+                    self.events.append(current)
+                    current = {}
+
+    async def wait_for(self, wamid: str, timeout: float) -> dict | None:
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            for ev in self.events:
+                if ev.get("event") == "message.created" and ev["data"].get("wa_message_id") == wamid:
+                    return ev
+            await asyncio.sleep(0.05)
+        return None
+
+    def close(self):
+        self._task.cancel()
+
+
+async def cleanup():
+    async with async_session() as db:
+        for sql in (
+            "DELETE FROM messages WHERE contact_wa_id = :wa",
+            "DELETE FROM conversation_state WHERE wa_id = :wa",
+            "DELETE FROM contacts WHERE wa_id = :wa",
+            "DELETE FROM users WHERE email = :email",
+        ):
+            await db.execute(text(sql), {"wa": WA_ID, "email": EMAIL})
+        await db.commit()
+
+
+async def main(args) -> bool:
+    await cleanup()
+    async with async_session() as db:
+        user_id = (await db.execute(text("""
+            INSERT INTO users (name, email, password_hash, role, is_active)
+            VALUES ('Teste Barramento', :email, 'x', 'admin', true) RETURNING id
+        """), {"email": EMAIL})).scalar()
+        await db.commit()
+    token = create_access_token({"sub": str(user_id)})
+
+    url_a, url_b = f"http://127.0.0.1:{args.port}", f"http://127.0.0.1:{args.port + 1}"
+    workers = [start_worker(args.port), start_worker(args.port + 1)]
+    ok = True
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            await wait_ready(client, url_a)
+            pid_b = await wait_ready(client, url_b)
+            reader = EventReader(client, url_b, token)
+            await asyncio.sleep(0.5)
+            run = int(time.time())
+
+            checks = [
+                ("Evento chega no outro worker", f"wamid.bus{run}a", "olá do worker A", None),
+                ("Payload acima do limite do NOTIFY (outbox)", f"wamid.bus{run}b", "x" * 20000, None),
+                ("Releitura após queda do LISTEN", f"wamid.bus{run}c", "publicado sem LISTEN", pid_b),
+            ]
+            for description, wamid, body, kill_pid in checks:
+                if kill_pid:
+                    async with engine.connect() as conn:
+                        await conn.execute(
+                            text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE application_name = :app"),
+                            {"app": f"imbohub-bus-{kill_pid}"},
+                        )
+                        await conn.commit()
+                started = time.perf_counter()
+                r = await client.post(f"{url_a}/webhook", json=meta_payload(wamid, body))
+                r.raise_for_status()
+                ev = await reader.wait_for(wamid, args.timeout)
+                elapsed = (time.perf_counter() - started) * 1000
+                if ev is None:
+                    ok = False
+                    print(f"❌ {description}: evento não chegou em {args.timeout:.0f}s")
+                elif ev["data"]["content"] != body:
+                    ok = False
+                    print(f"❌ {description}: conteúdo diferente ({len(ev['data']['content'])} de {len(body)} caracteres)")
+                else:
+                    print(f"✅ {description}: {elapsed:.0f} ms")
+
+            bus_b = (await client.get(f"{url_b}/api/events/stats")).json()["bus"]["counters"]
+            print(f"\n📊 Worker B: {bus_b}")
+            if not bus_b["fetched"] or not bus_b["caught_up"] or not bus_b["reconnects"]:
+                ok = False
+                print("❌ Contadores do worker B não mostram outbox/releitura")
+            reader.close()
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        await cleanup()
+        await engine.dispose()
+
+    print("\n🎉 Barramento entre workers OK" if ok else "\n⚠️ Barramento entre workers falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste do barramento de eventos com dois workers")
+    parser.add_argument("--port", type=int, default=8701, help="Porta do worker A (B usa a seguinte)")
+    parser.add_argument("--timeout", type=float, default=15.0, help="Espera máxima por evento (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
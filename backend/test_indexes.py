@@ -0,0 +1,211 @@
+"""
+Teste de regressão dos índices dos caminhos quentes (messages, contacts, schedules, ai_calls).
+Cria um schema temporário, popula com uma massa de dados realista, aplica os índices de
+app/migrate_indexes.py e roda EXPLAIN nas consultas quentes. Falha (exit 1) se alguma
+delas cair em Seq Scan na tabela principal.
+
+Rode com: python test_indexes.py
+          python test_indexes.py --messages 500000 --keep   # massa maior, mantém o schema
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import DATABASE_URL, Base
+import app.models  # noqa: F401 — registra as tabelas
+import app.voice_ai.models  # noqa: F401
+from app.migrate_indexes import INDEXES, create_indexes
+from app.partitions import ensure_partitions
+
+SCHEMA = "index_check"
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+
+# (descrição, tabela que não pode ter Seq Scan, SQL, parâmetros[, máximo de partições lidas])
+HOT_QUERIES = [
+    ("Histórico da conversa (IA e tela de chat)", "messages",
+     "SELECT * FROM messages WHERE contact_wa_id = :wa ORDER BY timestamp DESC LIMIT 20",
+     {"wa": "5511900000042"}),
+    ("Última mensagem do contato", "messages",
+     "SELECT content, timestamp FROM messages WHERE contact_wa_id = :wa ORDER BY timestamp DESC LIMIT 1",
+     {"wa": "5511900000042"}),
+    ("Não lidas de um contato", "messages",
+     "SELECT count(*) FROM messages WHERE contact_wa_id = :wa AND direction = 'inbound' AND status = 'received'",
+     {"wa": "5511900000042"}),
+    ("Não lidas de todos os contatos", "messages",
+     "SELECT contact_wa_id, count(*) FROM messages WHERE direction = 'inbound' AND status = 'received' "
+     "GROUP BY contact_wa_id",
+     {}),
+    ("Mensagens recebidas por contato (dashboard)", "messages",
+     "SELECT count(*) FROM messages WHERE contact_wa_id = :wa AND direction = 'inbound'",
+     {"wa": "5511900000042"}),
+    ("Mensagens do canal no período (dashboard/exportação)", "messages",
+     "SELECT count(*) FROM messages WHERE channel_id = :ch AND timestamp >= :since",
+     {"ch": 1, "since": NOW - timedelta(days=1)}, 1),  # só o mês atual (as futuras estão vazias)
+    ("Busca textual em mensagens (/api/search)", "messages",
+     "SELECT id FROM messages WHERE search_vector @@ websearch_to_tsquery('pt_unaccent', f_unaccent(:q))",
+     {"q": "4242"}),
+    ("Busca no histórico do contato", "messages",
+     "SELECT id FROM messages WHERE contact_wa_id = :wa "
+     "AND search_vector @@ websearch_to_tsquery('pt_unaccent', f_unaccent(:q)) ORDER BY id DESC LIMIT 21",
+     {"wa": "5511900000042", "q": "mensagem"}),
+    ("Leads novos do canal no período", "contacts",
+     "SELECT count(*) FROM contacts WHERE channel_id = :ch AND created_at >= :since",
+     {"ch": 1, "since": NOW - timedelta(days=1)}),
+    ("Leads do corretor", "contacts",
+     "SELECT wa_id FROM contacts WHERE assigned_to = :user",
+     {"user": 3}),
+    ("Scheduler de ligações", "schedules",
+     "SELECT * FROM schedules WHERE status = 'pending' AND type = 'voice_ai' AND scheduled_at <= :now",
+     {"now": NOW}),
+    ("Dashboard de ligações por origem", "ai_calls",
+     "SELECT count(*) FROM ai_calls WHERE source = 'elevenlabs' AND created_at >= :since",
+     {"since": NOW - timedelta(days=1)}),
+]
+
+
+async def seed(conn, messages: int, contacts: int):
+    """Massa de dados: 90 dias de histórico, poucas não lidas, maioria dos agendamentos concluída."""
+    params = {"now": NOW, "messages": messages, "contacts": contacts}
+    await conn.execute(text("INSERT INTO channels (id, name) SELECT g, 'Canal ' || g FROM generate_series(1, 4) g"))
+    await conn.execute(text("""
+        INSERT INTO users (id, name, email, password_hash, role)
+        SELECT g, 'Corretor ' || g, 'corretor' || g || '@teste.com', 'x', 'atendente' FROM generate_series(1, 40) g
+    """))
+    await conn.execute(text("""
+        INSERT INTO contacts (wa_id, name, channel_id, assigned_to, lead_status, created_at, updated_at)
+        SELECT '55119' || lpad(g::text, 8, '0'), 'Lead ' || g, 1 + g % 4, 1 + g % 40, 'novo',
+               CAST(:now AS timestamp) - make_interval(mins => (g * 37) % (90 * 24 * 60)),
+               CAST(:now AS timestamp)
+          FROM generate_series(1, :contacts) g
+    """), params)
+    await conn.execute(text("""
+        INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type,
+                              content, timestamp, status, sent_by_ai)
+        SELECT 'wamid.' || g,
+               '55119' || lpad((1 + g % :contacts)::text, 8, '0'),
+               1 + (1 + g % :contacts) % 4,
+               CASE WHEN g % 2 = 0 THEN 'inbound' ELSE 'outbound' END,
+               'text', 'mensagem ' || g,
+               CAST(:now AS timestamp) - make_interval(secs => (:messages - g) * (90 * 86400.0 / :messages)),
+               CASE WHEN g % 2 = 1 THEN 'read'
+                    WHEN g > :messages - :contacts / 10 THEN 'received'
+                    ELSE 'read' END,
+               false
+          FROM generate_series(1, :messages) g
+    """), params)
+    await conn.execute(text("""
+        INSERT INTO schedules (type, contact_wa_id, phone, scheduled_date, scheduled_time, scheduled_at, status)
+        SELECT CASE WHEN g % 3 = 0 THEN 'visita' ELSE 'voice_ai' END,
+               '55119' || lpad((1 + g % :contacts)::text, 8, '0'), '5511999999999',
+               '2026-01-01', '10:00',
+               CAST(:now AS timestamp) - make_interval(hours => 90 * 24 - g % (90 * 24)),
+               CASE WHEN g % 200 = 0 THEN 'pending' ELSE 'completed' END
+          FROM generate_series(1, :contacts) g
+    """), params)
+    await conn.execute(text("""
+        INSERT INTO ai_calls (from_number, to_number, source, created_at)
+        SELECT '5511000000000', '5511999999999',
+               CASE WHEN g % 2 = 0 THEN 'elevenlabs' ELSE 'twilio' END,
+               CAST(:now AS timestamp) - make_interval(mins => g % (90 * 24 * 60))
+          FROM generate_series(1, :contacts * 4) g
+    """), params)
+
+
+def _is_table(relation: str | None, table: str) -> bool:
+    """A própria tabela ou uma das partições mensais (messages_2026_10, messages_default)."""
+    return bool(relation) and (relation == table or relation.startswith(f"{table}_"))
+
+
+def seq_scans(plan: dict, table: str, empty: set[str]) -> list[str]:
+    """Seq Scans na tabela/partições com dados (partição vazia é sempre lida por Seq Scan)."""
+    found = []
+    relation = plan.get("Relation Name")
+    if plan.get("Node Type") == "Seq Scan" and _is_table(relation, table) and relation not in empty:
+        found.append(relation)
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, table, empty))
+    return found
+
+
+def scanned_relations(plan: dict, table: str) -> set[str]:
+    names = {plan["Relation Name"]} if _is_table(plan.get("Relation Name"), table) else set()
+    for child in plan.get("Plans", []):
+        names |= scanned_relations(child, table)
+    return names
+
+
+def used_indexes(plan: dict) -> set[str]:
+    names = {plan["Index Name"]} if plan.get("Index Name") else set()
+    for child in plan.get("Plans", []):
+        names |= used_indexes(child)
+    return names
+
+
+async def main(args) -> bool:
+    engine = create_async_engine(
+        DATABASE_URL, connect_args={"server_settings": {"search_path": SCHEMA}},
+    )
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Os modelos já declaram os índices; remove para testar a migração de verdade
+        for name, _ in INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        await ensure_partitions(conn, start=(NOW - timedelta(days=90)).date())
+        print(f"🌱 Populando {args.messages} mensagens e {args.contacts} contatos...")
+        await seed(conn, args.messages, args.contacts)
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await create_indexes(conn)
+
+    ok = True
+    print()
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT relname FROM pg_class
+             WHERE relkind = 'r' AND reltuples <= 0 AND pg_table_is_visible(oid)
+        """))
+        empty = {r[0] for r in result.all()}
+
+        for description, table, sql, params, *limits in HOT_QUERIES:
+            result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)
+            raw = result.scalar()
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            scanned = scanned_relations(plan, table)
+            if seq_scans(plan, table, empty):
+                ok = False
+                print(f"❌ {description}: Seq Scan em {', '.join(sorted(seq_scans(plan, table, empty)))}")
+            elif limits and len(scanned - empty) > limits[0]:
+                ok = False
+                print(f"❌ {description}: leu {len(scanned)} partições ({', '.join(sorted(scanned))})")
+            else:
+                indexes = sorted({name.split("_20")[0].removesuffix("_default") for name in used_indexes(plan)})
+                print(f"✅ {description}: {', '.join(indexes) or plan['Node Type']} ({len(scanned)} tabela(s))")
+
+    if not args.keep:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await engine.dispose()
+
+    print("\n🎉 Todas as consultas quentes usam índice" if ok else "\n⚠️ Há consultas quentes sem índice")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regressão de índices via EXPLAIN")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--keep", action="store_true", help="Não apaga o schema de teste no final")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,193 @@
+"""
+Teste do reenvio de documentos da base de conhecimento com deduplicação por hash
+(app/knowledge_ingest.py), contra a API de embeddings falsa de test_knowledge_ingest.py e o
+Postgres de DATABASE_URL:
+  1. primeiro envio x reenvio idêntico: chamadas à API e tempo (o reenvio não chama a API);
+  2. reenvio editado (chunks alterados, removidos e inseridos no meio): só os alterados vão
+     para a API, cada chunk com o próprio embedding, na ordem, sem linhas órfãs, e o índice
+     vetorial em memória igual ao banco depois do commit;
+  3. texto já embedado em outro documento do canal: vetor copiado, sem chamada;
+  4. modelo de embedding diferente: tudo embedado de novo;
+  5. API fora do ar no meio do reenvio: o documento anterior fica intacto;
+  6. API lenta: nenhuma conexão presa nem lock do documento tomado enquanto os embeddings
+     saem, e dois reenvios simultâneos terminam com uma cópia só do documento.
+Falha (exit 1) se algo não bater. Os documentos de teste são apagados no final.
+
+Rode com: python -m app.migrate_knowledge_dedup && python test_knowledge_dedup.py
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import numpy as np
+
+# Antes do app: aponta o cliente da OpenAI para a API falsa
+from test_knowledge_ingest import FakeEmbeddings, TITLE, cleanup, fake_vector, make_chunks, stored_chunks
+
+from sqlalchemy import text  # noqa: E402
+
+from app import embedding_store, knowledge_index, knowledge_ingest  # noqa: E402
+from app.database import async_session, engine  # noqa: E402
+
+
+def edit(chunks: list[dict], rng: random.Random, changed: int, removed: int, inserted: int) -> list[dict]:
+    """Nova versão do documento: alguns chunks reescritos, alguns apagados, alguns novos no meio."""
+    contents = [c["content"] for c in chunks]
+    positions = rng.sample(range(len(contents)), changed + removed)
+    for i in positions[:changed]:
+        contents[i] = contents[i].replace("piscina", "piscina aquecida", 1)
+    for i in sorted(positions[changed:], reverse=True):
+        del contents[i]
+    middle = len(contents) // 2
+    contents[middle:middle] = [f"Lançamento {i}: studio com varanda e rooftop. " * 20 for i in range(inserted)]
+    title = chunks[0]["title"]
+    return [{"title": title, "content": c, "chunk_index": i, "token_count": 300} for i, c in enumerate(contents)]
+
+
+async def upload(channel_id: int, chunks: list[dict], on_batch=None) -> tuple[list[int], dict, float]:
+    stats = {"api_calls": 0, "retries": 0}
+    started = time.perf_counter()
+    async with async_session() as db:
+        ids = await knowledge_ingest.ingest(db, channel_id, chunks, on_batch, stats)
+        await db.commit()
+    return ids, stats, time.perf_counter() - started
+
+
+def matches(rows, chunks: list[dict]) -> bool:
+    """Linhas gravadas (ORDER BY chunk_index) = chunks, cada uma com o embedding do próprio texto."""
+    return (
+        [(r.chunk_index, r.content) for r in rows] == [(c["chunk_index"], c["content"]) for c in chunks]
+        and all(np.array_equal(embedding_store.unpack(r.embedding_vec), np.float32(fake_vector(r.content))) for r in rows)
+    )
+
+
+async def ordered_rows(channel_id: int, title: str) -> list:
+    rows = await stored_chunks(channel_id, title)
+    return sorted(rows, key=lambda r: r.chunk_index)
+
+
+async def main(args) -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    async with async_session() as db:
+        channel_id = (await db.execute(text("SELECT min(id) FROM channels"))).scalar()
+    if channel_id is None:
+        print("⚠️ Nenhum canal no banco")
+        return False
+    rng = random.Random(3)
+    chunks = make_chunks(args.chunks)
+
+    async with FakeEmbeddings() as fake:
+        try:
+            await cleanup(channel_id)
+
+            # 1. Primeiro envio x reenvio idêntico
+            fake.reset(latency=args.latency)
+            first_ids, first, first_s = await upload(channel_id, chunks)
+            fake.reset(latency=args.latency)
+            again_ids, again, again_s = await upload(channel_id, chunks)
+            print(f"⏱️ Primeiro envio: {first['api_calls']} chamadas, {first_s:.2f}s | "
+                  f"reenvio idêntico: {again['api_calls']} chamadas, {again_s:.2f}s "
+                  f"(estimativa economizada: {again['seconds_saved_est']}s)")
+            check(fake.calls == 0 and again_ids == first_ids and again["kept_chunks"] == len(chunks),
+                  f"reenvio idêntico: {again['kept_chunks']} chunks mantidos, {again['saved_api_calls']} chamadas evitadas")
+
+            # 2. Reenvio editado, com o índice em memória já montado
+            await knowledge_index.get_index(channel_id)
+            edited = edit(chunks, rng, args.changed, args.removed, args.inserted)
+            fake.reset(latency=args.latency)
+            _, stats, edited_s = await upload(channel_id, edited)
+            await asyncio.gather(*knowledge_index._tasks)
+            print(f"⏱️ Reenvio editado: {stats['api_calls']} chamadas ({fake.inputs} chunks embedados), {edited_s:.2f}s | "
+                  f"{stats['saved_api_calls']} chamadas e {stats['saved_tokens']} tokens evitados, "
+                  f"~{stats['seconds_saved_est']}s economizados")
+            check(fake.inputs == stats["embedded_chunks"] == args.changed + args.inserted,
+                  f"só {fake.inputs} chunks novos/alterados foram para a API "
+                  f"({stats['kept_chunks']} mantidos, {stats['removed_chunks']} apagados)")
+            rows = await ordered_rows(channel_id, TITLE)
+            check(len(rows) == len(edited) and matches(rows, edited),
+                  f"{len(rows)} linhas = nova versão, na ordem, cada chunk com o próprio embedding")
+            async with async_session() as db:
+                db_ids = set((await db.execute(text("SELECT id FROM knowledge_documents WHERE channel_id = :c"),
+                                               {"c": channel_id})).scalars())
+            index = knowledge_index._indexes.get(channel_id)
+            check(index is not None and set(index.snapshot()[0].tolist()) == db_ids,
+                  "índice em memória igual ao banco depois do commit")
+
+            # 3. Mesmo texto em outro documento do canal
+            copy = [{**c, "title": TITLE + " cópia"} for c in edited[:args.changed]]
+            fake.reset()
+            _, stats, _ = await upload(channel_id, copy)
+            rows = await ordered_rows(channel_id, TITLE + " cópia")
+            check(fake.calls == 0 and stats["reused_chunks"] == len(copy) and matches(rows, copy),
+                  f"outro documento com o mesmo texto: {stats['reused_chunks']} vetores copiados, {fake.calls} chamadas")
+
+            # 4. Modelo diferente
+            async with async_session() as db:
+                await db.execute(text("UPDATE knowledge_documents SET embedding_model = 'modelo-antigo' "
+                                      "WHERE channel_id = :c AND title LIKE :t"), {"c": channel_id, "t": f"{TITLE}%"})
+                await db.commit()
+            fake.reset()
+            _, stats, _ = await upload(channel_id, edited)
+            check(stats["embedded_chunks"] == len(edited) and stats["removed_chunks"] == len(edited),
+                  f"modelo diferente: {stats['embedded_chunks']} chunks embedados de novo")
+
+            # 5. API fora do ar no meio do reenvio
+            before = await ordered_rows(channel_id, TITLE)
+            fake.reset(down=True)
+            try:
+                await upload(channel_id, edit(edited, rng, args.changed, 0, 0))
+                failed = False
+            except Exception:
+                failed = True
+            after = await ordered_rows(channel_id, TITLE)
+            check(failed and [(r.chunk_index, r.content) for r in after] == [(r.chunk_index, r.content) for r in before],
+                  "API fora do ar: reenvio falhou e o documento anterior ficou intacto")
+
+            # 6. API lenta: durante os embeddings, nada preso no banco
+            samples = []
+
+            async def probe(done: int):
+                checked_out = engine.pool.checkedout()
+                async with async_session() as db:
+                    free = (await db.execute(text("SELECT pg_try_advisory_xact_lock(:c, hashtext(:t))"),
+                                             {"c": channel_id, "t": TITLE})).scalar()
+                    await db.rollback()
+                samples.append((checked_out, free))
+
+            fake.reset(latency=args.latency)
+            version = edit(edited, rng, args.changed, 0, args.inserted)
+            await upload(channel_id, version, probe)
+            check(samples and all(checked_out == 0 and free for checked_out, free in samples),
+                  f"API lenta: nenhuma conexão em uso e lock do documento livre durante os embeddings "
+                  f"({len(samples)} lotes)")
+            fake.reset(latency=args.latency)
+            version = edit(version, rng, args.changed, args.removed, 0)
+            await asyncio.gather(upload(channel_id, version), upload(channel_id, version))
+            rows = await ordered_rows(channel_id, TITLE)
+            check(len(rows) == len(version) and matches(rows, version),
+                  f"dois reenvios simultâneos: {len(rows)} linhas = nova versão, sem duplicar")
+        finally:
+            await cleanup(channel_id)
+            await engine.dispose()
+
+    print("\n🎉 Reenvio com deduplicação OK" if ok else "\n⚠️ Reenvio com deduplicação falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste do reenvio deduplicado da base de conhecimento")
+    parser.add_argument("--chunks", type=int, default=500, help="Chunks do documento de teste")
+    parser.add_argument("--changed", type=int, default=20, help="Chunks alterados no reenvio")
+    parser.add_argument("--removed", type=int, default=10, help="Chunks removidos no reenvio")
+    parser.add_argument("--inserted", type=int, default=10, help="Chunks novos no meio do documento")
+    parser.add_argument("--latency", type=float, default=0.15, help="Latência da API falsa por chamada (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
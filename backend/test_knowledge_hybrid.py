@@ -0,0 +1,201 @@
+"""
+Teste da busca híbrida da base de conhecimento (app/knowledge_search.py) pelo caminho do
+RAG (ai_engine.search_knowledge), contra a API de embeddings falsa de test_knowledge_ingest.py
+e o Postgres de DATABASE_URL:
+  1. código exato ("ap4821", "AP 4821") no topo, o que a busca só vetorial não garante;
+  2. API de embeddings lenta: resposta só com o BM25 dentro do prazo, pausa nas chamadas
+     seguintes, e o vetor que chegou depois fica no cache de perguntas;
+  3. API fora do ar: resposta só com o BM25, sem erro;
+  4. upload, reenvio editado e remoção atualizam o índice lexical sem remontar, igual ao banco;
+  5. KNOWLEDGE_SEARCH_MODE=vector: mesmo resultado da busca vetorial de antes (cosseno).
+Falha (exit 1) se algo não bater. Os documentos de teste são apagados no final.
+
+Rode com: python test_knowledge_hybrid.py
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+# Antes do app: aponta o cliente da OpenAI para a API falsa
+from test_knowledge_ingest import FakeEmbeddings, TITLE, cleanup, fake_vector, make_chunks
+
+from sqlalchemy import select, text  # noqa: E402
+
+from app import knowledge_index, knowledge_ingest, knowledge_search, query_embeddings  # noqa: E402
+from app.ai_engine import search_knowledge  # noqa: E402
+from app.database import async_session, engine  # noqa: E402
+from app.models import KnowledgeDocument  # noqa: E402
+
+CODE_CHUNK = "Apartamento AP-4821 na Rua das Acácias, 152: 3 quartos, 98 m², varanda gourmet e duas vagas."
+
+
+async def upload(channel_id: int, chunks: list[dict]):
+    async with async_session() as db:
+        await knowledge_ingest.ingest(db, channel_id, chunks)
+        await db.commit()
+    await settle()
+
+
+async def settle():
+    """Espera os índices em memória aplicarem as mudanças publicadas no commit."""
+    await asyncio.gather(*knowledge_index._tasks, *knowledge_search._tasks)
+
+
+async def search(channel_id: int, query: str, top_k: int = 3) -> tuple[list[dict], float]:
+    started = time.perf_counter()
+    async with async_session() as db:
+        docs = await search_knowledge(query, channel_id, db, top_k=top_k)
+    return docs, time.perf_counter() - started
+
+
+def document(chunks: list[dict]) -> list[dict]:
+    chunks = [dict(c) for c in chunks]
+    chunks.insert(len(chunks) // 2, {"title": TITLE, "content": CODE_CHUNK, "chunk_index": 0, "token_count": 40})
+    return [{**c, "chunk_index": i} for i, c in enumerate(chunks)]
+
+
+async def db_ids(channel_id: int) -> set[int]:
+    async with async_session() as db:
+        result = await db.execute(select(KnowledgeDocument.id).where(KnowledgeDocument.channel_id == channel_id))
+        return set(result.scalars())
+
+
+async def main(args) -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    async with async_session() as db:
+        channel_id = (await db.execute(text("SELECT min(id) FROM channels"))).scalar()
+    if channel_id is None:
+        print("⚠️ Nenhum canal no banco")
+        return False
+    knowledge_search.KNOWLEDGE_SEARCH_MODE = "hybrid"
+    knowledge_search.KNOWLEDGE_EMBED_TIMEOUT_SEC = args.timeout
+    chunks = document(make_chunks(args.chunks))
+
+    async with FakeEmbeddings() as fake:
+        try:
+            await cleanup(channel_id)
+            fake.reset()
+            await upload(channel_id, chunks)
+            # Índices montados aqui: tudo que vem depois é incremental
+            await knowledge_index.get_index(channel_id)
+            lexical = await knowledge_search.get_index(channel_id)
+            builds = knowledge_search._counters["builds"]
+            check(lexical is not None and set(lexical._positions) == await db_ids(channel_id),
+                  f"índice lexical montado na primeira busca: {len(lexical or ())} chunks, igual ao banco")
+
+            # 1. Código exato
+            query_embeddings.clear()
+            top = {}
+            for query in ("Vocês ainda têm o ap4821?", "quero ver o AP 4821", "AP-4821 está disponível?"):
+                docs, _ = await search(channel_id, query)
+                top[query] = bool(docs) and docs[0]["content"] == CODE_CHUNK
+            by_vector = await knowledge_index.search(channel_id, fake_vector("Vocês ainda têm o ap4821?"), 3)
+            async with async_session() as db:
+                code_id = (await db.execute(select(KnowledgeDocument.id).where(
+                    KnowledgeDocument.channel_id == channel_id, KnowledgeDocument.content == CODE_CHUNK))).scalar()
+            check(all(top.values()), f"código exato em 3 grafias: chunk certo em 1º ({sum(top.values())}/3) "
+                                     f"| só vetorial: {'no top-3' if code_id in [d for d, _ in by_vector] else 'fora do top-3'}")
+
+            # 2. API lenta
+            query_embeddings.clear()
+            fake.reset(latency=args.slow)
+            before = dict(knowledge_search._counters)
+            docs, seconds = await search(channel_id, "Qual a metragem do AP-4821?")
+            check(docs and docs[0]["content"] == CODE_CHUNK and seconds < args.timeout + 0.5
+                  and knowledge_search._counters["embed_timeouts"] == before["embed_timeouts"] + 1,
+                  f"API lenta ({args.slow}s): resposta só BM25 em {seconds:.2f}s (prazo {args.timeout}s)")
+            calls = fake.calls
+            docs, seconds = await search(channel_id, "tem vaga no AP-4821?")
+            check(docs and fake.calls == calls and seconds < 0.5,
+                  f"pausa de {knowledge_search.KNOWLEDGE_EMBED_COOLDOWN_SEC:.0f}s: próxima busca sem chamar a API ({seconds * 1000:.0f} ms)")
+            await asyncio.gather(*knowledge_search._tasks, return_exceptions=True)
+            knowledge_search._embedding["down_until"] = 0.0
+            fake.reset()
+            hybrid = knowledge_search._counters["hybrid"]
+            docs, _ = await search(channel_id, "Qual a metragem do AP-4821?")
+            check(fake.calls == 0 and knowledge_search._counters["hybrid"] == hybrid + 1,
+                  "vetor que chegou depois do prazo ficou no cache: busca híbrida sem nova chamada")
+
+            # 3. API fora do ar
+            query_embeddings.clear()
+            knowledge_search._embedding["down_until"] = 0.0
+            fake.reset(down=True)
+            lexical_only = knowledge_search._counters["lexical_only"]
+            try:
+                docs, seconds = await search(channel_id, "duas vagas no AP-4821?")
+                failed = False
+            except Exception as e:
+                print(f"   erro: {e}")
+                failed = True
+            check(not failed and docs and docs[0]["content"] == CODE_CHUNK
+                  and knowledge_search._counters["lexical_only"] == lexical_only + 1,
+                  f"API fora do ar: resposta só BM25 em {seconds:.2f}s, sem erro")
+            await asyncio.gather(*knowledge_search._tasks, return_exceptions=True)
+            knowledge_search._embedding["down_until"] = 0.0
+
+            # 4. Reenvio editado e remoção
+            fake.reset()
+            edited = [dict(c) for c in chunks]
+            position = next(i for i, c in enumerate(edited) if c["content"] == CODE_CHUNK)
+            edited[position]["content"] = CODE_CHUNK.replace("AP-4821", "CO-7730").replace("Apartamento", "Cobertura")
+            await upload(channel_id, edited)
+            docs, _ = await search(channel_id, "cobertura CO-7730")
+            old, _ = await search(channel_id, "AP-4821")
+            check(docs and "CO-7730" in docs[0]["content"] and not any("AP-4821" in d["content"] for d in old)
+                  and knowledge_search._indexes.get(channel_id) is lexical
+                  and set(lexical._positions) == await db_ids(channel_id),
+                  "reenvio editado: código novo encontrado, o antigo sumiu, sem remontar, igual ao banco")
+            # Remoção de metade do documento (passa da fração de compactação)
+            compactions = knowledge_search._counters["compactions"]
+            async with async_session() as db:
+                rows = (await db.execute(select(KnowledgeDocument).where(
+                    KnowledgeDocument.channel_id == channel_id, KnowledgeDocument.title == TITLE,
+                    KnowledgeDocument.chunk_index <= position))).scalars().all()
+                for row in rows:
+                    await db.delete(row)
+                knowledge_index.publish_changes(db, channel_id, removed=[row.id for row in rows])
+                await db.commit()
+            await settle()
+            docs, _ = await search(channel_id, "cobertura CO-7730")
+            check(not any("CO-7730" in d["content"] for d in docs)
+                  and knowledge_search._indexes.get(channel_id) is lexical and knowledge_search._counters["builds"] == builds
+                  and knowledge_search._counters["compactions"] > compactions
+                  and set(lexical._positions) == await db_ids(channel_id),
+                  f"remoção de {len(rows)} chunks: fora do índice lexical (compactado), sem remontar, igual ao banco")
+
+            # 5. Modo só vetorial
+            await upload(channel_id, chunks)
+            knowledge_search.KNOWLEDGE_SEARCH_MODE = "vector"
+            try:
+                fake.reset()
+                query = "apartamento com piscina e academia"
+                docs, _ = await search(channel_id, query)
+                expected = await knowledge_index.search(channel_id, fake_vector(query), 3)
+                check([round(d["score"], 5) for d in docs] == [round(s, 5) for _, s in expected],
+                      "KNOWLEDGE_SEARCH_MODE=vector: mesmos chunks e scores (cosseno) da busca vetorial")
+            finally:
+                knowledge_search.KNOWLEDGE_SEARCH_MODE = "hybrid"
+            print(f"📊 {knowledge_search.stats()}")
+        finally:
+            await cleanup(channel_id)
+            await settle()
+            await engine.dispose()
+
+    print("\n🎉 Busca híbrida OK" if ok else "\n⚠️ Busca híbrida falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste da busca híbrida (BM25 + vetorial) da base de conhecimento")
+    parser.add_argument("--chunks", type=int, default=300, help="Chunks do documento de teste")
+    parser.add_argument("--timeout", type=float, default=0.5, help="KNOWLEDGE_EMBED_TIMEOUT_SEC no teste (s)")
+    parser.add_argument("--slow", type=float, default=1.5, help="Latência da API falsa no cenário lento (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
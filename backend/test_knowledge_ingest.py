@@ -0,0 +1,226 @@
+"""
+Teste da ingestão da base de conhecimento (app/knowledge_ingest.py) contra uma API de
+embeddings falsa (FakeEmbeddings: servidor local compatível com POST /v1/embeddings, com
+latência e erros 429/500 injetados) e o Postgres de DATABASE_URL:
+  1. caminho antigo (um generate_embedding por chunk, em série) x lotes concorrentes:
+     chamadas à API e tempo;
+  2. com 429 e 500 injetados: todos os chunks gravados, cada vetor no chunk certo, na ordem;
+  3. job em segundo plano: progresso consultado até "done";
+  4. API fora do ar: job "failed" e nenhum chunk gravado.
+Falha (exit 1) se algo não bater. Os documentos e jobs de teste são apagados no final.
+
+Rode com: python -m app.migrate_knowledge_ingest && python test_knowledge_ingest.py
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_PORT = int(os.getenv("FAKE_EMBEDDINGS_PORT", "8799"))
+# O cliente da OpenAI é criado no import de app.ai_engine
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}/v1"
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("KNOWLEDGE_EMBED_BACKOFF_SEC", "0.05")
+
+from sqlalchemy import text  # noqa: E402
+
+from app import embedding_store, knowledge_ingest  # noqa: E402
+from app.ai_engine import generate_embedding  # noqa: E402
+from app.database import async_session, engine  # noqa: E402
+
+TITLE = "Teste ingestão"
+DIM = 1536
+
+
+def fake_vector(content: str) -> list[float]:
+    """Vetor determinístico do texto (o teste confere que cada chunk recebeu o seu)."""
+    seed = int.from_bytes(hashlib.sha256(content.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM, dtype=np.float32).tolist()
+
+
+class FakeEmbeddings:
+    """API de embeddings local: latência fixa por chamada e falhas a cada N chamadas."""
+
+    def __init__(self, port: int = FAKE_PORT):
+        self.port = port
+        self.latency = 0.0
+        self.fail_every = 0        # 0 = nunca; alterna 429 (com Retry-After) e 500
+        self.down = False
+        self.calls = 0
+        self.inputs = 0
+        self.failures = 0
+        self.app = FastAPI()
+        self.app.post("/v1/embeddings")(self.embeddings)
+        self._server = None
+        self._task = None
+
+    async def embeddings(self, request: Request):
+        body = await request.json()
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.latency)
+        if self.down or (self.fail_every and call % self.fail_every == 0):
+            self.failures += 1
+            if not self.down and self.failures % 2:
+                return JSONResponse({"error": {"message": "rate limited"}}, status_code=429, headers={"retry-after": "0.05"})
+            return JSONResponse({"error": {"message": "server error"}}, status_code=500)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.inputs += len(inputs)
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [{"object": "embedding", "index": i, "embedding": fake_vector(t)} for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def reset(self, latency: float = 0.0, fail_every: int = 0, down: bool = False):
+        self.latency, self.fail_every, self.down = latency, fail_every, down
+        self.calls = self.inputs = self.failures = 0
+
+    async def __aenter__(self):
+        config = uvicorn.Config(self.app, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.02)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.should_exit = True
+        await self._task
+
+
+def make_chunks(count: int, title: str = TITLE) -> list[dict]:
+    """Chunks no formato de split_into_chunks (~300 tokens cada), sem depender do tokenizador."""
+    return [
+        {
+            "title": title,
+            "content": f"Empreendimento {i}: apartamento de {2 + i % 3} quartos no bairro {i % 17}, "
+                       f"condomínio com piscina, academia e {i % 4 + 1} vagas. " * 12,
+            "chunk_index": i,
+            "token_count": 300,
+        }
+        for i in range(count)
+    ]
+
+
+async def stored_chunks(channel_id: int, title: str) -> list:
+    async with async_session() as db:
+        result = await db.execute(text("""
+            SELECT chunk_index, content, embedding_vec FROM knowledge_documents
+             WHERE channel_id = :c AND title = :t ORDER BY id
+        """), {"c": channel_id, "t": title})
+        return result.all()
+
+
+async def cleanup(channel_id: int):
+    async with async_session() as db:
+        await db.execute(text("DELETE FROM knowledge_documents WHERE channel_id = :c AND title LIKE :t"),
+                         {"c": channel_id, "t": f"{TITLE}%"})
+        await db.execute(text("DELETE FROM knowledge_ingest_jobs WHERE channel_id = :c AND title LIKE :t"),
+                         {"c": channel_id, "t": f"{TITLE}%"})
+        await db.commit()
+
+
+async def main(args) -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    async with async_session() as db:
+        channel_id = (await db.execute(text("SELECT min(id) FROM channels"))).scalar()
+    if channel_id is None:
+        print("⚠️ Nenhum canal no banco")
+        return False
+    chunks = make_chunks(args.chunks)
+    print(f"📄 Documento de teste: {len(chunks)} chunks, {sum(c['token_count'] for c in chunks)} tokens\n")
+
+    async with FakeEmbeddings() as fake:
+        try:
+            await cleanup(channel_id)
+
+            # 1. Antigo x lotes, mesma latência por chamada
+            fake.reset(latency=args.latency)
+            started = time.perf_counter()
+            for chunk in chunks:
+                await generate_embedding(chunk["content"])
+            serial_s, serial_calls = time.perf_counter() - started, fake.calls
+
+            fake.reset(latency=args.latency)
+            started = time.perf_counter()
+            async with async_session() as db:
+                ids = await knowledge_ingest.ingest(db, channel_id, chunks)
+                await db.commit()
+            batched_s, batched_calls = time.perf_counter() - started, fake.calls
+            print(f"⏱️ Em série: {serial_calls} chamadas, {serial_s:.2f}s | "
+                  f"em lotes: {batched_calls} chamadas, {batched_s:.2f}s ({serial_s / batched_s:.0f}x mais rápido)")
+            check(len(ids) == len(chunks), f"{len(ids)} chunks gravados num INSERT")
+            await cleanup(channel_id)
+
+            # 2. Com 429/500 no meio
+            fake.reset(latency=args.latency / 4, fail_every=2)
+            stats = {}
+            async with async_session() as db:
+                await knowledge_ingest.ingest(db, channel_id, chunks, stats=stats)
+                await db.commit()
+            rows = await stored_chunks(channel_id, TITLE)
+            check(len(rows) == len(chunks) and stats["retries"] == fake.failures > 0,
+                  f"{fake.failures} erros 429/500 recuperados com nova tentativa, {len(rows)} chunks gravados")
+            check([r.chunk_index for r in rows] == [c["chunk_index"] for c in chunks],
+                  "chunks gravados na ordem do documento")
+            check(all(np.array_equal(embedding_store.unpack(r.embedding_vec), np.float32(fake_vector(r.content))) for r in rows),
+                  "cada chunk recebeu o próprio embedding")
+            await cleanup(channel_id)
+
+            # 3. Job em segundo plano
+            fake.reset(latency=args.latency)
+            async with async_session() as db:
+                job = await knowledge_ingest.start_job(db, channel_id, TITLE, chunks)
+            seen = []
+            while True:
+                async with async_session() as db:
+                    status = (await knowledge_ingest.get_jobs(db, job_id=job.id))[0]
+                seen.append(status["embedded_chunks"])
+                if status["status"] != "running":
+                    break
+                await asyncio.sleep(0.05)
+            check(status["status"] == "done" and status["saved_chunks"] == len(chunks),
+                  f"job {job.id}: {status['status']}, {status['saved_chunks']}/{status['total_chunks']} chunks, "
+                  f"{len(set(seen))} valores de progresso observados")
+            check(seen == sorted(seen), "progresso só avança")
+            await cleanup(channel_id)
+
+            # 4. API fora do ar: nada gravado
+            fake.reset(down=True)
+            async with async_session() as db:
+                job = await knowledge_ingest.start_job(db, channel_id, TITLE + " falha", make_chunks(len(chunks), TITLE + " falha"))
+            await asyncio.wait_for(asyncio.gather(*knowledge_ingest._tasks), timeout=60)
+            async with async_session() as db:
+                status = (await knowledge_ingest.get_jobs(db, job_id=job.id))[0]
+            rows = await stored_chunks(channel_id, TITLE + " falha")
+            check(status["status"] == "failed" and not rows,
+                  f"API fora do ar: job {status['status']} depois de {status['api_calls']} chamadas, {len(rows)} chunks gravados")
+        finally:
+            await cleanup(channel_id)
+            await engine.dispose()
+
+    print("\n🎉 Ingestão OK" if ok else "\n⚠️ Ingestão falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste da ingestão em lotes da base de conhecimento")
+    parser.add_argument("--chunks", type=int, default=300, help="Chunks do documento de teste")
+    parser.add_argument("--latency", type=float, default=0.15, help="Latência da API falsa por chamada (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
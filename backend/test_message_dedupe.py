@@ -0,0 +1,137 @@
+"""
+Teste da deduplicação global das mensagens (tabela message_ids, app/ingestion.py) contra o
+Postgres de DATABASE_URL. A chave única de messages inclui o timestamp (particionamento);
+o mesmo id com outro horário não pode virar uma segunda linha:
+  1. mensagem enviada pelo CRM (POST /api/send/text, canal Evolution) e depois o eco fromMe
+     do webhook com o messageTimestamp do provedor;
+  2. o eco chegando antes da rota gravar;
+  3. reentrega de mensagem recebida sem messageTimestamp (cai em now()): a segunda não é
+     inserida nem devolvida (não aciona a IA de novo);
+  4. o mesmo id em duas transações ao mesmo tempo.
+O envio à Evolution é substituído por uma função local. Falha (exit 1) se algo não bater.
+Os dados de teste são apagados no final.
+
+Rode com: python -m app.migrate_message_ids && python test_message_dedupe.py
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import text
+
+import app.evolution.client as evolution_client
+from app import routes
+from app.database import async_session, engine
+from app.ingestion import IngestBatch, collect_evolution_messages
+
+WA_ID = "5500999990077"
+INSTANCE = "teste-dedupe"
+PREFIX = "dedupe-test-"
+
+
+def evolution_message(msg_id: str, from_me: bool, body: str, timestamp: int | None) -> dict:
+    message = {
+        "key": {"remoteJid": f"{WA_ID}@s.whatsapp.net", "fromMe": from_me, "id": msg_id},
+        "pushName": "Teste Dedupe",
+        "message": {"conversation": body},
+        "messageType": "conversation",
+    }
+    if timestamp is not None:
+        message["messageTimestamp"] = timestamp
+    return message
+
+
+async def webhook(channel_id: int, messages: list[dict]) -> list[dict]:
+    """Mesmo caminho do MESSAGES_UPSERT em app/evolution/routes.py."""
+    async with async_session() as db:
+        batch = IngestBatch()
+        collect_evolution_messages(messages, batch, channel_id)
+        inserted = await batch.flush(db)
+        await db.commit()
+    return inserted
+
+
+async def send_from_crm(channel_id: int, msg_id: str, body: str):
+    async def fake_send(instance_name, to, message):
+        return {"key": {"id": msg_id, "fromMe": True, "remoteJid": f"{to}@s.whatsapp.net"}}
+
+    original = evolution_client.send_text
+    evolution_client.send_text = fake_send
+    try:
+        async with async_session() as db:
+            await routes.send_text(routes.SendTextRequest(to=WA_ID, text=body, channel_id=channel_id), db)
+    finally:
+        evolution_client.send_text = original
+
+
+async def rows(msg_id: str) -> int:
+    async with async_session() as db:
+        result = await db.execute(text("SELECT count(*) FROM messages WHERE wa_message_id = :id"), {"id": msg_id})
+        return result.scalar()
+
+
+async def cleanup():
+    async with async_session() as db:
+        await db.execute(text("DELETE FROM messages WHERE contact_wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM message_ids WHERE wa_message_id LIKE :p"), {"p": f"{PREFIX}%"})
+        await db.execute(text("DELETE FROM conversation_state WHERE wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM contacts WHERE wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM channels WHERE instance_name = :i"), {"i": INSTANCE})
+        await db.commit()
+
+
+async def main() -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    try:
+        await cleanup()
+        async with async_session() as db:
+            channel_id = (await db.execute(text("""
+                INSERT INTO channels (name, provider, instance_name, is_active)
+                VALUES ('Teste dedupe', 'evolution', :i, true) RETURNING id
+            """), {"i": INSTANCE})).scalar()
+            await db.commit()
+        now = int(time.time())
+
+        # 1. Enviada pelo CRM, depois o eco do webhook (horário do provedor ≠ horário gravado)
+        sent = f"{PREFIX}sent"
+        await send_from_crm(channel_id, sent, "Olá, tudo bem?")
+        echo = await webhook(channel_id, [evolution_message(sent, True, "Olá, tudo bem?", now + 2)])
+        check(await rows(sent) == 1 and not echo, f"envio pelo CRM + eco fromMe: {await rows(sent)} linha")
+
+        # 2. Eco antes da rota gravar
+        early = f"{PREFIX}early"
+        await webhook(channel_id, [evolution_message(early, True, "Segue o endereço", now + 5)])
+        await send_from_crm(channel_id, early, "Segue o endereço")
+        check(await rows(early) == 1, f"eco antes da rota: {await rows(early)} linha")
+
+        # 3. Reentrega sem messageTimestamp
+        inbound = f"{PREFIX}inbound"
+        first = await webhook(channel_id, [evolution_message(inbound, False, "Quero visitar", None)])
+        await asyncio.sleep(1.1)
+        again = await webhook(channel_id, [evolution_message(inbound, False, "Quero visitar", None)])
+        check(await rows(inbound) == 1 and len(first) == 1 and not again,
+              f"reentrega sem timestamp: {await rows(inbound)} linha, segunda entrega não devolvida para a IA")
+
+        # 4. Mesmo id em duas transações simultâneas, com horários diferentes
+        racing = f"{PREFIX}race"
+        results = await asyncio.gather(*(
+            webhook(channel_id, [evolution_message(racing, False, "Oi", now + offset)]) for offset in (0, 7)
+        ))
+        check(await rows(racing) == 1 and sum(len(r) for r in results) == 1,
+              f"mesmo id em duas transações: {await rows(racing)} linha")
+    finally:
+        await cleanup()
+        await engine.dispose()
+
+    print("\n🎉 Deduplicação de mensagens OK" if ok else "\n⚠️ Deduplicação de mensagens falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
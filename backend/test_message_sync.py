@@ -0,0 +1,113 @@
+"""
+Teste da sincronização do histórico (GET /api/contacts/{wa_id}/messages) contra o Postgres
+de DATABASE_URL:
+  1. commit fora de ordem: a mensagem de id menor commita depois que o cliente já sincronizou
+     a de id maior; a sincronização seguinte (after_id + since) devolve a que faltava;
+  2. reentrega atrasada (id novo, horário antigo) aparece no lugar em que foi enviada, na
+     primeira página e ao rolar para trás com before_id.
+A rota é chamada direto (sem HTTP). Falha (exit 1) se algo não bater. Os dados de teste são
+apagados no final.
+
+Rode com: python test_message_sync.py
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from fastapi import Response
+from sqlalchemy import text
+
+from app import routes
+from app.database import async_session, engine
+from app.models import Message
+
+WA_ID = "5500999990066"
+PREFIX = "sync-test-"
+
+
+def message(name: str, timestamp: datetime) -> Message:
+    return Message(
+        wa_message_id=f"{PREFIX}{name}", contact_wa_id=WA_ID, direction="inbound",
+        message_type="text", content=name, timestamp=timestamp, status="received",
+    )
+
+
+async def history(**params) -> tuple[object, str | None]:
+    response = Response()
+    async with async_session() as db:
+        body = await routes.get_messages(WA_ID, response, **{"limit": 100, "before_id": None,
+                                                             "after_id": None, "since": None, **params}, db=db)
+    return body, response.headers.get("X-Sync-Token")
+
+
+async def cleanup():
+    async with async_session() as db:
+        await db.execute(text("DELETE FROM messages WHERE contact_wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM message_ids WHERE wa_message_id LIKE :p"), {"p": f"{PREFIX}%"})
+        await db.execute(text("DELETE FROM contacts WHERE wa_id = :wa"), {"wa": WA_ID})
+        await db.commit()
+
+
+async def main() -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    slow = None
+    try:
+        await cleanup()
+        now = datetime.utcnow().replace(microsecond=0)
+        async with async_session() as db:
+            await db.execute(text("INSERT INTO contacts (wa_id, name) VALUES (:wa, 'Teste Sync')"), {"wa": WA_ID})
+            db.add(message("antiga", now - timedelta(hours=3)))
+            await db.commit()
+        page, token = await history()
+        after_id = max(m["id"] for m in page)
+
+        # 1. Commit fora de ordem
+        # Horas diferentes: os rollups de app/metrics.py (por hora) não serializam as duas transações
+        slow = async_session()
+        late = message("lenta", now - timedelta(hours=2))
+        slow.add(late)
+        await slow.flush()  # id sai da sequência aqui; o commit vem depois
+        async with async_session() as db:
+            fast = message("rapida", now - timedelta(seconds=1))
+            db.add(fast)
+            await db.commit()
+        delta, _ = await history(after_id=after_id, since=token)
+        seen = [m["content"] for m in delta["messages"]]
+        after_id = max([after_id, *(m["id"] for m in delta["messages"])])
+        token = delta["sync_token"] or token
+        await slow.commit()
+        # A folga repete as recentes que o cliente já tem (ele ignora pelo id)
+        check(late.id < fast.id and "rapida" in seen and "lenta" not in seen, f"antes do commit lento: delta = {seen} (id {late.id} < {fast.id})")
+        delta, _ = await history(after_id=after_id, since=token)
+        seen = [m["content"] for m in delta["messages"]]
+        check("lenta" in seen, f"depois do commit lento: delta = {seen} (after_id {after_id})")
+
+        # 2. Reentrega atrasada: id maior, horário entre as antigas
+        async with async_session() as db:
+            db.add(message("atrasada", now - timedelta(hours=2, minutes=30)))
+            await db.commit()
+        page, _ = await history()
+        order = [m["content"] for m in page]
+        check(order == ["antiga", "atrasada", "lenta", "rapida"], f"primeira página na ordem de envio: {order}")
+        page, _ = await history(limit=2)
+        older, _ = await history(limit=2, before_id=page[0]["id"])
+        order = [m["content"] for m in older + page]
+        check(order == ["antiga", "atrasada", "lenta", "rapida"], f"rolando para trás com before_id: {order}")
+    finally:
+        if slow is not None:
+            await slow.close()
+        await cleanup()
+        await engine.dispose()
+
+    print("\n🎉 Sincronização do histórico OK" if ok else "\n⚠️ Sincronização do histórico falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
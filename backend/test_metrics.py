@@ -0,0 +1,312 @@
+"""
+Teste dos rollups dos dashboards (app/metrics.py).
+Cria um schema temporário com os triggers, grava como a aplicação grava (mensagens em
+lotes, contatos novos, mudança de status e de corretor, envios de LP, ligações da IA que
+mudam de status/resultado, uma transação desfeita) e confere:
+  1. cada rollup bate com a mesma agregação feita direto nas tabelas de origem;
+  2. a reconstrução (python -m app.metrics rebuild) é idempotente e chega no mesmo resultado;
+  3. os dashboards (stats/advanced) respondem lendo só os rollups.
+Falha (exit 1) se algum número divergir.
+
+Rode com: python test_metrics.py
+          python test_metrics.py --messages 500000 --keep   # massa maior, mantém o schema
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import DATABASE_URL, Base
+import app.models  # noqa: F401 — registra as tabelas
+import app.voice_ai.models  # noqa: F401
+import app.metrics  # noqa: F401 — triggers no create_all
+from app import dashboard
+from app.metrics import ROLLUP_TABLES, rebuild
+from app.partitions import ensure_partitions
+
+SCHEMA = "metrics_check"
+NOW = datetime.now().replace(microsecond=0)
+CONVERSIONS = 37
+
+# (rollup, agregação equivalente nas tabelas de origem); as duas com as mesmas colunas
+CHECKS = [
+    ("Mensagens por canal/hora", """
+        SELECT channel_id, hour, inbound, outbound FROM metrics_channel_hourly
+         WHERE inbound + outbound > 0
+    """, """
+        SELECT coalesce(channel_id, 0), date_trunc('hour', timestamp),
+               count(*) FILTER (WHERE direction = 'inbound'), count(*) FILTER (WHERE direction = 'outbound')
+          FROM messages GROUP BY 1, 2
+    """),
+    ("Mensagens por corretor/hora", """
+        SELECT agent_id, channel_id, hour, inbound, outbound FROM metrics_agent_hourly
+         WHERE inbound + outbound > 0
+    """, """
+        SELECT c.assigned_to, coalesce(m.channel_id, 0), date_trunc('hour', m.timestamp),
+               count(*) FILTER (WHERE m.direction = 'inbound'), count(*) FILTER (WHERE m.direction = 'outbound')
+          FROM messages m JOIN contacts c ON c.wa_id = m.contact_wa_id
+         WHERE c.assigned_to IS NOT NULL GROUP BY 1, 2, 3
+    """),
+    ("Novos contatos por canal/hora", """
+        SELECT channel_id, hour, new_contacts FROM metrics_channel_hourly WHERE new_contacts > 0
+    """, """
+        SELECT coalesce(channel_id, 0), date_trunc('hour', created_at), count(*) FROM contacts GROUP BY 1, 2
+    """),
+    ("Contatos por canal/corretor/status/origem", """
+        SELECT channel_id, agent_id, lead_status, from_landing, contacts FROM metrics_contact_counts WHERE contacts <> 0
+    """, """
+        SELECT coalesce(channel_id, 0), coalesce(assigned_to, 0), coalesce(nullif(lead_status, ''), 'novo'),
+               EXISTS (SELECT 1 FROM form_submissions f WHERE f.phone = c.wa_id), count(*)
+          FROM contacts c GROUP BY 1, 2, 3, 4
+    """),
+    ("Envios de LP por hora/página/origem/campanha", """
+        SELECT hour, landing_page_id, utm_source, utm_campaign, submissions FROM metrics_forms_hourly
+    """, """
+        SELECT date_trunc('hour', created_at), landing_page_id, coalesce(utm_source, ''), coalesce(utm_campaign, ''), count(*)
+          FROM form_submissions GROUP BY 1, 2, 3, 4
+    """),
+    ("Envios de LP por canal/hora", """
+        SELECT channel_id, hour, form_submissions FROM metrics_channel_hourly WHERE form_submissions > 0
+    """, """
+        SELECT channel_id, date_trunc('hour', created_at), count(*) FROM form_submissions GROUP BY 1, 2
+    """),
+    ("Ligações da IA por hora/resultado/curso", """
+        SELECT hour, outcome, course, calls, completed, score_sum, score_count,
+               latency_sum, latency_count, duration_sum, duration_count
+          FROM metrics_ai_calls_hourly WHERE calls <> 0
+    """, """
+        SELECT date_trunc('hour', created_at), coalesce(outcome, ''), coalesce(course, ''),
+               count(*), count(*) FILTER (WHERE status = 'completed'),
+               coalesce(sum(score) FILTER (WHERE score > 0), 0), count(*) FILTER (WHERE score > 0),
+               coalesce(sum(avg_latency_ms) FILTER (WHERE avg_latency_ms > 0), 0), count(*) FILTER (WHERE avg_latency_ms > 0),
+               coalesce(sum(duration_seconds) FILTER (WHERE duration_seconds > 0), 0), count(*) FILTER (WHERE duration_seconds > 0)
+          FROM ai_calls GROUP BY 1, 2, 3
+    """),
+    ("Conversões", f"""
+        SELECT sum(conversions) FROM metrics_channel_hourly
+    """, f"""
+        SELECT {CONVERSIONS}::bigint
+    """),
+]
+
+
+async def seed(engine, messages: int, contacts: int):
+    """Grava em várias transações, como a aplicação: o que os triggers contam é o que importa."""
+    params = {"now": NOW, "messages": messages, "contacts": contacts}
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO channels (id, name) SELECT g, 'Canal ' || g FROM generate_series(1, 4) g"))
+        await conn.execute(text("""
+            INSERT INTO users (id, name, email, password_hash, role, is_active)
+            SELECT g, 'Corretor ' || g, 'corretor' || g || '@teste.com', 'x', 'atendente', true
+              FROM generate_series(1, 20) g
+        """))
+        await conn.execute(text("""
+            INSERT INTO landing_pages (id, channel_id, slug, title, template, config)
+            SELECT g, 1 + g % 4, 'lp-' || g, 'LP ' || g, 'imovel', '{}' FROM generate_series(1, 5) g
+        """))
+        # Envios antes dos contatos (metade dos telefones) e depois (outra parte, mais abaixo)
+        await conn.execute(text("""
+            INSERT INTO form_submissions (landing_page_id, channel_id, name, phone, utm_source, utm_campaign, created_at)
+            SELECT 1 + g % 5, 1 + (1 + g % 5) % 4, 'Lead', '55119' || lpad((g * 2)::text, 8, '0'),
+                   (ARRAY['google', 'facebook', NULL, ''])[1 + g % 4], (ARRAY['verao', NULL])[1 + g % 2],
+                   CAST(:now AS timestamp) - make_interval(mins => (g * 53) % (60 * 24 * 60))
+              FROM generate_series(1, :contacts / 4) g
+        """), params)
+        await conn.execute(text("""
+            INSERT INTO contacts (wa_id, name, channel_id, assigned_to, lead_status, created_at, updated_at)
+            SELECT '55119' || lpad(g::text, 8, '0'), 'Lead ' || g,
+                   CASE WHEN g % 50 = 0 THEN NULL ELSE 1 + g % 4 END,
+                   CASE WHEN g % 3 = 0 THEN NULL ELSE 1 + g % 20 END,
+                   (ARRAY['novo', 'em_contato', 'qualificado', '', NULL])[1 + g % 5],
+                   CAST(:now AS timestamp) - make_interval(mins => (g * 37) % (60 * 24 * 60)),
+                   CAST(:now AS timestamp)
+              FROM generate_series(1, :contacts) g
+        """), params)
+
+    # Mudança de corretor e de status (conversões), linha a linha como nas rotas
+    async with engine.begin() as conn:
+        await conn.execute(text("UPDATE contacts SET assigned_to = 1 + (id % 7) WHERE id % 11 = 0"))
+        await conn.execute(text("UPDATE contacts SET channel_id = 2 WHERE id % 13 = 0"))
+        await conn.execute(text(f"""
+            UPDATE contacts SET lead_status = 'convertido'
+             WHERE id IN (SELECT id FROM contacts WHERE lead_status IS DISTINCT FROM 'convertido'
+                           ORDER BY id LIMIT {CONVERSIONS})
+        """))
+        # Voltar de convertido não desconta; converter de novo conta de novo (não deve acontecer aqui)
+        await conn.execute(text("UPDATE contacts SET lead_status = 'convertido' WHERE lead_status = 'convertido'"))
+
+    # Mensagens em lotes (a ingestão insere várias por comando); lote repetido é ignorado
+    batch = max(messages // 20, 1)
+    for offset in range(0, messages, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text("""
+                INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type,
+                                      content, timestamp, status, sent_by_ai)
+                SELECT 'wamid.' || g,
+                       '55119' || lpad((1 + g % :contacts)::text, 8, '0'),
+                       CASE WHEN g % 97 = 0 THEN NULL ELSE 1 + (1 + g % :contacts) % 4 END,
+                       CASE WHEN g % 2 = 0 THEN 'inbound' ELSE 'outbound' END,
+                       'text', 'mensagem ' || g,
+                       CAST(:now AS timestamp) - make_interval(secs => (:messages - g) * (60 * 86400.0 / :messages)),
+                       'read', false
+                  FROM generate_series(CAST(:first AS int), CAST(:last AS int)) g
+                ON CONFLICT DO NOTHING
+            """), {**params, "first": offset + 1, "last": min(offset + batch, messages)})
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type, content, timestamp, status)
+            SELECT wa_message_id, contact_wa_id, channel_id, direction, message_type, content, timestamp, status
+              FROM messages ORDER BY id LIMIT 100
+            ON CONFLICT DO NOTHING
+        """))
+
+    # Envios de LP de contatos que já existem (passam a contar como vindos de LP)
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            INSERT INTO form_submissions (landing_page_id, channel_id, name, phone, utm_source, created_at)
+            SELECT 1 + g % 5, 1, 'Lead', '55119' || lpad((g * 3)::text, 8, '0'), 'instagram',
+                   CAST(:now AS timestamp) - make_interval(hours => g % 48)
+              FROM generate_series(1, :contacts / 10) g
+        """), params)
+
+    # Ligações: criadas como pending e depois atualizadas pelo pipeline (status, resultado, nota)
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            INSERT INTO ai_calls (from_number, to_number, source, course, status, created_at)
+            SELECT '5511000000000', '5511999999999', 'elevenlabs',
+                   (ARRAY['MBA', 'Direito', NULL])[1 + g % 3], 'pending',
+                   CAST(:now AS timestamp) - make_interval(mins => (g * 17) % (30 * 24 * 60))
+              FROM generate_series(1, :contacts / 2) g
+        """), params)
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            UPDATE ai_calls SET status = CASE WHEN id % 4 = 0 THEN 'no_answer' ELSE 'completed' END,
+                   outcome = (ARRAY['qualified', 'scheduled', 'not_qualified', 'no_answer'])[1 + id % 4],
+                   score = CASE WHEN id % 4 = 0 THEN 0 ELSE id % 100 END,
+                   avg_latency_ms = 400 + id % 300, duration_seconds = id % 600
+        """))
+        await conn.execute(text("UPDATE ai_calls SET outcome = 'scheduled', score = 90 WHERE id % 10 = 1"))
+        await conn.execute(text("DELETE FROM ai_calls WHERE id % 50 = 0"))
+
+    # Transação desfeita não pode deixar rastro nos rollups
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        await conn.execute(text("""
+            INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type, content, timestamp, status)
+            VALUES ('wamid.rollback', '5511900000001', 1, 'inbound', 'text', 'x', CAST(:now AS timestamp), 'received')
+        """), params)
+        await conn.execute(text("UPDATE contacts SET lead_status = 'convertido' WHERE id = 2"))
+        await trans.rollback()
+
+
+async def compare(conn) -> bool:
+    ok = True
+    for description, rollup_sql, source_sql in CHECKS:
+        rollup = sorted(tuple(r) for r in (await conn.execute(text(rollup_sql))).all())
+        source = sorted(tuple(r) for r in (await conn.execute(text(source_sql))).all())
+        if rollup == source:
+            print(f"✅ {description}: {len(rollup)} linhas iguais")
+        else:
+            ok = False
+            diff = set(rollup) ^ set(source)
+            print(f"❌ {description}: {len(diff)} linhas diferentes, ex.: {sorted(diff)[:3]}")
+    return ok
+
+
+# Colunas de chave de cada rollup (linhas com todos os contadores zerados não contam)
+KEY_COLUMNS = {
+    "metrics_channel_hourly": 2,
+    "metrics_agent_hourly": 3,
+    "metrics_ai_calls_hourly": 3,
+    "metrics_forms_hourly": 4,
+    "metrics_contact_counts": 4,
+}
+
+
+async def snapshot(conn) -> dict:
+    tables = {}
+    for table in ROLLUP_TABLES:
+        rows = (await conn.execute(text(f"SELECT * FROM {table}"))).all()
+        tables[table] = sorted(tuple(r) for r in rows if any(r[KEY_COLUMNS[table]:]))
+    return tables
+
+
+async def main(args) -> bool:
+    engine = create_async_engine(
+        DATABASE_URL, connect_args={"server_settings": {"search_path": SCHEMA}},
+    )
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_partitions(conn, start=(NOW - timedelta(days=60)).date())
+
+    print(f"🌱 Gravando {args.messages} mensagens e {args.contacts} contatos com os triggers ligados...")
+    started = time.perf_counter()
+    await seed(engine, args.messages, args.contacts)
+    print(f"   {time.perf_counter() - started:.1f}s\n")
+
+    async with engine.connect() as conn:
+        print("1. Rollups mantidos pelos triggers x tabelas de origem")
+        ok = await compare(conn)
+        before = await snapshot(conn)
+
+    print("\n2. Reconstrução")
+    for run in (1, 2):
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await rebuild(conn)
+        async with engine.connect() as conn:
+            same = await snapshot(conn) == before
+        elapsed = time.perf_counter() - started
+        if same:
+            print(f"✅ rebuild #{run}: mesmo resultado dos triggers ({elapsed:.1f}s)")
+        else:
+            ok = False
+            print(f"❌ rebuild #{run}: resultado diferente dos triggers")
+    async with engine.begin() as conn:
+        await rebuild(conn, NOW - timedelta(days=3))
+    async with engine.connect() as conn:
+        if await snapshot(conn) == before:
+            print("✅ rebuild --since: mesmo resultado")
+        else:
+            ok = False
+            print("❌ rebuild --since: resultado diferente")
+
+    print("\n3. Dashboards lendo os rollups")
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as db:
+        start, end = dashboard.period(None, None, 30)
+        for name, func in (("stats", dashboard.stats), ("advanced", dashboard.advanced)):
+            started = time.perf_counter()
+            result = await func(db, None, start, end)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"⏱️  dashboard.{name}: {elapsed:.0f} ms")
+        if result["converted"] != CONVERSIONS:
+            ok = False
+            print(f"❌ advanced.converted = {result['converted']} (esperado {CONVERSIONS})")
+
+    if not args.keep:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await engine.dispose()
+
+    print("\n🎉 Rollups consistentes" if ok else "\n⚠️ Rollups divergentes")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consistência dos rollups dos dashboards")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--keep", action="store_true", help="Não apaga o schema de teste no final")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
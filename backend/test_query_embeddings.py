@@ -0,0 +1,179 @@
+"""
+Teste do cache de embeddings das perguntas do RAG (app/query_embeddings.py), contra a API
+de embeddings falsa de test_knowledge_ingest.py e o Postgres de DATABASE_URL:
+  1. variações de caixa, espaço e pontuação ("Qual o valor??", "qual o  valor") = uma chamada;
+  2. fluxo de mensagens com perguntas recorrentes (distribuição de Zipf): chamadas à API,
+     hit ratio e latência com e sem cache;
+  3. a mesma pergunta chegando junto: uma chamada só; limite de entradas respeitado;
+  4. tabela persistente: outro worker (memória vazia) lê da tabela, sem chamar a API;
+  5. aquecimento com as mensagens recebidas mais frequentes do histórico.
+Falha (exit 1) se algo não bater. As mensagens, o contato e as linhas de teste são apagados
+no final.
+
+Rode com: python -m app.migrate_query_embeddings && python test_query_embeddings.py
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Antes do app: aponta o cliente da OpenAI para a API falsa
+from test_knowledge_ingest import FakeEmbeddings, fake_vector
+
+from sqlalchemy import text  # noqa: E402
+
+from app import knowledge_ingest, query_embeddings  # noqa: E402
+from app.ai_engine import embed_query, generate_embedding  # noqa: E402
+from app.database import async_session, engine  # noqa: E402
+
+TEST_MODEL = "modelo-teste-cache"
+WA_ID = "5500000000999"
+QUESTIONS = [
+    "qual o valor", "onde fica", "aceita financiamento", "tem vaga de garagem", "qual a metragem",
+    "aceita pet", "quando fica pronto", "tem área de lazer", "qual o valor do condomínio", "posso visitar",
+] + [f"o apartamento {i} ainda está disponível" for i in range(40)]
+
+
+def variant(question: str, rng: random.Random) -> str:
+    """Como a pergunta chega no WhatsApp: caixa, espaços e pontuação variando."""
+    message = question.capitalize() if rng.random() < 0.5 else question
+    message = message.replace(" ", "  ", 1) if rng.random() < 0.2 else message
+    return message + rng.choice(["?", "??", "", " ?", "!"])
+
+
+async def cleanup():
+    async with async_session() as db:
+        await db.execute(text("DELETE FROM messages WHERE contact_wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM contacts WHERE wa_id = :wa"), {"wa": WA_ID})
+        await db.execute(text("DELETE FROM query_embeddings WHERE model = :m"), {"m": TEST_MODEL})
+        await db.commit()
+
+
+async def main(args) -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    rng = random.Random(11)
+    async with FakeEmbeddings() as fake:
+        try:
+            await cleanup()
+
+            # 1. Normalização
+            fake.reset(latency=args.latency)
+            query_embeddings.clear()
+            vectors = [await embed_query(q) for q in ("Qual o valor??", "qual o  valor", "QUAL O VALOR", " qual o valor ?")]
+            check(fake.calls == 1 and all(np.array_equal(v, vectors[0]) for v in vectors)
+                  and np.array_equal(vectors[0], np.float32(fake_vector("qual o valor"))),
+                  f"4 variações da mesma pergunta: {fake.calls} chamada à API, mesmo vetor")
+
+            # 2. Fluxo com perguntas recorrentes
+            weights = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+            stream = [variant(q, rng) for q in rng.choices(QUESTIONS, weights, k=args.messages)]
+            fake.reset(latency=args.latency)
+            started = time.perf_counter()
+            for message in stream[:args.old_messages]:
+                await generate_embedding(message)
+            old_ms = (time.perf_counter() - started) * 1000 / args.old_messages
+
+            fake.reset(latency=args.latency)
+            query_embeddings.clear()
+            before = query_embeddings.stats()
+            latencies = []
+            for message in stream:
+                started = time.perf_counter()
+                await embed_query(message)
+                latencies.append((time.perf_counter() - started) * 1000)
+            after = query_embeddings.stats()
+            lookups = args.messages
+            hits = after["hits"] - before["hits"]
+            print(f"⏱️ {lookups} mensagens: sem cache {lookups} chamadas (~{old_ms:.0f} ms cada) | "
+                  f"com cache {fake.calls} chamadas, hit ratio {hits / lookups:.0%}, "
+                  f"p50 {statistics.median(latencies):.2f} ms")
+            check(fake.calls == len(set(query_embeddings.normalize_query(m) for m in stream)),
+                  f"uma chamada por pergunta distinta ({fake.calls}), hit ratio nas métricas: {after['hit_ratio']}")
+
+            # 3. Single-flight e limite de entradas
+            fake.reset(latency=args.latency)
+            query_embeddings.clear()
+            results = await asyncio.gather(*(embed_query("Tem portaria 24h?") for _ in range(20)))
+            check(fake.calls == 1 and all(r is results[0] for r in results),
+                  f"20 buscas simultâneas da mesma pergunta: {fake.calls} chamada")
+            limit = query_embeddings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES
+            query_embeddings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES = 10
+            try:
+                fake.reset()
+                for i in range(30):
+                    await embed_query(f"pergunta {i}")
+                check(len(query_embeddings._entries) == 10, f"limite de 10 entradas: {len(query_embeddings._entries)} em memória")
+            finally:
+                query_embeddings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES = limit
+
+            # 4. Tabela persistente
+            query_embeddings.QUERY_EMBEDDING_CACHE_PERSIST = True
+            try:
+                fake.reset()
+                query_embeddings.clear()
+                first = await query_embeddings.get("Onde fica o decorado?", TEST_MODEL, generate_embedding)
+                query_embeddings.clear()  # outro worker / reinício
+                before = query_embeddings.stats()["table_hits"]
+                second = await query_embeddings.get("onde fica o decorado", TEST_MODEL, generate_embedding)
+                check(fake.calls == 1 and query_embeddings.stats()["table_hits"] == before + 1 and np.array_equal(first, second),
+                      "memória vazia: vetor lido da tabela query_embeddings, sem chamar a API")
+
+                # 5. Aquecimento com o histórico
+                async with async_session() as db:
+                    channel_id = (await db.execute(text("SELECT min(id) FROM channels"))).scalar()
+                    await db.execute(text("INSERT INTO contacts (wa_id, name, channel_id) VALUES (:wa, 'Teste cache', :c)"),
+                                     {"wa": WA_ID, "c": channel_id})
+                    now = datetime.now()
+                    rows = [
+                        {"wa_message_id": f"qcache-{q}-{i}", "content": variant(q, rng), "ts": now}
+                        for rank, q in enumerate(QUESTIONS[:5]) for i in range(200 - rank * 30)
+                    ]
+                    await db.execute(text("""
+                        INSERT INTO messages (wa_message_id, contact_wa_id, channel_id, direction, message_type, content, timestamp, status)
+                        VALUES (:wa_message_id, :wa, :c, 'inbound', 'text', :content, :ts, 'read')
+                    """), [{**r, "wa": WA_ID, "c": channel_id} for r in rows])
+                    await db.commit()
+                frequent = await query_embeddings.frequent_queries(10, 1)
+                check(set(QUESTIONS[:5]) <= set(frequent),
+                      f"perguntas mais frequentes do histórico (variações somadas): {frequent[:5]}")
+
+                fake.reset()
+                query_embeddings.clear()
+                warmed = await query_embeddings.warm(knowledge_ingest.embed_texts, TEST_MODEL, limit=10, days=1)
+                query_embeddings.clear()
+                again = await query_embeddings.warm(knowledge_ingest.embed_texts, TEST_MODEL, limit=10, days=1)
+                check(warmed["embedded"] == len(frequent) and fake.calls == 1 and again["from_table"] == len(frequent),
+                      f"aquecimento: {warmed['embedded']} perguntas em {fake.calls} chamada; "
+                      f"segundo worker: {again['from_table']} da tabela")
+                fake.reset()
+                await asyncio.gather(*(query_embeddings.get(variant(q, rng), TEST_MODEL, generate_embedding) for q in QUESTIONS[:5]))
+                check(fake.calls == 0, "depois do aquecimento as perguntas frequentes não chamam a API")
+            finally:
+                query_embeddings.QUERY_EMBEDDING_CACHE_PERSIST = False
+            print(f"📊 {query_embeddings.stats()}")
+        finally:
+            await cleanup()
+            await engine.dispose()
+
+    print("\n🎉 Cache de embeddings OK" if ok else "\n⚠️ Cache de embeddings falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste do cache de embeddings das perguntas do RAG")
+    parser.add_argument("--messages", type=int, default=2000, help="Mensagens no fluxo simulado")
+    parser.add_argument("--old-messages", type=int, default=50, help="Mensagens no caminho sem cache")
+    parser.add_argument("--latency", type=float, default=0.15, help="Latência da API falsa por chamada (s)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
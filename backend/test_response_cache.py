@@ -0,0 +1,206 @@
+"""
+Teste do cache de respostas (app/response_cache.py) com dois workers.
+Sobe dois processos do app (uvicorn app.main:app) com EVENT_BUS_ENABLED=true contra o
+Postgres de DATABASE_URL e confere:
+  1. single-flight: N requisições simultâneas do mesmo dashboard no worker A calculam uma vez;
+  2. cache: a requisição seguinte é hit e devolve a mesma resposta;
+  3. invalidação entre workers: criar/apagar imóvel no worker A muda property_stats no
+     worker B antes do TTL (60s);
+  4. parâmetros diferentes (canal) são chaves diferentes;
+  5. mensagens chegando pelo webhook (worker A) enquanto os dashboards são lidos nos dois
+     workers: nenhuma invalidação, os dashboards seguem servidos do cache (taxa de acerto);
+     mudar o status do contato invalida o dashboard avançado no worker B antes do TTL.
+Falha (exit 1) se algo não bater. O imóvel, o canal e o contato de teste são apagados no final.
+
+Rode com: python -m app.migrate_metrics && python test_response_cache.py
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.database import async_session, engine
+from test_event_bus import wait_ready
+
+TITLE = "Imóvel teste cache"
+INSTANCE = "teste-cache"
+WA_ID = "5500999990088"
+
+
+def start_worker(port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "EVENT_BUS_ENABLED": "true",
+        "EVENT_BUS_PING_SEC": "1",
+        "WEBHOOK_QUEUE_ENABLED": "false",
+        "RESPONSE_CACHE_TTLS": "dashboard_stats=30,dashboard_advanced=60",
+        "GOOGLE_MAPS_API_KEY": "",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+
+
+async def cache_stats(client: httpx.AsyncClient, url: str) -> dict:
+    return (await client.get(f"{url}/api/cache/stats")).json()
+
+
+async def wait_total(client: httpx.AsyncClient, url: str, expected: int, timeout: float) -> float | None:
+    """Espera property_stats do worker refletir `expected`; devolve o tempo (ms) ou None."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        r = await client.get(f"{url}/api/properties/stats/summary")
+        if r.json()["total"] == expected:
+            return (time.perf_counter() - started) * 1000
+        await asyncio.sleep(0.05)
+    return None
+
+
+def webhook_message(index: int) -> dict:
+    return {
+        "event": "messages.upsert",
+        "data": {
+            "key": {"remoteJid": f"{WA_ID}@s.whatsapp.net", "fromMe": False, "id": f"cache-test-{time.time_ns()}-{index}"},
+            "pushName": "Teste Cache",
+            "message": {"conversation": f"Mensagem {index}"},
+            "messageType": "conversation",
+            "messageTimestamp": int(time.time()),
+        },
+    }
+
+
+async def main(args) -> bool:
+    url_a, url_b = f"http://127.0.0.1:{args.port}", f"http://127.0.0.1:{args.port + 1}"
+    workers = [start_worker(args.port), start_worker(args.port + 1)]
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    async with async_session() as db:
+        await db.execute(text("""
+            INSERT INTO channels (name, provider, instance_name, is_active)
+            VALUES ('Teste cache', 'evolution', :i, true)
+        """), {"i": INSTANCE})
+        await db.commit()
+
+    try:
+        async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=args.concurrency + 5)) as client:
+            await wait_ready(client, url_a)
+            await wait_ready(client, url_b)
+
+            # 1 e 2. Rajada no mesmo dashboard
+            before = await cache_stats(client, url_a)
+            responses = await asyncio.gather(*(
+                client.get(f"{url_a}/api/dashboard/stats") for _ in range(args.concurrency)
+            ))
+            after = await cache_stats(client, url_a)
+            computed = after["misses"] - before["misses"]
+            check(all(r.status_code == 200 for r in responses), f"{args.concurrency} requisições simultâneas responderam 200")
+            check(computed == 1, f"dashboard calculado {computed}x para {args.concurrency} requisições "
+                                 f"({after['coalesced'] - before['coalesced']} coalescidas)")
+            check(len({r.text for r in responses}) == 1, "todas receberam a mesma resposta")
+            again = await client.get(f"{url_a}/api/dashboard/stats")
+            hits = (await cache_stats(client, url_a))["hits"] - after["hits"]
+            check(hits == 1 and again.text == responses[0].text, "requisição seguinte servida do cache")
+
+            # 4. Outro canal = outra chave
+            before = await cache_stats(client, url_a)
+            await client.get(f"{url_a}/api/dashboard/stats", params={"channel_id": 999999})
+            after = await cache_stats(client, url_a)
+            check(after["misses"] - before["misses"] == 1, "channel_id diferente calcula de novo")
+
+            # 3. Invalidação entre workers
+            total = (await client.get(f"{url_b}/api/properties/stats/summary")).json()["total"]
+            await client.get(f"{url_b}/api/properties/stats/summary")
+            r = await client.post(f"{url_a}/api/properties", json={
+                "title": TITLE, "type": "apartamento", "latitude": -23.5, "longitude": -46.6,
+            })
+            r.raise_for_status()
+            created_id = r.json()["id"]
+            elapsed = await wait_total(client, url_b, total + 1, args.timeout)
+            check(elapsed is not None, f"imóvel criado no worker A aparece no worker B"
+                                       + (f" em {elapsed:.0f} ms" if elapsed is not None else ""))
+
+            (await client.delete(f"{url_a}/api/properties/{created_id}")).raise_for_status()
+            elapsed = await wait_total(client, url_b, total, args.timeout)
+            check(elapsed is not None, f"imóvel apagado no worker A some do worker B"
+                                       + (f" em {elapsed:.0f} ms" if elapsed is not None else ""))
+
+            # 5. Mensagens chegando enquanto os dashboards são lidos
+            dashboards = ("/api/dashboard/stats", "/api/dashboard/advanced")
+            for url in (url_a, url_b):
+                for path in dashboards:
+                    await client.get(f"{url}{path}")
+            before = {url: await cache_stats(client, url) for url in (url_a, url_b)}
+            delivered = True
+            for i in range(args.messages):
+                r = await client.post(f"{url_a}/api/evolution/webhook/{INSTANCE}", json=webhook_message(i))
+                delivered = r.status_code == 200 and r.json()["status"] == "ok"
+                if not delivered:
+                    break
+                for url in (url_a, url_b):
+                    for path in dashboards:
+                        await client.get(f"{url}{path}")
+            check(delivered, f"{args.messages} mensagens gravadas pelo webhook no worker A")
+            async with async_session() as db:
+                written = (await db.execute(text("SELECT count(*) FROM messages WHERE contact_wa_id = :wa"),
+                                            {"wa": WA_ID})).scalar()
+            for url, name in ((url_a, "A"), (url_b, "B")):
+                after = await cache_stats(client, url)
+                hits = after["hits"] - before[url]["hits"]
+                lookups = hits + after["misses"] - before[url]["misses"] + after["coalesced"] - before[url]["coalesced"]
+                invalidations = after["invalidations"] - before[url]["invalidations"]
+                check(written == args.messages and invalidations == 0 and hits == lookups,
+                      f"worker {name}: {written} mensagens gravadas, {invalidations} invalidações, "
+                      f"taxa de acerto dos dashboards {hits}/{lookups}")
+
+            before_b = await cache_stats(client, url_b)
+            r = await client.patch(f"{url_a}/api/contacts/{WA_ID}", json={"lead_status": "em_contato"})
+            r.raise_for_status()
+            started = time.perf_counter()
+            invalidated = False
+            while time.perf_counter() - started < args.timeout and not invalidated:
+                await client.get(f"{url_b}/api/dashboard/advanced")
+                invalidated = (await cache_stats(client, url_b))["misses"] > before_b["misses"]
+                await asyncio.sleep(0.05)
+            check(invalidated, "status do contato alterado no worker A: dashboard avançado recalculado no worker B"
+                               + (f" em {(time.perf_counter() - started) * 1000:.0f} ms" if invalidated else ""))
+
+            stats_b = await cache_stats(client, url_b)
+            print(f"\n📊 Worker B: hits={stats_b['hits']} misses={stats_b['misses']} "
+                  f"coalesced={stats_b['coalesced']} invalidations={stats_b['invalidations']}")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        async with async_session() as db:
+            await db.execute(text("DELETE FROM properties WHERE title = :title"), {"title": TITLE})
+            for table, column in (("messages", "contact_wa_id"), ("activities", "contact_wa_id"),
+                                  ("conversation_state", "wa_id"), ("contacts", "wa_id")):
+                await db.execute(text(f"DELETE FROM {table} WHERE {column} = :wa"), {"wa": WA_ID})
+            await db.execute(text("DELETE FROM message_ids WHERE wa_message_id LIKE 'cache-test-%'"))
+            await db.execute(text("DELETE FROM channels WHERE instance_name = :i"), {"i": INSTANCE})
+            await db.commit()
+        await engine.dispose()
+
+    print("\n🎉 Cache de respostas OK" if ok else "\n⚠️ Cache de respostas falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste do cache de respostas com dois workers")
+    parser.add_argument("--port", type=int, default=8711, help="Porta do worker A (B usa a seguinte)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requisições simultâneas no mesmo dashboard")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Espera máxima pela invalidação (s)")
+    parser.add_argument("--messages", type=int, default=30, help="Mensagens gravadas durante as leituras dos dashboards")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,92 @@
+"""
+Teste da fila de webhooks (app/webhook_queue.py) com um payload inválido no meio do lote,
+contra o Postgres de DATABASE_URL e um handler de teste (origem própria, sem tocar nas
+mensagens):
+  1. os payloads válidos do lote são processados já na primeira rodada, com uma tentativa;
+  2. só o payload inválido acumula tentativas e vira failed após QUEUE_MAX_ATTEMPTS;
+  3. contadores: retried conta as devoluções para a fila, failed os que desistiram.
+Falha (exit 1) se algo não bater. As linhas de teste são apagadas no final.
+
+Rode com: python -m app.migrate_webhook_queue && python test_webhook_queue.py
+"""
+import asyncio
+import sys
+
+from sqlalchemy import text
+
+from app import webhook_queue
+from app.database import async_session, engine
+
+SOURCE = "teste-fila"
+BATCH = 20
+POISON = 7
+
+
+async def handler(payloads: list[dict], db):
+    """Grava nada; falha se o lote tiver o payload inválido."""
+    handler.calls += 1
+    if any(p.get("poison") for p in payloads):
+        raise ValueError("payload inválido")
+
+
+async def cleanup():
+    async with async_session() as db:
+        await db.execute(text("DELETE FROM webhook_inbox WHERE source = :s"), {"s": SOURCE})
+        await db.commit()
+
+
+async def items() -> dict[int, tuple[str, int]]:
+    async with async_session() as db:
+        result = await db.execute(
+            text("SELECT id, status, attempts FROM webhook_inbox WHERE source = :s ORDER BY id"), {"s": SOURCE},
+        )
+        return {r.id: (r.status, r.attempts) for r in result.all()}
+
+
+async def main() -> bool:
+    ok = True
+
+    def check(condition: bool, message: str):
+        nonlocal ok
+        print(("✅ " if condition else "❌ ") + message)
+        ok = ok and condition
+
+    webhook_queue.QUEUE_BATCH_SIZE = BATCH
+    webhook_queue.QUEUE_MAX_ATTEMPTS = 3
+    try:
+        await cleanup()
+        ids = []
+        for i in range(BATCH):
+            async with async_session() as db:
+                ids.append(await webhook_queue.enqueue(SOURCE, {"n": i, "poison": i == POISON}, db))
+        poison_id = ids[POISON]
+        before = dict(webhook_queue._counters)
+
+        handler.calls = 0
+        await webhook_queue._process_once(SOURCE, handler)
+        state = await items()
+        valid = [state[i] for i in ids if i != poison_id]
+        check(all(s == ("done", 1) for s in valid) and state[poison_id] == ("pending", 1),
+              f"1ª rodada: {len(valid)} válidos processados, só o inválido volta para a fila "
+              f"({handler.calls} chamadas ao handler)")
+
+        for _ in range(webhook_queue.QUEUE_MAX_ATTEMPTS - 1):
+            await webhook_queue._process_once(SOURCE, handler)
+        state = await items()
+        check(state[poison_id] == ("failed", webhook_queue.QUEUE_MAX_ATTEMPTS)
+              and all(state[i] == ("done", 1) for i in ids if i != poison_id),
+              f"após {webhook_queue.QUEUE_MAX_ATTEMPTS} tentativas só o inválido fica failed; os válidos seguem com 1 tentativa")
+
+        counters = {k: webhook_queue._counters[k] - before[k] for k in ("processed", "retried", "failed")}
+        check(counters == {"processed": BATCH - 1, "retried": webhook_queue.QUEUE_MAX_ATTEMPTS - 1, "failed": 1},
+              f"contadores: {counters}")
+    finally:
+        await cleanup()
+        await engine.dispose()
+
+    print("\n🎉 Fila de webhooks OK" if ok else "\n⚠️ Fila de webhooks falhou")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
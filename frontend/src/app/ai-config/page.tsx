@@ -116,6 +116,12 @@ export default function AIConfigPage() {
     }
   };
 
+  // Reenvio do mesmo documento: chunks que não mudaram não passam de novo pela API de embeddings
+  const reusedInfo = (data: any) =>
+    data.reused_chunks
+      ? ` — ${data.reused_chunks} reaproveitados, ${data.saved_api_calls} chamadas à API evitadas`
+      : '';
+
   const handleUpload = async () => {
     if (!activeChannel || !uploadFile || !uploadTitle.trim()) return;
     setUploading(true);
@@ -128,7 +134,22 @@ export default function AIConfigPage() {
       const res = await api.post(`/ai/documents/${activeChannel.id}`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
-      setUploadSuccess(`"${uploadTitle}" enviado com sucesso! ${res.data.chunks_saved} chunks criados (${res.data.total_tokens} tokens)`);
+      if (res.status === 202) {
+        // Documento grande: processado em segundo plano, acompanha o progresso do job
+        let job = res.data;
+        while (job.status === 'running') {
+          setUploadSuccess(`Processando "${uploadTitle}"... ${job.embedded_chunks ?? 0}/${job.total_chunks} chunks`);
+          await new Promise((resolve) => setTimeout(resolve, 1500));
+          job = (await api.get(`/ai/documents/jobs/${res.data.job_id}`)).data;
+        }
+        if (job.status !== 'done') {
+          setUploadSuccess('');
+          throw { response: { data: { detail: job.error || 'Processamento do documento interrompido' } } };
+        }
+        setUploadSuccess(`"${uploadTitle}" enviado com sucesso! ${job.saved_chunks} chunks criados (${job.total_tokens} tokens)${reusedInfo(job)}`);
+      } else {
+        setUploadSuccess(`"${uploadTitle}" enviado com sucesso! ${res.data.chunks_saved} chunks criados (${res.data.total_tokens} tokens)${reusedInfo(res.data)}`);
+      }
       setUploadTitle('');
       setUploadFile(null);
       const fileInput = document.getElementById('doc-file') as HTMLInputElement;
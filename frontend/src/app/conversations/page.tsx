@@ -91,6 +91,12 @@ interface Message {
   sent_by_ai: boolean;
 }
 
+// Mensagens por página ao abrir a conversa ou rolar para trás
+const MESSAGES_PAGE_SIZE = 100;
+// Conversas por página na lista (mais páginas ao rolar); teto = CONTACTS_PAGE_MAX do backend
+const CONTACTS_PAGE_SIZE = 100;
+const CONTACTS_PAGE_MAX = 1000;
+
 const leadStatuses = [
   { value: 'novo', label: 'Novo', color: 'bg-blue-500', bg: 'bg-blue-500/20', text: 'text-blue-400', border: 'border-blue-500/30' },
   { value: 'em_contato', label: 'Em contato', color: 'bg-amber-500', bg: 'bg-amber-500/20', text: 'text-amber-400', border: 'border-amber-500/30' },
@@ -146,6 +152,10 @@ export default function ConversationsPage() {
   const [notesValue, setNotesValue] = useState('');
   const [togglingAI, setTogglingAI] = useState(false);
   const [loadingMessages, setLoadingMessages] = useState(false);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+  const [hasMoreContacts, setHasMoreContacts] = useState(false);
+  const [loadingMoreContacts, setLoadingMoreContacts] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [selectedBulk, setSelectedBulk] = useState<Set<string>>(new Set());
   const [showBulkStatus, setShowBulkStatus] = useState(false);
   const [showBulkTag, setShowBulkTag] = useState(false);
@@ -173,9 +183,18 @@ export default function ConversationsPage() {
   const imageInputRef = useRef<HTMLInputElement>(null);
   const loadedPicsRef = useRef<Set<string>>(new Set());
   const prevMsgCountRef = useRef<number>(0);
+  const lastMsgIdRef = useRef<number | null>(null);
+  // Ids já exibidos: o delta repete as mensagens da folga de sincronização
+  const knownMsgIdsRef = useRef<Set<number>>(new Set());
+  const syncTokenRef = useRef<string | null>(null);
+  const streamOpenRef = useRef<boolean>(false);
+  const currentWaIdRef = useRef<string | null>(null);
   const isTabFocusedRef = useRef<boolean>(true);
   const notifAudioRef = useRef<HTMLAudioElement | null>(null);
   const chatContainerRef = useRef<HTMLDivElement>(null);
+  // Paginação da lista: cursor da próxima página e quantas conversas já vieram
+  const nextContactsCursorRef = useRef<string | null>(null);
+  const contactsDepthRef = useRef<number>(0);
 
   useEffect(() => { setMounted(true); }, []);
 
@@ -207,22 +226,64 @@ export default function ConversationsPage() {
 
   useEffect(() => {
     if (activeChannel) {
+      nextContactsCursorRef.current = null;
+      contactsDepthRef.current = 0;
       loadContacts();
-      const interval = setInterval(loadContacts, 5000);
+      // Polling só como reserva enquanto o stream de eventos estiver fora
+      const interval = setInterval(() => { if (!streamOpenRef.current) loadContacts(); }, 5000);
       return () => clearInterval(interval);
     }
   }, [activeChannel]);
 
+  // Eventos em tempo real (SSE); o navegador reconecta sozinho mandando o Last-Event-ID
+  useEffect(() => {
+    if (!activeChannel || typeof EventSource === 'undefined') return;
+    const token = localStorage.getItem('token');
+    if (!token) return;
+    const source = new EventSource(
+      `${api.defaults.baseURL}/events?token=${encodeURIComponent(token)}&channel_id=${activeChannel.id}`
+    );
+    const syncSelected = (waId: string) => {
+      if (waId === currentWaIdRef.current && lastMsgIdRef.current !== null) loadMessages(waId);
+    };
+    source.addEventListener('ready', () => { streamOpenRef.current = true; });
+    source.addEventListener('resync', () => {
+      streamOpenRef.current = true;
+      loadContacts();
+      if (currentWaIdRef.current) syncSelected(currentWaIdRef.current);
+    });
+    source.addEventListener('contact.updated', (e) => {
+      const updated: Contact = JSON.parse((e as MessageEvent).data);
+      setContacts(prev => [updated, ...prev.filter(c => c.wa_id !== updated.wa_id)].sort(
+        (a, b) => (b.last_message_time || '').localeCompare(a.last_message_time || '')
+      ));
+      setSelectedContact(prev => (prev && prev.wa_id === updated.wa_id ? { ...prev, ...updated } : prev));
+    });
+    const onMessage = (e: Event) => syncSelected(JSON.parse((e as MessageEvent).data).contact_wa_id);
+    source.addEventListener('message.created', onMessage);
+    source.addEventListener('message.status', onMessage);
+    source.onerror = () => { streamOpenRef.current = false; };
+    return () => {
+      source.close();
+      streamOpenRef.current = false;
+    };
+  }, [activeChannel]);
+
   useEffect(() => {
     if (selectedContact) {
       prevMsgCountRef.current = 0;
+      lastMsgIdRef.current = null;
+      knownMsgIdsRef.current = new Set();
+      syncTokenRef.current = null;
+      currentWaIdRef.current = selectedContact.wa_id;
+      setHasOlderMessages(false);
       setShowScrollDown(false);
       setLoadingMessages(true);
       setMessages([]);
       loadMessages(selectedContact.wa_id);
       api.post(`/contacts/${selectedContact.wa_id}/read`);
       setNotesValue(selectedContact.notes || '');
-      const interval = setInterval(() => loadMessages(selectedContact.wa_id), 3000);
+      const interval = setInterval(() => { if (!streamOpenRef.current) loadMessages(selectedContact.wa_id); }, 3000);
       return () => clearInterval(interval);
     }
   }, [selectedContact]);
@@ -251,24 +312,41 @@ export default function ConversationsPage() {
     }
   };
 
+  // Carregar fotos de perfil dos contatos novos
+  const loadProfilePics = (list: Contact[]) => {
+    if (!activeChannel) return;
+    list.forEach((c: Contact) => {
+      if (!loadedPicsRef.current.has(c.wa_id)) {
+        loadedPicsRef.current.add(c.wa_id);
+        loadProfilePic(c.wa_id);
+      }
+    });
+  };
+
   const loadContacts = async () => {
     try {
-      const params = activeChannel ? `?channel_id=${activeChannel.id}` : '';
-      const res = await api.get(`/contacts${params}`);
-      setContacts(res.data);
+      // Recarrega só o que já está na tela (primeira página + as que vieram rolando), com teto
+      const limit = Math.min(Math.max(contactsDepthRef.current, CONTACTS_PAGE_SIZE), CONTACTS_PAGE_MAX);
+      const params: Record<string, any> = { limit };
+      if (activeChannel) params.channel_id = activeChannel.id;
+      const res = await api.get('/contacts', { params });
+      const fresh: Contact[] = res.data;
+      if (contactsDepthRef.current <= CONTACTS_PAGE_MAX) {
+        nextContactsCursorRef.current = res.headers['x-next-cursor'] || null;
+        setHasMoreContacts(!!nextContactsCursorRef.current);
+      }
+      contactsDepthRef.current = Math.max(contactsDepthRef.current, fresh.length);
+      setContacts(prev => {
+        if (prev.length <= fresh.length) return fresh;
+        // Além do teto: as páginas mais antigas já carregadas ficam como estão
+        const freshIds = new Set(fresh.map(c => c.wa_id));
+        return [...fresh, ...prev.slice(fresh.length).filter(c => !freshIds.has(c.wa_id))];
+      });
       if (selectedContact) {
-        const updated = res.data.find((c: Contact) => c.wa_id === selectedContact.wa_id);
+        const updated = fresh.find((c: Contact) => c.wa_id === selectedContact.wa_id);
         if (updated) setSelectedContact(updated);
       }
-      // Carregar fotos de perfil dos contatos novos
-      if (activeChannel) {
-        res.data.forEach((c: Contact) => {
-          if (!loadedPicsRef.current.has(c.wa_id)) {
-            loadedPicsRef.current.add(c.wa_id);
-            loadProfilePic(c.wa_id);
-          }
-        });
-      }
+      loadProfilePics(fresh);
     } catch (err) {
       toast.error('Erro ao carregar contatos');
     } finally {
@@ -276,6 +354,30 @@ export default function ConversationsPage() {
     }
   };
 
+  const loadMoreContacts = async () => {
+    const cursor = nextContactsCursorRef.current;
+    if (!cursor || loadingMoreContacts) return;
+    setLoadingMoreContacts(true);
+    try {
+      const params: Record<string, any> = { limit: CONTACTS_PAGE_SIZE, cursor };
+      if (activeChannel) params.channel_id = activeChannel.id;
+      const res = await api.get('/contacts', { params });
+      const page: Contact[] = res.data;
+      nextContactsCursorRef.current = res.headers['x-next-cursor'] || null;
+      setHasMoreContacts(!!nextContactsCursorRef.current);
+      contactsDepthRef.current += page.length;
+      setContacts(prev => {
+        const known = new Set(prev.map(c => c.wa_id));
+        return [...prev, ...page.filter(c => !known.has(c.wa_id))];
+      });
+      loadProfilePics(page);
+    } catch (err) {
+      toast.error('Erro ao carregar contatos');
+    } finally {
+      setLoadingMoreContacts(false);
+    }
+  };
+
   const loadProfilePic = async (waId: string) => {
     try {
       const channelId = activeChannel?.id || 1;
@@ -288,31 +390,91 @@ export default function ConversationsPage() {
 
   const loadMessages = async (waId: string) => {
     try {
-      const res = await api.get(`/contacts/${waId}/messages`);
-      const newMsgs: Message[] = res.data;
-
-      // Detectar novas mensagens inbound
-      if (prevMsgCountRef.current > 0 && newMsgs.length > prevMsgCountRef.current) {
-        const newOnes = newMsgs.slice(prevMsgCountRef.current);
-        const hasInbound = newOnes.some(m => m.direction === 'inbound');
-        if (hasInbound) {
+      // Primeira carga: só as mensagens mais recentes
+      if (lastMsgIdRef.current === null) {
+        const res = await api.get(`/contacts/${waId}/messages`, { params: { limit: MESSAGES_PAGE_SIZE } });
+        if (currentWaIdRef.current !== waId) return;
+        const firstMsgs: Message[] = res.data;
+        // Maior id (a lista vem na ordem de envio, não na de gravação)
+        lastMsgIdRef.current = firstMsgs.reduce((max, m) => Math.max(max, m.id), 0);
+        knownMsgIdsRef.current = new Set(firstMsgs.map(m => m.id));
+        syncTokenRef.current = res.headers['x-sync-token'] || null;
+        prevMsgCountRef.current = firstMsgs.length;
+        setHasOlderMessages(firstMsgs.length === MESSAGES_PAGE_SIZE);
+        setMessages(firstMsgs);
+        setLoadingMessages(false);
+        return;
+      }
+
+      // Atualizações: só o que mudou desde a última sincronização
+      const params: Record<string, any> = { after_id: lastMsgIdRef.current };
+      if (syncTokenRef.current) params.since = syncTokenRef.current;
+      const res = await api.get(`/contacts/${waId}/messages`, { params });
+      if (currentWaIdRef.current !== waId) return;
+      const delta: { messages: Message[]; status_changes: { id: number; status: string }[]; sync_token: string | null } = res.data;
+      if (delta.sync_token) syncTokenRef.current = delta.sync_token;
+      if (!delta.messages.length && !delta.status_changes.length) return;
+
+      // Mensagens de id menor que commitaram depois voltam na folga: só as que faltam entram
+      const newOnes = delta.messages.filter(m => !knownMsgIdsRef.current.has(m.id));
+      if (newOnes.length) {
+        lastMsgIdRef.current = newOnes.reduce((max, m) => Math.max(max, m.id), lastMsgIdRef.current ?? 0);
+        newOnes.forEach(m => knownMsgIdsRef.current.add(m.id));
+        // Detectar novas mensagens inbound
+        const inbound = newOnes.filter(m => m.direction === 'inbound');
+        if (prevMsgCountRef.current > 0 && inbound.length > 0 && !isTabFocusedRef.current) {
           // Tocar som se a aba não estiver em foco
-          if (!isTabFocusedRef.current) {
-            setUnreadCount(prev => prev + newOnes.filter(m => m.direction === 'inbound').length);
-            try { notifAudioRef.current?.play(); } catch {}
-          }
+          setUnreadCount(prev => prev + inbound.length);
+          try { notifAudioRef.current?.play(); } catch {}
         }
+        prevMsgCountRef.current += newOnes.length;
       }
-      prevMsgCountRef.current = newMsgs.length;
 
-      setMessages(newMsgs);
-      setLoadingMessages(false);
+      const statusById = new Map(delta.status_changes.map(c => [c.id, c.status]));
+      setMessages(prev => {
+        const known = new Set(prev.map(m => m.id));
+        const updated = statusById.size
+          ? prev.map(m => (statusById.has(m.id) ? { ...m, status: statusById.get(m.id)! } : m))
+          : prev;
+        const added = newOnes.filter(m => !known.has(m.id));
+        if (!added.length) return updated;
+        // Na ordem de envio, como o histórico (uma atrasada entra no lugar dela)
+        return [...updated, ...added].sort((a, b) =>
+          a.timestamp === b.timestamp ? a.id - b.id : a.timestamp < b.timestamp ? -1 : 1);
+      });
     } catch (err) {
       setLoadingMessages(false);
       // silent
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!selectedContact || loadingOlder || messages.length === 0) return;
+    const waId = selectedContact.wa_id;
+    const container = chatContainerRef.current;
+    const previousHeight = container?.scrollHeight || 0;
+    setLoadingOlder(true);
+    try {
+      const res = await api.get(`/contacts/${waId}/messages`, {
+        params: { before_id: messages[0].id, limit: MESSAGES_PAGE_SIZE },
+      });
+      if (currentWaIdRef.current !== waId) return;
+      const older: Message[] = res.data;
+      setHasOlderMessages(older.length === MESSAGES_PAGE_SIZE);
+      prevMsgCountRef.current += older.length;
+      older.forEach(m => knownMsgIdsRef.current.add(m.id));
+      setMessages(prev => [...older, ...prev]);
+      // Mantém a posição de leitura depois de inserir as mensagens antigas no topo
+      requestAnimationFrame(() => {
+        if (container) container.scrollTop += container.scrollHeight - previousHeight;
+      });
+    } catch (err) {
+      // silent
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const loadTags = async () => {
     try {
       const res = await api.get('/tags');
@@ -1000,7 +1162,13 @@ export default function ConversationsPage() {
           </div>
 
           {/* Contacts List */}
-          <div className="flex-1 overflow-y-auto border-t border-[#2a3942]">
+          <div
+            className="flex-1 overflow-y-auto border-t border-[#2a3942]"
+            onScroll={(e) => {
+              const el = e.currentTarget;
+              if (hasMoreContacts && el.scrollHeight - el.scrollTop - el.clientHeight < 300) loadMoreContacts();
+            }}
+          >
             {loading ? (
               <div className="space-y-0 p-1">
                 {[...Array(8)].map((_, i) => (
@@ -1132,6 +1300,18 @@ export default function ConversationsPage() {
                     </div>
                   );
                 })}
+
+                {hasMoreContacts && (
+                  <div className="flex justify-center py-3">
+                    <button
+                      onClick={loadMoreContacts}
+                      disabled={loadingMoreContacts}
+                      className="text-[12px] text-[#8696a0] bg-[#202c33] hover:bg-[#2a3942] px-3 py-1 rounded-full transition-colors disabled:opacity-50"
+                    >
+                      {loadingMoreContacts ? 'Carregando...' : 'Carregar mais conversas'}
+                    </button>
+                  </div>
+                )}
               </div>
             )}
           </div>
@@ -1271,6 +1451,17 @@ export default function ConversationsPage() {
                     }}
                     className="flex-1 overflow-y-auto px-[4%] py-4 space-y-1 bg-[#0b141a] relative" style={{ backgroundImage: 'url("data:image/svg+xml,%3Csvg width=\'200\' height=\'200\' xmlns=\'http://www.w3.org/2000/svg\'%3E%3Cdefs%3E%3Cpattern id=\'p\' width=\'40\' height=\'40\' patternUnits=\'userSpaceOnUse\'%3E%3Cpath d=\'M20 2a2 2 0 1 1 0 4 2 2 0 0 1 0-4z\' fill=\'%23111b21\' fill-opacity=\'0.6\'/%3E%3C/pattern%3E%3C/defs%3E%3Crect width=\'200\' height=\'200\' fill=\'url(%23p)\'/%3E%3C/svg%3E")' }}>
 
+                    {!loadingMessages && hasOlderMessages && (
+                      <div className="flex justify-center pb-2">
+                        <button
+                          onClick={loadOlderMessages}
+                          disabled={loadingOlder}
+                          className="text-[12px] text-[#8696a0] bg-[#202c33] hover:bg-[#2a3942] px-3 py-1 rounded-full transition-colors disabled:opacity-50"
+                        >
+                          {loadingOlder ? 'Carregando...' : 'Carregar mensagens anteriores'}
+                        </button>
+                      </div>
+                    )}
                     {loadingMessages ? (
                       <div className="space-y-3 py-4">
                         {[
@@ -5,7 +5,7 @@ import { useRouter } from 'next/navigation';
 import {
   Search, X, User, MessageCircle, LayoutDashboard, GitBranch,
   BarChart3, FileText, Users, Zap, PhoneCall, Calendar, Radio,
-  ArrowRight, Command, Hash,
+  ArrowRight, Command, Hash, Home,
 } from 'lucide-react';
 import api from '@/lib/api';
 
@@ -14,6 +14,24 @@ interface ContactResult {
   name: string;
   lead_status: string;
   tags: { id: number; name: string; color: string }[];
+  highlight?: string;
+}
+
+interface MessageResult {
+  id: number;
+  contact_wa_id: string;
+  contact_name: string;
+  direction: string;
+  timestamp: string | null;
+  highlight: string;
+}
+
+interface PropertyResult {
+  id: number;
+  title: string;
+  address: string;
+  status: string;
+  highlight: string;
 }
 
 interface PageResult {
@@ -27,6 +45,18 @@ const iconMap: Record<string, React.ElementType> = {
   FileText, Users, Zap, PhoneCall, Calendar, Radio,
 };
 
+// Destaques da busca vêm como texto puro com o termo entre <mark></mark>
+function Highlight({ text }: { text: string }) {
+  const parts = text.split(/<\/?mark>/);
+  return (
+    <>
+      {parts.map((part, i) => (i % 2 === 1
+        ? <mark key={i} className="bg-transparent font-semibold" style={{ color: 'var(--primary)' }}>{part}</mark>
+        : <span key={i}>{part}</span>))}
+    </>
+  );
+}
+
 const statusColors: Record<string, string> = {
   novo: 'bg-blue-500',
   em_contato: 'bg-amber-500',
@@ -41,6 +71,8 @@ export default function CommandPalette() {
   const [query, setQuery] = useState('');
   const [contacts, setContacts] = useState<ContactResult[]>([]);
   const [pages, setPages] = useState<PageResult[]>([]);
+  const [messages, setMessages] = useState<MessageResult[]>([]);
+  const [properties, setProperties] = useState<PropertyResult[]>([]);
   const [activeIndex, setActiveIndex] = useState(0);
   const [loading, setLoading] = useState(false);
   const inputRef = useRef<HTMLInputElement>(null);
@@ -52,6 +84,8 @@ export default function CommandPalette() {
   const allItems = [
     ...pages.map(p => ({ type: 'page' as const, ...p })),
     ...contacts.map(c => ({ type: 'contact' as const, ...c })),
+    ...messages.map(m => ({ type: 'message' as const, ...m })),
+    ...properties.map(p => ({ type: 'property' as const, ...p })),
   ];
 
   // Cmd+K listener
@@ -76,6 +110,8 @@ export default function CommandPalette() {
       setQuery('');
       setContacts([]);
       setPages([]);
+      setMessages([]);
+      setProperties([]);
       setActiveIndex(0);
     }
   }, [open]);
@@ -85,6 +121,8 @@ export default function CommandPalette() {
     if (term.length < 2) {
       setContacts([]);
       setPages([]);
+      setMessages([]);
+      setProperties([]);
       setLoading(false);
       return;
     }
@@ -93,6 +131,8 @@ export default function CommandPalette() {
       const res = await api.get(`/search?q=${encodeURIComponent(term)}`);
       setContacts(res.data.contacts || []);
       setPages(res.data.pages || []);
+      setMessages(res.data.messages || []);
+      setProperties(res.data.properties || []);
       setActiveIndex(0);
     } catch {
       // silent
@@ -116,9 +156,13 @@ export default function CommandPalette() {
   const navigate = (item: typeof allItems[0]) => {
     setOpen(false);
     if (item.type === 'page') {
-      router.push((item as PageResult & { type: 'page' }).href);
+      router.push(item.href);
+    } else if (item.type === 'contact') {
+      router.push(`/conversations?contact=${item.wa_id}`);
+    } else if (item.type === 'message') {
+      router.push(`/conversations?contact=${item.contact_wa_id}`);
     } else {
-      router.push(`/conversations?contact=${(item as ContactResult & { type: 'contact' }).wa_id}`);
+      router.push('/properties');
     }
   };
 
@@ -137,7 +181,7 @@ export default function CommandPalette() {
 
   if (!open) return null;
 
-  const hasResults = contacts.length > 0 || pages.length > 0;
+  const hasResults = allItems.length > 0;
   const showEmpty = query.length >= 2 && !loading && !hasResults;
 
   return (
@@ -159,7 +203,7 @@ export default function CommandPalette() {
             value={query}
             onChange={e => setQuery(e.target.value)}
             onKeyDown={handleKeyDown}
-            placeholder="Buscar contatos, páginas..."
+            placeholder="Buscar contatos, mensagens, imóveis..."
             className="flex-1 text-[15px] placeholder:text-gray-400 outline-none bg-transparent"
             style={{ color: 'var(--text)' }}
             aria-label="Busca global"
@@ -242,7 +286,7 @@ export default function CommandPalette() {
                       {initials}
                     </div>
                     <div className="flex-1 min-w-0">
-                      <p className="text-[13px] font-medium truncate" style={{ color: 'var(--text)' }}>{contact.name}</p>
+                      <p className="text-[13px] font-medium truncate" style={{ color: 'var(--text)' }}><Highlight text={contact.highlight || contact.name} /></p>
                       <div className="flex items-center gap-2 mt-0.5">
                         <span className="text-[11px]" style={{ color: 'var(--muted)' }}>+{contact.wa_id}</span>
                         <span className={`w-1.5 h-1.5 rounded-full ${statusColors[contact.lead_status] || 'bg-gray-400'}`} />
@@ -260,6 +304,67 @@ export default function CommandPalette() {
             </div>
           )}
 
+          {/* Messages */}
+          {messages.length > 0 && (
+            <div className="px-2 pt-2 pb-2">
+              <p className="px-2 pb-1.5 text-[11px] font-semibold uppercase tracking-wider" style={{ color: 'var(--muted)' }}>Mensagens</p>
+              {messages.map((message, i) => {
+                const idx = pages.length + contacts.length + i;
+                return (
+                  <button
+                    key={message.id}
+                    data-index={idx}
+                    onClick={() => navigate({ type: 'message', ...message })}
+                    onMouseEnter={() => setActiveIndex(idx)}
+                    className="w-full flex items-center gap-3 px-3 py-2.5 rounded-xl text-left transition-colors"
+                    style={{ backgroundColor: activeIndex === idx ? 'var(--primary-light)' : 'transparent' }}
+                  >
+                    <div className="w-8 h-8 rounded-lg flex items-center justify-center flex-shrink-0" style={{ backgroundColor: 'var(--bg)' }}>
+                      <MessageCircle className="w-4 h-4" style={{ color: 'var(--muted)' }} />
+                    </div>
+                    <div className="flex-1 min-w-0">
+                      <p className="text-[13px] truncate" style={{ color: 'var(--text)' }}><Highlight text={message.highlight} /></p>
+                      <p className="text-[11px] mt-0.5 truncate" style={{ color: 'var(--muted)' }}>
+                        {message.contact_name}
+                        {message.timestamp && ` · ${new Date(message.timestamp).toLocaleDateString('pt-BR')}`}
+                      </p>
+                    </div>
+                    <ArrowRight className="w-3.5 h-3.5 transition-opacity flex-shrink-0" style={{ color: 'var(--primary)', opacity: activeIndex === idx ? 1 : 0 }} />
+                  </button>
+                );
+              })}
+            </div>
+          )}
+
+          {/* Properties */}
+          {properties.length > 0 && (
+            <div className="px-2 pt-2 pb-2">
+              <p className="px-2 pb-1.5 text-[11px] font-semibold uppercase tracking-wider" style={{ color: 'var(--muted)' }}>Imóveis</p>
+              {properties.map((property, i) => {
+                const idx = pages.length + contacts.length + messages.length + i;
+                return (
+                  <button
+                    key={property.id}
+                    data-index={idx}
+                    onClick={() => navigate({ type: 'property', ...property })}
+                    onMouseEnter={() => setActiveIndex(idx)}
+                    className="w-full flex items-center gap-3 px-3 py-2.5 rounded-xl text-left transition-colors"
+                    style={{ backgroundColor: activeIndex === idx ? 'var(--primary-light)' : 'transparent' }}
+                  >
+                    <div className="w-8 h-8 rounded-lg flex items-center justify-center flex-shrink-0" style={{ backgroundColor: 'var(--bg)' }}>
+                      <Home className="w-4 h-4" style={{ color: 'var(--muted)' }} />
+                    </div>
+                    <div className="flex-1 min-w-0">
+                      <p className="text-[13px] font-medium truncate" style={{ color: 'var(--text)' }}><Highlight text={property.highlight || property.title} /></p>
+                      <p className="text-[11px] mt-0.5 truncate" style={{ color: 'var(--muted)' }}>{property.address}</p>
+                    </div>
+                    <ArrowRight className="w-3.5 h-3.5 transition-opacity flex-shrink-0" style={{ color: 'var(--primary)', opacity: activeIndex === idx ? 1 : 0 }} />
+                  </button>
+                );
+              })}
+            </div>
+          )}
+
           {/* Default state */}
           {!loading && query.length < 2 && (
             <div className="px-4 py-6 text-center">
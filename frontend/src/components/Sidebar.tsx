@@ -62,10 +62,8 @@ export default function Sidebar({ mobileOpen = false, onMobileClose }: SidebarPr
 
   const fetchUnread = useCallback(async () => {
     try {
-      const res = await api.get('/contacts', { params: { limit: 200 } });
-      const contacts = res.data;
-      const count = contacts.filter((c: any) => c.unread > 0).length;
-      setUnreadCount(count);
+      const res = await api.get('/contacts/unread-count');
+      setUnreadCount(res.data.conversations);
     } catch {
       // silent
     }